@@ -188,6 +188,44 @@ class Ipmi(bmc.Bmc, chassis.Chassis, fru.Fru, picmg.Picmg, hpm.Hpm,
 
         return rsp
 
+    def send_message_batch(self, reqs, retry=3, skip_timeouts=False):
+        """Sends several request messages and returns the responses in the
+        same order.
+
+        If the interface supports it, all requests are sent at once.
+        Otherwise, they are sent one after another. If `skip_timeouts` is
+        set, None is returned for a request which timed out instead of
+        raising `TimeoutError`.
+        """
+        for req in reqs:
+            req.target = self.target
+            req.requester = self.requester
+
+        if not hasattr(self.interface, 'send_and_receive_batch'):
+            return [self._send_message_or_none(req, retry, skip_timeouts)
+                    for req in reqs]
+
+        rsps = self.interface.send_and_receive_batch(reqs,
+                skip_timeouts=skip_timeouts)
+
+        # resend requests which were rejected because the node was busy
+        for (index, req) in enumerate(reqs):
+            if rsps[index] is None:
+                continue
+            if rsps[index].completion_code == msgs.constants.CC_NODE_BUSY:
+                rsps[index] = self._send_message_or_none(req, retry,
+                        skip_timeouts)
+
+        return rsps
+
+    def _send_message_or_none(self, req, retry, skip_timeouts):
+        try:
+            return self.send_message(req, retry)
+        except TimeoutError:
+            if not skip_timeouts:
+                raise
+            return None
+
     def send_message_with_name(self, name, *args, **kwargs):
         req = create_request_by_name(name)
 
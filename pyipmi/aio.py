@@ -0,0 +1,772 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""asyncio front-end for the native LAN interfaces.
+
+This module needs Python 3.5 or later and is not imported by `pyipmi`.
+The asyncio counterparts of `fleet.Fleet` and `poller.SensorPoller` are
+kept here for the same reason. The protocol logic is shared with the
+blocking mixins through the request generators of `helper.run_steps`.
+
+Example:
+
+    interface = pyipmi.aio.create_interface('rmcpplus', cipher_suite=17)
+    ipmi = pyipmi.aio.create_connection(interface)
+    ipmi.session.set_session_type_rmcp('10.0.0.1', port=623)
+    ipmi.session.set_auth_type_user('admin', 'admin')
+    await ipmi.session.establish()
+    device_id = await ipmi.get_device_id()
+    await ipmi.session.close()
+"""
+
+import array
+import asyncio
+import time
+
+from . import Session, NullRequester, Target
+from . import interfaces
+from .bmc import DeviceId, Watchdog
+from .helper import SdrRecordReader, SdrReadSize, SdrWalker, \
+        REPOSITORY_SDR, DEVICE_SDR, sdr_read_requests, sdr_read_results, \
+        sdr_chunk_steps, Done, next_step, run_step
+from .chassis import ChassisStatus
+from .errors import TimeoutError, CompletionCodeError, DecodingError, \
+        RetryError
+from .fleet import FleetResult, host_and_port
+from .fru import FruInventory, fru_read_steps
+from .logger import log
+from .poller import BasePoller
+from .msgs import constants, create_message, create_request_by_name, \
+        encode_message, decode_message
+from .sdr import SdrCommon, SdrRepositoryInfo
+from .sel import SelEntry, sel_entry_steps
+from .sensor import sensor_reading_from_response, is_readable_sensor, \
+        sensor_reading_requests, SensorSnapshot
+from .utils import check_completion_code, array_tobytes, \
+        py3enc_unic_bytes_fix
+from .interfaces.ipmb import rx_filter
+from .interfaces.rmcp import Rmcp, RmcpMsg, RMCP_CLASS_IPMI
+from .interfaces.rmcpplus import RmcpPlusMsg
+
+
+def create_interface(interface, *args, window=1, **kwargs):
+    """Creates the native LAN interface `interface` ('rmcp' or 'rmcpplus')
+    and runs it on an asyncio datagram transport.
+    """
+    return AsyncLan(interfaces.create_interface(interface, *args, **kwargs),
+            window)
+
+
+def create_connection(interface):
+    session = AsyncSession()
+    session.interface = interface
+    ipmi = AsyncIpmi()
+    ipmi.interface = interface
+    ipmi.session = session
+    ipmi.requester = NullRequester()
+    return ipmi
+
+
+# the loop of the calling coroutine, get_running_loop is new in Python 3.7
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+async def _run_steps(steps, send_fn, reserve_fn=None):
+    """The coroutine counterpart of `helper.run_steps`. `send_fn` and
+    `reserve_fn` are coroutine functions.
+    """
+    step = next_step(steps)
+    while not isinstance(step, Done):
+        (result, error) = (None, None)
+        try:
+            result = await run_step(step, send_fn, reserve_fn,
+                    asyncio.sleep)
+        except CompletionCodeError as e:
+            error = e
+        step = next_step(steps, result, error)
+    return step.value
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, interface):
+        self._interface = interface
+
+    def datagram_received(self, data, addr):
+        self._interface._datagram_received(data)
+
+    def error_received(self, exc):
+        log().debug('RMCP socket error: %s', exc)
+
+
+class AsyncLan(object):
+    """Runs a native LAN interface (`Rmcp` or `RmcpPlus`) on an asyncio
+    datagram transport.
+
+    The session setup, the message encoding and the cryptography are done
+    by the wrapped interface. Up to `window` requests are in flight at the
+    same time, further requests wait until a response has arrived. The
+    responses are matched by the IPMB sequence number.
+    """
+
+    MAX_WINDOW = 32
+
+    def __init__(self, interface, window=1):
+        if not isinstance(interface, Rmcp):
+            raise RuntimeError('interface %s is not supported by asyncio' %
+                    interface.NAME)
+        if not 1 <= window <= self.MAX_WINDOW:
+            raise RuntimeError('window must be between 1 and %d' %
+                    self.MAX_WINDOW)
+
+        self.interface = interface
+        self.window = window
+        self._transport = None
+        self._slots = None
+        self._pending = {}
+        self._handshake = None
+
+    async def establish_session(self, session):
+        loop = _running_loop()
+        self.interface._session = session
+        self.interface._reset_session()
+        self._slots = asyncio.Semaphore(self.window)
+
+        (self._transport, _) = await loop.create_datagram_endpoint(
+                lambda: _DatagramProtocol(self),
+                remote_addr=(session._rmcp_host, session._rmcp_port))
+
+        try:
+            steps = self.interface._session_activation()
+            rsp = None
+            while True:
+                try:
+                    request = steps.send(rsp)
+                except StopIteration:
+                    break
+                rsp = await self._send_and_receive_step(request)
+        except Exception:
+            self.interface._reset_session()
+            self._close()
+            raise
+
+    async def close_session(self, session):
+        req = self.interface._close_session_request()
+        try:
+            if req is not None:
+                await self._send_and_receive_msg(req)
+        except TimeoutError:
+            log().warning('Close session request timed out')
+        except CompletionCodeError as e:
+            log().warning('Close session request failed: %s', e)
+        finally:
+            self.interface._reset_session()
+            self._close()
+
+    def _close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def _send(self, sdu):
+        if self._transport is None:
+            raise RuntimeError('Session needs to be established')
+        self._transport.sendto(RmcpMsg(RMCP_CLASS_IPMI).pack(sdu))
+
+    def _datagram_received(self, pdu):
+        rmcp = RmcpMsg()
+        try:
+            sdu = rmcp.unpack(pdu)
+        except DecodingError as e:
+            log().debug('dropping invalid RMCP message: %s', e)
+            return
+
+        if rmcp.class_of_msg != RMCP_CLASS_IPMI:
+            return
+
+        if self._handshake is not None:
+            (payload_type, tag, future) = self._handshake
+            payload = self.interface._match_payload(sdu, payload_type, tag)
+            if payload is not None:
+                if not future.done():
+                    future.set_result(payload)
+                return
+
+        try:
+            rx_data = array.array('B', self.interface._unpack_ipmi_msg(sdu))
+        except DecodingError as e:
+            log().debug('dropping invalid IPMI message: %s', e)
+            return
+
+        if len(rx_data) < 7:
+            return
+        pending = self._pending.get(rx_data[4] >> 2)
+        if pending is None:
+            return
+        (header, future) = pending
+        if rx_filter(header, rx_data) and not future.done():
+            future.set_result(rx_data)
+
+    async def _wait(self, future, send_fn):
+        for _ in range(self.interface.max_retries):
+            send_fn()
+            try:
+                return await asyncio.wait_for(asyncio.shield(future),
+                        self.interface.timeout)
+            except asyncio.TimeoutError:
+                log().warning('RMCP request timed out')
+
+        raise TimeoutError()
+
+    async def _send_and_receive_payload(self, payload_type, payload,
+            rsp_payload_type):
+        tag = bytearray(payload)[0]
+        sdu = RmcpPlusMsg().pack(payload, payload_type)
+
+        future = _running_loop().create_future()
+        self._handshake = (rsp_payload_type, tag, future)
+        try:
+            rsp = await self._wait(future, lambda: self._send(sdu))
+        finally:
+            self._handshake = None
+
+        self.interface._check_payload_status(rsp)
+        return rsp
+
+    async def _send_and_receive(self, target, lun, netfn, cmdid, payload):
+        await self._slots.acquire()
+        try:
+            # skip sequence numbers of requests which are still pending
+            while True:
+                (header, tx_data) = self.interface._build_request(target,
+                        lun, netfn, cmdid, payload)
+                if header.rq_seq not in self._pending:
+                    break
+
+            future = _running_loop().create_future()
+            self._pending[header.rq_seq] = (header, future)
+            try:
+                rx_data = await self._wait(future, lambda: self._send(
+                        self.interface._pack_ipmi_msg(tx_data)))
+            finally:
+                del self._pending[header.rq_seq]
+        finally:
+            self._slots.release()
+
+        # strip IPMB header and checksum, keep completion code
+        return array_tobytes(rx_data[6:-1])
+
+    async def _send_and_receive_msg(self, req):
+        rx_data = await self._send_and_receive(None, req.lun, req.netfn,
+                req.cmdid, encode_message(req))
+        rsp = create_message(req.cmdid, req.netfn + 1)
+        decode_message(rsp, rx_data)
+        check_completion_code(rsp.completion_code)
+        return rsp
+
+    async def _send_and_receive_step(self, request):
+        if isinstance(request, tuple):
+            return await self._send_and_receive_payload(*request)
+        return await self._send_and_receive_msg(request)
+
+    async def send_and_receive_raw(self, target, lun, netfn, raw_bytes):
+        raw_bytes = py3enc_unic_bytes_fix(raw_bytes)
+        return await self._send_and_receive(target, lun, netfn,
+                raw_bytes[0], raw_bytes[1:])
+
+    async def send_and_receive(self, req):
+        log().debug('IPMI Request [%s]', req)
+
+        rx_data = await self._send_and_receive(req.target, req.lun,
+                req.netfn, req.cmdid, encode_message(req))
+        rsp = create_message(req.cmdid, req.netfn + 1)
+        decode_message(rsp, rx_data)
+
+        log().debug('IPMI Response [%s])', rsp)
+
+        return rsp
+
+
+class AsyncSession(Session):
+    async def establish(self):
+        if hasattr(self.interface, 'establish_session'):
+            await self.interface.establish_session(self)
+
+    async def close(self):
+        if hasattr(self.interface, 'close_session'):
+            await self.interface.close_session(self)
+
+
+class AsyncIpmi(object):
+    """The coroutine counterpart of `pyipmi.Ipmi`.
+
+    It provides the commonly used methods of the `Bmc`, `Chassis`, `Fru`,
+    `Sdr`, `Sel` and `Sensor` mixins. Methods which return a generator in
+    `Ipmi` return a list here.
+    """
+
+    def __init__(self):
+        self.interface = None
+        self.session = None
+        self.requester = None
+        self.target = None
+        # `cache.SdrCache` used by the SDR list methods
+        self.sdr_cache = None
+        # `helper.SdrReadSize` per repository and target
+        self._sdr_read_sizes = {}
+
+    async def send_message(self, req, retry=3):
+        req.target = self.target
+        req.requester = self.requester
+
+        while retry > 0:
+            retry -= 1
+            rsp = await self.interface.send_and_receive(req)
+            if rsp.completion_code != constants.CC_NODE_BUSY:
+                return rsp
+
+        raise RetryError()
+
+    async def send_message_with_name(self, name, **kwargs):
+        req = create_request_by_name(name)
+
+        for k, v in kwargs.items():
+            setattr(req, k, v)
+
+        rsp = await self.send_message(req)
+        check_completion_code(rsp.completion_code)
+        return rsp
+
+    async def send_message_batch(self, reqs, retry=3, skip_timeouts=False):
+        """Sends all requests concurrently and returns the responses in the
+        same order. The number of requests in flight is limited by the
+        window of the interface. See `pyipmi.Ipmi.send_message_batch` for
+        `skip_timeouts`.
+        """
+        async def send_message_or_none(req):
+            try:
+                return await self.send_message(req, retry)
+            except TimeoutError:
+                if not skip_timeouts:
+                    raise
+                return None
+
+        return await asyncio.gather(
+                *[send_message_or_none(req) for req in reqs])
+
+    async def raw_command(self, lun, netfn, raw_bytes):
+        return await self.interface.send_and_receive_raw(self.target, lun,
+                netfn, raw_bytes)
+
+    # Bmc
+
+    async def get_device_id(self):
+        return DeviceId(await self.send_message_with_name('GetDeviceId'))
+
+    async def cold_reset(self):
+        await self.send_message_with_name('ColdReset')
+
+    async def warm_reset(self):
+        await self.send_message_with_name('WarmReset')
+
+    async def get_watchdog_timer(self):
+        return Watchdog(await self.send_message_with_name('GetWatchdogTimer'))
+
+    async def reset_watchdog_timer(self):
+        await self.send_message_with_name('ResetWatchdogTimer')
+
+    # Chassis
+
+    async def get_chassis_status(self):
+        return ChassisStatus(
+                await self.send_message_with_name('GetChassisStatus'))
+
+    # Sensor
+
+    async def reserve_device_sdr_repository(self):
+        rsp = await self.send_message_with_name('ReserveDeviceSdrRepository')
+        return rsp.reservation_id
+
+    async def _get_device_sdr_chunk(self, reservation_id, record_id, offset,
+            length):
+        req = create_request_by_name('GetDeviceSdr')
+        req.reservation_id = reservation_id
+        req.record_id = record_id
+        req.offset = offset
+        req.bytes_to_read = length
+        rsp = await _run_steps(sdr_chunk_steps(req), self.send_message,
+                self.reserve_device_sdr_repository)
+        return (rsp.next_record_id, rsp.record_data)
+
+    async def get_device_sdr(self, record_id, reservation_id=None):
+        (next_id, record_data) = await self._get_sdr_data(
+                self.reserve_device_sdr_repository,
+                self._get_device_sdr_chunk, record_id, reservation_id,
+                self._sdr_read_size(DEVICE_SDR))
+        return SdrCommon.from_data(record_data, next_id)
+
+    async def get_device_sdr_list(self, reservation_id=None):
+        if self.sdr_cache is not None:
+            return await self._get_cached_sdr_list(DEVICE_SDR,
+                    'GetDeviceSdrInfo', self.sdr_cache.device_stamp,
+                    self._get_device_sdr_list, reservation_id)
+        return await self._get_device_sdr_list(reservation_id)
+
+    async def _get_device_sdr_list(self, reservation_id):
+        return await self._get_sdr_list('GetDeviceSdr',
+                self.reserve_device_sdr_repository, reservation_id,
+                self._sdr_read_size(DEVICE_SDR))
+
+    async def rearm_sensor_events(self, sensor_number):
+        await self.send_message_with_name('RearmSensorEvents',
+                sensor_number=sensor_number)
+
+    async def get_sensor_reading(self, sensor_number, lun=0):
+        rsp = await self.send_message_with_name('GetSensorReading',
+                sensor_number=sensor_number, lun=lun)
+        return sensor_reading_from_response(rsp)
+
+    async def get_sensor_readings(self, sensor_numbers, lun=0):
+        """See `Sensor.get_sensor_readings`."""
+        async def reading_or_error(sensor_number):
+            try:
+                return await self.get_sensor_reading(sensor_number, lun)
+            except CompletionCodeError as e:
+                return e
+
+        return await asyncio.gather(
+                *[reading_or_error(n) for n in sensor_numbers])
+
+    async def read_all_sensors(self, sdrs=None):
+        """See `Sensor.read_all_sensors`. The requests are sent
+        concurrently.
+        """
+        if sdrs is None:
+            sdrs = await self.get_device_sdr_list()
+        sdrs = [s for s in sdrs if is_readable_sensor(s)]
+
+        timestamp = time.time()
+        rsps = await self.send_message_batch(sensor_reading_requests(sdrs),
+                skip_timeouts=True)
+        return SensorSnapshot(sdrs, rsps, timestamp,
+                time.time() - timestamp)
+
+    # Sdr
+
+    async def get_sdr_repository_info(self):
+        return SdrRepositoryInfo(
+                await self.send_message_with_name('GetSdrRepositoryInfo'))
+
+    async def reserve_sdr_repository(self):
+        rsp = await self.send_message_with_name('ReserveSdrRepository')
+        return rsp.reservation_id
+
+    async def _get_repository_sdr_chunk(self, reservation_id, record_id,
+            offset, length):
+        req = create_request_by_name('GetSdr')
+        req.reservation_id = reservation_id
+        req.record_id = record_id
+        req.offset = offset
+        req.bytes_to_read = length
+        rsp = await _run_steps(sdr_chunk_steps(req), self.send_message,
+                self.reserve_sdr_repository)
+        return (rsp.next_record_id, rsp.record_data)
+
+    async def get_repository_sdr(self, record_id, reservation_id=None):
+        (next_id, record_data) = await self._get_sdr_data(
+                self.reserve_sdr_repository, self._get_repository_sdr_chunk,
+                record_id, reservation_id,
+                self._sdr_read_size(REPOSITORY_SDR))
+        return SdrCommon.from_data(record_data, next_id)
+
+    async def get_repository_sdr_list(self, reservation_id=None):
+        if self.sdr_cache is not None:
+            return await self._get_cached_sdr_list(REPOSITORY_SDR,
+                    'GetSdrRepositoryInfo', self.sdr_cache.repository_stamp,
+                    self._get_repository_sdr_list, reservation_id)
+        return await self._get_repository_sdr_list(reservation_id)
+
+    async def _get_repository_sdr_list(self, reservation_id):
+        return await self._get_sdr_list('GetSdr', self.reserve_sdr_repository,
+                reservation_id, self._sdr_read_size(REPOSITORY_SDR))
+
+    async def _get_cached_sdr_list(self, repository, info_name, stamp_fn,
+            list_fn, reservation_id):
+        """See `cache.SdrCache.entries`."""
+        key = self.sdr_cache.key(
+                await self.send_message_with_name('GetDeviceId'), repository,
+                getattr(self.target, 'ipmb_address', None),
+                *self.sdr_cache.address(self))
+        stamp = stamp_fn(await self.send_message_with_name(info_name))
+
+        sdrs = self.sdr_cache.load(key, stamp)
+        if sdrs is None:
+            read_size = self._sdr_read_size(repository)
+            self.sdr_cache.load_read_size(key, read_size)
+            sdrs = await list_fn(reservation_id)
+            self.sdr_cache.store(key, stamp, sdrs, read_size)
+        return sdrs
+
+    async def _get_sdr_list(self, name, reserve_fn, reservation_id,
+            read_size):
+        """See `helper.walk_sdr_helper`."""
+        async def read_batch(batch):
+            (reservation_id, reads) = batch
+            return sdr_read_results(await self.send_message_batch(
+                    sdr_read_requests(name, reservation_id, reads)))
+
+        walker = SdrWalker(read_size)
+        await _run_steps(walker.steps(reservation_id), read_batch, reserve_fn)
+        return [SdrCommon.from_data(record_data, next_id)
+                for (next_id, record_data) in walker.completed()]
+
+    async def _get_sdr_data(self, reserve_fn, get_fn, record_id,
+            reservation_id=None, read_size=None):
+        """See `helper.get_sdr_data_helper`."""
+        reader = SdrRecordReader(record_id, read_size)
+        return await _run_steps(reader.steps(reservation_id),
+                lambda read: get_fn(*read), reserve_fn)
+
+    def _sdr_read_size(self, repository):
+        """See `Sdr._sdr_read_size`."""
+        key = (repository, getattr(self.target, 'ipmb_address', None))
+        if key not in self._sdr_read_sizes:
+            self._sdr_read_sizes[key] = SdrReadSize()
+        return self._sdr_read_sizes[key]
+
+    # Sel
+
+    async def get_sel_entries_count(self):
+        rsp = await self.send_message_with_name('GetSelInfo')
+        return rsp.entries
+
+    async def get_sel_reservation_id(self):
+        rsp = await self.send_message_with_name('ReserveSel')
+        return rsp.reservation_id
+
+    async def _get_sel_entry(self, reservation_id, record_id):
+        """See `Sel._get_sel_entry`."""
+        return await _run_steps(sel_entry_steps(reservation_id, record_id),
+                self.send_message)
+
+    async def get_sel_entries(self):
+        if await self.get_sel_entries_count() == 0:
+            return []
+        reservation_id = await self.get_sel_reservation_id()
+
+        entries = []
+        next_record_id = 0
+        while True:
+            (next_record_id, record_data) = await self._get_sel_entry(
+                    reservation_id, next_record_id)
+            entries.append(SelEntry(record_data))
+            if next_record_id == 0xffff:
+                break
+        return entries
+
+    # Fru
+
+    async def get_fru_inventory_area_info(self, fru_id=0):
+        rsp = await self.send_message_with_name('GetFruInventoryAreaInfo',
+                fru_id=fru_id)
+        return rsp.area_size
+
+    async def read_fru_data(self, offset=None, count=None, fru_id=0):
+        """See `Fru.read_fru_data`."""
+        return await _run_steps(fru_read_steps(offset, count, fru_id),
+                self.send_message)
+
+    async def get_fru_inventory(self, fru_id=0):
+        return FruInventory(await self.read_fru_data(fru_id=fru_id))
+
+
+class AsyncFleet(object):
+    """The asyncio counterpart of `pyipmi.fleet.Fleet` for the native LAN
+    interfaces.
+
+    All hosts are handled by one event loop. At most `max_concurrency`
+    sessions are open at the same time and at most `max_per_host` to the
+    same host. `window` is the number of requests in flight per session.
+    A host which takes longer than `deadline` seconds is cancelled and
+    reported with a `TimeoutError`.
+    """
+
+    def __init__(self, hosts, user='', password='', interface='rmcp',
+            interface_options=None, target_address=0x20,
+            max_concurrency=1000, max_per_host=1, deadline=None, window=1):
+        if max_concurrency < 1 or max_per_host < 1:
+            raise RuntimeError('concurrency limits must be at least 1')
+        self.hosts = [host_and_port(host) for host in hosts]
+        self.user = user
+        self.password = password
+        self.interface = interface
+        self.interface_options = interface_options or {}
+        self.target_address = target_address
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.deadline = deadline
+        self.window = window
+
+    def as_completed(self, fn, *args, **kwargs):
+        """Calls the coroutine function `fn(ipmi, *args, **kwargs)` for each
+        host.
+
+        Returns an iterator of awaitables like `asyncio.as_completed`, each
+        of them returns the `FleetResult` of the next finished host. This
+        has to be called from a coroutine.
+        """
+        limit = asyncio.Semaphore(self.max_concurrency)
+        host_limits = {}
+        for host in self.hosts:
+            if host not in host_limits:
+                host_limits[host] = asyncio.Semaphore(self.max_per_host)
+
+        return asyncio.as_completed([self._run(index, host, limit,
+                host_limits[host], fn, args, kwargs)
+                for (index, host) in enumerate(self.hosts)])
+
+    async def run_all(self, fn, *args, **kwargs):
+        """Like `as_completed` but returns the results as list in the order
+        of the hosts.
+        """
+        results = [None] * len(self.hosts)
+        for future in self.as_completed(fn, *args, **kwargs):
+            result = await future
+            results[result.index] = result
+        return results
+
+    async def _run(self, index, host, limit, host_limit, fn, args, kwargs):
+        async with limit:
+            async with host_limit:
+                start = time.time()
+                result = None
+                error = None
+                try:
+                    result = await asyncio.wait_for(self._call(host, fn,
+                            args, kwargs), self.deadline)
+                except asyncio.TimeoutError:
+                    error = TimeoutError()
+                except Exception as e:
+                    error = e
+                return FleetResult(index, host[0], host[1], result, error,
+                        time.time() - start)
+
+    async def _call(self, host, fn, args, kwargs):
+        interface = create_interface(self.interface, window=self.window,
+                **self.interface_options)
+        ipmi = create_connection(interface)
+        ipmi.target = Target(self.target_address)
+        ipmi.session.set_session_type_rmcp(host[0], host[1])
+        ipmi.session.set_auth_type_user(self.user, self.password)
+        try:
+            await ipmi.session.establish()
+            try:
+                result = await fn(ipmi, *args, **kwargs)
+            except Exception:
+                await ipmi.session.close()
+                raise
+            await ipmi.session.close()
+            return result
+        finally:
+            # drops the socket if the call was cancelled
+            interface._close()
+
+
+class AsyncSensorPoller(BasePoller):
+    """The asyncio counterpart of `pyipmi.poller.SensorPoller`.
+
+    The targets are read with `AsyncIpmi` connections, all of them by one
+    event loop. `callback(target, snapshot)` may be a coroutine function.
+    """
+
+    def __init__(self, callback, rate=10.0, burst=None, jitter=None,
+            error_callback=None, rnd=None, clock=time.time):
+        BasePoller.__init__(self, callback, rate, burst, jitter, rnd, clock)
+        self.error_callback = error_callback
+        self._stopped = None
+        self._tasks = set()
+
+    async def poll(self, target, records):
+        """See `SensorPoller.poll`."""
+        connection = self._target(target)
+        if connection is None:
+            return None
+        (ipmi, bucket) = connection
+        timestamp = self._clock()
+        rsps = []
+        for (delay, chunk) in self._chunks(bucket, records):
+            if delay > 0:
+                await asyncio.sleep(delay)
+            rsps.extend(await ipmi.send_message_batch(
+                    sensor_reading_requests(chunk), skip_timeouts=True))
+        return SensorSnapshot(records, rsps, timestamp,
+                self._clock() - timestamp)
+
+    async def _poll(self, target, records):
+        try:
+            snapshot = await self.poll(target, records)
+        except Exception as e:
+            log().warning('poller: reading %s failed: %r', target, e)
+            if self.error_callback is not None:
+                self.error_callback(target, e)
+            return
+        finally:
+            self._busy.discard(target)
+        if snapshot is None:
+            return
+        result = self.callback(target, snapshot)
+        if asyncio.iscoroutine(result):
+            await result
+
+    def _start_due(self, now):
+        with self._lock:
+            due = self.schedule.due(now)
+        for (target, records) in due:
+            if target in self._busy:
+                log().debug('poller: %s is busy, skipping %d sensors',
+                        target, len(records))
+                continue
+            self._busy.add(target)
+            task = asyncio.ensure_future(self._poll(target, records))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def run_pending(self, now=None):
+        """Reads all sensors which are due and waits for them."""
+        self._start_due(self._clock() if now is None else now)
+        if self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    async def run(self):
+        """Polls until `stop` is called, then waits for the batches being
+        read.
+        """
+        self._stopped = asyncio.Event()
+        while not self._stopped.is_set():
+            self._start_due(self._clock())
+            next_time = self._next_time()
+            delay = 1.0
+            if next_time is not None:
+                delay = min(max(next_time - self._clock(), 0), delay)
+            try:
+                await asyncio.wait_for(self._stopped.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        if self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    def stop(self):
+        if self._stopped is not None:
+            self._stopped.set()
@@ -0,0 +1,287 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""A persistent cache for SDR records.
+
+Example:
+
+    ipmi.sdr_cache = pyipmi.cache.SdrCache('~/.cache/pyipmi')
+    for s in ipmi.sdr_repository_entries():
+        print(s)
+"""
+
+from builtins import object
+
+import binascii
+import json
+import os
+import re
+import tempfile
+import threading
+
+from array import array
+
+from .helper import REPOSITORY_SDR, DEVICE_SDR
+from .logger import log
+from .sdr import SdrCommon
+
+
+def _record_bytes(s):
+    return bytes(bytearray(s.data[:]))
+
+
+def _replace(src, dst):
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+class SdrCache(object):
+    """Keeps the SDR records of a BMC across connections.
+
+    The records are stored per BMC model and firmware, as reported by
+    Get Device ID, per host and port of the session, as hosts of the same
+    model can have different records, and per IPMB address of the target.
+    Each entry is
+    stored together with a stamp of the repository, which is built from
+    Get SDR Repository Info (most recent addition and erase timestamps)
+    or Get Device SDR Info (sensor population change indicator). The
+    cached records are only used as they are if the stamp is unchanged.
+    If the stamp has changed, they can be updated with the records which
+    have changed, see `entries`.
+
+    The `helper.SdrReadSize` learned while reading the records is stored
+    as well. It is used as starting point if the records have to be read
+    again.
+
+    If `directory` is None, the records are kept in memory only.
+    Otherwise each entry is written as JSON file into the directory.
+    """
+
+    VERSION = 1
+
+    def __init__(self, directory=None):
+        if directory is not None:
+            directory = os.path.expanduser(directory)
+        self.directory = directory
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(device_id_rsp, repository, target_address=None, host=None,
+            port=None):
+        """Returns the cache key for the repository of a BMC.
+
+        `device_id_rsp` is the Get Device ID response of the BMC and
+        `repository` one of REPOSITORY_SDR and DEVICE_SDR. `host` and
+        `port` are the address of the BMC, see `address`.
+        """
+        rsp = device_id_rsp
+        parts = [repository,
+                '%06x' % rsp.manufacturer_id,
+                '%04x' % rsp.product_id,
+                '%02x' % rsp.device_id,
+                '%x' % rsp.device_revision.device_revision,
+                '%x.%02x' % (rsp.firmware_revision.major,
+                        rsp.firmware_revision.minor)]
+        if rsp.auxiliary is not None:
+            parts.append(''.join('%02x' % b for b in rsp.auxiliary))
+        if host is not None:
+            # the key is used as file name
+            parts.append(re.sub(r'[^0-9A-Za-z.]', '_', str(host)))
+            if port is not None:
+                parts.append('%d' % port)
+        if target_address is not None:
+            parts.append('%02x' % target_address)
+        return '-'.join(parts)
+
+    @staticmethod
+    def address(ipmi):
+        """Returns the tuple of host and port of the RMCP session of
+        `ipmi`, or (None, None) for other sessions.
+        """
+        session = getattr(ipmi, 'session', None)
+        return (getattr(session, '_rmcp_host', None),
+                getattr(session, '_rmcp_port', None))
+
+    @staticmethod
+    def repository_stamp(info_rsp):
+        """Returns the stamp of a Get SDR Repository Info response."""
+        return [info_rsp.record_count, info_rsp.most_recent_addition,
+                info_rsp.most_recent_erase]
+
+    @staticmethod
+    def device_stamp(info_rsp):
+        """Returns the stamp of a Get Device SDR Info response."""
+        return [info_rsp.number_of_sensors, info_rsp.flags._value,
+                info_rsp.sensor_population_change]
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _read(self, key):
+        if self.directory is None:
+            return self._entries.get(key)
+
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError) as e:
+            log().debug('sdr cache: can not read %s: %s', key, e)
+            return None
+
+        if entry.get('version') != self.VERSION:
+            return None
+        return entry
+
+    def _write(self, key, entry):
+        if self.directory is None:
+            self._entries[key] = entry
+            return
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        (fd, tmp) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            _replace(tmp, self._path(key))
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def load(self, key, stamp=None):
+        """Returns the cached records or None if there is no entry or the
+        repository has changed. If `stamp` is None, the records are
+        returned even if the repository has changed.
+        """
+        with self._lock:
+            entry = self._read(key)
+
+        if entry is None:
+            return None
+        if stamp is not None and entry['stamp'] != list(stamp):
+            return None
+
+        return [SdrCommon.from_data(
+                array('B', binascii.unhexlify(data.encode('ascii'))),
+                next_id) for (next_id, data) in entry['records']]
+
+    def load_read_size(self, key, read_size):
+        """Restores the `SdrReadSize` stored with the entry, unless it
+        has already learned the sizes of the target.
+        """
+        if read_size.learned:
+            return
+
+        with self._lock:
+            entry = self._read(key)
+
+        if entry is not None and entry.get('read_size') is not None:
+            read_size.restore(entry['read_size'])
+
+    def store(self, key, stamp, records, read_size=None):
+        """Stores the complete list of SDR records of a repository."""
+        entry = {
+            'version': self.VERSION,
+            'stamp': list(stamp),
+            'records': [[s.next_id,
+                    binascii.hexlify(_record_bytes(s)).decode('ascii')]
+                    for s in records],
+        }
+        if read_size is not None:
+            entry['read_size'] = read_size.state()
+        with self._lock:
+            self._write(key, entry)
+
+    def invalidate(self, key):
+        """Removes an entry from the cache."""
+        with self._lock:
+            self._entries.pop(key, None)
+            if self.directory is not None and \
+                    os.path.exists(self._path(key)):
+                os.remove(self._path(key))
+
+    @staticmethod
+    def _target_address(ipmi):
+        return getattr(getattr(ipmi, 'target', None), 'ipmb_address', None)
+
+    def repository_entries(self, ipmi, fetch_fn, read_size=None,
+            sync_fn=None):
+        """Generator which returns the SDR repository records of the BMC
+        connected by `ipmi`, see `entries`.
+        """
+        key = self.key(ipmi.send_message_with_name('GetDeviceId'),
+                REPOSITORY_SDR, self._target_address(ipmi),
+                *self.address(ipmi))
+        stamp = self.repository_stamp(
+                ipmi.send_message_with_name('GetSdrRepositoryInfo'))
+        return self.entries(key, stamp, fetch_fn, read_size, sync_fn)
+
+    def device_entries(self, ipmi, fetch_fn, read_size=None, sync_fn=None):
+        """Generator which returns the device SDR records of the target
+        of `ipmi`, see `entries`.
+        """
+        key = self.key(ipmi.send_message_with_name('GetDeviceId'),
+                DEVICE_SDR, self._target_address(ipmi),
+                *self.address(ipmi))
+        stamp = self.device_stamp(
+                ipmi.send_message_with_name('GetDeviceSdrInfo'))
+        return self.entries(key, stamp, fetch_fn, read_size, sync_fn)
+
+    def entries(self, key, stamp, fetch_fn, read_size=None, sync_fn=None):
+        """Generator which returns the cached records.
+
+        If the cache has no valid entry, the records are read with the
+        generator function `fetch_fn` instead and stored, once all of them
+        have been read. `read_size` is the `SdrReadSize` used by
+        `fetch_fn`.
+
+        If the repository has changed and `sync_fn` is given, it is called
+        with the outdated records instead of `fetch_fn` and returns the
+        current records, e.g. by reading only the records which have
+        changed.
+        """
+        records = self.load(key, stamp)
+        if records is not None:
+            log().debug('sdr cache: using %d records of %s',
+                    len(records), key)
+            for s in records:
+                yield s
+            return
+
+        if read_size is not None:
+            self.load_read_size(key, read_size)
+
+        if sync_fn is not None:
+            records = self.load(key)
+            if records is not None:
+                log().debug('sdr cache: updating %d records of %s',
+                        len(records), key)
+                records = sync_fn(records)
+                self.store(key, stamp, records, read_size)
+                for s in records:
+                    yield s
+                return
+
+        records = []
+        for s in fetch_fn():
+            records.append(s)
+            yield s
+        self.store(key, stamp, records, read_size)
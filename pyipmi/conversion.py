@@ -0,0 +1,126 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Converts many raw sensor readings at once with NumPy.
+
+This module needs the optional `numpy` package. The conversion is the
+same as `SdrFullSensorRecord.convert_sensor_raw_to_value`, except that
+readings which can not be converted are NaN instead of raising an error.
+
+Example:
+
+    sdrs = [s for s in ipmi.device_sdr_entries()
+            if isinstance(s, pyipmi.sdr.SdrFullSensorRecord)]
+    raw = [ipmi.get_sensor_reading(s.number)[0] for s in sdrs]
+    values = pyipmi.conversion.convert_sensor_readings(raw, sdrs)
+"""
+
+from .errors import DecodingError
+from .sdr import SdrFullSensorRecord, L_LINEAR, L_LN, L_LOG, L_LOG2, L_E, \
+        L_EXP10, L_EXP2, L_1_X, L_SQR, L_CUBE, L_SQRT, L_CUBERT
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _linearizations():
+    return {
+        L_LINEAR: lambda x: x,
+        L_LN:     numpy.log,
+        L_LOG:    numpy.log10,
+        L_LOG2:   numpy.log2,
+        L_E:      numpy.exp,
+        L_EXP10:  lambda x: numpy.power(10.0, x),
+        L_EXP2:   numpy.exp2,
+        L_1_X:    numpy.reciprocal,
+        L_SQR:    numpy.square,
+        L_CUBE:   lambda x: numpy.power(x, 3),
+        L_SQRT:   numpy.sqrt,
+        L_CUBERT: lambda x: numpy.power(x, 1.0/3),
+    }
+
+
+def _check_numpy():
+    if numpy is None:
+        raise RuntimeError('No numpy module found. You can not use the '
+                'vectorized conversion.')
+
+
+def conversion_parameters(sdrs):
+    """Returns the conversion parameters of a list of full sensor records
+    as dict of arrays, which can be passed to `convert_raw_to_values`.
+    """
+    _check_numpy()
+    return {
+        'm': numpy.array([s.m for s in sdrs], dtype=numpy.float64),
+        'b': numpy.array([s.b for s in sdrs], dtype=numpy.float64),
+        'k1': numpy.array([s.k1 for s in sdrs], dtype=numpy.float64),
+        'k2': numpy.array([s.k2 for s in sdrs], dtype=numpy.float64),
+        'linearization': numpy.array([s.linearization for s in sdrs],
+                dtype=numpy.int64),
+        'analog_data_format': numpy.array(
+                [s.analog_data_format for s in sdrs], dtype=numpy.int64),
+    }
+
+
+def convert_raw_to_values(raw, m, b, k1, k2, linearization,
+        analog_data_format=SdrFullSensorRecord.DATA_FMT_UNSIGNED):
+    """Converts raw readings with the conversion parameters of their
+    sensors.
+
+    All arguments are arrays (or scalars) which are broadcast against each
+    other, e.g. `raw` may contain several samples per sensor in its last
+    axis. Returns an array of floats.
+    """
+    _check_numpy()
+    raw = numpy.asarray(raw, dtype=numpy.int64)
+    fmt = numpy.asarray(analog_data_format)
+    linearization = numpy.asarray(linearization) & 0x7f
+
+    unknown = numpy.setdiff1d(numpy.unique(linearization),
+            list(_linearizations()))
+    if len(unknown):
+        raise DecodingError('unknown linearization %d' % unknown[0])
+
+    negative = (raw & 0x80) != 0
+    ones = -((raw & 0x7f) ^ 0x7f)
+    x = numpy.where(negative
+            & (fmt == SdrFullSensorRecord.DATA_FMT_1S_COMPLEMENT), ones, raw)
+    x = numpy.where(negative
+            & (fmt == SdrFullSensorRecord.DATA_FMT_2S_COMPLEMENT), ones - 1, x)
+
+    with numpy.errstate(all='ignore'):
+        y = (m * x.astype(numpy.float64) + b * numpy.power(10.0, k1)) \
+                * numpy.power(10.0, k2)
+        (y, linearization) = numpy.broadcast_arrays(y, linearization)
+        values = numpy.full(y.shape, numpy.nan)
+        for (code, fn) in _linearizations().items():
+            mask = linearization == code
+            if mask.any():
+                values[mask] = fn(y[mask])
+        # math errors of the scalar conversion
+        values[~numpy.isfinite(values)] = numpy.nan
+
+    return values
+
+
+def convert_sensor_readings(raw, sdrs):
+    """Converts the raw readings of a list of full sensor records. The last
+    axis of `raw` corresponds to `sdrs`.
+    """
+    return convert_raw_to_values(raw, **conversion_parameters(sdrs))
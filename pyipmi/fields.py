@@ -4,8 +4,12 @@
 #from builtins import object
 
 import array
+import codecs
 
 from .errors import DecodingError
+from .utils import array_tobytes, bcd_search
+
+codecs.register(bcd_search)
 
 class VersionField(object):
     """This class represent the Version fields defines by IPMI.
@@ -41,7 +45,7 @@ class VersionField(object):
         if data[1] is 0xff:
             self.minor = data[1]
         elif data[1] <= 0x99:
-            self.minor = int(data[1:2].tostring().decode('bcd+'))
+            self.minor = int(array_tobytes(data[1:2]).decode('bcd+'))
         else:
             raise DecodingError()
 
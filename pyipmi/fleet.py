@@ -0,0 +1,260 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Runs the same operation against many BMCs.
+
+Example:
+
+    fleet = pyipmi.fleet.Fleet(['10.0.0.1', '10.0.0.2'], 'admin', 'admin',
+            interface='rmcpplus', max_workers=64, deadline=30)
+    def chassis_status(ipmi):
+        return ipmi.get_chassis_status()
+
+    for result in fleet.run(chassis_status):
+        print(result.host, result.error or result.result)
+"""
+
+from builtins import object
+
+import collections
+import multiprocessing
+import threading
+import time
+
+from queue import Queue, Empty
+
+from . import create_connection, Target
+from . import interfaces
+from .errors import TimeoutError
+
+DEFAULT_PORT = 623
+
+
+def host_and_port(host):
+    """Returns the tuple of host and port of a host given by name or as
+    tuple of name and port.
+    """
+    if isinstance(host, tuple):
+        return host
+    return (host, DEFAULT_PORT)
+
+
+class FleetResult(object):
+    """The outcome of an operation on one host.
+
+    `index` is the position of the host in the host list. `result` is the
+    return value of the operation and `error` is the exception it raised,
+    if any. A `TimeoutError` is reported if the host exceeded its
+    deadline. `duration` is the time in seconds.
+    """
+
+    def __init__(self, index, host, port, result=None, error=None,
+            duration=0):
+        self.index = index
+        self.host = host
+        self.port = port
+        self.result = result
+        self.error = error
+        self.duration = duration
+
+    def __str__(self):
+        if self.error is not None:
+            return '%s:%d failed: %r' % (self.host, self.port, self.error)
+        return '%s:%d: %s' % (self.host, self.port, self.result)
+
+
+def _call(options, host, port, fn, args, kwargs):
+    """Connects to the BMC, calls `fn` with the connection and closes the
+    session again. Returns a tuple of result and error.
+
+    This is a module level function, so it can be run in a process pool.
+    """
+    try:
+        interface = interfaces.create_interface(options['interface'],
+                **options['interface_options'])
+        ipmi = create_connection(interface)
+        ipmi.target = Target(options['target_address'])
+        ipmi.session.set_session_type_rmcp(host, port)
+        ipmi.session.set_auth_type_user(options['user'],
+                options['password'])
+        ipmi.session.establish()
+        try:
+            return (fn(ipmi, *args, **kwargs), None)
+        finally:
+            ipmi.session.close()
+    except Exception as e:
+        return (None, e)
+
+
+class Fleet(object):
+    """Runs an operation against many BMCs with bounded concurrency.
+
+    `hosts` is a list of host names or tuples of host name and port.
+    Each host gets its own connection, created with the interface
+    `interface` and the keyword arguments `interface_options`.
+
+    At most `max_workers` hosts are handled at the same time and at most
+    `max_per_host` at once for a host listed several times, because BMCs
+    only support a few sessions. The operations run in threads, or in
+    processes if `use_processes` is set. In that case the operation and
+    its result must be picklable.
+
+    A host which takes longer than `deadline` seconds is reported with a
+    `TimeoutError`. The operation is not interrupted, but its result is
+    discarded. It still counts against `max_workers` and `max_per_host`
+    until it has finished, because its session is still open. If only such
+    operations are left and they block the remaining hosts for another
+    `deadline` seconds, the remaining hosts are reported with a
+    `TimeoutError` without being started.
+    """
+
+    def __init__(self, hosts, user='', password='', interface='rmcp',
+            interface_options=None, target_address=0x20, max_workers=32,
+            max_per_host=1, deadline=None, use_processes=False):
+        if max_workers < 1 or max_per_host < 1:
+            raise RuntimeError('concurrency limits must be at least 1')
+        self.hosts = [host_and_port(host) for host in hosts]
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.deadline = deadline
+        self.use_processes = use_processes
+        self._options = {
+            'interface': interface,
+            'interface_options': interface_options or {},
+            'target_address': target_address,
+            'user': user,
+            'password': password,
+        }
+
+    def _start_thread(self, results, index, host, fn, args, kwargs):
+        def run():
+            (result, error) = _call(self._options, host[0], host[1], fn,
+                    args, kwargs)
+            results.put((index, result, error))
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def _start_process(self, pool, results, index, host, fn, args, kwargs):
+        def done(value):
+            results.put((index, value[0], value[1]))
+
+        def failed(error):
+            # e.g. the operation or its result could not be pickled
+            results.put((index, None, error))
+
+        pool.apply_async(_call, (self._options, host[0], host[1], fn, args,
+                kwargs), callback=done, error_callback=failed)
+
+    def run(self, fn, *args, **kwargs):
+        """Calls `fn(ipmi, *args, **kwargs)` for each host.
+
+        Returns a generator which yields a `FleetResult` for each host as
+        soon as the host is finished.
+        """
+
+        results = Queue()
+        waiting = collections.deque(enumerate(self.hosts))
+        # index -> (host, start time)
+        running = {}
+        # index -> host, for jobs reported as timed out but still running
+        expired = {}
+        host_count = collections.defaultdict(int)
+
+        pool = None
+        if self.use_processes:
+            pool = multiprocessing.Pool(self.max_workers)
+
+        try:
+            while waiting or running:
+                for _ in range(len(waiting)):
+                    if len(running) + len(expired) >= self.max_workers:
+                        break
+                    (index, host) = waiting.popleft()
+                    if host_count[host] >= self.max_per_host:
+                        waiting.append((index, host))
+                        continue
+
+                    host_count[host] += 1
+                    running[index] = (host, time.time())
+                    if pool is not None:
+                        self._start_process(pool, results, index, host, fn,
+                                args, kwargs)
+                    else:
+                        self._start_thread(results, index, host, fn, args,
+                                kwargs)
+
+                timeout = None
+                if self.deadline is not None and running:
+                    first_start = min(start for (_, start) in
+                            running.values())
+                    timeout = max(0, first_start + self.deadline
+                            - time.time())
+                elif self.deadline is not None:
+                    # the waiting hosts are blocked by operations which
+                    # have timed out and may never finish
+                    timeout = self.deadline
+
+                try:
+                    (index, result, error) = results.get(timeout=timeout)
+                except Empty:
+                    if running:
+                        expired_results = self._expire(running, expired)
+                    else:
+                        expired_results = self._expire_waiting(waiting)
+                    for result in expired_results:
+                        yield result
+                    continue
+
+                # the host has already been reported as timed out, only
+                # release its slot now that the operation has finished
+                if index in expired:
+                    host = expired.pop(index)
+                    host_count[host] -= 1
+                    continue
+
+                (host, start) = running.pop(index)
+                host_count[host] -= 1
+                yield FleetResult(index, host[0], host[1], result, error,
+                        time.time() - start)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def _expire(self, running, expired):
+        now = time.time()
+        for (index, (host, start)) in list(running.items()):
+            if now - start < self.deadline:
+                continue
+            del running[index]
+            expired[index] = host
+            yield FleetResult(index, host[0], host[1], None, TimeoutError(),
+                    now - start)
+
+    def _expire_waiting(self, waiting):
+        while waiting:
+            (index, host) = waiting.popleft()
+            yield FleetResult(index, host[0], host[1], None, TimeoutError())
+
+    def run_all(self, fn, *args, **kwargs):
+        """Like `run` but returns the results as list in the order of the
+        hosts.
+        """
+        results = [None] * len(self.hosts)
+        for result in self.run(fn, *args, **kwargs):
+            results[result.index] = result
+        return results
@@ -24,8 +24,9 @@ import codecs
 import datetime
 
 from .errors import DecodingError, CompletionCodeError
-from .msgs import constants
-from .utils import bcd_search, chunks
+from .helper import run_steps, Done
+from .msgs import constants, create_request_by_name
+from .utils import bcd_search, chunks, array_tobytes, check_completion_code
 
 codecs.register(bcd_search)
 
@@ -52,46 +53,58 @@ class Fru(object):
             offset += len(chunk)
 
     def read_fru_data(self, offset=None, count=None, fru_id=0):
-        #off = 0
-        #area_size = 0
-        req_size = 32
-        data = array.array('B')
-
-        # first check for maximum area size
-        if offset is None:
-            area_size = self.get_fru_inventory_area_info(fru_id)
-            off = 0
-        else:
-            area_size = offset + count
-            off = offset
-
-        while off < area_size:
-            if (off + req_size) > area_size:
-                req_size = area_size - off
-
-            try:
-                rsp = self.send_message_with_name('ReadFruData',
-                            fru_id=fru_id, offset=off, count=req_size)
-            except CompletionCodeError as e:
-                if e.cc in (constants.CC_CANT_RET_NUM_REQ_BYTES,
-                            constants.CC_REQ_DATA_FIELD_EXCEED,
-                            constants.CC_PARAM_OUT_OF_RANGE):
-                    req_size -= 2
-                    if req_size <= 0:
-                        raise
-                    continue
-                else:
-                    raise
-
-            data.extend(rsp.data)
-            off += rsp.count
-
-        return data.tostring()
+        return run_steps(fru_read_steps(offset, count, fru_id),
+                self.send_message)
 
     def get_fru_inventory(self, fru_id=0):
         return FruInventory(self.read_fru_data(fru_id=fru_id))
 
 
+def fru_read_steps(offset=None, count=None, fru_id=0):
+    """Request generator which reads `count` bytes of FRU data at `offset`,
+    or the entire FRU inventory area, see `helper.run_steps`.
+
+    The data is read in chunks of 32 bytes, which are made smaller if the
+    target rejects them.
+    """
+    req_size = 32
+    data = array.array('B')
+
+    # first check for maximum area size
+    if offset is None:
+        req = create_request_by_name('GetFruInventoryAreaInfo')
+        req.fru_id = fru_id
+        rsp = yield req
+        check_completion_code(rsp.completion_code)
+        area_size = rsp.area_size
+        off = 0
+    else:
+        area_size = offset + count
+        off = offset
+
+    while off < area_size:
+        if (off + req_size) > area_size:
+            req_size = area_size - off
+
+        req = create_request_by_name('ReadFruData')
+        req.fru_id = fru_id
+        req.offset = off
+        req.count = req_size
+        rsp = yield req
+        if rsp.completion_code in (constants.CC_CANT_RET_NUM_REQ_BYTES,
+                    constants.CC_REQ_DATA_FIELD_EXCEED,
+                    constants.CC_PARAM_OUT_OF_RANGE):
+            req_size -= 2
+            if req_size > 0:
+                continue
+        check_completion_code(rsp.completion_code)
+
+        data.extend(rsp.data)
+        off += rsp.count
+
+    yield Done(array_tobytes(data))
+
+
 class FruDataField(object):
     TYPE_BINARY = 0
     TYPE_BCD_PLUS = 1
@@ -335,9 +348,9 @@ class FruPicmgRecord(FruDataMultiRecord):
         if len(data) < 10:
             raise DecodingError('data too short')
         FruDataMultiRecord._from_data(self, data)
-        self.manufacturer_id = ord(data[5]) | ord(data[6]) << 8 | ord(data[7]) << 16
-        self.picmg_record_type_id = ord(data[8])
-        self.format_version = ord(data[9])
+        self.manufacturer_id = data[5] | data[6] << 8 | data[7] << 16
+        self.picmg_record_type_id = data[8]
+        self.format_version = data[9]
 
 
 class FruPicmgPowerModuleCapabilityRecord(FruPicmgRecord):
@@ -345,7 +358,7 @@ class FruPicmgPowerModuleCapabilityRecord(FruPicmgRecord):
         if len(data) < 12:
             raise DecodingError('data too short')
         FruPicmgRecord._from_data(self, data)
-        maximum_current_output = ord(data[10]) | ord(data[11]) << 8
+        maximum_current_output = data[10] | data[11] << 8
         self.maximum_current_output = float(maximum_current_output/10)
 
 
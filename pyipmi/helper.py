@@ -20,86 +20,591 @@ import time
 
 from .errors import DecodingError, CompletionCodeError, RetryError
 from .utils import check_completion_code, ByteBuffer
-from .msgs import constants
+from .msgs import constants, create_request_by_name
 
 #from . import sdr #unused
 
-def get_sdr_chunk_helper(send_fn, req, reserve_fn, retry=5):
 
+# Steps of the request generators. A request generator yields the
+# requests of an operation and gets the responses sent back, like the
+# session setup of the LAN interfaces. This way the blocking mixins and
+# the asyncio front-end share the same logic and only run the steps
+# differently.
+
+class Delay(object):
+    """Step which asks the caller to wait `seconds`."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+
+class Done(object):
+    """Last step of a request generator, `value` is its result."""
+
+    def __init__(self, value):
+        self.value = value
+
+
+# step which asks the caller for a new reservation id
+RESERVE = 'reserve'
+
+
+def next_step(steps, result=None, error=None):
+    """Sends the result of the last step into the request generator
+    `steps`, or throws its `error` into it, and returns the next step. A
+    generator which is finished returns a `Done` step.
+
+    This is the part of running the steps which is shared by `run_steps`
+    and its asyncio counterpart.
+    """
+    try:
+        if error is not None:
+            step = steps.throw(error)
+        else:
+            step = steps.send(result)
+    except StopIteration:
+        return Done(None)
+    if isinstance(step, Done):
+        steps.close()
+    return step
+
+
+def run_step(step, send_fn, reserve_fn, sleep_fn=time.sleep):
+    """Runs a step other than `Done` and returns its result.
+
+    If `send_fn`, `reserve_fn` and `sleep_fn` are coroutine functions,
+    the returned awaitable has to be awaited.
+    """
+    if isinstance(step, Delay):
+        return sleep_fn(step.seconds)
+    elif step is RESERVE:
+        return reserve_fn()
+    return send_fn(step)
+
+
+def run_steps(steps, send_fn, reserve_fn=None):
+    """Runs the request generator `steps` and returns the value of its
+    `Done` step, or None.
+
+    `send_fn` is called with each step other than `Delay`, `Done` and
+    `RESERVE` and its return value is sent back into the generator. For
+    `RESERVE`, the return value of `reserve_fn` is sent back. A
+    `CompletionCodeError` raised by a step is thrown into the generator.
+    """
+    step = next_step(steps)
+    while not isinstance(step, Done):
+        (result, error) = (None, None)
+        try:
+            result = run_step(step, send_fn, reserve_fn)
+        except CompletionCodeError as e:
+            error = e
+        step = next_step(steps, result, error)
+    return step.value
+
+
+def sdr_chunk_steps(req, retry=5):
+    """Request generator which sends the Get SDR or Get Device SDR request
+    `req` until it succeeds, see `run_steps`.
+    """
     while True:
         retry -= 1
         if retry == 0:
             raise RetryError()
-        rsp = send_fn(req)
+        rsp = yield req
         if rsp.completion_code == constants.CC_OK:
             break
         elif rsp.completion_code == constants.CC_RES_CANCELED:
-            req.reservation_id = reserve_fn()
-            time.sleep(0.1)
-            continue
+            req.reservation_id = yield RESERVE
+            yield Delay(0.1)
         elif rsp.completion_code == constants.CC_TIMEOUT:
-            time.sleep(0.1)
-            continue
+            yield Delay(0.1)
         elif rsp.completion_code == constants.CC_RESP_COULD_NOT_BE_PRV:
-            time.sleep(0.1 * retry)
-            continue
+            yield Delay(0.1 * retry)
         else:
             check_completion_code(rsp.completion_code)
 
-    return rsp
+    yield Done(rsp)
+
+
+def get_sdr_chunk_helper(send_fn, req, reserve_fn, retry=5):
+    return run_steps(sdr_chunk_steps(req, retry), send_fn, reserve_fn)
+
+# completion codes of a SDR read which asks for too many bytes, some
+# targets reject a read of the entire record with a generic code
+_READ_SIZE_ERRORS = (
+    constants.CC_CANT_RET_NUM_REQ_BYTES,
+    constants.CC_REQ_DATA_FIELD_EXCEED,
+    constants.CC_REQ_DATA_INV_LENGTH,
+    constants.CC_PARAM_OUT_OF_RANGE,
+    constants.CC_INV_DATA_FIELD_IN_REQ,
+)
+
+# the SDR repository and the device SDRs of a target
+REPOSITORY_SDR = 'repository'
+DEVICE_SDR = 'device'
+
+SDR_HEADER_LENGTH = 5
+# `bytes_to_read` value to read the entire record
+SDR_ENTIRE_RECORD = 0xff
+
+
+class SdrReadSize(object):
+    """Learns how many bytes a Get SDR or Get Device SDR request of one
+    target may return.
+
+    Reading the entire record at once is tried first. If the target does
+    not support this, the records are read in chunks. The chunk size is
+    doubled as long as the reads succeed. After a read was rejected, the
+    size is bisected between the largest accepted and the smallest
+    rejected size.
+    """
+
+    DEFAULT_SIZE = 20
+    MAX_SIZE = 0xfe
+
+    def __init__(self, state=None):
+        # size of the next chunk
+        self.size = self.DEFAULT_SIZE
+        # largest accepted and smallest rejected size
+        self.accepted_size = 0
+        self.rejected_size = None
+        # None until it is known if the entire record can be read at once
+        self.entire_record = None
+        if state is not None:
+            self.restore(state)
+
+    @property
+    def learned(self):
+        """True if anything is known about the target."""
+        return (self.accepted_size > 0 or self.rejected_size is not None
+                or self.entire_record is not None)
+
+    def restore(self, state):
+        """Restores the sizes returned by `state`."""
+        (self.size, self.accepted_size, self.rejected_size,
+                self.entire_record) = state
+
+    def state(self):
+        """Returns the learned sizes as list, e.g. to store them."""
+        return [self.size, self.accepted_size, self.rejected_size,
+                self.entire_record]
+
+    def accepted(self, size):
+        self.accepted_size = max(self.accepted_size, size)
+        if size < self.size:
+            # the last chunk of a record
+            return
+        if self.rejected_size is None:
+            self.size = min(self.size * 2, self.MAX_SIZE)
+        elif self.accepted_size + 1 < self.rejected_size:
+            self.size = (self.accepted_size + self.rejected_size) // 2
+
+    def rejected(self, size):
+        if self.rejected_size is None or size < self.rejected_size:
+            self.rejected_size = size
+        if self.accepted_size >= size:
+            # the target does not accept what it accepted before
+            self.accepted_size = 0
+        self.size = max(1, (self.accepted_size + size) // 2)
+
+
+class SdrRecordReader(object):
+    """Reads one SDR record in chunks.
+
+    `reads()` is a generator which yields a tuple of record id, offset and
+    length for each Get SDR request. The caller sends back the tuple of
+    next record id and data of the response, or throws the
+    `CompletionCodeError` of the request into the generator. This way the
+    blocking helper and the asyncio front-end share the same logic.
+
+    The record is available as `record_data` and the id of the next
+    record as `next_id` once the generator is exhausted.
+    """
+
+    def __init__(self, record_id, read_size=None, retry=20):
+        self.record_id = record_id
+        self.read_size = read_size or SdrReadSize()
+        self.retry = retry
+        self.next_id = None
+        self.record_data = None
+
+    def _failed(self):
+        self.retry -= 1
+        if self.retry <= 0:
+            raise RetryError()
+
+    def _rejected(self, error):
+        """Handles the error of a read, which is re-raised unless the
+        target rejected the number of requested bytes.
+        """
+        if error.cc not in _READ_SIZE_ERRORS:
+            raise error
+        self._failed()
+
+    def reads(self):
+        read_size = self.read_size
+        data = None
+
+        if read_size.entire_record is not False:
+            try:
+                (self.next_id, data) = \
+                        yield (self.record_id, 0, SDR_ENTIRE_RECORD)
+            except CompletionCodeError as e:
+                self._rejected(e)
+                if read_size.entire_record is None:
+                    read_size.entire_record = False
+
+        while data is None or len(data) < SDR_HEADER_LENGTH:
+            if data is not None:
+                self._failed()
+            try:
+                (self.next_id, data) = \
+                        yield (self.record_id, 0, SDR_HEADER_LENGTH)
+            except CompletionCodeError as e:
+                self._rejected(e)
+                data = None
+
+        header = ByteBuffer(data)
+        # the record id is unknown if the first record is read
+        self.record_id = header.pop_unsigned_int(2)
+        header.pop_unsigned_int(2)
+        record_length = header.pop_unsigned_int(1) + SDR_HEADER_LENGTH
 
-def get_sdr_data_helper(reserve_fn, get_fn, record_id, reservation_id=None):
+        if len(data) >= record_length and len(data) > SDR_HEADER_LENGTH:
+            read_size.entire_record = True
+            self.record_data = ByteBuffer(data[:record_length])
+            return
+
+        record_data = ByteBuffer(data)
+        while len(record_data) < record_length:
+            offset = len(record_data)
+            length = min(read_size.size, record_length - offset)
+            try:
+                (self.next_id, data) = \
+                        yield (self.record_id, offset, length)
+            except CompletionCodeError as e:
+                self._rejected(e)
+                read_size.rejected(length)
+                continue
+
+            if len(data) == 0:
+                self._failed()
+                continue
+            read_size.accepted(len(data))
+            record_data.extend(data[:length])
+
+        self.record_data = record_data
+
+    def steps(self, reservation_id=None):
+        """Request generator which reads the record, see `run_steps`.
+
+        Each read is yielded as tuple of reservation id, record id, offset
+        and length. The result is the tuple of next record id and record
+        data.
+        """
+        if reservation_id is None:
+            reservation_id = yield RESERVE
+
+        reads = self.reads()
+        rsp = None
+        error = None
+        while True:
+            try:
+                if error is not None:
+                    request = reads.throw(error)
+                else:
+                    request = reads.send(rsp)
+            except StopIteration:
+                break
+
+            try:
+                rsp = yield (reservation_id,) + request
+                error = None
+            except CompletionCodeError as e:
+                rsp = None
+                error = e
+
+        yield Done((self.next_id, self.record_data))
+
+
+def get_sdr_data_helper(reserve_fn, get_fn, record_id, reservation_id=None,
+        read_size=None):
     """Helper function to retrieve the sdr data using the specified
     functions.
 
     This can be used for SDRs from the Sensor Device or form the SDR
-    repository.
+    repository. `read_size` is the `SdrReadSize` of the target, which is
+    updated with the sizes accepted by the target.
     """
+    reader = SdrRecordReader(record_id, read_size)
+    return run_steps(reader.steps(reservation_id), lambda read: get_fn(*read),
+            reserve_fn)
 
-    if reservation_id is None:
-        reservation_id = reserve_fn()
 
-    (next_id, data) = get_fn(reservation_id, record_id, 0, 5)
 
-    header = ByteBuffer(data)
-    record_id = header.pop_unsigned_int(2)
-    record_version = header.pop_unsigned_int(1)
-    record_type = header.pop_unsigned_int(1)
-    record_payload_length = header.pop_unsigned_int(1)
-    record_length = record_payload_length + 5
-    record_data = ByteBuffer(data)
+# completion codes after which a SDR read is sent again
+_SDR_RETRY_ERRORS = (
+    constants.CC_RES_CANCELED,
+    constants.CC_TIMEOUT,
+    constants.CC_RESP_COULD_NOT_BE_PRV,
+)
 
-    offset = len(record_data)
-    max_req_len = 20
-    retry = 20
 
-    # now get the other record data
-    while True:
-        retry -= 1
-        if retry == 0:
+class _WalkRecord(object):
+    def __init__(self, record_id):
+        self.record_id = record_id
+        self.next_id = None
+        # record length including the header, None until it is known
+        self.length = None
+        self.entire_record_rejected = False
+        # set if only the header of the record is read
+        self.header_only = False
+        self.failures = 0
+        # tuples of offset and data
+        self.chunks = []
+        self.received = 0
+
+    @property
+    def complete(self):
+        return self.length is not None and \
+                (self.header_only or self.received >= self.length)
+
+    def record_data(self):
+        record_data = ByteBuffer()
+        for (_, data) in sorted(self.chunks, key=lambda chunk: chunk[0]):
+            record_data.extend(data)
+        return record_data
+
+
+class SdrWalker(object):
+    """Reads all records of a SDR repository with pipelined requests.
+
+    `reads()` is a generator which yields a list of tuples of record id,
+    offset and length. All reads of a list are independent of each other
+    and can be sent at once. The caller sends back a list with the tuple
+    of next record id and data, or the `CompletionCodeError` of each
+    read.
+
+    As soon as the header of a record has been read, the next record id
+    is known. The remaining chunks of the record and the header of the
+    next record are therefore requested together. Reads which failed
+    because the reservation was canceled, the target was busy or too many
+    bytes were requested are sent again with the next list; the caller
+    only has to reserve the repository again.
+
+    If `select` is given, it is called with the header of each record and
+    only the records for which it returns True are read completely. Only
+    the header is returned for the other records.
+
+    `completed()` returns the records read so far.
+    """
+
+    def __init__(self, read_size=None, record_id=0, retry=20, select=None):
+        self.read_size = read_size or SdrReadSize()
+        self.retry = retry
+        self.select = select
+        self._records = [_WalkRecord(record_id)]
+        self._record_ids = set([record_id])
+        self._pending = []
+
+    def completed(self):
+        """Returns the tuples of next record id and record data of the
+        records completed since the last call, in repository order.
+        """
+        completed = []
+        while self._records and self._records[0].complete:
+            record = self._records.pop(0)
+            completed.append((record.next_id, record.record_data()))
+        return completed
+
+    def _failed(self, record):
+        record.failures += 1
+        if record.failures >= self.retry:
             raise RetryError()
 
-        length = max_req_len
-        if (offset + length) > record_length:
-            length = record_length - offset
+    def _header_length(self, record):
+        if self.select is not None or \
+                self.read_size.entire_record is False or \
+                record.entire_record_rejected:
+            return SDR_HEADER_LENGTH
+        return SDR_ENTIRE_RECORD
 
-        try:
-            (next_id, data) = get_fn(reservation_id, record_id, offset, length)
-        except CompletionCodeError as e:
-            if e.cc == constants.CC_CANT_RET_NUM_REQ_BYTES:
-                # reduce max lenght
-                max_req_len -= 4
-                if max_req_len <= 0:
-                    retry = 0
+    def _read_header(self, record):
+        self._pending.append((record, 0, self._header_length(record)))
+
+    def _read_chunks(self, record, offset, length):
+        end = offset + length
+        while offset < end:
+            length = min(self.read_size.size, end - offset)
+            self._pending.append((record, offset, length))
+            offset += length
+
+    def _header_read(self, record, length, next_id, data):
+        if len(data) < SDR_HEADER_LENGTH:
+            self._failed(record)
+            self._read_header(record)
+            return
+
+        header = ByteBuffer(data[:SDR_HEADER_LENGTH])
+        # the record id is unknown if the first record is read
+        record.record_id = header.pop_unsigned_int(2)
+        header.pop_unsigned_int(2)
+        record.length = header.pop_unsigned_int(1) + SDR_HEADER_LENGTH
+        record.next_id = next_id
+
+        data = data[:record.length]
+        if length == SDR_ENTIRE_RECORD and len(data) == record.length:
+            self.read_size.entire_record = True
+        record.chunks.append((0, data))
+        record.received = len(data)
+        if self.select is not None and \
+                not self.select(data[:SDR_HEADER_LENGTH]):
+            record.header_only = True
+        elif length == SDR_HEADER_LENGTH and self.read_size.entire_record \
+                and len(data) < record.length:
+            # the target returns entire records, so the rest of a record
+            # whose header was read on its own is read at once
+            self._pending.append((record, len(data),
+                    record.length - len(data)))
+        else:
+            self._read_chunks(record, len(data), record.length - len(data))
+
+        if next_id != 0xffff and next_id not in self._record_ids:
+            self._record_ids.add(next_id)
+            next_record = _WalkRecord(next_id)
+            self._records.append(next_record)
+            self._read_header(next_record)
+
+    def _chunk_read(self, record, offset, length, data):
+        if len(data) == 0:
+            self._failed(record)
+            self._read_chunks(record, offset, length)
+            return
+
+        data = data[:length]
+        self.read_size.accepted(len(data))
+        record.chunks.append((offset, data))
+        record.received += len(data)
+        if len(data) < length:
+            self._read_chunks(record, offset + len(data), length - len(data))
+
+    def _read_failed(self, record, offset, length, error):
+        if error.cc in _READ_SIZE_ERRORS:
+            self._failed(record)
+            if record.length is None:
+                if length == SDR_ENTIRE_RECORD:
+                    record.entire_record_rejected = True
+                    if self.read_size.entire_record is None:
+                        self.read_size.entire_record = False
+                self._read_header(record)
             else:
-                raise CompletionCodeError(e.cc)
+                self.read_size.rejected(length)
+                self._read_chunks(record, offset, length)
+        elif error.cc in _SDR_RETRY_ERRORS:
+            self._failed(record)
+            self._pending.append((record, offset, length))
+        else:
+            raise error
+
+    def steps(self, reservation_id=None):
+        """Request generator which reads the repository, see `run_steps`.
+
+        Each list of reads is yielded as tuple of reservation id and list,
+        the list of results is sent back. The repository is reserved again
+        if the reservation has been canceled. The records read so far are
+        returned by `completed()` after each step.
+        """
+        if reservation_id is None:
+            reservation_id = yield RESERVE
+
+        reads = self.reads()
+        results = None
+        while True:
+            try:
+                batch = reads.send(results)
+            except StopIteration:
+                break
+
+            results = yield (reservation_id, batch)
+            errors = sdr_walk_errors(results)
+            if constants.CC_RES_CANCELED in errors:
+                reservation_id = yield RESERVE
+            elif errors:
+                yield Delay(0.1)
+
+    def reads(self):
+        self._read_header(self._records[0])
+
+        while self._pending:
+            pending = self._pending
+            self._pending = []
+            results = yield [(record.record_id, offset, length)
+                    for (record, offset, length) in pending]
 
-        record_data.extend(data[:])
-        offset = len(record_data)
-        if len(record_data) >= record_length:
+            for ((record, offset, length), result) in zip(pending, results):
+                if isinstance(result, CompletionCodeError):
+                    self._read_failed(record, offset, length, result)
+                elif record.length is None:
+                    self._header_read(record, length, *result)
+                else:
+                    self._chunk_read(record, offset, length, result[1])
+
+
+def sdr_read_requests(name, reservation_id, reads):
+    """Returns the Get SDR or Get Device SDR requests, as given by `name`,
+    for the reads of a `SdrWalker`.
+    """
+    reqs = []
+    for (record_id, offset, length) in reads:
+        req = create_request_by_name(name)
+        req.reservation_id = reservation_id
+        req.record_id = record_id
+        req.offset = offset
+        req.bytes_to_read = length
+        reqs.append(req)
+    return reqs
+
+
+def sdr_read_results(rsps):
+    """Returns the results of Get SDR responses for a `SdrWalker`."""
+    results = []
+    for rsp in rsps:
+        if rsp.completion_code != constants.CC_OK:
+            results.append(CompletionCodeError(rsp.completion_code))
+        else:
+            results.append((rsp.next_record_id, rsp.record_data))
+    return results
+
+
+def sdr_walk_errors(results):
+    """Returns the completion codes of the reads of a batch which failed
+    because the reservation was canceled or the target was busy.
+    """
+    return set(r.cc for r in results if isinstance(r, CompletionCodeError)
+            and r.cc in _SDR_RETRY_ERRORS)
+
+
+def walk_sdr_helper(reserve_fn, get_batch_fn, reservation_id=None,
+        read_size=None, select=None):
+    """Generator which returns the tuples of next record id and record data
+    of all records of a SDR repository, see `SdrWalker`.
+
+    `get_batch_fn` is called with the reservation id and the list of
+    reads and returns the list of results. The repository is reserved
+    again if the reservation has been canceled. If `select` is given,
+    only the records for which it returns True are read completely.
+    """
+    walker = SdrWalker(read_size, select=select)
+    steps = walker.steps(reservation_id)
+    step = next_step(steps)
+    while True:
+        for record in walker.completed():
+            yield record
+        if isinstance(step, Done):
             break
 
-    return (next_id, record_data)
+        step = next_step(steps, run_step(step,
+                lambda batch: get_batch_fn(*batch), reserve_fn))
 
 
 INITIATE_ERASE = 0xaa
@@ -29,7 +29,7 @@ import time
 from .errors import CompletionCodeError, HpmError, TimeoutError
 from .msgs import create_request_by_name
 from .msgs import constants
-from .utils import check_completion_code, bcd_search, chunks
+from .utils import check_completion_code, bcd_search, chunks, array_tobytes
 from .utils import py3dec_unic_bytes_fix, bytes2 as bytes #overwrites system bytes
 from .state import State
 from .fields import VersionField
@@ -448,7 +448,7 @@ class ComponentPropertyCurrentVersion(ComponentProperty):
 class ComponentPropertyDescriptionString(ComponentProperty):
 
     def _from_rsp_data(self, data):
-        self.description = py3dec_unic_bytes_fix(array.array('B', data).tostring())
+        self.description = py3dec_unic_bytes_fix(array_tobytes(array.array('B', data)))
         self.description = self.description.replace('\0', '')
 
 
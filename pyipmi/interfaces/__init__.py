@@ -16,11 +16,15 @@
 
 from .ipmitool import Ipmitool
 from .aardvark import Aardvark
+from .rmcp import Rmcp
+from .rmcpplus import RmcpPlus
 from .mock import Mock
 
 INTERFACES = [
         Ipmitool,
         Aardvark,
+        Rmcp,
+        RmcpPlus,
         Mock,
 ]
 
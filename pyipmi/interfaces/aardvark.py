@@ -16,13 +16,14 @@
 
 from builtins import object
 
-import time
 import array
 
 from ..msgs import create_message, encode_message, decode_message
 from ..errors import TimeoutError
 from ..logger import log
-from ..interfaces.ipmb import IpmbHeader, checksum
+from ..utils import py3enc_unic_bytes_fix
+from ..interfaces.ipmb import IpmbHeader, RequestPipeline, checksum, \
+        rx_filter
 
 try:
     import pyaardvark
@@ -30,14 +31,15 @@ except ImportError:
     pyaardvark = None
 
 
-class Aardvark(object):
+class Aardvark(RequestPipeline):
     NAME = 'aardvark'
 
     def __init__(self, slave_address=0x20, port=0, serial_number=None,
-            enable_i2c_pullups=True):
+            enable_i2c_pullups=True, window=1):
         if pyaardvark is None:
             raise RuntimeError('No pyaardvark module found. You can not '
                     'use this interface.')
+        RequestPipeline.__init__(self, window)
         self.slave_address = slave_address
         self.timeout = 0.25 # 250 ms
         self.max_retries = 3
@@ -63,18 +65,7 @@ class Aardvark(object):
         self._dev.close()
 
     def is_ipmc_accessible(self, target):
-        header = IpmbHeader()
-        header.netfn = 6
-        header.rs_lun = 0
-        header.rs_sa = target.ipmb_address
-        header.rq_seq = self.next_sequence_number
-        header.rq_lun = 0
-        header.rq_sa = self.slave_address
-        header.cmd_id = ord(1)
-        raw_data = []
-
-        self._send_raw(header, raw_data)
-        rx_data = self._receive_raw(header)
+        self._send_and_receive(target, 0, 6, 1, b'')
         return True
 
     def _inc_sequence_number(self):
@@ -88,69 +79,10 @@ class Aardvark(object):
         return data
 
     def _rx_filter(self, header, rx_data):
+        return rx_filter(header, rx_data)
 
-        log().debug('[%s]' % ' '.join(['%02x' % b for b in rx_data]))
-
-        checks = [
-            (checksum(rx_data[0:3]), 0, 'Header checksum failed'),
-            (checksum(rx_data[3:]), 0, 'payload checksum failed'),
-            (rx_data[0], header.rq_sa, 'slave address mismatch'),
-            (rx_data[1] & ~3, header.netfn << 2 | 4, 'NetFn mismatch'),
-            (rx_data[3], header.rs_sa, 'target address mismatch'),
-            (rx_data[1] & 3, header.rq_lun, 'request LUN mismatch'),
-            (rx_data[4] & 3, header.rs_lun & 3, 'responder LUN mismatch'),
-            (rx_data[4] >> 2, header.rq_seq, 'sequence number mismatch'),
-            (rx_data[5], header.cmd_id, 'command id mismatch'),
-        ]
-
-        match = True
-
-        for left, right, msg in checks:
-            if left != right:
-                log().debug('%s (%02Xh != %02Xh)' % (msg, left, right))
-                match = False
-
-        return match
-
-    def _send_raw(self, header, raw_bytes):
-
-        cmd_data =  [ord(c) for c in raw_bytes]
-        tx_data = self._encode_ipmb_msg_req(header, cmd_data)
-
-        i2c_addr = header.rs_sa >> 1
-        self._dev.i2c_master_write(i2c_addr, tx_data.tostring())
-        log().debug('I2C TX to %02Xh [%s]', i2c_addr,
-                ' '.join(['%02x' % b for b in tx_data]))
-
-    def _receive_raw(self, header):
-        start_time = time.time()
-        rsp_received = False
-        poll_returned_no_data = False
-        while not rsp_received:
-            timeout = self.timeout - (time.time() - start_time)
-
-            if timeout <= 0 or poll_returned_no_data:
-                raise TimeoutError()
-
-            ret = self._dev.poll(int(timeout * 1000))
-
-            # poll returns an empty list if no event is pending
-            if not ret:
-                poll_returned_no_data = True
-                continue
-
-            (i2c_addr, rx_data) = self._dev.i2c_slave_read()
-            log().debug('I2C RX from %02Xh [%s]', i2c_addr << 1,
-                    ' '.join(['%02x' % ord(c) for c in rx_data]))
-
-            rx_data = array.array('B', rx_data)
-            rq_sa = array.array('B', [i2c_addr << 1,])
-
-            rsp_received = self._rx_filter(header, rq_sa + rx_data)
-
-        return rx_data
-
-    def _send_and_receive(self, target, lun, netfn, cmdid, payload):
+    def _build_request(self, target, lun, netfn, cmdid, payload):
+        """Returns the IPMB header and the I2C data of a request."""
         self._inc_sequence_number()
 
         # assemble IPMB header
@@ -163,26 +95,43 @@ class Aardvark(object):
         header.rq_sa = self.slave_address
         header.cmd_id = cmdid
 
-        retries = 0
-        while retries < self.max_retries:
-            try:
-                self._send_raw(header, payload)
-                rx_data = self._receive_raw(header)
-                break
-            except TimeoutError:
-                log().warning('I2C transaction timed out'),
-                pass
+        cmd_data = array.array('B', py3enc_unic_bytes_fix(payload))
+        tx_data = self._encode_ipmb_msg_req(header, cmd_data)
 
-            retries += 1
+        return (header, tx_data)
 
-        else:
+    def _send_request(self, header, tx_data):
+        i2c_addr = header.rs_sa >> 1
+        self._dev.i2c_master_write(i2c_addr, bytes(bytearray(tx_data)))
+        log().debug('I2C TX to %02Xh [%s]', i2c_addr,
+                ' '.join(['%02x' % b for b in tx_data]))
+
+    def _receive_response(self, timeout):
+        if timeout <= 0:
             raise TimeoutError()
 
-        return rx_data.tostring()[5:-1]
+        ret = self._dev.poll(int(timeout * 1000))
+
+        # poll returns an empty list if no event is pending
+        if not ret:
+            raise TimeoutError()
+
+        (i2c_addr, rx_data) = self._dev.i2c_slave_read()
+        rx_data = array.array('B', bytearray(rx_data))
+        log().debug('I2C RX from %02Xh [%s]', i2c_addr << 1,
+                ' '.join(['%02x' % b for b in rx_data]))
+
+        return array.array('B', [i2c_addr << 1]) + rx_data
+
+    def _send_and_receive(self, target, lun, netfn, cmdid, payload):
+        rx_data = self._send_and_receive_pipelined(
+                [(target, lun, netfn, cmdid, payload)])[0]
+        return self._strip_ipmb_msg(rx_data)
 
     def send_and_receive_raw(self, target, lun, netfn, raw_bytes):
-        return self._send_and_receive(target, lun, netfn, ord(raw_bytes[0]),
-                raw_bytes[1:])
+        raw_bytes = py3enc_unic_bytes_fix(raw_bytes)
+        return self._send_and_receive(target, lun, netfn,
+                bytearray(raw_bytes)[0], raw_bytes[1:])
 
     def send_and_receive(self, msg):
         """Sends an IPMI request message and waits for its response.
@@ -17,6 +17,13 @@
 from builtins import object
 
 import array
+import collections
+import time
+
+from ..errors import TimeoutError
+from ..logger import log
+from ..msgs import create_message, encode_message, decode_message
+from ..utils import array_tobytes, py3enc_unic_bytes_fix
 
 
 def checksum(data):
@@ -32,6 +39,7 @@ class IpmbHeader(object):
         self.rs_lun = None
         self.rq_sa = None
         self.rq_lun = None
+        self.rq_seq = None
         self.netfn = None
         self.cmd_id = None
 
@@ -44,3 +52,239 @@ class IpmbHeader(object):
         data.append(self.cmd_id)
         return data
 
+
+def encode_ipmb_msg(header, data):
+    """Encode an IPMB request message including the responder slave address
+    and both checksums.
+
+    `header` is the IpmbHeader of the request.
+    `data` is the request data following the command id.
+    """
+
+    msg = array.array('B', [header.rs_sa])
+    msg.extend(header.encode())
+    msg.extend(data)
+    msg.append(checksum(msg[3:]))
+    return msg
+
+
+def rx_filter(header, rx_data):
+    """Check if `rx_data` is the response matching the request described by
+    `header`.
+    """
+
+    log().debug('[%s]' % ' '.join(['%02x' % b for b in rx_data]))
+
+    if len(rx_data) < 7:
+        log().debug('message too short (%d bytes)' % len(rx_data))
+        return False
+
+    checks = [
+        (checksum(rx_data[0:3]), 0, 'Header checksum failed'),
+        (checksum(rx_data[3:]), 0, 'payload checksum failed'),
+        (rx_data[0], header.rq_sa, 'slave address mismatch'),
+        (rx_data[1] & ~3, header.netfn << 2 | 4, 'NetFn mismatch'),
+        (rx_data[3], header.rs_sa, 'target address mismatch'),
+        (rx_data[1] & 3, header.rq_lun, 'request LUN mismatch'),
+        (rx_data[4] & 3, header.rs_lun & 3, 'responder LUN mismatch'),
+        (rx_data[4] >> 2, header.rq_seq, 'sequence number mismatch'),
+        (rx_data[5], header.cmd_id, 'command id mismatch'),
+    ]
+
+    match = True
+
+    for left, right, msg in checks:
+        if left != right:
+            log().debug('%s (%02Xh != %02Xh)' % (msg, left, right))
+            match = False
+
+    return match
+
+
+class RequestPipeline(object):
+    """Mixin for interfaces which keep several IPMB requests in flight.
+
+    Up to `window` requests per target are sent before the first response
+    is awaited. The responses are matched to the requests by the sequence
+    number and are checked with `rx_filter`. If a request to a target times
+    out, the window of this target falls back to 1 because the BMC may not
+    cope with several requests in flight.
+
+    The interface has to provide `timeout`, `max_retries` and the methods:
+
+    `_build_request(target, lun, netfn, cmdid, payload)` returns the
+    IpmbHeader and the message of a new request,
+    `_send_request(header, tx_data)` sends the message and
+    `_receive_response(timeout)` returns the next received IPMB message,
+    starting with the requester slave address, or None if the received
+    data was not an IPMB message.
+    """
+
+    MAX_WINDOW = 32
+
+    def __init__(self, window=1):
+        self._check_window(window)
+        self.window = window
+        self._target_windows = {}
+
+    def _check_window(self, window):
+        if not 1 <= window <= self.MAX_WINDOW:
+            raise RuntimeError('window must be between 1 and %d' %
+                    self.MAX_WINDOW)
+
+    @staticmethod
+    def _target_key(target):
+        if target is None:
+            return None
+        return target.ipmb_address
+
+    def set_window(self, target, window):
+        """Sets the number of requests which may be in flight to `target`
+        at the same time.
+        """
+        self._check_window(window)
+        self._target_windows[self._target_key(target)] = window
+
+    def get_window(self, target):
+        return self._target_windows.get(self._target_key(target),
+                self.window)
+
+    def _send_and_receive_pipelined(self, requests, skip_timeouts=False):
+        """Sends the requests given as tuples of target, lun, netfn,
+        command id and payload. Returns the received IPMB response messages
+        in the order of the requests.
+
+        If `skip_timeouts` is set, None is returned for a request which
+        timed out instead of raising `TimeoutError`.
+        """
+
+        rx_datas = [None] * len(requests)
+        waiting = collections.deque(range(len(requests)))
+        # sequence number -> [index, header, tx_data, deadline, tries]
+        in_flight = {}
+        target_count = collections.defaultdict(int)
+
+        while waiting or in_flight:
+            for _ in range(len(waiting)):
+                # the sequence number has 6 bits
+                if len(in_flight) >= 63:
+                    break
+                index = waiting.popleft()
+                target = requests[index][0]
+                key = self._target_key(target)
+                if target_count[key] >= self.get_window(target):
+                    waiting.append(index)
+                    continue
+
+                (header, tx_data) = self._build_request(*requests[index])
+                while header.rq_seq in in_flight:
+                    (header, tx_data) = self._build_request(*requests[index])
+                self._send_request(header, tx_data)
+                in_flight[header.rq_seq] = [index, header, tx_data,
+                        time.time() + self.timeout, 1]
+                target_count[key] += 1
+
+            if not in_flight:
+                continue
+            deadline = min(entry[3] for entry in in_flight.values())
+            try:
+                rx_data = self._receive_response(deadline - time.time())
+            except TimeoutError:
+                for index in self._handle_timeouts(requests, in_flight,
+                        skip_timeouts):
+                    target_count[self._target_key(requests[index][0])] -= 1
+                continue
+
+            if rx_data is None or len(rx_data) < 7:
+                continue
+            entry = in_flight.get(rx_data[4] >> 2)
+            if entry is None or not rx_filter(entry[1], rx_data):
+                continue
+
+            del in_flight[entry[1].rq_seq]
+            target_count[self._target_key(requests[entry[0]][0])] -= 1
+            rx_datas[entry[0]] = rx_data
+
+        return rx_datas
+
+    def _handle_timeouts(self, requests, in_flight, skip_timeouts=False):
+        """Resends the requests whose deadline has passed. Returns the
+        indices of the requests which were given up, if `skip_timeouts` is
+        set.
+        """
+        now = time.time()
+        skipped = []
+        for entry in list(in_flight.values()):
+            if entry[3] > now:
+                continue
+
+            (index, header, tx_data, _, tries) = entry
+            log().warning('%s request timed out', self.NAME)
+            if tries >= self.max_retries:
+                if not skip_timeouts:
+                    raise TimeoutError()
+                del in_flight[header.rq_seq]
+                skipped.append(index)
+                continue
+
+            target = requests[index][0]
+            if self.get_window(target) > 1:
+                log().warning('falling back to one request in flight for '
+                        'target %s', self._target_key(target))
+                self.set_window(target, 1)
+
+            self._send_request(header, tx_data)
+            entry[3] = now + self.timeout
+            entry[4] = tries + 1
+
+        return skipped
+
+    def send_and_receive_raw_batch(self, requests, skip_timeouts=False):
+        """Sends several raw requests, given as tuples of target, lun, netfn
+        and raw bytes, and returns the raw responses in the same order.
+
+        If `skip_timeouts` is set, None is returned for a request which
+        timed out instead of raising `TimeoutError`.
+        """
+        pipelined = []
+        for (target, lun, netfn, raw_bytes) in requests:
+            raw_bytes = py3enc_unic_bytes_fix(raw_bytes)
+            pipelined.append((target, lun, netfn, bytearray(raw_bytes)[0],
+                    raw_bytes[1:]))
+
+        return [None if rx_data is None else self._strip_ipmb_msg(rx_data)
+                for rx_data in self._send_and_receive_pipelined(pipelined,
+                        skip_timeouts)]
+
+    def send_and_receive_batch(self, reqs, skip_timeouts=False):
+        """Sends several IPMI request messages and returns the response
+        messages in the same order.
+
+        A response with a completion code other than `CC_OK` is returned
+        as is, so the caller can decide how to handle it. If
+        `skip_timeouts` is set, None is returned for a request which timed
+        out instead of raising `TimeoutError`.
+        """
+        requests = []
+        for req in reqs:
+            log().debug('IPMI Request [%s]', req)
+            requests.append((req.target, req.lun, req.netfn, req.cmdid,
+                    encode_message(req)))
+
+        rsps = []
+        for (req, rx_data) in zip(reqs,
+                self._send_and_receive_pipelined(requests, skip_timeouts)):
+            if rx_data is None:
+                rsps.append(None)
+                continue
+            rsp = create_message(req.cmdid, req.netfn + 1)
+            decode_message(rsp, self._strip_ipmb_msg(rx_data))
+            log().debug('IPMI Response [%s])', rsp)
+            rsps.append(rsp)
+
+        return rsps
+
+    @staticmethod
+    def _strip_ipmb_msg(rx_data):
+        # strip IPMB header and checksum, keep completion code
+        return array_tobytes(rx_data[6:-1])
@@ -18,14 +18,45 @@
 from builtins import chr
 from builtins import object
 
+import os
 import re
-from subprocess import Popen, PIPE
+import select
+import tempfile
+import time
+from subprocess import Popen, PIPE, STDOUT
 from array import array
 from .. import Session
 from ..errors import TimeoutError
 from ..logger import log
 from ..msgs import encode_message, decode_message, create_message
-from ..utils import py3dec_unic_bytes_fix, ByteBuffer
+from ..utils import py3dec_unic_bytes_fix, py3enc_unic_bytes_fix, \
+        array_tobytes
+
+try:
+    from subprocess import TimeoutExpired
+except ImportError:
+    # Python 2, Popen.wait() has no timeout
+    TimeoutExpired = None
+
+
+def _wait(child, timeout):
+    """Waits up to `timeout` seconds for the process to exit. Returns
+    False if it is still running.
+    """
+    if TimeoutExpired is not None:
+        try:
+            child.wait(timeout=timeout)
+        except TimeoutExpired:
+            return False
+        return True
+
+    deadline = time.time() + timeout
+    while child.poll() is None:
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
 
 class Ipmitool(object):
     """This interface uses the ipmitool raw command to "emulate" a RMCP
@@ -34,28 +65,50 @@ class Ipmitool(object):
     It uses the session information to assemble the correct ipmitool
     parameters. Therefore, a session has to be established before any request
     can be sent.
+
+    If `persistent` is set, one long-lived `ipmitool ... shell` process is
+    started for each target and the raw commands are written to its stdin.
+    This saves the process creation and the ipmitool session setup for each
+    request. The processes are terminated by `close_session`. A shell
+    which writes no output for `timeout` seconds is considered hung, it is
+    killed and `TimeoutError` is raised.
     """
 
     NAME = 'ipmitool'
     IPMITOOL_PATH = 'ipmitool'
+    SHELL_PROMPT = b'ipmitool> '
     supported_interfaces = ['lan', 'lanplus', 'serial-terminal']
 
-    def __init__(self, interface_type='lan'):
+    def __init__(self, interface_type='lan', persistent=False, timeout=30.0):
         if interface_type in self.supported_interfaces:
             self._interface_type = interface_type
         else:
             raise RuntimeError('interface type %s not supported' %
                     interface_type)
 
+        self.persistent = persistent
+        self.timeout = timeout
+        self._shells = {}
+        self._sentinel_number = 0
+
         self.re_completion_code = re.compile(
                 b"Unable to send RAW command \(.*rsp=(0x[0-9a-f]+)\)")
         self.re_timeout = re.compile(
                 b"Unable to send RAW command \(.*cmd=0x[0-9a-f]+\)")
+        self.re_raw_error = re.compile(
+                b"Unable to send RAW command \\(.*netfn=0x([0-9a-f]+).*"
+                b"cmd=0x([0-9a-f]+)")
+        self.re_prompt = re.compile(b'^(' + re.escape(self.SHELL_PROMPT)
+                + b')+')
 
     def establish_session(self, session):
         # just remember session parameters here
+        self._stop_shells()
         self._session = session
 
+    def close_session(self, session):
+        self._stop_shells()
+
     def rmcp_ping(self):
 
         if self._interface_type == 'serial-terminal':
@@ -88,6 +141,13 @@ class Ipmitool(object):
         return accessible
 
     def send_and_receive_raw(self, target, lun, netfn, raw_bytes):
+        if self.persistent:
+            outputs, rest, rc = self._run_ipmitool_shell(target, lun,
+                    [self._build_ipmitool_raw_command(netfn, raw_bytes)])
+            if outputs:
+                return self._parse_raw_output(outputs[0], 0)
+            return self._parse_raw_output(rest, rc)
+
         if self._interface_type in ['lan', 'lanplus']:
             cmd = self._build_ipmitool_cmd(target, lun, netfn, raw_bytes)
         elif self._interface_type in ['serial-terminal']:
@@ -98,9 +158,12 @@ class Ipmitool(object):
 
         output, rc = self._run_ipmitool(cmd)
 
+        return self._parse_raw_output(output, rc)
+
+    def _parse_raw_output(self, output, rc):
         # check for errors
-        match_completion_code = self.re_completion_code.match(output)
-        match_timeout = self.re_timeout.match(output)
+        match_completion_code = self.re_completion_code.search(output)
+        match_timeout = self.re_timeout.search(output)
         data = array('B')
         if match_completion_code:
             cc = int(match_completion_code.group(1), 16)
@@ -119,21 +182,116 @@ class Ipmitool(object):
             # strip 'Close Session command failed' lines
             output_lines = [ l for l in output_lines
                     if not l.startswith('Close Session command failed') ]
-            output = ''.join(output_lines).replace('\r','').strip()
+            output = ' '.join(output_lines).replace('\r','').strip()
             if len(output):
-                for x in output.split(' '):
-                    data.append(int(x, 16))
+                try:
+                    for x in output.split():
+                        data.append(int(x, 16))
+                except ValueError:
+                    raise RuntimeError('unexpected ipmitool output: %s' %
+                            output)
+
+        return array_tobytes(data)
+
+    def send_and_receive_raw_batch(self, requests, skip_timeouts=False):
+        """Sends several raw requests with as few ipmitool calls as possible.
+
+        `requests` is a list of `(target, lun, netfn, raw_bytes)` tuples. All
+        requests for the same target and LUN are run by a single `ipmitool
+        exec` call, or by the shell process in persistent mode.
+
+        Returns the list of responses in the order of the requests. If
+        `skip_timeouts` is set, None is returned for a request which timed
+        out instead of raising `TimeoutError`.
+        """
 
-        return data.tostring()
+        groups = []
+        group_index = {}
+        for (index, (target, lun, netfn, raw_bytes)) in enumerate(requests):
+            key = (self._build_ipmitool_target(target), lun)
+            if key not in group_index:
+                group_index[key] = len(groups)
+                groups.append((target, lun, []))
+            raw_bytes = py3enc_unic_bytes_fix(raw_bytes)
+            groups[group_index[key]][2].append((index, netfn, raw_bytes))
+
+        responses = [None] * len(requests)
+        for (target, lun, group) in groups:
+            commands = [self._build_ipmitool_raw_command(netfn, raw_bytes)
+                    for (_, netfn, raw_bytes) in group]
+
+            if self.persistent:
+                (outputs, rest, rc) = self._run_ipmitool_shell(target, lun,
+                        commands)
+                error_lines = []
+            else:
+                (outputs, rest, error_output, rc) = \
+                        self._run_ipmitool_exec(target, lun, commands)
+                error_lines = [l for l in error_output.splitlines()
+                        if self.re_raw_error.search(l)]
+
+            for (n, (index, netfn, raw_bytes)) in enumerate(group):
+                if n > len(outputs):
+                    raise RuntimeError('ipmitool failed with rc=%d' % rc)
+                elif n == len(outputs):
+                    output = rest
+                else:
+                    output = outputs[n]
+
+                # failed commands print their error to stderr only
+                if (len(output.strip()) == 0 and len(error_lines) > 0
+                        and self._is_raw_error_of(error_lines[0], netfn,
+                                raw_bytes)):
+                    output = error_lines.pop(0)
+
+                try:
+                    if n < len(outputs):
+                        responses[index] = self._parse_raw_output(output, 0)
+                    else:
+                        responses[index] = self._parse_raw_output(output,
+                                rc or 1)
+                except TimeoutError:
+                    if not skip_timeouts:
+                        raise
+
+        return responses
+
+    def _is_raw_error_of(self, line, netfn, raw_bytes):
+        match = self.re_raw_error.search(line)
+        return (int(match.group(1), 16) == netfn
+                and int(match.group(2), 16) == bytearray(raw_bytes)[0])
+
+    def send_and_receive_batch(self, reqs, skip_timeouts=False):
+        """Sends several IPMI request messages with as few ipmitool calls as
+        possible and returns the response messages in the same order.
+
+        See `send_and_receive_raw_batch` for `skip_timeouts`.
+        """
+
+        requests = []
+        for req in reqs:
+            log().debug('IPMI Request [%s]', req)
+            requests.append((req.target, req.lun, req.netfn,
+                    self._encode_raw_request(req)))
+
+        rsps = []
+        for (req, rsp_data) in zip(reqs,
+                self.send_and_receive_raw_batch(requests, skip_timeouts)):
+            if rsp_data is None:
+                rsps.append(None)
+                continue
+            rsp = create_message(req.cmdid, req.netfn + 1)
+            decode_message(rsp, rsp_data)
+            log().debug('IPMI Response [%s])', rsp)
+            rsps.append(rsp)
+
+        return rsps
 
     def send_and_receive(self, req):
         log().debug('IPMI Request [%s]', req)
 
-        req_data = ByteBuffer((req.cmdid,))
-        req_data.push_string(encode_message(req))
-
         rsp_data = self.send_and_receive_raw(req.target, req.lun, req.netfn,
-                req_data.tostring())
+                self._encode_raw_request(req))
 
         rsp = create_message(req.cmdid, req.netfn + 1)
         decode_message(rsp, rsp_data)
@@ -141,11 +299,20 @@ class Ipmitool(object):
 
         return rsp
 
-    def _build_ipmitool_raw_data(self, lun, netfn, raw_bytes):
-        cmd_data = ' -l %d raw 0x%02x ' % (lun, netfn)
-        cmd_data += ' '.join(['0x%02x' % ord(d) for d in raw_bytes])
+    @staticmethod
+    def _encode_raw_request(req):
+        return bytes(bytearray((req.cmdid,))) + encode_message(req)
+
+    def _build_ipmitool_raw_command(self, netfn, raw_bytes):
+        raw_bytes = bytearray(py3enc_unic_bytes_fix(raw_bytes))
+        cmd_data = 'raw 0x%02x ' % netfn
+        cmd_data += ' '.join(['0x%02x' % d for d in raw_bytes])
         return cmd_data
 
+    def _build_ipmitool_raw_data(self, lun, netfn, raw_bytes):
+        return ' -l %d %s' % (lun,
+                self._build_ipmitool_raw_command(netfn, raw_bytes))
+
     def _build_ipmitool_target(self, target):
         cmd = ''
         if hasattr(target, 'routing'):
@@ -166,10 +333,19 @@ class Ipmitool(object):
 
         return cmd
 
-    def _build_ipmitool_cmd(self, target, lun, netfn, raw_bytes):
+    def _build_ipmitool_session_args(self):
         if not hasattr(self, '_session'):
             raise RuntimeError('Session needs to be set')
 
+        if self._interface_type == 'serial-terminal':
+            return '{path!s:s} -I {interface!s:s} -D {port!s:s}:{baud!s:s}'\
+                .format(
+                    path=self.IPMITOOL_PATH,
+                    interface=self._interface_type,
+                    port=self._session._serial_port,
+                    baud=self._session._serial_baudrate
+                )
+
         cmd = self.IPMITOOL_PATH
         cmd += (' -I %s' % self._interface_type)
         cmd += (' -H %s' % self._session._rmcp_host)
@@ -185,6 +361,10 @@ class Ipmitool(object):
             raise RuntimeError('Session type %d not supported' %
                     self._session.auth_type)
 
+        return cmd
+
+    def _build_ipmitool_cmd(self, target, lun, netfn, raw_bytes):
+        cmd = self._build_ipmitool_session_args()
         cmd += self._build_ipmitool_target(target)
         cmd += self._build_ipmitool_raw_data(lun, netfn, raw_bytes)
         cmd += (' 2>&1')
@@ -192,23 +372,192 @@ class Ipmitool(object):
         return cmd
 
     def _build_serial_ipmitool_cmd(self, target, lun, netfn, raw_bytes):
-        if not hasattr(self, '_session'):
-            raise RuntimeError('Session needs to be set')
-
-        cmd = '{path!s:s} -I {interface!s:s} -D {port!s:s}:{baud!s:s}'\
-            .format(
-                path=self.IPMITOOL_PATH,
-                interface=self._interface_type,
-                port=self._session._serial_port,
-                baud=self._session._serial_baudrate
-            )
-
+        cmd = self._build_ipmitool_session_args()
         cmd += self._build_ipmitool_target(target)
         cmd += self._build_ipmitool_raw_data(lun, netfn, raw_bytes)
         #cmd += (' 2>&1')
 
         return cmd
 
+    def _build_ipmitool_shell_cmd(self, target, lun):
+        cmd = self._build_ipmitool_session_args()
+        cmd += self._build_ipmitool_target(target)
+        cmd += (' -l %d shell' % lun)
+
+        return cmd
+
+    def _start_shell(self, cmd):
+        log().debug('Starting ipmitool shell "%s"', cmd)
+        # stderr is merged so that error messages are seen in order
+        return Popen(cmd, shell=True, stdin=PIPE, stdout=PIPE, stderr=STDOUT)
+
+    def _stop_shells(self):
+        for (cmd, child) in self._shells.items():
+            log().debug('Stopping ipmitool shell "%s"', cmd)
+            try:
+                child.stdin.write(b'exit\n')
+                child.stdin.close()
+            except (IOError, OSError):
+                pass
+            if not _wait(child, self.timeout):
+                log().warning('ipmitool shell "%s" did not exit, killing it',
+                        cmd)
+                child.kill()
+                child.wait()
+            child.stdout.close()
+        self._shells = {}
+
+    def _kill_shell(self, cmd):
+        child = self._shells.pop(cmd)
+        log().warning('ipmitool shell "%s" hung, killing it', cmd)
+        child.kill()
+        child.wait()
+        child.stdin.close()
+        child.stdout.close()
+
+    def _read_shell_lines(self, child):
+        """A generator that returns the output lines of a shell process.
+
+        Raises `TimeoutError` if the process writes nothing for `timeout`
+        seconds. The pipe is read without the buffer of `child.stdout`, so
+        that `select` sees all pending data.
+        """
+        fd = child.stdout.fileno()
+        data = b''
+        while True:
+            (readable, _, _) = select.select([fd], [], [], self.timeout)
+            if not readable:
+                raise TimeoutError()
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                if data:
+                    yield data
+                return
+            lines = (data + chunk).split(b'\n')
+            data = lines.pop()
+            for line in lines:
+                yield line + b'\n'
+
+    def _build_ipmitool_script(self, commands):
+        """Returns the script for `commands` and the list of sentinels.
+
+        An echo command with an unique sentinel is added after each command.
+        The output up to the echoed sentinel belongs to the command.
+        """
+
+        script = b''
+        sentinels = []
+        for command in commands:
+            self._sentinel_number += 1
+            sentinel = ('__pyipmi_sentinel_%d__' %
+                    self._sentinel_number).encode()
+            script += command.encode() + b'\n'
+            script += b'echo ' + sentinel + b'\n'
+            sentinels.append(sentinel)
+
+        return script, sentinels
+
+    def _split_ipmitool_output(self, output, sentinels):
+        """Splits the output of a script into the outputs of the commands.
+
+        If the script was aborted, less outputs than sentinels are returned.
+        """
+
+        outputs = []
+        lines = []
+        for line in output.splitlines(True):
+            line = self.re_prompt.sub(b'', line)
+            if (len(outputs) < len(sentinels)
+                    and line.rstrip(b'\r\n') == sentinels[len(outputs)]):
+                outputs.append(b''.join(lines))
+                lines = []
+            else:
+                lines.append(line)
+
+        return outputs, b''.join(lines)
+
+    def _run_ipmitool_shell(self, target, lun, commands):
+        """Runs `commands` in the ipmitool shell process of the given target.
+
+        All commands are written at once, the outputs are collected
+        afterwards. Returns the list of outputs, the remaining output of an
+        aborted command and the return code.
+        """
+
+        cmd = self._build_ipmitool_shell_cmd(target, lun)
+        child = self._shells.get(cmd)
+        if child is None:
+            child = self._start_shell(cmd)
+            self._shells[cmd] = child
+
+        (script, sentinels) = self._build_ipmitool_script(commands)
+
+        log().debug('Running ipmitool shell commands:\n%s', script)
+
+        output = []
+        try:
+            child.stdin.write(script)
+            child.stdin.flush()
+
+            for line in self._read_shell_lines(child):
+                output.append(line)
+                if self.re_prompt.sub(b'', line).rstrip(b'\r\n') \
+                        == sentinels[-1]:
+                    output = b''.join(output)
+                    log().debug('output was:\n%s', output)
+                    (outputs, rest) = self._split_ipmitool_output(output,
+                            sentinels)
+                    return outputs, rest, 0
+        except TimeoutError:
+            self._kill_shell(cmd)
+            raise
+        except (IOError, OSError):
+            pass
+
+        # the process has terminated, e.g. the session could not be opened
+        del self._shells[cmd]
+        child.stdout.close()
+        rc = child.wait()
+        output = b''.join(output)
+        log().debug('ipmitool shell terminated with rc=%d, output was:\n%s',
+                rc, output)
+
+        (outputs, rest) = self._split_ipmitool_output(output, sentinels)
+        return outputs, rest, rc or 1
+
+    def _run_ipmitool_exec(self, target, lun, commands):
+        """Runs `commands` with a single `ipmitool exec` call.
+
+        stdout and stderr are read separately, because their order is not
+        preserved if both are written to the same pipe. Returns the list of
+        outputs, the remaining output of an aborted command, the error output
+        and the return code.
+        """
+
+        (script, sentinels) = self._build_ipmitool_script(commands)
+
+        (fd, path) = tempfile.mkstemp(prefix='pyipmi-', suffix='.script')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(script)
+
+            cmd = self._build_ipmitool_session_args()
+            cmd += self._build_ipmitool_target(target)
+            cmd += (' -l %d exec %s' % (lun, path))
+
+            log().debug('Running ipmitool "%s" with script:\n%s', cmd, script)
+
+            child = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE)
+            (output, error_output) = child.communicate()
+        finally:
+            os.unlink(path)
+
+        log().debug('return with rc=%d, output was:\n%s\nerrors were:\n%s',
+                child.returncode, output, error_output)
+
+        (outputs, rest) = self._split_ipmitool_output(output, sentinels)
+        return outputs, rest, error_output, child.returncode
+
     def _run_ipmitool(self, cmd):
         """Legacy call of ipmitool (will be removed in future).
         """
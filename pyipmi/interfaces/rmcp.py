@@ -0,0 +1,511 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+from builtins import object
+
+import array
+import hashlib
+import socket
+import struct
+import time
+
+from .. import Session
+from ..errors import TimeoutError, DecodingError, CompletionCodeError
+from ..logger import log
+from ..msgs import create_message, create_request_by_name, \
+        encode_message, decode_message
+from ..utils import check_completion_code, array_tobytes, \
+        py3enc_unic_bytes_fix
+from .ipmb import IpmbHeader, RequestPipeline, encode_ipmb_msg
+
+RMCP_VERSION_1_0 = 0x06
+RMCP_SEQ_NUMBER_NO_ACK = 0xff
+
+RMCP_CLASS_ASF = 0x06
+RMCP_CLASS_IPMI = 0x07
+
+ASF_IANA_ENTERPRISE_NUMBER = 4542
+ASF_TYPE_PRESENCE_PONG = 0x40
+ASF_TYPE_PRESENCE_PING = 0x80
+
+AUTH_TYPE_NONE = 0x00
+AUTH_TYPE_MD2 = 0x01
+AUTH_TYPE_MD5 = 0x02
+AUTH_TYPE_STRAIGHT_PASSWORD = 0x04
+AUTH_TYPE_OEM = 0x05
+
+PRIVILEGE_LEVEL_CALLBACK = 0x01
+PRIVILEGE_LEVEL_USER = 0x02
+PRIVILEGE_LEVEL_OPERATOR = 0x03
+PRIVILEGE_LEVEL_ADMINISTRATOR = 0x04
+
+PRIVILEGE_LEVELS = {
+    'callback': PRIVILEGE_LEVEL_CALLBACK,
+    'user': PRIVILEGE_LEVEL_USER,
+    'operator': PRIVILEGE_LEVEL_OPERATOR,
+    'administrator': PRIVILEGE_LEVEL_ADMINISTRATOR,
+}
+
+
+def _pad(value, length=16):
+    value = py3enc_unic_bytes_fix(value or b'')
+    if len(value) > length:
+        raise RuntimeError('value must not exceed %d bytes' % length)
+    return value + b'\x00' * (length - len(value))
+
+
+class RmcpMsg(object):
+    """The RMCP header which is prepended to all ASF and IPMI messages."""
+
+    HEADER_FORMAT = '!BBBB'
+    HEADER_LEN = 4
+
+    def __init__(self, class_of_msg=None):
+        self.version = RMCP_VERSION_1_0
+        self.seq_number = RMCP_SEQ_NUMBER_NO_ACK
+        self.class_of_msg = class_of_msg
+
+    def pack(self, sdu):
+        return struct.pack(self.HEADER_FORMAT, self.version, 0,
+                self.seq_number, self.class_of_msg) + sdu
+
+    def unpack(self, pdu):
+        if len(pdu) < self.HEADER_LEN:
+            raise DecodingError('RMCP message too short')
+        (self.version, _, self.seq_number, self.class_of_msg) = \
+                struct.unpack(self.HEADER_FORMAT, pdu[:self.HEADER_LEN])
+        if self.version != RMCP_VERSION_1_0:
+            raise DecodingError('invalid RMCP version %d' % self.version)
+        return pdu[self.HEADER_LEN:]
+
+
+class AsfMsg(object):
+    """ASF message as used by the RMCP presence ping."""
+
+    HEADER_FORMAT = '!IBBBB'
+    HEADER_LEN = 8
+
+    def __init__(self, asf_type=None, tag=0):
+        self.asf_type = asf_type
+        self.tag = tag
+        self.data = b''
+
+    def pack(self):
+        return struct.pack(self.HEADER_FORMAT, ASF_IANA_ENTERPRISE_NUMBER,
+                self.asf_type, self.tag, 0, len(self.data)) + self.data
+
+    def unpack(self, pdu):
+        if len(pdu) < self.HEADER_LEN:
+            raise DecodingError('ASF message too short')
+        (iana, self.asf_type, self.tag, _, length) = \
+                struct.unpack(self.HEADER_FORMAT, pdu[:self.HEADER_LEN])
+        if iana != ASF_IANA_ENTERPRISE_NUMBER:
+            raise DecodingError('invalid ASF IANA enterprise number')
+        self.data = pdu[self.HEADER_LEN:self.HEADER_LEN + length]
+
+
+class IpmiMsg(object):
+    """The IPMI v1.5 session wrapper.
+
+    The authentication code is calculated over the session id, the session
+    sequence number and the IPMI message with the password of the session.
+    """
+
+    def __init__(self, auth_type=AUTH_TYPE_NONE, password=None):
+        self.auth_type = auth_type
+        self.password = _pad(password)
+        self.session_id = 0
+        self.sequence_number = 0
+        self.auth_code = None
+
+    def _auth_code(self, data):
+        if self.auth_type == AUTH_TYPE_NONE:
+            return b''
+        elif self.auth_type == AUTH_TYPE_STRAIGHT_PASSWORD:
+            return self.password
+        elif self.auth_type == AUTH_TYPE_MD5:
+            return hashlib.md5(self.password
+                    + struct.pack('<I', self.session_id)
+                    + data
+                    + struct.pack('<I', self.sequence_number)
+                    + self.password).digest()
+        raise RuntimeError('authentication type %d not supported' %
+                self.auth_type)
+
+    def pack(self, sdu):
+        return struct.pack('<BII', self.auth_type, self.sequence_number,
+                self.session_id) \
+            + self._auth_code(sdu) \
+            + struct.pack('B', len(sdu)) + sdu
+
+    def unpack(self, pdu):
+        if len(pdu) < 10:
+            raise DecodingError('IPMI session header too short')
+        (self.auth_type, self.sequence_number, self.session_id) = \
+                struct.unpack('<BII', pdu[:9])
+        offset = 9
+        self.auth_code = None
+        if self.auth_type != AUTH_TYPE_NONE:
+            self.auth_code = pdu[offset:offset+16]
+            offset += 16
+        length = struct.unpack('B', pdu[offset:offset+1])[0]
+        offset += 1
+        sdu = pdu[offset:offset+length]
+        if len(sdu) != length:
+            raise DecodingError('IPMI message too short')
+        return sdu
+
+
+class Rmcp(RequestPipeline):
+    """This interface talks RMCP/IPMI v1.5 over LAN directly.
+
+    In contrast to the ipmitool interface, the session is activated only once
+    in `establish_session` and is reused by all subsequent requests on the
+    same UDP socket until `close_session` is called.
+
+    With `window` greater than 1, `send_and_receive_batch` keeps up to
+    `window` requests in flight on the session.
+    """
+
+    NAME = 'rmcp'
+    SESSION_MSG_CLASS = IpmiMsg
+
+    def __init__(self, slave_address=0x81, host_target_address=0x20,
+            privilege_level='administrator', timeout=1.0, max_retries=3,
+            window=1):
+        RequestPipeline.__init__(self, window)
+        if privilege_level not in PRIVILEGE_LEVELS:
+            raise RuntimeError('privilege level %s not supported' %
+                    privilege_level)
+        self.slave_address = slave_address
+        self.host_target_address = host_target_address
+        self.privilege_level = PRIVILEGE_LEVELS[privilege_level]
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.next_sequence_number = 0
+
+        self._sock = None
+        self._ipmi_msg = self.SESSION_MSG_CLASS()
+        self._session_active = False
+        self._asf_tag = 0
+
+    def _open(self):
+        if self._sock is not None:
+            self._sock.close()
+
+        host = self._session._rmcp_host
+        port = self._session._rmcp_port
+        (family, socktype, proto, _, addr) = socket.getaddrinfo(host, port,
+                0, socket.SOCK_DGRAM)[0]
+        self._sock = socket.socket(family, socktype, proto)
+        # only accept datagrams from the BMC
+        self._sock.connect(addr)
+
+    def _close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _send_rmcp_msg(self, class_of_msg, sdu):
+        if self._sock is None:
+            raise RuntimeError('Session needs to be established')
+        self._sock.send(RmcpMsg(class_of_msg).pack(sdu))
+
+    def _receive_rmcp_msg(self, class_of_msg, timeout):
+        """Returns the next RMCP message payload of the given class. Other
+        messages are silently dropped.
+        """
+
+        start_time = time.time()
+        while True:
+            remaining = timeout - (time.time() - start_time)
+            if remaining <= 0:
+                raise TimeoutError()
+
+            self._sock.settimeout(remaining)
+            try:
+                pdu = self._sock.recv(1024)
+            except socket.timeout:
+                raise TimeoutError()
+
+            rmcp = RmcpMsg()
+            try:
+                sdu = rmcp.unpack(pdu)
+            except DecodingError as e:
+                log().debug('dropping invalid RMCP message: %s', e)
+                continue
+
+            if rmcp.class_of_msg == class_of_msg:
+                return sdu
+
+    def _inc_sequence_number(self):
+        self.next_sequence_number = (self.next_sequence_number + 1) % 64
+
+    def _inc_session_sequence_number(self):
+        if self._session_active:
+            # zero is reserved for messages outside a session
+            seq = (self._ipmi_msg.sequence_number + 1) & 0xffffffff
+            self._ipmi_msg.sequence_number = seq or 1
+
+    def _pack_ipmi_msg(self, data):
+        """Returns the session wrapper for the IPMB message `data`.
+
+        Each call uses the next session sequence number.
+        """
+        self._inc_session_sequence_number()
+        log().debug('IPMI TX [%s]', ' '.join(['%02x' % b for b in data]))
+        return self._ipmi_msg.pack(array_tobytes(data))
+
+    def _send_ipmi_msg(self, data):
+        self._send_rmcp_msg(RMCP_CLASS_IPMI, self._pack_ipmi_msg(data))
+
+    def _unpack_ipmi_msg(self, sdu):
+        """Returns the IPMI message carried by the session wrapper `sdu`.
+
+        Raises a DecodingError if the message does not belong to the
+        session.
+        """
+        ipmi_msg = IpmiMsg()
+        data = ipmi_msg.unpack(sdu)
+
+        # the session id is only known after the activation
+        if (self._session_active
+                and ipmi_msg.session_id != self._ipmi_msg.session_id):
+            raise DecodingError('session id mismatch (%08Xh != %08Xh)' %
+                    (ipmi_msg.session_id, self._ipmi_msg.session_id))
+
+        return data
+
+    def _send_request(self, header, tx_data):
+        self._send_ipmi_msg(tx_data)
+
+    def _receive_response(self, timeout):
+        sdu = self._receive_rmcp_msg(RMCP_CLASS_IPMI, timeout)
+        try:
+            return array.array('B', self._unpack_ipmi_msg(sdu))
+        except DecodingError as e:
+            log().debug('dropping invalid IPMI message: %s', e)
+            return None
+
+    def _rs_sa(self, target):
+        if target is None or target.ipmb_address is None:
+            return self.host_target_address
+
+        if target.ipmb_address != self.host_target_address:
+            raise RuntimeError('The rmcp interface does not support '
+                    'bridging (target 0x%02x)' % target.ipmb_address)
+
+        return target.ipmb_address
+
+    def _build_request(self, target, lun, netfn, cmdid, payload):
+        """Returns the IPMB header and the IPMB message of a request."""
+        self._inc_sequence_number()
+
+        # assemble IPMB header
+        header = IpmbHeader()
+        header.netfn = netfn
+        header.rs_lun = lun
+        header.rs_sa = self._rs_sa(target)
+        header.rq_seq = self.next_sequence_number
+        header.rq_lun = 0
+        header.rq_sa = self.slave_address
+        header.cmd_id = cmdid
+
+        tx_data = encode_ipmb_msg(header,
+                array.array('B', py3enc_unic_bytes_fix(payload)))
+
+        return (header, tx_data)
+
+    def _send_and_receive(self, target, lun, netfn, cmdid, payload):
+        rx_data = self._send_and_receive_pipelined(
+                [(target, lun, netfn, cmdid, payload)])[0]
+        return self._strip_ipmb_msg(rx_data)
+
+    def _send_and_receive_msg(self, req):
+        rx_data = self._send_and_receive(None, req.lun, req.netfn,
+                req.cmdid, encode_message(req))
+        rsp = create_message(req.cmdid, req.netfn + 1)
+        decode_message(rsp, rx_data)
+        check_completion_code(rsp.completion_code)
+        return rsp
+
+    def _select_auth_type(self, rsp):
+        if self._session.auth_type == Session.AUTH_TYPE_NONE:
+            if not rsp.support.none:
+                raise RuntimeError('BMC does not support authentication '
+                        'type NONE')
+            return AUTH_TYPE_NONE
+
+        if rsp.support.md5:
+            return AUTH_TYPE_MD5
+        elif rsp.support.straight:
+            return AUTH_TYPE_STRAIGHT_PASSWORD
+        elif rsp.support.none:
+            return AUTH_TYPE_NONE
+
+        raise RuntimeError('no supported authentication type offered by '
+                'the BMC')
+
+    def _session_activation(self):
+        """Generator which yields the requests needed to activate the
+        session. The response of each request is sent back into the
+        generator.
+
+        This way the blocking interface and the asyncio front-end share the
+        same session setup.
+        """
+        req = create_request_by_name('GetChannelAuthenticationCapabilities')
+        req.privilege_level.requested = self.privilege_level
+        rsp = yield req
+        auth_type = self._select_auth_type(rsp)
+
+        username = None
+        password = None
+        if self._session.auth_type == Session.AUTH_TYPE_PASSWORD:
+            username = self._session._auth_username
+            password = self._session._auth_password
+
+        req = create_request_by_name('GetSessionChallenge')
+        req.authentication.type = auth_type
+        req.user_name = array.array('B', _pad(username))
+        rsp = yield req
+
+        # the activate session request is already authenticated using the
+        # temporary session id
+        self._ipmi_msg = IpmiMsg(auth_type, password)
+        self._ipmi_msg.session_id = rsp.temporary_session_id
+
+        req = create_request_by_name('ActivateSession')
+        req.authentication.type = auth_type
+        req.privilege_level.maximum_requested = self.privilege_level
+        req.challenge_string = rsp.challenge_string
+        req.initial_outbound_sequence_number = 1
+        rsp = yield req
+
+        self._ipmi_msg.session_id = rsp.session_id
+        # the sequence number is incremented before each message is sent
+        self._ipmi_msg.sequence_number = \
+                (rsp.initial_inbound_sequence_number - 1) & 0xffffffff
+        self._session_active = True
+
+        req = create_request_by_name('SetSessionPrivilegeLevel')
+        req.privilege_level.requested = self.privilege_level
+        yield req
+
+        log().debug('RMCP session %08Xh activated', self._ipmi_msg.session_id)
+
+    def _send_and_receive_step(self, request):
+        return self._send_and_receive_msg(request)
+
+    def _activate_session(self):
+        steps = self._session_activation()
+        rsp = None
+        while True:
+            try:
+                request = steps.send(rsp)
+            except StopIteration:
+                break
+            rsp = self._send_and_receive_step(request)
+
+    def _reset_session(self):
+        self._ipmi_msg = self.SESSION_MSG_CLASS()
+        self._session_active = False
+
+    def _close_session_request(self):
+        """Returns the request to close the active session or None."""
+        if not self._session_active:
+            return None
+        req = create_request_by_name('CloseSession')
+        req.session_id = self._ipmi_msg.session_id
+        return req
+
+    def establish_session(self, session):
+        self._session = session
+        self._open()
+        self._reset_session()
+
+        try:
+            self._activate_session()
+        except Exception:
+            self._session_active = False
+            self._close()
+            raise
+
+    def close_session(self, session):
+        req = self._close_session_request()
+        try:
+            if req is not None:
+                self._send_and_receive_msg(req)
+        except TimeoutError:
+            log().warning('Close session request timed out')
+        except CompletionCodeError as e:
+            log().warning('Close session request failed: %s', e)
+        finally:
+            # the session is dropped on our side in any case
+            self._reset_session()
+            self._close()
+
+    def rmcp_ping(self):
+        if self._sock is None:
+            self._open()
+
+        self._asf_tag = (self._asf_tag + 1) % 0xff
+        ping = AsfMsg(ASF_TYPE_PRESENCE_PING, self._asf_tag)
+        self._send_rmcp_msg(RMCP_CLASS_ASF, ping.pack())
+
+        start_time = time.time()
+        while True:
+            timeout = self.timeout - (time.time() - start_time)
+            sdu = self._receive_rmcp_msg(RMCP_CLASS_ASF, timeout)
+            pong = AsfMsg()
+            try:
+                pong.unpack(sdu)
+            except DecodingError:
+                continue
+            if (pong.asf_type == ASF_TYPE_PRESENCE_PONG
+                    and pong.tag == self._asf_tag):
+                return
+
+    def is_ipmc_accessible(self, target):
+        try:
+            self.rmcp_ping()
+            accessible = True
+        except TimeoutError:
+            accessible = False
+
+        return accessible
+
+    def send_and_receive_raw(self, target, lun, netfn, raw_bytes):
+        raw_bytes = py3enc_unic_bytes_fix(raw_bytes)
+        return self._send_and_receive(target, lun, netfn,
+                array.array('B', raw_bytes[0:1])[0], raw_bytes[1:])
+
+    def send_and_receive(self, req):
+        """Sends an IPMI request message and waits for its response.
+
+        `req` is a IPMI Message containing both the request and response.
+        """
+
+        log().debug('IPMI Request [%s]', req)
+
+        rx_data = self._send_and_receive(req.target, req.lun, req.netfn,
+                req.cmdid, encode_message(req))
+        rsp = create_message(req.cmdid, req.netfn + 1)
+        decode_message(rsp, rx_data)
+
+        log().debug('IPMI Response [%s])', rsp)
+
+        return rsp
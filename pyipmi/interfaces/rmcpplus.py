@@ -0,0 +1,456 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+from builtins import object
+
+import hashlib
+import hmac
+import os
+import struct
+import time
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    AES = None
+
+from .. import Session
+from ..errors import TimeoutError, DecodingError
+from ..logger import log
+from ..msgs import create_request_by_name
+from ..utils import py3enc_unic_bytes_fix
+from .rmcp import Rmcp, RMCP_CLASS_IPMI, _pad
+
+AUTH_TYPE_RMCP_PLUS = 0x06
+
+PAYLOAD_TYPE_IPMI = 0x00
+PAYLOAD_TYPE_OPEN_SESSION_REQUEST = 0x10
+PAYLOAD_TYPE_OPEN_SESSION_RESPONSE = 0x11
+PAYLOAD_TYPE_RAKP_1 = 0x12
+PAYLOAD_TYPE_RAKP_2 = 0x13
+PAYLOAD_TYPE_RAKP_3 = 0x14
+PAYLOAD_TYPE_RAKP_4 = 0x15
+
+PAYLOAD_TYPE_MASK = 0x3f
+PAYLOAD_AUTHENTICATED = 0x40
+PAYLOAD_ENCRYPTED = 0x80
+
+NEXT_HEADER = 0x07
+
+# lookup the user by name and privilege level in the RAKP message 1
+RAKP_NAME_ONLY_LOOKUP = 0x10
+
+AUTH_ALGORITHM_RAKP_HMAC_SHA1 = 0x01
+AUTH_ALGORITHM_RAKP_HMAC_SHA256 = 0x03
+
+INTEGRITY_ALGORITHM_NONE = 0x00
+INTEGRITY_ALGORITHM_HMAC_SHA1_96 = 0x01
+INTEGRITY_ALGORITHM_HMAC_SHA256_128 = 0x04
+
+CONFIDENTIALITY_ALGORITHM_NONE = 0x00
+CONFIDENTIALITY_ALGORITHM_AES_CBC_128 = 0x01
+
+CIPHER_SUITES = {
+    1: (AUTH_ALGORITHM_RAKP_HMAC_SHA1, INTEGRITY_ALGORITHM_NONE,
+        CONFIDENTIALITY_ALGORITHM_NONE),
+    2: (AUTH_ALGORITHM_RAKP_HMAC_SHA1, INTEGRITY_ALGORITHM_HMAC_SHA1_96,
+        CONFIDENTIALITY_ALGORITHM_NONE),
+    3: (AUTH_ALGORITHM_RAKP_HMAC_SHA1, INTEGRITY_ALGORITHM_HMAC_SHA1_96,
+        CONFIDENTIALITY_ALGORITHM_AES_CBC_128),
+    15: (AUTH_ALGORITHM_RAKP_HMAC_SHA256, INTEGRITY_ALGORITHM_NONE,
+        CONFIDENTIALITY_ALGORITHM_NONE),
+    16: (AUTH_ALGORITHM_RAKP_HMAC_SHA256, INTEGRITY_ALGORITHM_HMAC_SHA256_128,
+        CONFIDENTIALITY_ALGORITHM_NONE),
+    17: (AUTH_ALGORITHM_RAKP_HMAC_SHA256, INTEGRITY_ALGORITHM_HMAC_SHA256_128,
+        CONFIDENTIALITY_ALGORITHM_AES_CBC_128),
+}
+
+# (hash function, length of the RAKP message 4 integrity check value)
+AUTH_ALGORITHMS = {
+    AUTH_ALGORITHM_RAKP_HMAC_SHA1: (hashlib.sha1, 12),
+    AUTH_ALGORITHM_RAKP_HMAC_SHA256: (hashlib.sha256, 16),
+}
+
+# (hash function, length of the authcode in the session trailer)
+INTEGRITY_ALGORITHMS = {
+    INTEGRITY_ALGORITHM_HMAC_SHA1_96: (hashlib.sha1, 12),
+    INTEGRITY_ALGORITHM_HMAC_SHA256_128: (hashlib.sha256, 16),
+}
+
+RMCP_PLUS_STATUS_CODES = {
+    0x01: 'Insufficient resources to create a session',
+    0x02: 'Invalid session ID',
+    0x03: 'Invalid payload type',
+    0x04: 'Invalid authentication algorithm',
+    0x05: 'Invalid integrity algorithm',
+    0x06: 'No matching authentication payload',
+    0x07: 'No matching integrity payload',
+    0x08: 'Inactive session ID',
+    0x09: 'Invalid role',
+    0x0a: 'Unauthorized role or privilege level requested',
+    0x0b: 'Insufficient resources to create a session at the requested role',
+    0x0c: 'Invalid name length',
+    0x0d: 'Unauthorized name',
+    0x0e: 'Unauthorized GUID',
+    0x0f: 'Invalid integrity check value',
+    0x10: 'Invalid confidentiality algorithm',
+    0x11: 'No cipher suite match with proposed security algorithms',
+    0x12: 'Illegal or unrecognized parameter',
+}
+
+AES_BLOCK_SIZE = 16
+
+
+class CipherSuite(object):
+    """The authentication, integrity and confidentiality algorithms used by
+    a RMCP+ session.
+    """
+
+    def __init__(self, cipher_suite_id):
+        if cipher_suite_id not in CIPHER_SUITES:
+            raise RuntimeError('cipher suite %d not supported' %
+                    cipher_suite_id)
+
+        self.id = cipher_suite_id
+        (self.authentication, self.integrity, self.confidentiality) = \
+                CIPHER_SUITES[cipher_suite_id]
+
+        if (self.confidentiality == CONFIDENTIALITY_ALGORITHM_AES_CBC_128
+                and AES is None):
+            raise RuntimeError('No pycryptodome module found. The cipher '
+                    'suite %d needs AES-CBC-128.' % cipher_suite_id)
+
+        (self._auth_hash, self.icv_length) = \
+                AUTH_ALGORITHMS[self.authentication]
+        (self._integrity_hash, self.integrity_length) = \
+                INTEGRITY_ALGORITHMS.get(self.integrity, (None, 0))
+
+    def rakp_hmac(self, key, data):
+        return hmac.new(key, data, self._auth_hash).digest()
+
+    def rakp_icv(self, key, data):
+        return self.rakp_hmac(key, data)[:self.icv_length]
+
+    def integrity_check(self, key, data):
+        return hmac.new(key, data, self._integrity_hash).digest()[
+                :self.integrity_length]
+
+    def encrypt(self, key, data):
+        pad_length = (AES_BLOCK_SIZE - (len(data) + 1) % AES_BLOCK_SIZE) \
+                % AES_BLOCK_SIZE
+        data += bytes(bytearray(range(1, pad_length + 1))) \
+                + struct.pack('B', pad_length)
+        iv = os.urandom(AES_BLOCK_SIZE)
+        cipher = AES.new(key[:AES_BLOCK_SIZE], AES.MODE_CBC, iv)
+        return iv + cipher.encrypt(data)
+
+    def decrypt(self, key, data):
+        if len(data) < 2 * AES_BLOCK_SIZE or len(data) % AES_BLOCK_SIZE:
+            raise DecodingError('invalid length of encrypted payload')
+        iv = data[:AES_BLOCK_SIZE]
+        cipher = AES.new(key[:AES_BLOCK_SIZE], AES.MODE_CBC, iv)
+        data = cipher.decrypt(data[AES_BLOCK_SIZE:])
+        pad_length = bytearray(data)[-1]
+        if pad_length >= AES_BLOCK_SIZE:
+            raise DecodingError('invalid confidentiality pad length')
+        return data[:-1 - pad_length]
+
+
+class RmcpPlusMsg(object):
+    """The IPMI v2.0 RMCP+ session wrapper.
+
+    Outside a session, no keys are given and the payload is sent in the
+    clear. Inside a session, the payload is encrypted with K2 and the
+    session trailer is protected with K1 according to the cipher suite.
+    """
+
+    HEADER_FORMAT = '<BBIIH'
+    HEADER_LEN = 12
+
+    def __init__(self, cipher_suite=None, k1=None, k2=None):
+        self.cipher_suite = cipher_suite
+        self.k1 = None
+        self.k2 = None
+        if cipher_suite is not None:
+            if cipher_suite.integrity != INTEGRITY_ALGORITHM_NONE:
+                self.k1 = k1
+            if cipher_suite.confidentiality != CONFIDENTIALITY_ALGORITHM_NONE:
+                self.k2 = k2
+        self.payload_type = PAYLOAD_TYPE_IPMI
+        self.session_id = 0
+        self.sequence_number = 0
+        self.authenticated = False
+        self.encrypted = False
+
+    def pack(self, sdu, payload_type=PAYLOAD_TYPE_IPMI):
+        self.payload_type = payload_type
+        self.encrypted = self.k2 is not None
+        self.authenticated = self.k1 is not None
+
+        if self.encrypted:
+            sdu = self.cipher_suite.encrypt(self.k2, sdu)
+            payload_type |= PAYLOAD_ENCRYPTED
+        if self.authenticated:
+            payload_type |= PAYLOAD_AUTHENTICATED
+
+        pdu = struct.pack(self.HEADER_FORMAT, AUTH_TYPE_RMCP_PLUS,
+                payload_type, self.session_id, self.sequence_number,
+                len(sdu)) + sdu
+
+        if self.authenticated:
+            # the integrity pad aligns the trailer to a multiple of four
+            pad_length = (4 - (len(pdu) + 2) % 4) % 4
+            pdu += b'\xff' * pad_length \
+                    + struct.pack('BB', pad_length, NEXT_HEADER)
+            pdu += self.cipher_suite.integrity_check(self.k1, pdu)
+
+        return pdu
+
+    def unpack(self, pdu):
+        if len(pdu) < self.HEADER_LEN:
+            raise DecodingError('RMCP+ session header too short')
+
+        (auth_type, payload_type, self.session_id, self.sequence_number,
+                length) = struct.unpack(self.HEADER_FORMAT,
+                        pdu[:self.HEADER_LEN])
+        if auth_type != AUTH_TYPE_RMCP_PLUS:
+            raise DecodingError('not a RMCP+ message')
+
+        self.payload_type = payload_type & PAYLOAD_TYPE_MASK
+        self.authenticated = bool(payload_type & PAYLOAD_AUTHENTICATED)
+        self.encrypted = bool(payload_type & PAYLOAD_ENCRYPTED)
+
+        sdu = pdu[self.HEADER_LEN:self.HEADER_LEN + length]
+        if len(sdu) != length:
+            raise DecodingError('RMCP+ payload too short')
+
+        if self.authenticated:
+            if self.k1 is None:
+                raise DecodingError('unexpected authenticated message')
+            auth_code_offset = len(pdu) - self.cipher_suite.integrity_length
+            if auth_code_offset < self.HEADER_LEN + length + 2:
+                raise DecodingError('RMCP+ session trailer too short')
+            auth_code = self.cipher_suite.integrity_check(self.k1,
+                    pdu[:auth_code_offset])
+            if not hmac.compare_digest(auth_code, pdu[auth_code_offset:]):
+                raise DecodingError('RMCP+ integrity check failed')
+
+        if self.encrypted:
+            if self.k2 is None:
+                raise DecodingError('unexpected encrypted message')
+            sdu = self.cipher_suite.decrypt(self.k2, sdu)
+
+        return sdu
+
+
+def _algorithm_payload(payload_type, algorithm):
+    return struct.pack('BBBBBBBB', payload_type, 0, 0, 8, algorithm, 0, 0, 0)
+
+
+class RmcpPlus(Rmcp):
+    """This interface talks RMCP+/IPMI v2.0 over LAN directly.
+
+    The session is opened with the RAKP handshake in `establish_session`.
+    The session integrity key (SIK) and the derived keys K1 and K2 are
+    computed only once and are used by all subsequent requests until
+    `close_session` is called.
+    """
+
+    NAME = 'rmcpplus'
+    SESSION_MSG_CLASS = RmcpPlusMsg
+
+    def __init__(self, slave_address=0x81, host_target_address=0x20,
+            privilege_level='administrator', cipher_suite=3, kg=None,
+            timeout=1.0, max_retries=3, window=1):
+        Rmcp.__init__(self, slave_address, host_target_address,
+                privilege_level, timeout, max_retries, window)
+        self.cipher_suite = CipherSuite(cipher_suite)
+        self.kg = kg
+        self._console_session_id = 0
+        self._message_tag = 0
+
+    def _unpack_ipmi_msg(self, sdu):
+        msg = RmcpPlusMsg(self._ipmi_msg.cipher_suite, self._ipmi_msg.k1,
+                self._ipmi_msg.k2)
+        data = msg.unpack(sdu)
+
+        if msg.payload_type != PAYLOAD_TYPE_IPMI:
+            raise DecodingError('unexpected payload type %02Xh' %
+                    msg.payload_type)
+
+        if self._session_active:
+            if msg.session_id != self._console_session_id:
+                raise DecodingError('session id mismatch (%08Xh != %08Xh)' %
+                        (msg.session_id, self._console_session_id))
+            if self._ipmi_msg.k1 is not None and not msg.authenticated:
+                raise DecodingError('unauthenticated message in session')
+
+        return data
+
+    def _match_payload(self, sdu, payload_type, tag):
+        """Returns the session setup payload if `sdu` is the expected
+        response, otherwise None.
+        """
+        msg = RmcpPlusMsg()
+        try:
+            payload = msg.unpack(sdu)
+        except DecodingError as e:
+            log().debug('dropping invalid RMCP+ message: %s', e)
+            return None
+
+        if (msg.payload_type == payload_type and len(payload) >= 8
+                and bytearray(payload)[0] == tag):
+            return payload
+
+        return None
+
+    def _check_payload_status(self, rsp):
+        status = bytearray(rsp)[1]
+        if status != 0:
+            raise RuntimeError('RMCP+ session setup failed: %s (%02Xh)' %
+                    (RMCP_PLUS_STATUS_CODES.get(status, 'Unknown error'),
+                    status))
+
+    def _receive_payload(self, payload_type, tag):
+        start_time = time.time()
+        while True:
+            timeout = self.timeout - (time.time() - start_time)
+            sdu = self._receive_rmcp_msg(RMCP_CLASS_IPMI, timeout)
+            payload = self._match_payload(sdu, payload_type, tag)
+            if payload is not None:
+                return payload
+
+    def _send_and_receive_payload(self, payload_type, payload,
+            rsp_payload_type):
+        """Sends a session setup message and waits for its response.
+
+        These messages are always sent outside of a session.
+        """
+
+        tag = bytearray(payload)[0]
+        sdu = RmcpPlusMsg().pack(payload, payload_type)
+
+        retries = 0
+        while retries < self.max_retries:
+            self._send_rmcp_msg(RMCP_CLASS_IPMI, sdu)
+            try:
+                rsp = self._receive_payload(rsp_payload_type, tag)
+                break
+            except TimeoutError:
+                log().warning('RMCP+ session setup timed out')
+
+            retries += 1
+
+        else:
+            raise TimeoutError()
+
+        self._check_payload_status(rsp)
+
+        return rsp
+
+    def _next_message_tag(self):
+        self._message_tag = (self._message_tag + 1) % 0x100
+        return self._message_tag
+
+    def _send_and_receive_step(self, request):
+        if isinstance(request, tuple):
+            return self._send_and_receive_payload(*request)
+        return self._send_and_receive_msg(request)
+
+    def _session_activation(self):
+        """Generator which yields the session setup messages, as tuple of
+        payload type, payload and expected response payload type, and the
+        requests needed to activate the session.
+        """
+        username = b''
+        password = None
+        if self._session.auth_type == Session.AUTH_TYPE_PASSWORD:
+            username = py3enc_unic_bytes_fix(self._session._auth_username)
+            password = self._session._auth_password
+        if len(username) > 16:
+            raise RuntimeError('user name must not exceed 16 bytes')
+
+        suite = self.cipher_suite
+        kuid = _pad(password, 20)
+        if self.kg is not None:
+            kg = _pad(self.kg, 20)
+        else:
+            kg = kuid
+
+        console_session_id = struct.unpack('<I', os.urandom(4))[0] or 1
+
+        # open session request
+        req = struct.pack('<BBHI', self._next_message_tag(),
+                self.privilege_level, 0, console_session_id) \
+            + _algorithm_payload(0, suite.authentication) \
+            + _algorithm_payload(1, suite.integrity) \
+            + _algorithm_payload(2, suite.confidentiality)
+        rsp = yield (PAYLOAD_TYPE_OPEN_SESSION_REQUEST, req,
+                PAYLOAD_TYPE_OPEN_SESSION_RESPONSE)
+        if len(rsp) < 36:
+            raise DecodingError('open session response too short')
+        (rsp_console_session_id, bmc_session_id) = \
+                struct.unpack('<II', rsp[4:12])
+        if rsp_console_session_id != console_session_id:
+            raise DecodingError('open session response for wrong session')
+        algorithms = bytearray(rsp)[16:36:8]
+        if tuple(algorithms) != CIPHER_SUITES[suite.id]:
+            raise RuntimeError('BMC does not support cipher suite %d' %
+                    suite.id)
+
+        # RAKP message 1/2
+        rm = os.urandom(16)
+        role = self.privilege_level | RAKP_NAME_ONLY_LOOKUP
+        user = struct.pack('BB', role, len(username)) + username
+        req = struct.pack('<BBHI', self._next_message_tag(), 0, 0,
+                bmc_session_id) + rm \
+            + struct.pack('BBBB', role, 0, 0, len(username)) + username
+        rsp = yield (PAYLOAD_TYPE_RAKP_1, req, PAYLOAD_TYPE_RAKP_2)
+        rc = rsp[8:24]
+        guid = rsp[24:40]
+        auth_code = suite.rakp_hmac(kuid,
+                struct.pack('<II', console_session_id, bmc_session_id)
+                + rm + rc + guid + user)
+        if not hmac.compare_digest(auth_code, rsp[40:]):
+            raise RuntimeError('RAKP message 2 authentication failed')
+
+        sik = suite.rakp_hmac(kg, rm + rc + user)
+
+        # RAKP message 3/4
+        req = struct.pack('<BBHI', self._next_message_tag(), 0, 0,
+                bmc_session_id) \
+            + suite.rakp_hmac(kuid, rc + struct.pack('<I', console_session_id)
+                    + user)
+        rsp = yield (PAYLOAD_TYPE_RAKP_3, req, PAYLOAD_TYPE_RAKP_4)
+        icv = suite.rakp_icv(sik, rm + struct.pack('<I', bmc_session_id)
+                + guid)
+        if not hmac.compare_digest(icv, rsp[8:]):
+            raise RuntimeError('RAKP message 4 integrity check failed')
+
+        k1 = suite.rakp_hmac(sik, b'\x01' * 20)
+        k2 = suite.rakp_hmac(sik, b'\x02' * 20)
+
+        self._ipmi_msg = RmcpPlusMsg(suite, k1, k2)
+        self._ipmi_msg.session_id = bmc_session_id
+        self._console_session_id = console_session_id
+        self._session_active = True
+
+        req = create_request_by_name('SetSessionPrivilegeLevel')
+        req.privilege_level.requested = self.privilege_level
+        yield req
+
+        log().debug('RMCP+ session %08Xh activated (cipher suite %d)',
+                bmc_session_id, suite.id)
@@ -34,6 +34,8 @@ import array
 import pyipmi
 import pyipmi.interfaces
 
+from pyipmi.utils import array_tobytes
+
 Command = namedtuple('Command', 'name fn')
 CommandHelp = namedtuple('CommandHelp', 'name arguments help')
 
@@ -119,6 +121,12 @@ def sdr_show(ipmi, s):
         print("Entity:           %s.%s" % (s.entity_id, s.entity_instance))
         print("Reading:          %s" % raw)
         print("Reading state:    0x%x" % states)
+    elif isinstance(s, pyipmi.sdr.SdrEntityAssociationRecord):
+        print("SDR record ID:    0x%04x" % s.id)
+        print("Entity:           %s.%s" % (s.container_entity_id,
+                s.container_entity_instance))
+        print("Contains:         %s" % ' '.join('%s.%s' % e
+                for e in s.contained_entities))
     else:
         print("SDR record ID:    0x%04x" % s.id)
         print("Device Id string: %s" % s.device_id_string)
@@ -161,30 +169,46 @@ def cmd_sdr_list(ipmi, args):
     print("SDR-ID |     | Device String    |")
     print("=======|=====|==================|====================")
 
-    for s in ipmi.device_sdr_entries():
-        try:
-            number = None
-            value = None
-            states = None
-
-            if s.type is pyipmi.sdr.SDR_TYPE_FULL_SENSOR_RECORD:
-                (value, states) = ipmi.get_sensor_reading(s.number)
-                number = s.number
-                if value is not None:
-                    value = s.convert_sensor_raw_to_value(value)
-
-            elif s.type is pyipmi.sdr.SDR_TYPE_COMPACT_SENSOR_RECORD:
-                (value, states) = ipmi.get_sensor_reading(s.number)
-                number = s.number
-
-            print_sdr_list_entry(s.id, number, s.device_id_string,
-                        value, states)
-
-        except pyipmi.errors.CompletionCodeError as e:
-            if s.type in (pyipmi.sdr.SDR_TYPE_COMPACT_SENSOR_RECORD,
-                    pyipmi.sdr.SDR_TYPE_FULL_SENSOR_RECORD):
+    sdrs = list(ipmi.device_sdr_entries())
+    sensor_types = (pyipmi.sdr.SDR_TYPE_FULL_SENSOR_RECORD,
+            pyipmi.sdr.SDR_TYPE_COMPACT_SENSOR_RECORD)
+
+    # read all sensors at once
+    sensors = [s for s in sdrs if s.type in sensor_types]
+    readings = dict(zip([s.id for s in sensors],
+            ipmi.get_sensor_readings([s.number for s in sensors])))
+
+    for s in sdrs:
+        number = None
+        value = None
+        states = None
+
+        if isinstance(s, pyipmi.sdr.SdrEntityAssociationRecord):
+            continue
+
+        if s.type in sensor_types:
+            reading = readings[s.id]
+            if isinstance(reading, pyipmi.errors.CompletionCodeError):
                 print("0x%04x | %3d | %-16s | ERR: CC=0x%02x " % (s.id,
-                        s.number, s.device_id_string, e.cc))
+                        s.number, s.device_id_string, reading.cc))
+                continue
+
+            (value, states) = reading
+            number = s.number
+            if (s.type is pyipmi.sdr.SDR_TYPE_FULL_SENSOR_RECORD
+                    and value is not None):
+                value = s.convert_sensor_raw_to_value(value)
+
+        print_sdr_list_entry(s.id, number, s.device_id_string,
+                    value, states)
+
+def cmd_sdr_dump(ipmi, args):
+    if len(args) != 1:
+        usage()
+        return
+
+    count = ipmi.dump_sdr_repository(args[0])
+    print('Dumped %d SDRs to %s' % (count, args[0]))
 
 def cmd_fru_print(ipmi, args):
     fru_id = 0
@@ -270,8 +294,8 @@ def cmd_raw(ipmi, args):
 
     netfn = int(args[0], 0)
     raw_bytes = array.array('B', [int(d, 0) for d in args[1:]])
-    rsp = ipmi.raw_command(lun, netfn, raw_bytes.tostring())
-    print(' '.join('%02x' % ord(d) for d in rsp))
+    rsp = ipmi.raw_command(lun, netfn, array_tobytes(raw_bytes))
+    print(' '.join('%02x' % d for d in bytearray(rsp)))
 
 def cmd_hpm_capabilities(ipmi, args):
     cap = ipmi.get_target_upgrade_capabilities()
@@ -405,7 +429,8 @@ Options:
   -h               Show this help
   -v               Be verbose
   -V               Print version
-  -I <interface>   Set interface (available: aardvark ipmitool)
+  -I <interface>   Set interface (available: aardvark ipmitool rmcp
+                   rmcpplus)
   -H <host>        Set RMCP host
   -U <user>        Set RMCP user
   -P <password>    Set RMCP password
@@ -417,6 +442,14 @@ Aardvark options:
   serial=<SN>       Serial number of the device
   pullups=<on|off>  Enable/disable pullups
   power=<on|off>    Enable/disable target power
+  window=<N>        Max. number of requests in flight (default 1)
+
+RMCP options:
+  window=<N>        Max. number of requests in flight (default 1)
+
+RMCP+ options:
+  cipher_suite=<N>  Cipher suite (1, 2, 3, 15, 16 or 17, default 3)
+  window=<N>        Max. number of requests in flight (default 1)
 '''[1:])
         print('Commands:')
 
@@ -498,6 +531,8 @@ def main():
     aardvark_serial = None
     aardvark_pullups = None
     aardvark_target_power = None
+    rmcpplus_cipher_suite = 3
+    window = 1
 
     for option in interface_options:
         (name, value) = option.split('=', 1)
@@ -511,13 +546,24 @@ def main():
             aardvark_target_power = True
         elif (interface_name, name, value) == ('aardvark', 'power', 'off'):
             aardvark_target_power = False
+        elif (interface_name, name) == ('rmcpplus', 'cipher_suite'):
+            rmcpplus_cipher_suite = int(value)
+        elif (interface_name in ('aardvark', 'rmcp', 'rmcpplus')
+                and name == 'window'):
+            window = int(value)
         else:
             print('Warning: unknown option %s' % name)
 
     try:
         if interface_name == 'aardvark':
             interface = pyipmi.interfaces.create_interface(interface_name,
-                            serial_number=aardvark_serial)
+                            serial_number=aardvark_serial, window=window)
+        elif interface_name == 'rmcp':
+            interface = pyipmi.interfaces.create_interface(interface_name,
+                            window=window)
+        elif interface_name == 'rmcpplus':
+            interface = pyipmi.interfaces.create_interface(interface_name,
+                            cipher_suite=rmcpplus_cipher_suite, window=window)
         else:
             interface = pyipmi.interfaces.create_interface(interface_name)
     except RuntimeError as e:
@@ -568,6 +614,7 @@ COMMANDS = (
         Command('sdr list', cmd_sdr_list),
         Command('sdr show', cmd_sdr_show),
         Command('sdr showall', cmd_sdr_show_all),
+        Command('sdr dump', cmd_sdr_dump),
         Command('fru print', cmd_fru_print),
         Command('picmg frucontrol cr', cmd_picmg_frucontrol_cold_reset),
         Command('picmg power get', cmd_picmg_get_power),
@@ -610,6 +657,8 @@ COMMAND_HELP = (
         CommandHelp('sdr list', None, 'List all SDRs'),
         CommandHelp('sdr show', '<sdr-id>', 'Show detail for one SDR'),
         CommandHelp('sdr showall', None, 'Show detail for all SDRs'),
+        CommandHelp('sdr dump', '<file>',
+                'Write the SDR repository to a file'),
 
         CommandHelp('bmc', None,
                 'Management Controller status and global enables'),
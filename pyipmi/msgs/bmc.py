@@ -422,3 +422,160 @@ class MasterWriteReadRsp(Message):
         CompletionCode(),
         RemainingBytes('data'),
     )
+
+
+@register_message_class
+class GetChannelAuthenticationCapabilitiesReq(Message):
+    __cmdid__ = constants.CMDID_GET_CHANNEL_AUTHENTICATION_CAPABILITIES
+    __netfn__ = constants.NETFN_APP
+    __fields__ = (
+        Bitfield('channel', 1,
+            Bitfield.Bit('number', 4, 0xe),
+            Bitfield.ReservedBit(3, 0),
+            Bitfield.Bit('type', 1, 0),
+        ),
+        Bitfield('privilege_level', 1,
+            Bitfield.Bit('requested', 4, 0),
+            Bitfield.ReservedBit(4, 0),
+        ),
+    )
+
+
+@register_message_class
+class GetChannelAuthenticationCapabilitiesRsp(Message):
+    __cmdid__ = constants.CMDID_GET_CHANNEL_AUTHENTICATION_CAPABILITIES
+    __netfn__ = constants.NETFN_APP | 1
+    __fields__ = (
+        CompletionCode(),
+        UnsignedInt('channel_number', 1),
+        Bitfield('support', 1,
+            Bitfield.Bit('none', 1),
+            Bitfield.Bit('md2', 1),
+            Bitfield.Bit('md5', 1),
+            Bitfield.ReservedBit(1, 0),
+            Bitfield.Bit('straight', 1),
+            Bitfield.Bit('oem_proprietary', 1),
+            Bitfield.ReservedBit(1, 0),
+            Bitfield.Bit('ipmi_2_0', 1),
+        ),
+        Bitfield('status', 1,
+            Bitfield.Bit('anonymous_login_enabled', 1),
+            Bitfield.Bit('anonymous_login_null_user', 1),
+            Bitfield.Bit('anonymous_login_non_null', 1),
+            Bitfield.Bit('user_level', 1),
+            Bitfield.Bit('per_message', 1),
+            Bitfield.Bit('kg', 1),
+            Bitfield.ReservedBit(2, 0),
+        ),
+        Bitfield('extended_capabilities', 1,
+            Bitfield.Bit('ipmi_1_5', 1),
+            Bitfield.Bit('ipmi_2_0', 1),
+            Bitfield.ReservedBit(6, 0),
+        ),
+        UnsignedInt('oem_id', 3),
+        UnsignedInt('oem_auxiliary_data', 1),
+    )
+
+
+@register_message_class
+class GetSessionChallengeReq(Message):
+    __cmdid__ = constants.CMDID_GET_SESSION_CHALLENGE
+    __netfn__ = constants.NETFN_APP
+    __fields__ = (
+        Bitfield('authentication', 1,
+            Bitfield.Bit('type', 4, 0),
+            Bitfield.ReservedBit(4, 0),
+        ),
+        ByteArray('user_name', 16, default='\x00' * 16),
+    )
+
+
+@register_message_class
+class GetSessionChallengeRsp(Message):
+    __cmdid__ = constants.CMDID_GET_SESSION_CHALLENGE
+    __netfn__ = constants.NETFN_APP | 1
+    __fields__ = (
+        CompletionCode(),
+        UnsignedInt('temporary_session_id', 4),
+        ByteArray('challenge_string', 16),
+    )
+
+
+@register_message_class
+class ActivateSessionReq(Message):
+    __cmdid__ = constants.CMDID_ACTIVATE_SESSION
+    __netfn__ = constants.NETFN_APP
+    __fields__ = (
+        Bitfield('authentication', 1,
+            Bitfield.Bit('type', 4, 0),
+            Bitfield.ReservedBit(4, 0),
+        ),
+        Bitfield('privilege_level', 1,
+            Bitfield.Bit('maximum_requested', 4, 0),
+            Bitfield.ReservedBit(4, 0),
+        ),
+        ByteArray('challenge_string', 16),
+        UnsignedInt('initial_outbound_sequence_number', 4),
+    )
+
+
+@register_message_class
+class ActivateSessionRsp(Message):
+    __cmdid__ = constants.CMDID_ACTIVATE_SESSION
+    __netfn__ = constants.NETFN_APP | 1
+    __fields__ = (
+        CompletionCode(),
+        Bitfield('authentication', 1,
+            Bitfield.Bit('type', 4, 0),
+            Bitfield.ReservedBit(4, 0),
+        ),
+        UnsignedInt('session_id', 4),
+        UnsignedInt('initial_inbound_sequence_number', 4),
+        Bitfield('privilege_level', 1,
+            Bitfield.Bit('maximum_allowed', 4, 0),
+            Bitfield.ReservedBit(4, 0),
+        ),
+    )
+
+
+@register_message_class
+class SetSessionPrivilegeLevelReq(Message):
+    __cmdid__ = constants.CMDID_SET_SESSION_PRIVILEGE_LEVEL
+    __netfn__ = constants.NETFN_APP
+    __fields__ = (
+        Bitfield('privilege_level', 1,
+            Bitfield.Bit('requested', 4, 0),
+            Bitfield.ReservedBit(4, 0),
+        ),
+    )
+
+
+@register_message_class
+class SetSessionPrivilegeLevelRsp(Message):
+    __cmdid__ = constants.CMDID_SET_SESSION_PRIVILEGE_LEVEL
+    __netfn__ = constants.NETFN_APP | 1
+    __fields__ = (
+        CompletionCode(),
+        Bitfield('privilege_level', 1,
+            Bitfield.Bit('new', 4, 0),
+            Bitfield.ReservedBit(4, 0),
+        ),
+    )
+
+
+@register_message_class
+class CloseSessionReq(Message):
+    __cmdid__ = constants.CMDID_CLOSE_SESSION
+    __netfn__ = constants.NETFN_APP
+    __fields__ = (
+        UnsignedInt('session_id', 4),
+    )
+
+
+@register_message_class
+class CloseSessionRsp(Message):
+    __cmdid__ = constants.CMDID_CLOSE_SESSION
+    __netfn__ = constants.NETFN_APP | 1
+    __fields__ = (
+        CompletionCode(),
+    )
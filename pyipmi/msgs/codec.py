@@ -0,0 +1,265 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Compiled message codecs.
+
+A `MessageCodec` is created for each message class when it is registered.
+Consecutive fields with a fixed length are encoded and decoded with one
+precompiled `struct.Struct`. Trailing optional fields and remaining bytes
+are handled directly as well. Only the fields following a field which
+can not be compiled (e.g. `Conditional`) are processed by the generic
+field code.
+"""
+
+from builtins import object
+
+import struct
+
+from array import array
+
+from . import constants
+from .message import ByteArray, UnsignedInt, CompletionCode, Bitfield, \
+        Optional, RemainingBytes
+from ..errors import CompletionCodeError, EncodingError, DecodingError
+from ..utils import ByteBuffer, py3enc_unic_bytes_fix
+
+_STRUCT_CODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+# kinds of compiled fields
+_INT = 0
+_BITFIELD = 1
+_BYTE_ARRAY = 2
+
+# kinds of decoding steps
+_STEP_STRUCT = 0
+_STEP_OPTIONAL = 1
+_STEP_REMAINING = 2
+
+
+def _overrides(field, base):
+    """Returns True if the class of `field` changes the encoding or the
+    decoding of `base`.
+    """
+    for cls in type(field).__mro__:
+        if cls is base:
+            return False
+        if 'encode' in cls.__dict__ or 'decode' in cls.__dict__:
+            return True
+    return True
+
+
+def _int_from_bytes(data):
+    value = 0
+    for (i, b) in enumerate(bytearray(data)):
+        value |= b << (8 * i)
+    return value
+
+
+def _int_to_bytes(value, length):
+    return bytes(bytearray((value >> (8 * i)) & 0xff for i in range(length)))
+
+
+def _to_bytes(data):
+    # struct can unpack directly from all buffer types
+    if isinstance(data, (bytes, bytearray, memoryview, array)):
+        return data
+    return bytes(bytearray(py3enc_unic_bytes_fix(data)))
+
+
+class _CompiledField(object):
+    def __init__(self, name, kind, length):
+        self.name = name
+        self.kind = kind
+        self.length = length
+        if kind == _BYTE_ARRAY:
+            self.code = '%ds' % length
+        else:
+            self.code = _STRUCT_CODES.get(length, '%ds' % length)
+        # byte arrays and integers with an odd length are packed as bytes
+        self.is_bytes = self.code.endswith('s')
+        self.mask = (1 << (8 * length)) - 1
+
+    def value(self, obj):
+        """Returns the value to be packed."""
+        value = getattr(obj, self.name)
+        if self.kind == _INT:
+            value &= self.mask
+        elif self.kind == _BITFIELD:
+            value = value._value
+        else:
+            if len(value) != self.length:
+                raise EncodingError('Array must be exaclty %d bytes long '
+                        '(but is %d long)' % (self.length, len(value)))
+            return bytes(bytearray(b & 0xff for b in value))
+
+        if self.is_bytes:
+            return _int_to_bytes(value, self.length)
+        return value
+
+    def set_value(self, obj, value):
+        """Sets the field from the unpacked value."""
+        if self.kind == _BYTE_ARRAY:
+            setattr(obj, self.name, array('B', bytearray(value)))
+            return
+
+        if self.is_bytes:
+            value = _int_from_bytes(value)
+        if self.kind == _INT:
+            setattr(obj, self.name, value)
+        else:
+            getattr(obj, self.name)._value = value
+
+
+def _compile_field(field):
+    """Returns the `_CompiledField` of a field with fixed length or None."""
+    if isinstance(field, UnsignedInt) and not _overrides(field, UnsignedInt):
+        return _CompiledField(field.name, _INT, field.length)
+    if isinstance(field, Bitfield) and not _overrides(field, Bitfield):
+        return _CompiledField(field.name, _BITFIELD, field.length)
+    if type(field) is ByteArray:
+        return _CompiledField(field.name, _BYTE_ARRAY, field.length)
+    return None
+
+
+class MessageCodec(object):
+    """Encodes and decodes the `__fields__` of a message class."""
+
+    def __init__(self, fields):
+        fields = list(fields)
+
+        # decoding stops at a completion code other than CC_OK
+        self.completion_code = None
+        if fields and type(fields[0]) is CompletionCode:
+            self.completion_code = fields.pop(0).name
+
+        self.steps = []
+        # fields which are handled by the generic code
+        self.fields = []
+        group = []
+        for (index, field) in enumerate(fields):
+            compiled = _compile_field(field)
+            if compiled is not None:
+                group.append(compiled)
+                continue
+
+            if group:
+                self.steps.append((_STEP_STRUCT, self._struct(group)))
+                group = []
+
+            optional = None
+            if type(field) is Optional:
+                optional = _compile_field(field._field)
+            if optional is not None and optional.kind != _BITFIELD:
+                self.steps.append((_STEP_OPTIONAL, self._struct([optional])))
+            elif type(field) is RemainingBytes:
+                self.steps.append((_STEP_REMAINING, field.name))
+            else:
+                self.fields = fields[index:]
+                break
+
+        if group:
+            self.steps.append((_STEP_STRUCT, self._struct(group)))
+
+    @staticmethod
+    def _struct(compiled_fields):
+        fmt = '<' + ''.join(f.code for f in compiled_fields)
+        return (struct.Struct(fmt), compiled_fields)
+
+    def encode(self, obj):
+        parts = []
+        if self.completion_code is not None:
+            parts.append(struct.pack('B',
+                    getattr(obj, self.completion_code) & 0xff))
+
+        for (kind, arg) in self.steps:
+            if kind == _STEP_STRUCT:
+                (st, compiled_fields) = arg
+                parts.append(st.pack(*[f.value(obj) for f in
+                        compiled_fields]))
+            elif kind == _STEP_OPTIONAL:
+                (st, compiled_fields) = arg
+                if getattr(obj, compiled_fields[0].name) is not None:
+                    parts.append(st.pack(compiled_fields[0].value(obj)))
+            else:
+                parts.append(bytes(bytearray(
+                        py3enc_unic_bytes_fix(getattr(obj, arg)))))
+
+        data = b''.join(parts)
+        if not self.fields:
+            return data
+
+        buf = ByteBuffer(data)
+        for field in self.fields:
+            field.encode(obj, buf)
+        return buf.tobytes()
+
+    def decode(self, obj, data):
+        data = _to_bytes(data)
+        offset = 0
+
+        if self.completion_code is not None:
+            if len(data) < 1:
+                raise DecodingError('Data too short for message')
+            cc = bytearray(data[0:1])[0]
+            setattr(obj, self.completion_code, cc)
+            if cc != constants.CC_OK:
+                return
+            offset = 1
+
+        for (kind, arg) in self.steps:
+            if kind == _STEP_STRUCT:
+                (st, compiled_fields) = arg
+                if len(data) < offset + st.size:
+                    raise DecodingError('Data too short for message')
+                values = st.unpack_from(data, offset)
+                for (f, value) in zip(compiled_fields, values):
+                    f.set_value(obj, value)
+                offset += st.size
+            elif kind == _STEP_OPTIONAL:
+                (st, compiled_fields) = arg
+                if offset >= len(data):
+                    setattr(obj, compiled_fields[0].name, None)
+                    continue
+                if len(data) < offset + st.size:
+                    raise DecodingError('Data too short for message')
+                compiled_fields[0].set_value(obj,
+                        st.unpack_from(data, offset)[0])
+                offset += st.size
+            else:
+                setattr(obj, arg, array('B', bytearray(data[offset:])))
+                offset = len(data)
+
+        remaining = len(data) - offset
+        if self.fields:
+            buf = ByteBuffer(data[offset:])
+            try:
+                for field in self.fields:
+                    field.decode(obj, buf)
+            except CompletionCodeError:
+                return
+            remaining = len(buf)
+
+        if remaining > 0:
+            raise DecodingError('Data has extra bytes')
+
+
+def compile_message_class(cls):
+    """Returns the `MessageCodec` for the message class `cls` or None if
+    the class has no fields.
+    """
+    if not hasattr(cls, '__fields__'):
+        return None
+    return MessageCodec(cls.__fields__)
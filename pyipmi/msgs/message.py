@@ -75,7 +75,7 @@ class ByteArray(BaseField):
         if self.default is not None:
             return array('B', self.default)
         else:
-            return array('B', self.length * '\x00')
+            return array('B', [0] * self.length)
 
 
 class VariableByteArray(ByteArray):
@@ -199,7 +199,7 @@ class RemainingBytes(BaseField):
 
     def decode(self, obj, data):
         setattr(obj, self.name, array('B', data[:]))
-        del data.array[:]
+        del data[:]
 
     def create(self):
         return array('B')
@@ -344,20 +344,37 @@ class Message(object):
                         field.name)
             setattr(self, field.name, field.create())
 
+    def _codec(self):
+        # only the registered class itself has a compiled codec
+        return self.__class__.__dict__.get('__codec__')
+
     def _encode(self):
         '''Encode the message and return a bytestring.'''
         if not hasattr(self, '__fields__'):
-            return ''
+            return b''
+
+        codec = self._codec()
+        if codec is not None:
+            return codec.encode(self)
+        return self._encode_fields()
 
+    def _encode_fields(self):
         data = ByteBuffer()
         for field in self.__fields__:
             field.encode(self, data)
-        return data.tostring()
+        return data.tobytes()
 
     def _decode(self, data):
         if not hasattr(self, '__fields__'):
             raise NotImplementedError('You have to overwrite this method')
 
+        codec = self._codec()
+        if codec is not None:
+            codec.decode(self, data)
+        else:
+            self._decode_fields(data)
+
+    def _decode_fields(self, data):
         data = ByteBuffer(data)
         cc = None
         for field in self.__fields__:
@@ -18,6 +18,7 @@
 
 from functools import partial
 from ..errors import DescriptionError
+from .codec import compile_message_class
 
 class MessageRegistry(object):
     def __init__(self):
@@ -49,6 +50,9 @@ class MessageRegistry(object):
             raise DescriptionError('Message (%d,%d) already registered (%s)' %
                     (msg_id[0], msg_id[1], self.registry[msg_id]))
 
+        # compile the encoder and decoder of the message
+        cls.__codec__ = compile_message_class(cls)
+
         # register name
         self.registry[cls.__name__] = cls
         # register (netfn, cmdid) tuple
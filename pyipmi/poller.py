@@ -0,0 +1,622 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Polls sensors of many targets, each sensor with its own interval.
+
+Example:
+
+    def show(target, snapshot):
+        print(target, snapshot.values)
+
+    poller = pyipmi.poller.SensorPoller(show, rate=5)
+    poller.add_target('board1', ipmi)
+    poller.add_sensors('board1', ipmi.device_sdr_entries(),
+            intervals={pyipmi.sensor.SENSOR_TYPE_TEMPERATURE: 5,
+                       pyipmi.sensor.SENSOR_TYPE_VOLTAGE: 30},
+            default=60)
+    poller.start()
+    ...
+    poller.stop()
+
+`SensorDeltaFilter` passes only the readings which have changed on:
+
+    poller = pyipmi.poller.SensorPoller(
+            pyipmi.poller.SensorDeltaFilter(publish, deadband=2))
+"""
+
+from builtins import object
+
+import array
+import collections
+import math
+import random
+import threading
+import time
+
+from queue import Queue
+
+from .logger import log
+from .sdr import SdrFullSensorRecord, _complement
+from .sensor import is_readable_sensor, sensor_reading_requests, \
+        SensorSnapshot, EVENT_READING_TYPE_CODE_THRESHOLD
+
+
+class TokenBucket(object):
+    """Limits the number of requests per second.
+
+    The bucket holds up to `burst` tokens and is refilled with `rate`
+    tokens per second. `clock` returns the current time in seconds.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.time):
+        if rate <= 0:
+            raise RuntimeError('rate must be greater than 0')
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self._clock = clock
+        self._tokens = self.burst
+        self._last = clock()
+
+    def reserve(self, count=1):
+        """Takes `count` tokens and returns the time in seconds to wait
+        until they are available. The tokens are taken even if they are
+        not available yet, so the following requests wait longer.
+        """
+        now = self._clock()
+        self._tokens = min(self.burst,
+                self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        self._tokens -= count
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+
+class PollSchedule(object):
+    """Decides which sensors are due.
+
+    Each target gets a random offset of up to `jitter` seconds, so the
+    targets are not polled at the same time. If `jitter` is None, the
+    offset is up to the interval of the first sensor of the target. The
+    sensors of a target are due at the offset plus a multiple of their
+    interval, so sensors with the same interval, or with intervals which
+    are multiples of each other, are due together and read in one batch.
+
+    A target is any hashable object, e.g. a host name.
+    """
+
+    def __init__(self, jitter=None, rnd=None):
+        self.jitter = jitter
+        self._rnd = rnd or random.Random()
+        self._offsets = {}
+        # (target, interval) -> [next time, records by (lun, number)]
+        self._groups = collections.OrderedDict()
+
+    def _next_time(self, target, interval, now):
+        offset = self._offsets[target]
+        return offset + (math.floor((now - offset) / interval) + 1) \
+                * interval
+
+    def add(self, target, record, interval, now=None):
+        """Polls the sensor `record` of `target` every `interval`
+        seconds. A sensor which is already polled gets the new interval.
+        """
+        if interval <= 0:
+            raise RuntimeError('interval must be greater than 0')
+        if now is None:
+            now = time.time()
+        self.remove(target, record)
+
+        if target not in self._offsets:
+            jitter = self.jitter if self.jitter is not None else interval
+            self._offsets[target] = self._rnd.random() * jitter
+
+        key = (target, interval)
+        if key not in self._groups:
+            self._groups[key] = [self._next_time(target, interval, now),
+                    collections.OrderedDict()]
+        self._groups[key][1][(record.owner_lun, record.number)] = record
+
+    def remove(self, target, record=None):
+        """Stops polling a sensor of a target, or all of its sensors if
+        `record` is None.
+        """
+        for key in list(self._groups):
+            if key[0] != target:
+                continue
+            records = self._groups[key][1]
+            if record is None:
+                records.clear()
+            else:
+                records.pop((record.owner_lun, record.number), None)
+            if not records:
+                del self._groups[key]
+
+    def targets(self):
+        return list(collections.OrderedDict.fromkeys(
+                target for (target, _) in self._groups))
+
+    def next_time(self):
+        """Returns the time the next sensors are due, or None."""
+        if not self._groups:
+            return None
+        return min(group[0] for group in self._groups.values())
+
+    def due(self, now=None):
+        """Returns the sensors which are due as list of tuples of target
+        and records, one tuple per target.
+
+        The sensors are scheduled again. Periods which were missed are
+        skipped.
+        """
+        if now is None:
+            now = time.time()
+
+        batches = collections.OrderedDict()
+        for ((target, interval), group) in self._groups.items():
+            if group[0] > now:
+                continue
+            group[0] = self._next_time(target, interval, now)
+            records = batches.setdefault(target, collections.OrderedDict())
+            records.update(group[1])
+
+        return [(target, list(records.values()))
+                for (target, records) in batches.items()]
+
+
+class BasePoller(object):
+    """The part of `SensorPoller` and `aio.AsyncSensorPoller` which does
+    not depend on how the requests are sent.
+
+    Targets and sensors can be added and removed while polling, the
+    schedule and the connections are guarded by a lock.
+    """
+
+    def __init__(self, callback, rate=10.0, burst=None, jitter=None,
+            rnd=None, clock=time.time):
+        self.callback = callback
+        self.rate = rate
+        self.burst = burst
+        self.schedule = PollSchedule(jitter, rnd)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._buckets = {}
+        # targets whose last batch has not been read completely
+        self._busy = set()
+
+    def add_target(self, target, ipmi):
+        """Adds a target, which is read with the connection `ipmi`."""
+        bucket = TokenBucket(self.rate, self.burst, self._clock)
+        with self._lock:
+            self._connections[target] = ipmi
+            self._buckets[target] = bucket
+
+    def remove_target(self, target):
+        """Removes a target and its sensors. A batch of the target which
+        has not been started yet is skipped.
+        """
+        with self._lock:
+            self.schedule.remove(target)
+            self._connections.pop(target, None)
+            self._buckets.pop(target, None)
+
+    def add_sensor(self, target, record, interval):
+        now = self._clock()
+        with self._lock:
+            self.schedule.add(target, record, interval, now)
+
+    def add_sensors(self, target, records, intervals=None, default=None):
+        """Adds the full and compact sensor records of a target.
+
+        `intervals` maps sensor type codes to intervals in seconds. The
+        other sensors are polled every `default` seconds, or not at all if
+        `default` is None. Returns the number of sensors added.
+        """
+        intervals = intervals or {}
+        count = 0
+        for record in records:
+            if not is_readable_sensor(record):
+                continue
+            interval = intervals.get(record.sensor_type_code, default)
+            if interval is None:
+                continue
+            self.add_sensor(target, record, interval)
+            count += 1
+        return count
+
+    def _target(self, target):
+        """Returns the tuple of connection and token bucket of a target,
+        or None if it has been removed.
+        """
+        with self._lock:
+            ipmi = self._connections.get(target)
+            if ipmi is None:
+                return None
+            return (ipmi, self._buckets[target])
+
+    def _next_time(self):
+        with self._lock:
+            return self.schedule.next_time()
+
+    def _chunks(self, bucket, records):
+        """Splits the records into batches of at most `burst` requests of
+        the token bucket of a target. Yields the time to wait before each
+        batch and the batch.
+        """
+        size = max(int(bucket.burst), 1)
+        for index in range(0, len(records), size):
+            chunk = records[index:index + size]
+            yield (bucket.reserve(len(chunk)), chunk)
+
+
+class SensorPoller(BasePoller):
+    """Polls the sensors of several targets in threads.
+
+    `callback(target, snapshot)` is called with a `sensor.SensorSnapshot`
+    of the sensors of a target which were due together. The requests of
+    a batch are sent with `send_message_batch`. At most `rate` requests
+    per second and `burst` requests at once are sent to each target. If
+    the previous batch of a target has not been read yet, the sensors
+    which are due are skipped. Errors are logged and passed to
+    `error_callback(target, error)`, if it is set.
+
+    The batches are read by up to `max_workers` threads, each target by
+    one thread at a time. Each target needs its own connection.
+    """
+
+    def __init__(self, callback, rate=10.0, burst=None, jitter=None,
+            max_workers=8, error_callback=None, rnd=None, clock=time.time):
+        BasePoller.__init__(self, callback, rate, burst, jitter, rnd, clock)
+        self.max_workers = max_workers
+        self.error_callback = error_callback
+        self._stop = threading.Event()
+        self._jobs = None
+        self._threads = []
+        self._dispatcher = None
+
+    def poll(self, target, records):
+        """Reads the sensors of a target, waiting for the rate limit, and
+        returns a `sensor.SensorSnapshot`.
+
+        Returns None if the poller is stopped while waiting or if the
+        target has been removed.
+        """
+        connection = self._target(target)
+        if connection is None:
+            return None
+        (ipmi, bucket) = connection
+        timestamp = self._clock()
+        rsps = []
+        for (delay, chunk) in self._chunks(bucket, records):
+            if delay > 0 and self._stop.wait(delay):
+                return None
+            rsps.extend(ipmi.send_message_batch(
+                    sensor_reading_requests(chunk), skip_timeouts=True))
+        return SensorSnapshot(records, rsps, timestamp,
+                self._clock() - timestamp)
+
+    def _poll(self, target, records):
+        try:
+            snapshot = self.poll(target, records)
+        except Exception as e:
+            log().warning('poller: reading %s failed: %r', target, e)
+            if self.error_callback is not None:
+                self.error_callback(target, e)
+            return
+        finally:
+            with self._lock:
+                self._busy.discard(target)
+        if snapshot is not None:
+            self.callback(target, snapshot)
+
+    def _due(self, now):
+        batches = []
+        with self._lock:
+            for (target, records) in self.schedule.due(now):
+                if target in self._busy:
+                    log().debug('poller: %s is busy, skipping %d sensors',
+                            target, len(records))
+                    continue
+                self._busy.add(target)
+                batches.append((target, records))
+        return batches
+
+    def run_pending(self, now=None):
+        """Reads all sensors which are due in the calling thread."""
+        if now is None:
+            now = self._clock()
+        for (target, records) in self._due(now):
+            self._poll(target, records)
+
+    def _worker(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            if self._stop.is_set():
+                # queued before the poller was stopped
+                with self._lock:
+                    self._busy.discard(job[0])
+                continue
+            self._poll(*job)
+
+    def _dispatch(self):
+        while not self._stop.is_set():
+            for job in self._due(self._clock()):
+                self._jobs.put(job)
+            next_time = self._next_time()
+            delay = 1.0
+            if next_time is not None:
+                delay = min(max(next_time - self._clock(), 0), delay)
+            self._stop.wait(delay)
+
+    def start(self):
+        """Starts polling in background threads."""
+        if self._threads:
+            raise RuntimeError('poller is already running')
+        self._stop.clear()
+        with self._lock:
+            self._busy.clear()
+        self._jobs = Queue()
+        self._threads = [threading.Thread(target=self._worker)
+                for _ in range(self.max_workers)]
+        self._dispatcher = threading.Thread(target=self._dispatch)
+        for thread in self._threads + [self._dispatcher]:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        """Stops polling and waits for the batches being read. Batches
+        which are waiting for the rate limit are aborted.
+        """
+        if not self._threads:
+            return
+        self._stop.set()
+        # no jobs must be queued after the sentinels
+        self._dispatcher.join()
+        for _ in range(self.max_workers):
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._dispatcher = None
+        self._stop.clear()
+
+
+# reasons of a `SensorChange`
+CHANGE_INITIAL = 'initial'
+CHANGE_VALUE = 'value'
+CHANGE_STATES = 'states'
+CHANGE_THRESHOLD = 'threshold'
+CHANGE_ERROR = 'error'
+
+# zones of a threshold sensor
+ZONE_NORMAL = 0
+ZONE_UPPER_NON_CRITICAL = 1
+ZONE_UPPER_CRITICAL = 2
+ZONE_UPPER_NON_RECOVERABLE = 3
+ZONE_LOWER_NON_CRITICAL = -1
+ZONE_LOWER_CRITICAL = -2
+ZONE_LOWER_NON_RECOVERABLE = -3
+
+# thresholds by zone, with their bit in the readable threshold mask
+_UPPER_THRESHOLDS = (('unc', 0x08), ('ucr', 0x10), ('unr', 0x20))
+_LOWER_THRESHOLDS = (('lnc', 0x01), ('lcr', 0x02), ('lnr', 0x04))
+
+# value of the table for a missing reading, state or error
+_NONE = -1
+
+SensorChange = collections.namedtuple('SensorChange', ['target', 'record',
+        'raw', 'value', 'states', 'error', 'zone', 'previous_raw',
+        'previous_states', 'previous_zone', 'reasons'])
+
+
+def _signed_raw(record, raw):
+    """Returns the raw reading as number which is ordered like the
+    converted readings of linear sensors.
+    """
+    fmt = getattr(record, 'analog_data_format', None)
+    if fmt == SdrFullSensorRecord.DATA_FMT_1S_COMPLEMENT and raw & 0x80:
+        raw = -((raw & 0x7f) ^ 0x7f)
+    elif fmt == SdrFullSensorRecord.DATA_FMT_2S_COMPLEMENT:
+        raw = _complement(raw, 8)
+    if getattr(record, 'm', 1) < 0:
+        raw = -raw
+    return raw
+
+
+class _Limits(object):
+    """The readable thresholds and the hysteresis of a sensor, as signed
+    raw readings.
+    """
+
+    def __init__(self, record):
+        self.upper = []
+        self.lower = []
+        self.positive_hysteresis = 0
+        self.negative_hysteresis = 0
+        if not isinstance(record, SdrFullSensorRecord) or \
+                record.event_reading_type_code != \
+                EVENT_READING_TYPE_CODE_THRESHOLD:
+            return
+
+        readable = record.discrete_reading_mask & 0x3f
+        threshold = record.threshold
+        for (limits, names) in ((self.upper, _UPPER_THRESHOLDS),
+                (self.lower, _LOWER_THRESHOLDS)):
+            for (name, bit) in names:
+                limits.append(_signed_raw(record, threshold[name])
+                        if readable & bit else None)
+        hysteresis = record.hysteresis
+        self.positive_hysteresis = hysteresis['positive_going']
+        self.negative_hysteresis = hysteresis['negative_going']
+
+    def zone(self, raw, previous):
+        """Returns the zone of the signed raw reading. A threshold which
+        was crossed is only left again after the hysteresis.
+        """
+        zone = ZONE_NORMAL
+        for (level, limit) in enumerate(self.upper, 1):
+            if limit is None:
+                continue
+            if previous >= level:
+                limit -= self.negative_hysteresis
+            if raw >= limit:
+                zone = level
+        for (level, limit) in enumerate(self.lower, 1):
+            if limit is None:
+                continue
+            if previous <= -level:
+                limit += self.positive_hysteresis
+            if raw <= limit:
+                zone = -level
+        return zone
+
+
+class SensorDeltaFilter(object):
+    """Passes only the sensor readings which have changed.
+
+    It is used as callback of `SensorPoller` or `aio.AsyncSensorPoller`.
+    The last reading of each sensor of each target is kept in a table.
+    For each snapshot, `callback` is called with the list of
+    `SensorChange` of the sensors which
+
+    - are read for the first time,
+    - have a raw reading which moved more than the deadband of the sensor
+      since the last change,
+    - have other assertion states,
+    - crossed a threshold of a full threshold sensor, or left it by more
+      than its hysteresis,
+    - failed or recovered, or failed with another completion code.
+
+    `deadband` is the default deadband in raw counts, `set_deadband` sets
+    it per sensor.
+
+    The table is guarded by a lock, because `SensorPoller` calls the
+    filter from several threads. `callback` is called without the lock.
+    """
+
+    def __init__(self, callback, deadband=0):
+        self.callback = callback
+        self.deadband = deadband
+        self._lock = threading.Lock()
+        self._deadbands = {}
+        # (target, lun, number) -> row of the table
+        self._rows = {}
+        self._records = []
+        self._limits = []
+        self._raw = array.array('h')
+        self._states = array.array('l')
+        self._zone = array.array('b')
+        self._error = array.array('h')
+
+    def __call__(self, target, snapshot):
+        changes = self.update(target, snapshot)
+        if changes:
+            return self.callback(changes)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def set_deadband(self, target, record, deadband):
+        self._deadbands[(target, record.owner_lun, record.number)] = deadband
+
+    def _row(self, key, record):
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self._records)
+            self._rows[key] = row
+            self._records.append(record)
+            self._limits.append(_Limits(record))
+            for column in (self._raw, self._states, self._error):
+                column.append(_NONE)
+            self._zone.append(ZONE_NORMAL)
+            return (row, True)
+
+        if self._records[row] is not record:
+            # e.g. the thresholds have changed
+            self._records[row] = record
+            self._limits[row] = _Limits(record)
+        return (row, False)
+
+    def update(self, target, snapshot):
+        """Updates the table with a `sensor.SensorSnapshot` of a target and
+        returns the list of `SensorChange`.
+        """
+        with self._lock:
+            return self._update(target, snapshot)
+
+    def _update(self, target, snapshot):
+        changes = []
+        for (record, raw, value, states, error) in snapshot:
+            key = (target, record.owner_lun, record.number)
+            (row, new) = self._row(key, record)
+
+            previous_raw = self._raw[row]
+            previous_states = self._states[row]
+            previous_zone = self._zone[row]
+            raw_ = _NONE if raw is None else raw
+            states_ = _NONE if states is None else states
+            error_ = _NONE if error is None else error
+
+            reasons = []
+            if new:
+                reasons.append(CHANGE_INITIAL)
+            else:
+                if error_ != self._error[row]:
+                    reasons.append(CHANGE_ERROR)
+                if (raw_ == _NONE) != (previous_raw == _NONE) or \
+                        (raw_ != _NONE and abs(_signed_raw(record, raw_)
+                        - _signed_raw(record, previous_raw))
+                        > self._deadbands.get(key, self.deadband)):
+                    reasons.append(CHANGE_VALUE)
+                if states_ != previous_states:
+                    reasons.append(CHANGE_STATES)
+
+            zone = previous_zone
+            if raw_ != _NONE:
+                zone = self._limits[row].zone(_signed_raw(record, raw_),
+                        previous_zone)
+                if zone != previous_zone:
+                    reasons.append(CHANGE_THRESHOLD)
+
+            # the deadband applies to the last reading which was passed
+            if new or CHANGE_VALUE in reasons:
+                self._raw[row] = raw_
+            self._states[row] = states_
+            self._zone[row] = zone
+            self._error[row] = error_
+
+            if reasons:
+                changes.append(SensorChange(target, record, raw, value,
+                        states, error, zone,
+                        None if previous_raw == _NONE else previous_raw,
+                        None if previous_states == _NONE
+                            else previous_states,
+                        previous_zone, tuple(reasons)))
+        return changes
+
+    def last(self, target, record):
+        """Returns the last raw reading which was passed and the last
+        states of a sensor, or None.
+        """
+        with self._lock:
+            row = self._rows.get((target, record.owner_lun, record.number))
+            if row is None:
+                return None
+            return tuple(None if v == _NONE else v
+                    for v in (self._raw[row], self._states[row]))
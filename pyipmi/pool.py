@@ -0,0 +1,300 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""A pool of established connections.
+
+Example:
+
+    pool = pyipmi.pool.ConnectionPool(interface='rmcpplus')
+    with pool.connection('10.0.0.1', user='admin', password='admin') as ipmi:
+        ipmi.get_chassis_status()
+"""
+
+from builtins import object
+
+import collections
+import contextlib
+import hashlib
+import hmac
+import threading
+import time
+
+from . import create_connection, Target
+from . import interfaces
+from .errors import TimeoutError, CompletionCodeError
+from .logger import log
+
+
+def _secret(password):
+    if not isinstance(password, bytes):
+        password = password.encode('utf-8')
+    return hashlib.sha256(password).digest()
+
+
+class _PooledConnection(object):
+    def __init__(self, key, ipmi, secret):
+        self.key = key
+        self.ipmi = ipmi
+        # hash of the password the session was established with
+        self.secret = secret
+        self.created = time.time()
+        self.last_used = self.created
+
+
+class ConnectionPool(object):
+    """Hands out established `Ipmi` connections.
+
+    The connections are kept per BMC, identified by host, port, user and
+    cipher suite. A connection which is given back with `release` is reused
+    by the next `acquire` for the same BMC, so the session is established
+    only once. It is only handed out to a caller with the same password.
+
+    `max_per_bmc` limits the number of sessions to one BMC, counted per
+    host and port for all users and cipher suites. If the limit is reached,
+    an idle session of another user, cipher suite or password is closed to
+    make room for the new one; if all sessions are in use, `acquire` waits
+    up to `acquire_timeout` seconds for a free one. Idle connections are
+    closed after `idle_timeout` seconds, connections older than `max_age`
+    seconds are not reused and at most `max_idle` idle connections are
+    kept in total, the least recently used ones are closed first.
+
+    An idle connection which was not used for `keepalive_interval` seconds
+    is checked with a Get Device ID request before it is handed out.
+    Broken connections are replaced by new ones.
+    """
+
+    def __init__(self, interface='rmcp', interface_options=None,
+            target_address=0x20, max_per_bmc=2, max_idle=64,
+            idle_timeout=60, max_age=None, keepalive_interval=10,
+            acquire_timeout=None):
+        if max_per_bmc < 1:
+            raise RuntimeError('max_per_bmc must be at least 1')
+        self.interface = interface
+        self.interface_options = interface_options or {}
+        self.target_address = target_address
+        self.max_per_bmc = max_per_bmc
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.keepalive_interval = keepalive_interval
+        self.acquire_timeout = acquire_timeout
+
+        self._lock = threading.Condition()
+        # idle connections, the least recently used first
+        self._idle = collections.OrderedDict()
+        # id of the Ipmi object -> connection
+        self._in_use = {}
+        # number of sessions (idle and in use) per (host, port)
+        self._sessions = collections.defaultdict(int)
+
+    @staticmethod
+    def _key(host, port, user, cipher_suite):
+        return (host, port, user, cipher_suite)
+
+    @staticmethod
+    def _bmc(key):
+        return key[:2]
+
+    def _connect(self, key, password):
+        (host, port, user, cipher_suite) = key
+        options = dict(self.interface_options)
+        if cipher_suite is not None:
+            options['cipher_suite'] = cipher_suite
+        interface = interfaces.create_interface(self.interface, **options)
+        ipmi = create_connection(interface)
+        ipmi.target = Target(self.target_address)
+        ipmi.session.set_session_type_rmcp(host, port)
+        ipmi.session.set_auth_type_user(user, password)
+        ipmi.session.establish()
+        log().debug('pool: new session to %s:%d', host, port)
+        return _PooledConnection(key, ipmi, _secret(password))
+
+    def _disconnect(self, conn):
+        try:
+            conn.ipmi.session.close()
+        except Exception as e:
+            log().debug('pool: closing session failed: %s', e)
+
+    def _is_expired(self, conn, now):
+        if self.idle_timeout is not None and \
+                now - conn.last_used > self.idle_timeout:
+            return True
+        if self.max_age is not None and now - conn.created > self.max_age:
+            return True
+        return False
+
+    def _is_alive(self, conn, now):
+        if now - conn.last_used < self.keepalive_interval:
+            return True
+        try:
+            conn.ipmi.send_message_with_name('GetDeviceId')
+        except Exception as e:
+            log().debug('pool: keepalive failed: %s', e)
+            return False
+        return True
+
+    def _evict(self, now):
+        """Removes expired and surplus idle connections from the pool and
+        returns them. Has to be called with the lock held.
+        """
+        evicted = []
+        for (conn_id, conn) in list(self._idle.items()):
+            if (self._is_expired(conn, now) or (self.max_idle is not None
+                    and len(self._idle) > self.max_idle)):
+                del self._idle[conn_id]
+                self._sessions[self._bmc(conn.key)] -= 1
+                evicted.append(conn)
+        return evicted
+
+    def _take_idle(self, key, secret=None):
+        """Removes the most recently used idle connection with `key` and
+        the password hash `secret` from the pool and returns it, or None. If
+        `secret` is None, any idle connection to the BMC of `key` is taken,
+        whatever user, cipher suite or password it uses.
+        """
+        for (conn_id, conn) in reversed(list(self._idle.items())):
+            if secret is None:
+                if self._bmc(conn.key) != self._bmc(key):
+                    continue
+            elif conn.key != key or \
+                    not hmac.compare_digest(conn.secret, secret):
+                continue
+            del self._idle[conn_id]
+            return conn
+        return None
+
+    def acquire(self, host, port=623, user='', password='',
+            cipher_suite=None):
+        """Returns an established connection to the BMC.
+
+        The connection has to be given back with `release`.
+        """
+
+        key = self._key(host, port, user, cipher_suite)
+        bmc = self._bmc(key)
+        secret = _secret(password)
+        deadline = None
+        if self.acquire_timeout is not None:
+            deadline = time.time() + self.acquire_timeout
+
+        while True:
+            with self._lock:
+                evicted = self._evict(time.time())
+            for old in evicted:
+                self._disconnect(old)
+
+            stale = None
+            with self._lock:
+                conn = self._take_idle(key, secret)
+                if conn is None and self._sessions[bmc] < self.max_per_bmc:
+                    # reserve the session before connecting
+                    self._sessions[bmc] += 1
+                elif conn is None:
+                    # an idle session of another user, cipher suite or
+                    # password is replaced by the new one
+                    stale = self._take_idle(key)
+                    if stale is None:
+                        timeout = None
+                        if deadline is not None:
+                            timeout = deadline - time.time()
+                            if timeout <= 0:
+                                raise TimeoutError()
+                        self._lock.wait(timeout)
+                        continue
+
+            if stale is not None:
+                self._disconnect(stale)
+
+            if conn is None:
+                try:
+                    conn = self._connect(key, password)
+                except Exception:
+                    self._release_session(key)
+                    raise
+            elif not self._is_alive(conn, time.time()):
+                self._disconnect(conn)
+                self._release_session(key)
+                continue
+
+            conn.last_used = time.time()
+            with self._lock:
+                self._in_use[id(conn.ipmi)] = conn
+            return conn.ipmi
+
+    def _release_session(self, key):
+        with self._lock:
+            self._sessions[self._bmc(key)] -= 1
+            self._lock.notify_all()
+
+    def release(self, ipmi, broken=False):
+        """Gives a connection back to the pool.
+
+        If `broken` is set, the session is closed instead of being reused.
+        """
+        with self._lock:
+            conn = self._in_use.pop(id(ipmi))
+            conn.last_used = time.time()
+            if not broken and not self._is_expired(conn, conn.last_used):
+                self._idle[id(ipmi)] = conn
+                evicted = self._evict(conn.last_used)
+                self._lock.notify_all()
+                conn = None
+            else:
+                evicted = []
+
+        for old in evicted:
+            self._disconnect(old)
+
+        if conn is not None:
+            self._disconnect(conn)
+            self._release_session(conn.key)
+
+    @contextlib.contextmanager
+    def connection(self, host, port=623, user='', password='',
+            cipher_suite=None):
+        """Context manager which acquires a connection and releases it
+        again. The connection is dropped if an exception other than a
+        `CompletionCodeError` is raised.
+        """
+        ipmi = self.acquire(host, port, user, password, cipher_suite)
+        broken = False
+        try:
+            yield ipmi
+        except CompletionCodeError:
+            raise
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.release(ipmi, broken)
+
+    def sessions(self, host, port=623):
+        """Returns the number of sessions to the BMC, of all users and
+        cipher suites."""
+        with self._lock:
+            return self._sessions[(host, port)]
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle = list(self._idle.values())
+            self._idle.clear()
+            for conn in idle:
+                self._sessions[self._bmc(conn.key)] -= 1
+            self._lock.notify_all()
+
+        for conn in idle:
+            self._disconnect(conn)
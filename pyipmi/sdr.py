@@ -21,21 +21,33 @@ from builtins import object
 import math
 from . import errors
 import array
+import bisect
+import collections
+import hashlib
+import mmap
+import os
+import struct
+import threading
 import time
 
 from .errors import DecodingError, CompletionCodeError, RetryError
-from .utils import check_completion_code, ByteBuffer
+from .utils import check_completion_code, ByteBuffer, array_tobytes, \
+        py3dec_unic_bytes_fix
 from .msgs import create_request_by_name
-#from .msgs import constants
+from .msgs import constants
 
 from .helper import get_sdr_data_helper, clear_repository_helper
-from .helper import get_sdr_chunk_helper
+from .helper import get_sdr_chunk_helper, SdrReadSize, REPOSITORY_SDR
+from .helper import SDR_HEADER_LENGTH
+from .helper import walk_sdr_helper, sdr_read_requests, sdr_read_results
+from .logger import log
 from .state import State
 
 SDR_TYPE_FULL_SENSOR_RECORD = 0x01
 SDR_TYPE_COMPACT_SENSOR_RECORD = 0x02
 SDR_TYPE_EVENT_ONLY_SENSOR_RECORD = 0x03
 SDR_TYPE_ENTITY_ASSOCIATION_RECORD = 0x08
+SDR_TYPE_DEVICE_RELATIVE_ENTITY_ASSOCIATION_RECORD = 0x09
 SDR_TYPE_FRU_DEVICE_LOCATOR_RECORD = 0x11
 SDR_TYPE_MANAGEMENT_CONTROLLER_DEVICE_LOCATOR_RECORD = 0x12
 SDR_TYPE_MANAGEMENT_CONTROLLER_CONFIRMATION_RECORD = 0x13
@@ -45,6 +57,17 @@ SDR_TYPE_OEM_SENSOR_RECORD = 0xC0
 GET_INITIALIZATION_AGENT_STATUS = 0
 RUN_INITIALIZATION_AGENT = 1
 
+# progress of Partial Add SDR
+PARTIAL_ADD_IN_PROGRESS = 0
+PARTIAL_ADD_LAST = 1
+
+# completion codes of a Partial Add SDR request with too much data
+_WRITE_SIZE_ERRORS = (
+    constants.CC_REQ_DATA_INV_LENGTH,
+    constants.CC_REQ_DATA_FIELD_EXCEED,
+    constants.CC_CANT_RET_NUM_REQ_BYTES,
+)
+
 L_LINEAR = 0
 L_LN = 1
 L_LOG = 2
@@ -58,10 +81,38 @@ L_CUBE = 9
 L_SQRT = 10
 L_CUBERT = 11
 
+LINEARIZATIONS = {
+    L_LINEAR: lambda x: x,
+    L_LN:     math.log,
+    L_LOG:    lambda x: math.log(x, 10),
+    L_LOG2:   lambda x: math.log(x, 2),
+    L_E:      math.exp,
+    L_EXP10:  lambda x: math.pow(10, x),
+    L_EXP2:   lambda x: math.pow(2, x),
+    L_1_X:    lambda x: 1.0 / x,
+    L_SQR:    lambda x: math.pow(x, 2),
+    L_CUBE:   lambda x: math.pow(x, 3),
+    L_SQRT:   math.sqrt,
+    L_CUBERT: lambda x: math.pow(x, 1.0/3),
+}
+
 
 class Sdr(object):
     def __init__(self):
-        pass
+        # `cache.SdrCache` used by the SDR and device SDR generators
+        self.sdr_cache = None
+        # `SdrRepository` returned by get_sdr_repository
+        self.sdr_repository = None
+        # `SdrReadSize` per repository and target
+        self._sdr_read_sizes = {}
+
+    def _sdr_read_size(self, repository):
+        """Returns the `SdrReadSize` of the current target."""
+        key = (repository, getattr(getattr(self, 'target', None),
+                'ipmb_address', None))
+        if key not in self._sdr_read_sizes:
+            self._sdr_read_sizes[key] = SdrReadSize()
+        return self._sdr_read_sizes[key]
 
     def get_sdr_repository_info(self):
         return SdrRepositoryInfo(
@@ -83,35 +134,99 @@ class Sdr(object):
         req.bytes_to_read = length
 
         rsp = get_sdr_chunk_helper(self.send_message, req, \
-                                   self.reserve_device_sdr_repository)
+                                   self.reserve_sdr_repository)
 
         return (rsp.next_record_id, rsp.record_data)
 
+    def _get_sdr_chunks(self, reservation_id, reads):
+        reqs = sdr_read_requests('GetSdr', reservation_id, reads)
+        return sdr_read_results(self.send_message_batch(reqs))
+
     def get_repository_sdr(self, record_id, reservation_id=None):
         (next_id, record_data) = get_sdr_data_helper(
                 self.reserve_sdr_repository, self._get_sdr_chunk,
-                record_id, reservation_id)
+                record_id, reservation_id,
+                self._sdr_read_size(REPOSITORY_SDR))
         return SdrCommon.from_data(record_data, next_id)
 
     def sdr_repository_entries(self):
         """A generator that returns the SDR list. Starting with ID=0x0000 and
         end when ID=0xffff is returned.
-        """
-        reservation_id = self.reserve_device_sdr_repository()
-        record_id = 0
 
-        while True:
-            s = self.get_repository_sdr(record_id, reservation_id)
+        If `sdr_cache` is set, the records are taken from the cache as long
+        as the repository has not changed. Otherwise the cached records are
+        updated with `SdrRepository.sync`.
+        """
+        if self.sdr_cache is not None:
+            entries = self.sdr_cache.repository_entries(self,
+                    self._sdr_repository_entries,
+                    self._sdr_read_size(REPOSITORY_SDR),
+                    self._sync_sdr_records)
+        else:
+            entries = self._sdr_repository_entries()
+
+        for s in entries:
             yield s
-            if s.next_id == 0xffff:
-                break
-            record_id = s.next_id
+
+    def _sdr_repository_entries(self):
+        for (next_id, record_data) in walk_sdr_helper(
+                self.reserve_sdr_repository, self._get_sdr_chunks,
+                read_size=self._sdr_read_size(REPOSITORY_SDR)):
+            yield SdrCommon.from_data(record_data, next_id)
 
     def get_repository_sdr_list(self, reservation_id=None):
         """Returns the complete SDR list.
         """
         return list(self.sdr_repository_entries())
 
+    def get_sdr_repository(self):
+        """Returns a `SdrRepository` with all SDR repository records.
+
+        It is kept as `sdr_repository`, which is updated by
+        `partial_add_sdr` and `delete_sdr`.
+        """
+        self.sdr_repository = SdrRepository(self.sdr_repository_entries())
+        return self.sdr_repository
+
+    def sync_sdr_repository(self, repository=None, verify=False):
+        """Updates `repository`, by default `sdr_repository`, to the
+        current SDR repository, reading only the records which have
+        changed, see `SdrRepository.sync`. If there is no repository yet,
+        it is read completely with `get_sdr_repository`.
+
+        Returns a tuple with the ids of the records which have been
+        added or replaced and the ids of the records which have been
+        removed.
+        """
+        if repository is None:
+            repository = self.sdr_repository
+        if repository is None:
+            repository = self.get_sdr_repository()
+            return ([s.id for s in repository], [])
+
+        info = self.get_sdr_repository_info()
+        return repository.sync(self.reserve_sdr_repository,
+                self._get_sdr_chunks, self._sdr_read_size(REPOSITORY_SDR),
+                info.record_count, verify)
+
+    def _sync_sdr_records(self, records):
+        repository = SdrRepository(records)
+        self.sync_sdr_repository(repository)
+        return list(repository)
+
+    def dump_sdr_repository(self, path):
+        """Writes all SDR repository records to the file `path`, in the
+        format of `ipmitool sdr dump`. Returns the number of records.
+
+        The file can be read with `SdrDumpFile`.
+        """
+        count = 0
+        with open(path, 'wb') as f:
+            for s in self.sdr_repository_entries():
+                f.write(array_tobytes(s.data))
+                count += 1
+        return count
+
     def partial_add_sdr(self,
                 reservation_id, record_id, offset, progress, data):
 
@@ -120,9 +235,12 @@ class Sdr(object):
         req.record_id = record_id
         req.offset = offset
         req.status.in_progress = progress
-        req.data = data
+        req.record_data = data
         rsp = self.send_message(req)
         check_completion_code(rsp.completion_code)
+        if self.sdr_repository is not None:
+            self.sdr_repository.partial_add(rsp.record_id, offset, progress,
+                    data)
         return rsp.record_id
 
     def delete_sdr(self, record_id):
@@ -133,6 +251,8 @@ class Sdr(object):
         reservation_id = self.reserve_device_sdr_repository()
         rsp = self.send_message_with_name('DeleteSdr',
                 reservation_id=reservation_id, record_id=record_id)
+        if self.sdr_repository is not None:
+            self.sdr_repository.remove(record_id)
         return rsp.record_id
 
     def _clear_sdr_repository(self, cmd, reservation_id):
@@ -143,6 +263,84 @@ class Sdr(object):
     def clear_sdr_repository(self, retry=5):
         clear_repository_helper(self.reserve_sdr_repository,
                 self._clear_sdr_repository, retry)
+        if self.sdr_repository is not None:
+            self.sdr_repository = SdrRepository()
+
+    def _add_sdr(self, reservation_id, data, write_size, result,
+            retry=20):
+        """Adds one record with Partial Add SDR requests and returns the
+        reservation id, which has changed if the reservation was canceled.
+        """
+        record_id = 0
+        offset = 0
+        while offset < len(data):
+            entire_record = (offset == 0 and
+                    write_size.entire_record is not False)
+            if entire_record:
+                length = len(data)
+            else:
+                length = min(write_size.size, len(data) - offset)
+            progress = PARTIAL_ADD_LAST if offset + length == len(data) \
+                    else PARTIAL_ADD_IN_PROGRESS
+
+            result.requests += 1
+            try:
+                record_id = self.partial_add_sdr(reservation_id, record_id,
+                        offset, progress, data[offset:offset + length])
+            except CompletionCodeError as e:
+                retry -= 1
+                if retry <= 0:
+                    raise RetryError()
+                if e.cc == constants.CC_RES_CANCELED:
+                    # the partially added record is discarded
+                    reservation_id = self.reserve_sdr_repository()
+                    record_id = 0
+                    offset = 0
+                elif e.cc in _WRITE_SIZE_ERRORS:
+                    if entire_record:
+                        write_size.entire_record = False
+                    else:
+                        write_size.rejected(length)
+                else:
+                    raise
+                continue
+
+            if entire_record:
+                write_size.entire_record = True
+            else:
+                write_size.accepted(length)
+            offset += length
+
+        return reservation_id
+
+    def load_sdr_repository(self, records, retry=5):
+        """Replaces the content of the SDR repository with `records`.
+
+        `records` are `SdrCommon` objects or the raw data of records, e.g.
+        a `SdrDumpFile`. The repository is cleared first, then each record
+        is written with Partial Add SDR. The whole record is sent at once
+        if the target accepts it, otherwise it is sent in chunks of the
+        largest size the target accepts. The reservation is only renewed
+        if it has been canceled.
+
+        Returns a `SdrLoadResult`.
+        """
+        result = SdrLoadResult()
+        start = time.time()
+
+        self.clear_sdr_repository(retry)
+        reservation_id = self.reserve_sdr_repository()
+        write_size = SdrReadSize()
+        for record in records:
+            data = _record_array(getattr(record, 'data', record))
+            reservation_id = self._add_sdr(reservation_id, data, write_size,
+                    result)
+            result.records += 1
+            result.bytes += len(data)
+
+        result.seconds = time.time() - start
+        log().info('SDR repository loaded: %s', result)
+        return result
 
     def _run_initialization_agent(self, cmd):
         rsp = self.send_message_with_name('RunInitializationAgent', cmd=cmd)
@@ -155,6 +353,27 @@ class Sdr(object):
         return self._run_initialization_agent(GET_INITIALIZATION_AGENT_STATUS)
 
 
+class SdrLoadResult(object):
+    """The statistics of `Sdr.load_sdr_repository`."""
+
+    def __init__(self):
+        self.records = 0
+        self.bytes = 0
+        self.requests = 0
+        self.seconds = 0.0
+
+    @property
+    def bytes_per_second(self):
+        if self.seconds <= 0:
+            return 0.0
+        return self.bytes / self.seconds
+
+    def __str__(self):
+        return '%d records, %d bytes in %d requests, %.3f s (%.1f bytes/s)' \
+                % (self.records, self.bytes, self.requests, self.seconds,
+                self.bytes_per_second)
+
+
 class SdrRepositoryInfo(State):
     def __init__(self, rsp):
         if rsp:
@@ -186,14 +405,598 @@ class SdrRepositoryAllocationInfo(State):
         self.maximum_record_size = rsp.maximum_record_size
 
 
+def _index_add(index, key, record):
+    if key not in index:
+        index[key] = collections.OrderedDict()
+    index[key][record.id] = record
+
+
+def _index_remove(index, key, record):
+    records = index.get(key)
+    if records is not None and records.get(record.id) is record:
+        del records[record.id]
+        if not records:
+            del index[key]
+
+
+class SdrRepository(object):
+    """A collection of SDR records with indexes for the common lookups.
+
+    The records are looked up by record id, by sensor (owner id, owner LUN
+    and sensor number), by entity (entity id and instance), by sensor type
+    code, by device id string and by record type.
+
+    Example:
+
+        sdrs = SdrRepository(ipmi.device_sdr_entries())
+        s = sdrs.find_sensor(0x20, 0, 0x10)
+        temperatures = sdrs.find_by_sensor_type(0x01)
+    """
+
+    def __init__(self, records=None):
+        self._records = collections.OrderedDict()
+        self._by_sensor = {}
+        self._by_entity = {}
+        self._by_sensor_type = {}
+        self._by_name = {}
+        self._by_type = {}
+        # data of the records which are added with Partial Add SDR
+        self._partial = {}
+        # `EntityHierarchy` of the records, built when it is needed
+        self._hierarchy = None
+        if records is not None:
+            for record in records:
+                self.add(record)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(list(self._records.values()))
+
+    def __contains__(self, record_id):
+        return record_id in self._records
+
+    @staticmethod
+    def _keys(record):
+        """Returns the keys of the record for the indexes which apply."""
+        keys = []
+        if hasattr(record, 'number'):
+            keys.append(('_by_sensor',
+                    (record.owner_id, record.owner_lun, record.number)))
+        if hasattr(record, 'entity_id'):
+            keys.append(('_by_entity',
+                    (record.entity_id, record.entity_instance)))
+        # event-only sensor records call it sensor_type
+        sensor_type = getattr(record, 'sensor_type_code',
+                getattr(record, 'sensor_type', None))
+        if sensor_type is not None:
+            keys.append(('_by_sensor_type', sensor_type))
+        if hasattr(record, 'device_id_string'):
+            keys.append(('_by_name', record.device_id_string))
+        keys.append(('_by_type', record.type))
+        return keys
+
+    def add(self, record):
+        """Adds a record, a record with the same id is replaced."""
+        self.remove(record.id)
+        self._records[record.id] = record
+        self._hierarchy = None
+        for (index, key) in self._keys(record):
+            _index_add(getattr(self, index), key, record)
+
+    def remove(self, record_id):
+        """Removes the record with the id and returns it, or None if there
+        is no such record.
+        """
+        record = self._records.pop(record_id, None)
+        if record is None:
+            return None
+        for (index, key) in self._keys(record):
+            _index_remove(getattr(self, index), key, record)
+        self._hierarchy = None
+        return record
+
+    def partial_add(self, record_id, offset, progress, data):
+        """Collects the data of a Partial Add SDR request. The record is
+        added once its last part has been sent.
+
+        `record_id` is the id returned by the BMC.
+        """
+        if offset == 0:
+            self._partial[record_id] = array.array('B')
+        record_data = self._partial.get(record_id)
+        if record_data is None:
+            # the first part was sent before the repository was read
+            return
+
+        del record_data[offset:]
+        record_data.extend(bytearray(data))
+        if progress != PARTIAL_ADD_LAST:
+            return
+
+        del self._partial[record_id]
+        record_data[0:2] = array.array('B',
+                [record_id & 0xff, (record_id >> 8) & 0xff])
+        try:
+            self.add(SdrCommon.from_data(record_data))
+        except DecodingError:
+            # the record is not indexed, like it is not returned by
+            # sdr_repository_entries
+            pass
+
+    def sync(self, reserve_fn, get_batch_fn, read_size=None,
+            record_count=None, verify=False):
+        """Updates the records to the ones of a live repository, which
+        is walked with the functions of `walk_sdr_helper`.
+
+        The headers (record id, version, type and length) of the live
+        records are compared to the ones of the records in this repository
+        while the repository is walked, and only the records which are new
+        or whose header has changed are read completely. A record whose
+        data is changed without changing its header is therefore only
+        detected if `verify` is set, which reads all records but keeps the
+        unchanged ones. `record_count` is the number of records reported
+        by the repository, if it is known.
+
+        Returns a tuple with the ids of the records which have been
+        added or replaced and the ids of the records which have been
+        removed.
+        """
+        selected = set()
+
+        def select(header):
+            header = _record_array(header)
+            record_id = header[0] | (header[1] << 8)
+            record = self._records.get(record_id)
+            if verify or record is None or \
+                    record.data[:SDR_HEADER_LENGTH] != header:
+                selected.add(record_id)
+                return True
+            return False
+
+        chain = []
+        seen = set()
+        if record_count != 0:
+            for (next_id, data) in walk_sdr_helper(reserve_fn,
+                    get_batch_fn, read_size=read_size, select=select):
+                data = _record_array(data)
+                record_id = data[0] | (data[1] << 8)
+                if record_id in seen:
+                    raise DecodingError('SDR record 0x%04x is linked twice'
+                            % record_id)
+                seen.add(record_id)
+                chain.append((record_id, data, next_id))
+
+        if record_count is not None and len(chain) != record_count:
+            log().debug('sdr sync: %d records linked, %d reported',
+                    len(chain), record_count)
+
+        removed = [record_id for record_id in self._records
+                if record_id not in seen]
+        for record_id in removed:
+            self.remove(record_id)
+
+        changed = []
+        for (record_id, data, next_id) in chain:
+            record = self._records.get(record_id)
+            if record is not None and (record_id not in selected
+                    or record.data == data):
+                record.next_id = next_id
+                continue
+            self.add(SdrCommon.from_data(data, next_id))
+            changed.append(record_id)
+
+        # keep the order of the live repository
+        for (record_id, _, _) in chain:
+            self._records[record_id] = self._records.pop(record_id)
+
+        return (changed, removed)
+
+    def get(self, record_id, default=None):
+        return self._records.get(record_id, default)
+
+    def find_sensor(self, owner_id, owner_lun, number):
+        """Returns the sensor record with the record key or None."""
+        records = self._by_sensor.get((owner_id, owner_lun, number))
+        if not records:
+            return None
+        return next(iter(records.values()))
+
+    def find_by_entity(self, entity_id, entity_instance):
+        return list(self._by_entity.get((entity_id, entity_instance),
+                {}).values())
+
+    def find_by_sensor_type(self, sensor_type_code):
+        return list(self._by_sensor_type.get(sensor_type_code, {}).values())
+
+    def find_by_name(self, device_id_string):
+        return list(self._by_name.get(device_id_string, {}).values())
+
+    def records_of_type(self, sdr_type):
+        """Iterates over the records of a type, e.g.
+        SDR_TYPE_FULL_SENSOR_RECORD.
+        """
+        return iter(list(self._by_type.get(sdr_type, {}).values()))
+
+    def entity_hierarchy(self):
+        """Returns the `EntityHierarchy` of the records. It is shared with
+        other repositories with the same records.
+        """
+        if self._hierarchy is None:
+            self._hierarchy = EntityHierarchy.shared(self._records.values())
+        return self._hierarchy
+
+
+class EntityHierarchy(object):
+    """The entity tree of a set of SDR records.
+
+    The tree is built from the entity association records. Entities are
+    identified by (entity id, entity instance). The children, the
+    descendants and the sensors below each entity are computed once, so
+    all lookups are dict lookups.
+
+    Hosts with the same SDR records can share one tree, see `shared`.
+
+    Example:
+
+        tree = EntityHierarchy.shared(ipmi.device_sdr_entries())
+        # all sensors of processor module 3 and the entities it contains
+        sensors = tree.sensors(0x09, 3)
+    """
+
+    # trees returned by `shared`, by digest of the records
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, records):
+        self._children = collections.OrderedDict()
+        self._parents = {}
+        self._records = collections.OrderedDict()
+
+        for record in records:
+            if isinstance(record, SdrEntityAssociationRecord):
+                container = (record.container_entity_id,
+                        record.container_entity_instance)
+                children = self._children.setdefault(container, [])
+                for child in record.contained_entities:
+                    if child not in children:
+                        children.append(child)
+                        self._parents.setdefault(child, []).append(
+                                container)
+            elif hasattr(record, 'entity_id'):
+                self._records.setdefault((record.entity_id,
+                        record.entity_instance), []).append(record)
+
+        entities = list(self._children) + [e for e in self._records
+                if e not in self._children]
+        self._descendants = dict((e, tuple(self._walk(e)))
+                for e in entities)
+        self._sensors = {}
+        for entity in entities:
+            records = []
+            for e in (entity,) + self._descendants[entity]:
+                records.extend(r for r in self._records.get(e, [])
+                        if hasattr(r, 'number'))
+            self._sensors[entity] = tuple(records)
+
+    def _walk(self, entity):
+        """Returns the descendants of the entity, depth first."""
+        seen = set([entity])
+        stack = list(reversed(self._children.get(entity, [])))
+        while stack:
+            child = stack.pop()
+            if child in seen:
+                continue
+            seen.add(child)
+            yield child
+            stack.extend(reversed(self._children.get(child, [])))
+
+    @staticmethod
+    def digest(records):
+        """Returns a digest of the data of the records, which identifies
+        hosts with the same SDR records.
+        """
+        h = hashlib.sha1()
+        for record in records:
+            data = array_tobytes(_record_array(record.data))
+            h.update(struct.pack('<H', len(data)))
+            h.update(data)
+        return h.hexdigest()
+
+    @classmethod
+    def shared(cls, records):
+        """Returns the tree of the records. The tree is built only once for
+        all calls with the same records.
+        """
+        records = list(records)
+        key = cls.digest(records)
+        with cls._shared_lock:
+            tree = cls._shared.get(key)
+            if tree is None:
+                tree = cls(records)
+                cls._shared[key] = tree
+        return tree
+
+    @classmethod
+    def clear_shared(cls):
+        with cls._shared_lock:
+            cls._shared.clear()
+
+    def __contains__(self, entity):
+        return entity in self._descendants
+
+    def entities(self):
+        """Returns all entities, which are in an association or have a
+        record.
+        """
+        return list(self._descendants)
+
+    def roots(self):
+        """Returns the entities which are not contained in another one."""
+        return [e for e in self._descendants if e not in self._parents]
+
+    def children(self, entity_id, entity_instance):
+        return list(self._children.get((entity_id, entity_instance), []))
+
+    def parents(self, entity_id, entity_instance):
+        return list(self._parents.get((entity_id, entity_instance), []))
+
+    def descendants(self, entity_id, entity_instance):
+        return list(self._descendants.get((entity_id, entity_instance), ()))
+
+    def records(self, entity_id, entity_instance):
+        """Returns the records of the entity itself, e.g. its sensors and
+        FRU device locators.
+        """
+        return list(self._records.get((entity_id, entity_instance), []))
+
+    def sensors(self, entity_id, entity_instance):
+        """Returns the sensor records of the entity and of all entities it
+        contains.
+        """
+        return list(self._sensors.get((entity_id, entity_instance), ()))
+
+
+def _complement(value, size):
+    if (value & (1 << (size-1))):
+        value = -(1<<size) + value
+    return value
+
+
+def _record_array(data):
+    if isinstance(data, array.array) and data.typecode == 'B':
+        return data
+    return array.array('B', data[:])
+
+
+class _Field(object):
+    """An attribute of a SDR record, which is decoded from the record data
+    whenever it is read. Assigned values are kept in `_overrides`.
+    """
+
+    def __init__(self, decode):
+        self.decode = decode
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        if obj._overrides is not None and self in obj._overrides:
+            return obj._overrides[self]
+        return self.decode(obj.data)
+
+    def __set__(self, obj, value):
+        if obj._overrides is None:
+            obj._overrides = {}
+        obj._overrides[self] = value
+        obj._field_changed()
+
+
+def _uint(offset, length=1):
+    if length == 1:
+        return _Field(lambda data: data[offset])
+
+    def decode(data):
+        value = 0
+        for i in range(length):
+            value |= data[offset + i] << (8 * i)
+        return value
+    return _Field(decode)
+
+
+def _bits(offset, mask, shift=0):
+    return _Field(lambda data: (data[offset] >> shift) & mask)
+
+
+def _flags(offset, names):
+    """Returns the names of the bits of the byte which are set."""
+    return _Field(lambda data: [name for (bit, name) in names
+            if data[offset] & bit])
+
+
+def _string(offset):
+    return _Field(lambda data:
+            py3dec_unic_bytes_fix(array_tobytes(data[offset:])))
+
+
+_INITIALIZATION_FLAGS = (
+    (0x40, 'scanning'),
+    (0x20, 'events'),
+    (0x10, 'thresholds'),
+    (0x08, 'hysteresis'),
+    (0x04, 'type'),
+    (0x02, 'default_event_generation'),
+    (0x01, 'default_scanning'),
+)
+
+_HYSTERESIS_SUPPORT = (
+    'hysteresis_not_supported',
+    'hysteresis_readable',
+    'hysteresis_read_and_setable',
+    'hysteresis_fixed',
+)
+
+_THRESHOLD_SUPPORT = (
+    'threshold_not_supported',
+    'threshold_readable',
+    'threshold_read_and_setable',
+    'threshold_fixed',
+)
+
+_ANALOG_CHARACTERISTIC_FLAGS = (
+    (0x01, 'nominal_reading'),
+    (0x02, 'normal_max'),
+    (0x04, 'normal_min'),
+)
+
+_THRESHOLD_OFFSETS = (
+    ('unr', 36),
+    ('ucr', 37),
+    ('unc', 38),
+    ('lnr', 39),
+    ('lcr', 40),
+    ('lnc', 41),
+)
+
+
+def _contained_entities(flags_offset, offsets):
+    """Returns the contained entities of an entity association record as
+    list of (entity id, entity instance). Ranges are expanded and unused
+    entries are left out.
+    """
+    def decode(data):
+        entities = [(data[o], data[o + 1]) for o in offsets]
+        if not data[flags_offset] & 0x80:
+            return [e for e in entities if e[0] != 0]
+
+        contained = []
+        for (first, last) in (entities[0:2], entities[2:4]):
+            if first[0] != 0:
+                contained.extend((first[0], instance)
+                        for instance in range(first[1], last[1] + 1))
+        return contained
+    return _Field(decode)
+
+
+def _capabilities(data):
+    capabilities = data[11]
+    flags = []
+    if capabilities & 0x80:
+        flags.append('ignore_sensor')
+    if capabilities & 0x40:
+        flags.append('auto_rearm')
+    flags.append(_HYSTERESIS_SUPPORT[(capabilities & 0x30) >> 4])
+    flags.append(_THRESHOLD_SUPPORT[(capabilities & 0x30) >> 4])
+    return flags
+
+
+class SdrDumpFile(object):
+    """The records of a SDR dump file, as written by `dump_sdr_repository`
+    or `ipmitool sdr dump`.
+
+    The file is mapped into memory. Only the record boundaries are read
+    when it is opened, each record is decoded by `SdrCommon.from_data`
+    when it is accessed. The next record id of a record is the id of the
+    following record in the file, like it is in the repository.
+
+    Example:
+
+        with SdrDumpFile('board.sdr') as dump:
+            sdrs = SdrRepository(dump)
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            if os.fstat(self._file.fileno()).st_size > 0:
+                self._map = mmap.mmap(self._file.fileno(), 0,
+                        access=mmap.ACCESS_READ)
+            else:
+                # empty files can not be mapped
+                self._map = b''
+            self._records = self._scan()
+        except Exception:
+            self.close()
+            raise
+
+    def _scan(self):
+        """Returns the tuples of offset and length of all records."""
+        records = []
+        offset = 0
+        while offset < len(self._map):
+            header = bytearray(self._map[offset:offset + 5])
+            if len(header) < 5:
+                raise DecodingError('Truncated SDR header at offset %d' %
+                        offset)
+            length = header[4] + 5
+            if offset + length > len(self._map):
+                raise DecodingError('Truncated SDR record at offset %d' %
+                        offset)
+            records.append((offset, length))
+            offset += length
+        return records
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        for index in range(len(self._records)):
+            yield self[index]
+
+    def record_data(self, index):
+        """Returns the data of a record."""
+        (offset, length) = self._records[index]
+        return array.array('B', bytearray(self._map[offset:offset + length]))
+
+    def _next_id(self, index):
+        if index + 1 >= len(self._records):
+            return 0xffff
+        offset = self._records[index + 1][0]
+        header = bytearray(self._map[offset:offset + 2])
+        return header[0] | (header[1] << 8)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self._records)
+        return SdrCommon.from_data(self.record_data(index),
+                self._next_id(index))
+
+
 class SdrCommon(object):
+    """The common part of all SDR records.
+
+    A record only keeps its data. The attributes are decoded from the data
+    when they are read, which keeps large numbers of records small.
+    """
+
+    __slots__ = ('data', 'next_id', '_overrides')
+
+    # the number of bytes up to the variable length part of the record
+    MIN_LENGTH = 5
+
+    id = _uint(0, 2)
+    version = _uint(2)
+    type = _uint(3)
+    length = _uint(4)
+
     def __init__(self, data, next_id=None):
+        self._overrides = None
         if data:
-            self.data = data
-            self._common_header(data)
-
-            if hasattr(self, '_from_data'):
-                self._from_data(data)
+            self.data = _record_array(data)
+            if len(self.data) < self.MIN_LENGTH:
+                raise DecodingError('Invalid SDR length (%d)' %
+                        len(self.data))
 
         if next_id:
             self.next_id = next_id
@@ -203,24 +1006,9 @@ class SdrCommon(object):
             (self.device_id_string, ' '.join(['%02x' % b for b in self.data]))
         return s
 
-    def _common_header(self, data):
-        buffer = ByteBuffer(data[:])
-        try:
-            self.id = buffer.pop_unsigned_int(2)
-            self.version = buffer.pop_unsigned_int(1)
-            self.type = buffer.pop_unsigned_int(1)
-            self.length = buffer.pop_unsigned_int(1)
-        except:
-            raise DecodingError('Invalid SDR length (%d)' % len(data))
-
-    def _common_record_key(self, buffer):
-        self.owner_id = buffer.pop_unsigned_int(1)
-        self.owner_lun = buffer.pop_unsigned_int(1) & 0x3
-        self.number = buffer.pop_unsigned_int(1)
-
-    def _entity(self, buffer):
-        self.entity_id = buffer.pop_unsigned_int(1)
-        self.entity_instance = buffer.pop_unsigned_int(1)
+    def _field_changed(self):
+        """Called when a field is assigned."""
+        pass
 
     @staticmethod
     def from_data(data, next_id=None):
@@ -234,6 +1022,10 @@ class SdrCommon(object):
                         SdrCompactSensorRecord,
                 SDR_TYPE_EVENT_ONLY_SENSOR_RECORD:
                         SdrEventOnlySensorRecord,
+                SDR_TYPE_ENTITY_ASSOCIATION_RECORD:
+                        SdrEntityAssociationRecord,
+                SDR_TYPE_DEVICE_RELATIVE_ENTITY_ASSOCIATION_RECORD:
+                        SdrDeviceRelativeEntityAssociationRecord,
                 SDR_TYPE_FRU_DEVICE_LOCATOR_RECORD:
                         SdrFruDeviceLocator,
                 SDR_TYPE_MANAGEMENT_CONTROLLER_DEVICE_LOCATOR_RECORD:
@@ -250,16 +1042,78 @@ class SdrCommon(object):
 ###
 # SDR type 0x01
 ##################################################
+# conversion tables of the full sensor records, shared by all records with
+# the same conversion formula
+_CONVERSION_TABLES = {}
+_REVERSE_CONVERSION_TABLES = {}
+_MAX_CONVERSION_TABLES = 1024
+
+
 class SdrFullSensorRecord(SdrCommon):
     DATA_FMT_UNSIGNED = 0
     DATA_FMT_1S_COMPLEMENT = 1
     DATA_FMT_2S_COMPLEMENT = 2
     DATA_FMT_NONE = 3
 
+    # the shared conversion tables, looked up when they are used first
+    __slots__ = ('_raw_to_value', '_value_to_raw')
+
+    MIN_LENGTH = 48
+
+    # record key bytes
+    owner_id = _uint(5)
+    owner_lun = _bits(6, 0x3)
+    number = _uint(7)
+    # record body bytes
+    entity_id = _uint(8)
+    entity_instance = _uint(9)
+    sensor_initialization = _uint(10)
+    initialization = _flags(10, _INITIALIZATION_FLAGS)
+    sensor_capabilities = _uint(11)
+    capabilities = _Field(_capabilities)
+    sensor_type_code = _uint(12)
+    event_reading_type_code = _uint(13)
+    assertion_mask = _uint(14, 2)
+    deassertion_mask = _uint(16, 2)
+    discrete_reading_mask = _uint(18, 2)
+    analog_data_format = _bits(20, 0x3, 6)
+    rate_unit = _Field(lambda data: (data[20] >> 3) >> 0x7)
+    modifier_unit = _bits(20, 0x2, 1)
+    percentage = _bits(20, 0x1)
+    linearization = _bits(23, 0x7f)
+    # NAC: Bug fix.  Upstream did not properly account for
+    # 'M' being a twos complement value.
+    m = _Field(lambda data:
+            _complement(data[24] | ((data[25] & 0xc0) << 2), 10))
+    tolerance = _bits(25, 0x3f)
+    b = _Field(lambda data:
+            _complement(data[26] | ((data[27] & 0xc0) << 2), 10))
+    accuracy = _Field(lambda data:
+            (data[27] & 0x3f) | ((data[28] & 0xf0) << 4))
+    accuracy_exp = _bits(28, 0x3, 2)
+    k2 = _Field(lambda data: _complement(data[29] >> 4, 4))
+    k1 = _Field(lambda data: _complement(data[29] & 0x0f, 4))
+    analog_characteristics = _uint(30)
+    analog_characteristic = _flags(30, _ANALOG_CHARACTERISTIC_FLAGS)
+    nominal_reading = _uint(31)
+    normal_maximum = _uint(32)
+    normal_minimum = _uint(33)
+    sensor_maximum_reading = _uint(34)
+    sensor_minimum_reading = _uint(35)
+    threshold = _Field(lambda data:
+            dict((name, data[offset]) for (name, offset)
+                in _THRESHOLD_OFFSETS))
+    hysteresis = _Field(lambda data: {
+            'positive_going': data[42], 'negative_going': data[43]})
+    reserved = _uint(44, 2)
+    oem = _uint(46)
+    device_id_string_type_length = _uint(47)
+    device_id_string = _string(48)
+
     def __init__(self, data, next_id=None):
-        super(self.__class__, self).__init__(data, next_id)
-        if data:
-            self._from_data(data)
+        self._raw_to_value = None
+        self._value_to_raw = None
+        SdrCommon.__init__(self, data, next_id)
 
     def __str__(self):
         s = '["%-16s"] [%s:%s] [%s]' \
@@ -267,7 +1121,16 @@ class SdrFullSensorRecord(SdrCommon):
                 self.entity_instance, ' '.join(['%02x' % b for b in self.data]))
         return s
 
-    def convert_sensor_raw_to_value(self, raw):
+    def _field_changed(self):
+        # the conversion formula may have changed
+        self._raw_to_value = None
+        self._value_to_raw = None
+
+    def _conversion_key(self):
+        return (self.analog_data_format, self.linearization & 0x7f,
+                self.m, self.b, self.k1, self.k2)
+
+    def _convert(self, raw):
         fmt = self.analog_data_format
         if (fmt == self.DATA_FMT_1S_COMPLEMENT):
             if raw & 0x80:
@@ -279,344 +1142,243 @@ class SdrFullSensorRecord(SdrCommon):
 
         return self.l((self.m * raw + (self.b * 10**self.k1)) * 10**self.k2)
 
-    def convert_sensor_value_to_raw(self, value):
-        linearization = self.linearization & 0x7f
+    def _conversion_table(self):
+        """Returns the values of all 256 raw readings. The value is None
+        if the raw reading can not be converted.
+        """
+        if self._raw_to_value is None:
+            key = self._conversion_key()
+            table = _CONVERSION_TABLES.get(key)
+            if table is None:
+                values = []
+                for raw in range(256):
+                    try:
+                        values.append(self._convert(raw))
+                    except (ValueError, ZeroDivisionError, OverflowError):
+                        values.append(None)
+                table = tuple(values)
+                if len(_CONVERSION_TABLES) >= _MAX_CONVERSION_TABLES:
+                    _CONVERSION_TABLES.clear()
+                _CONVERSION_TABLES[key] = table
+            self._raw_to_value = table
+        return self._raw_to_value
+
+    def _reverse_conversion_table(self):
+        """Returns the sorted values and their raw readings."""
+        if self._value_to_raw is None:
+            key = self._conversion_key()
+            table = _REVERSE_CONVERSION_TABLES.get(key)
+            if table is None:
+                pairs = sorted((value, raw) for (raw, value)
+                        in enumerate(self._conversion_table())
+                        if value is not None)
+                table = (tuple(value for (value, _) in pairs),
+                        tuple(raw for (_, raw) in pairs))
+                if len(_REVERSE_CONVERSION_TABLES) >= \
+                        _MAX_CONVERSION_TABLES:
+                    _REVERSE_CONVERSION_TABLES.clear()
+                _REVERSE_CONVERSION_TABLES[key] = table
+            self._value_to_raw = table
+        return self._value_to_raw
 
-        if linearization is not L_LINEAR:
-            raise NotImplementedError()
+    def convert_sensor_raw_to_value(self, raw):
+        value = self._conversion_table()[raw]
+        if value is None:
+            # raises the error of the conversion
+            return self._convert(raw)
+        return value
 
-        raw = ((float(value) * 10**(-1 * self.k2)) / self.m) - (self.b * 10**self.k1)
+    def convert_sensor_value_to_raw(self, value):
+        """Returns the raw reading whose value is closest to `value`.
 
-        fmt = self.analog_data_format
-        if (fmt == self.DATA_FMT_1S_COMPLEMENT):
-            if value < 0:
-                raise NotImplementedError()
-        elif (fmt == self.DATA_FMT_2S_COMPLEMENT):
-            if value < 0:
-                raise NotImplementedError()
+        The value must not be more than half a step outside the range of
+        the sensor.
+        """
+        (values, raws) = self._reverse_conversion_table()
+        if len(values) < 2:
+            raise ValueError()
 
-        raw = int(round(raw))
-        if raw > 0xff:
+        value = float(value)
+        if value < values[0] - (values[1] - values[0]) / 2 or \
+                value > values[-1] + (values[-1] - values[-2]) / 2:
             raise ValueError()
 
-        return raw
+        i = bisect.bisect_left(values, value)
+        if i == len(values) or \
+                (i > 0 and value - values[i - 1] <= values[i] - value):
+            i -= 1
+        return raws[i]
 
     @property
     def l(self):
         try:
-            return {
-                L_LN:     math.log,
-                L_LOG:    lambda x: math.log(x, 10),
-                L_LOG2:   lambda x: math.log(x, 2),
-                L_E:      math.exp,
-                L_EXP10:  lambda x: math.pow(10, x),
-                L_EXP2:   lambda x: math.pow(2, x),
-                L_1_X:    lambda x: 1.0 / x,
-                L_SQR:    lambda x: math.pow(x, 2),
-                L_CUBE:   lambda x: math.pow(x, 3),
-                L_SQRT:   math.sqrt,
-                L_CUBERT: lambda x: math.pow(x, 1.0/3),
-                L_LINEAR: lambda x: x,
-            }[self.linearization & 0x7f]
+            return LINEARIZATIONS[self.linearization & 0x7f]
         except KeyError:
             raise errors.DecodingError('unknown linearization %d' %
                                        (self.linearization & 0x7f))
 
     def _convert_complement(self, value, size):
-        if (value & (1 << (size-1))):
-            value = -(1<<size) + value
-        return value
-
-    def _from_data(self, data):
-        buffer = ByteBuffer(data[5:])
-        # record key bytes
-        self._common_record_key(buffer.pop_slice(3))
-        # record body bytes
-        self._entity(buffer.pop_slice(2))
-
-        # byte 11
-        initialization = buffer.pop_unsigned_int(1)
-        self.initialization = []
-        if initialization & 0x40:
-            self.initialization.append('scanning')
-        if initialization & 0x20:
-            self.initialization.append('events')
-        if initialization & 0x10:
-            self.initialization.append('thresholds')
-        if initialization & 0x08:
-            self.initialization.append('hysteresis')
-        if initialization & 0x04:
-            self.initialization.append('type')
-        if initialization & 0x02:
-            self.initialization.append('default_event_generation')
-        if initialization & 0x01:
-            self.initialization.append('default_scanning')
-
-        # byte 12 - sensor capabilities
-        capabilities = buffer.pop_unsigned_int(1)
-        self.capabilities = []
-        # ignore sensor
-        if capabilities & 0x80:
-            self.capabilities.append('ignore_sensor')
-        # sensor auto re-arm support
-        if capabilities & 0x40:
-            self.capabilities.append('auto_rearm')
-        # sensor hysteresis support
-        HYSTERESIS_MASK = 0x30
-        HYSTERESIS_IS_NOT_SUPPORTED = 0x00
-        HYSTERESIS_IS_READABLE = 0x10
-        HYSTERESIS_IS_READ_AND_SETTABLE = 0x20
-        HYSTERESIS_IS_FIXED = 0x30
-        if capabilities & HYSTERESIS_MASK == HYSTERESIS_IS_NOT_SUPPORTED:
-            self.capabilities.append('hysteresis_not_supported')
-        elif capabilities & HYSTERESIS_MASK == HYSTERESIS_IS_READABLE:
-            self.capabilities.append('hysteresis_readable')
-        elif capabilities & HYSTERESIS_MASK == HYSTERESIS_IS_READ_AND_SETTABLE:
-            self.capabilities.append('hysteresis_read_and_setable')
-        elif capabilities & HYSTERESIS_MASK == HYSTERESIS_IS_FIXED:
-            self.capabilities.append('hysteresis_fixed')
-        # sensor threshold support
-        THRESHOLD_MASK = 0x30
-        THRESHOLD_IS_NOT_SUPPORTED = 0x00
-        THRESHOLD_IS_READABLE = 0x10
-        THRESHOLD_IS_READ_AND_SETTABLE = 0x20
-        THRESHOLD_IS_FIXED = 0x30
-        if capabilities & THRESHOLD_MASK == THRESHOLD_IS_NOT_SUPPORTED:
-            self.capabilities.append('threshold_not_supported')
-        elif capabilities & THRESHOLD_MASK == THRESHOLD_IS_READABLE:
-            self.capabilities.append('threshold_readable')
-        elif capabilities & THRESHOLD_MASK == THRESHOLD_IS_READ_AND_SETTABLE:
-            self.capabilities.append('threshold_read_and_setable')
-        elif capabilities & THRESHOLD_MASK == THRESHOLD_IS_FIXED:
-            self.capabilities.append('threshold_fixed')
-        # sensor event message control support
-        if (capabilities & 0x03) is 0:
-            pass
-        if (capabilities & 0x03) is 1:
-            pass
-        if (capabilities & 0x03) is 2:
-            pass
-        if (capabilities & 0x03) is 3:
-            pass
-
-        self.sensor_type_code = buffer.pop_unsigned_int(1)
-        self.event_reading_type_code = buffer.pop_unsigned_int(1)
-        self.assertion_mask = buffer.pop_unsigned_int(2)
-        self.deassertion_mask = buffer.pop_unsigned_int(2)
-        self.discrete_reading_mask = buffer.pop_unsigned_int(2)
-        # byte 21, 22, 23
-        units_1 = buffer.pop_unsigned_int(1)
-        units_2 = buffer.pop_unsigned_int(1)
-        units_3 = buffer.pop_unsigned_int(1)
-        self.analog_data_format = (units_1 >> 6) & 0x3
-        self.rate_unit = (units_1 >> 3) >> 0x7
-        self.modifier_unit = (units_1 >> 1) & 0x2
-        self.percentage = units_1 & 0x1
-        # byte 24
-        self.linearization = buffer.pop_unsigned_int(1) & 0x7f
-        # byte 25, 26
-        m = buffer.pop_unsigned_int(1)
-        m_tol = buffer.pop_unsigned_int(1)
-        #self.m = (m & 0xff) | (((m_tol & 0xc0) << 2) | ~0x3ff)
-        self.m = (m & 0xff) | ((m_tol & 0xc0) << 2)
-        # NAC: Bug fix.  Upstream did not properly account for
-        # 'M' being a twos complement value.
-        self.m = self._convert_complement(self.m, 10)
-        self.tolerance = (m_tol & 0x3f)
-
-        # byte 27, 28, 29
-        b = buffer.pop_unsigned_int(1)
-        b_acc = buffer.pop_unsigned_int(1)
-        acc_accexp = buffer.pop_unsigned_int(1)
-        self.b = (b & 0xff) | ((b_acc & 0xc0) << 2)
-        self.b = self._convert_complement(self.b, 10)
-        self.accuracy = (b_acc & 0x3f) | ((acc_accexp & 0xf0) << 4)
-        self.accuracy_exp = (acc_accexp & 0x0c) >> 2
-        # byte 30
-        rexp_bexp = buffer.pop_unsigned_int(1)
-        self.k2 = (rexp_bexp & 0xf0) >> 4
-        # convert 2s complement
-        #if self.k2 & 0x8: # 4bit
-        #    self.k2 = -0x10 + self.k2
-        self.k2 = self._convert_complement(self.k2, 4)
-
-        self.k1 = rexp_bexp & 0x0f
-        # convert 2s complement
-        #if self.k1 & 0x8:
-        #    self.k1 = -0x10 + self.k1
-        self.k1 = self._convert_complement(self.k1, 4)
-
-        # byte 31
-        analog_characteristics = buffer.pop_unsigned_int(1)
-        self.analog_characteristic = []
-        if analog_characteristics & 0x01:
-            self.analog_characteristic.append('nominal_reading')
-        if analog_characteristics & 0x02:
-            self.analog_characteristic.append('normal_max')
-        if analog_characteristics & 0x04:
-            self.analog_characteristic.append('normal_min')
-
-        self.nominal_reading = buffer.pop_unsigned_int(1)
-        self.normal_maximum = buffer.pop_unsigned_int(1)
-        self.normal_minimum = buffer.pop_unsigned_int(1)
-        self.sensor_maximum_reading = buffer.pop_unsigned_int(1)
-        self.sensor_minimum_reading = buffer.pop_unsigned_int(1)
-        self.threshold = {}
-        self.threshold['unr'] = buffer.pop_unsigned_int(1)
-        self.threshold['ucr'] = buffer.pop_unsigned_int(1)
-        self.threshold['unc'] = buffer.pop_unsigned_int(1)
-        self.threshold['lnr'] = buffer.pop_unsigned_int(1)
-        self.threshold['lcr'] = buffer.pop_unsigned_int(1)
-        self.threshold['lnc'] = buffer.pop_unsigned_int(1)
-        self.hysteresis = {}
-        self.hysteresis['positive_going'] = buffer.pop_unsigned_int(1)
-        self.hysteresis['negative_going'] = buffer.pop_unsigned_int(1)
-        self.reserved = buffer.pop_unsigned_int(2)
-        self.oem = buffer.pop_unsigned_int(1)
-        self.device_id_string_type_length = buffer.pop_unsigned_int(1)
-        self.device_id_string = buffer.tostring()
+        return _complement(value, size)
 
 
 ###
 # SDR type 0x02
 ##################################################
 class SdrCompactSensorRecord(SdrCommon):
-    def __init__(self, data, next_id=None):
-        super(self.__class__, self).__init__(data, next_id)
-        if data:
-            self._from_data(data)
-
-    def __str__(self):
-        s = '["%-16s"] [%s]' % (self.device_id_string, ' '.join(['%02x' % b for b in self.data]))
-        return s
-
-    def _from_data(self, data):
-        buffer = ByteBuffer(data[5:])
-
-        # record key bytes
-        self._common_record_key(buffer.pop_slice(3))
-
-        # record body bytes
-        self._entity(buffer.pop_slice(2))
-
-        self.sensor_initialization = buffer.pop_unsigned_int(1)
-        self.capabilities = buffer.pop_unsigned_int(1)
-        self.sensor_type_code = buffer.pop_unsigned_int(1)
-        self.event_reading_type_code = buffer.pop_unsigned_int(1)
-        self.assertion_mask = buffer.pop_unsigned_int(2)
-        self.deassertion_mask = buffer.pop_unsigned_int(2)
-        self.discrete_reading_mask = buffer.pop_unsigned_int(2)
-        self.units_1 = buffer.pop_unsigned_int(1)
-        self.units_2 = buffer.pop_unsigned_int(1)
-        self.units_3 = buffer.pop_unsigned_int(1)
-        self.record_sharing = buffer.pop_unsigned_int(2)
-        self.positive_going_hysteresis = buffer.pop_unsigned_int(1)
-        self.negative_going_hysteresis = buffer.pop_unsigned_int(1)
-        self.reserved = buffer.pop_unsigned_int(3)
-        self.oem = buffer.pop_unsigned_int(1)
-        self.device_id_string_type_length = buffer.pop_unsigned_int(1)
-        self.device_id_string = buffer.tostring()
+    __slots__ = ()
+
+    MIN_LENGTH = 32
+
+    # record key bytes
+    owner_id = _uint(5)
+    owner_lun = _bits(6, 0x3)
+    number = _uint(7)
+    # record body bytes
+    entity_id = _uint(8)
+    entity_instance = _uint(9)
+    sensor_initialization = _uint(10)
+    capabilities = _uint(11)
+    sensor_type_code = _uint(12)
+    event_reading_type_code = _uint(13)
+    assertion_mask = _uint(14, 2)
+    deassertion_mask = _uint(16, 2)
+    discrete_reading_mask = _uint(18, 2)
+    units_1 = _uint(20)
+    units_2 = _uint(21)
+    units_3 = _uint(22)
+    record_sharing = _uint(23, 2)
+    positive_going_hysteresis = _uint(25)
+    negative_going_hysteresis = _uint(26)
+    reserved = _uint(27, 3)
+    oem = _uint(30)
+    device_id_string_type_length = _uint(31)
+    device_id_string = _string(32)
 
 
 ###
 # SDR type 0x03
 ##################################################
 class SdrEventOnlySensorRecord(SdrCommon):
-    def __init__(self, data, next_id=None):
-        super(self.__class__, self).__init__(data, next_id)
-        if data:
-            self._from_data(data)
+    __slots__ = ()
+
+    MIN_LENGTH = 17
+
+    # record key bytes
+    owner_id = _uint(5)
+    owner_lun = _bits(6, 0x3)
+    number = _uint(7)
+    # record body bytes
+    entity_id = _uint(8)
+    entity_instance = _uint(9)
+    sensor_type = _uint(10)
+    event_reading_type_code = _uint(11)
+    record_sharing = _uint(12, 2)
+    reserved = _uint(14)
+    oem = _uint(15)
+    device_id_string_type_length = _uint(16)
+    device_id_string = _string(17)
 
     def __str__(self):
         return 'Not supported yet.'
 
-    def _from_data(self, data):
-        buffer = ByteBuffer(data[5:])
 
-        # record key bytes
-        self._common_record_key(buffer.pop_slice(3))
+###
+# SDR type 0x08
+##################################################
+class SdrEntityAssociationRecord(SdrCommon):
+    __slots__ = ()
+
+    MIN_LENGTH = 16
+
+    # record key bytes
+    container_entity_id = _uint(5)
+    container_entity_instance = _uint(6)
+    contained_entities_range = _bits(7, 0x1, 7)
+    linked = _bits(7, 0x1, 6)
+    presence_sensor_always_accessible = _bits(7, 0x1, 5)
+    # record body bytes
+    contained_entities = _contained_entities(7, (8, 10, 12, 14))
+
+    def __str__(self):
+        return 'Entity %d.%d contains %s' % (self.container_entity_id,
+                self.container_entity_instance, ', '.join(
+                    '%d.%d' % e for e in self.contained_entities))
+
+
+###
+# SDR type 0x09
+##################################################
+class SdrDeviceRelativeEntityAssociationRecord(SdrEntityAssociationRecord):
+    __slots__ = ()
 
-        # record body bytes
-        self._entity(buffer.pop_slice(2))
+    MIN_LENGTH = 26
 
-        self.sensor_type = buffer.pop_unsigned_int(1)
-        self.event_reading_type_code = buffer.pop_unsigned_int(1)
-        self.record_sharing = buffer.pop_unsigned_int(2)
-        self.reserved = buffer.pop_unsigned_int(1)
-        self.oem = buffer.pop_unsigned_int(1)
-        self.device_id_string_type_length = buffer.pop_unsigned_int(1)
-        self.device_id_string = buffer.tostring()
+    # record key bytes
+    container_entity_id = _uint(5)
+    container_entity_instance = _uint(6)
+    container_device_address = _bits(7, 0x7f, 1)
+    container_device_channel = _bits(8, 0xf, 4)
+    contained_entities_range = _bits(9, 0x1, 7)
+    linked = _bits(9, 0x1, 6)
+    presence_sensor_always_accessible = _bits(9, 0x1, 5)
+    # record body bytes
+    contained_entities = _contained_entities(9, (12, 16, 20, 24))
 
 
 ###
 # SDR type 0x11
 ##################################################
 class SdrFruDeviceLocator(SdrCommon):
-    def __init__(self, data, next_id=None):
-        super(self.__class__, self).__init__(data, next_id)
-        if data:
-            self._from_data(data)
+    __slots__ = ()
 
-    def __str__(self):
-        s = '["%-16s"] [%s]' % (self.device_id_string, ' '.join(['%02x' % b for b in self.data]))
-        return s
+    MIN_LENGTH = 16
 
-    def _from_data(self, data):
-        buffer = ByteBuffer(data[5:])
-        self.device_access_address = buffer.pop_unsigned_int(1) >> 1
-        self.fru_device_id = buffer.pop_unsigned_int(1)
-        self.logical_physical = buffer.pop_unsigned_int(1)
-        self.channel_number = buffer.pop_unsigned_int(1)
-        self.reserved = buffer.pop_unsigned_int(1)
-        self.device_type = buffer.pop_unsigned_int(1)
-        self.device_type_modifier= buffer.pop_unsigned_int(1)
-        self._entity(buffer.pop_slice(2))
-        self.oem = buffer.pop_unsigned_int(1)
-        self.device_id_string_type_length = buffer.pop_unsigned_int(1)
-        self.device_id_string = buffer.tostring()
+    device_access_address = _bits(5, 0x7f, 1)
+    fru_device_id = _uint(6)
+    logical_physical = _uint(7)
+    channel_number = _uint(8)
+    reserved = _uint(9)
+    device_type = _uint(10)
+    device_type_modifier = _uint(11)
+    entity_id = _uint(12)
+    entity_instance = _uint(13)
+    oem = _uint(14)
+    device_id_string_type_length = _uint(15)
+    device_id_string = _string(16)
 
 
 ###
 # SDR type 0x12
 ##################################################
 class SdrManagementContollerDeviceLocator(SdrCommon):
-    def __init__(self, data, next_id=None):
-        super(self.__class__, self).__init__(data, next_id)
-        if data:
-            self._from_data(data)
-
-    def __str__(self):
-        s = '["%-16s"] [%s]' % (self.device_id_string, ' '.join(['%02x' % b for b in self.data]))
-        return s
-
-    def _from_data(self, data):
-        buffer = ByteBuffer(data[5:])
-        self.device_slave_address = buffer.pop_unsigned_int(1) >> 1
-        self.channel_number = buffer.pop_unsigned_int(1) & 0xf
-        self.power_state_notification = buffer.pop_unsigned_int(1)
-        self.global_initialization = 0
-        self.device_capabilities = buffer.pop_unsigned_int(1)
-        self.reserved = buffer.pop_unsigned_int(3)
-        self._entity(buffer.pop_slice(2))
-        self.oem = buffer.pop_unsigned_int(1)
-        self.device_id_string_type_length = buffer.pop_unsigned_int(1)
-        self.device_id_string = buffer.tostring()
+    __slots__ = ()
+
+    MIN_LENGTH = 16
+
+    device_slave_address = _bits(5, 0x7f, 1)
+    channel_number = _bits(6, 0xf)
+    power_state_notification = _uint(7)
+    global_initialization = _Field(lambda data: 0)
+    device_capabilities = _uint(8)
+    reserved = _uint(9, 3)
+    entity_id = _uint(12)
+    entity_instance = _uint(13)
+    oem = _uint(14)
+    device_id_string_type_length = _uint(15)
+    device_id_string = _string(16)
 
 ###
 # SDR type 0xC0
 ##################################################
 class SdrOEMSensorRecord(SdrCommon):
-    def __init__(self, data, next_id=None):
-        super(self.__class__, self).__init__(data, next_id)
-        if data:
-            self._from_data(data)
+    __slots__ = ()
 
-    def __str__(self):
-        return 'Not supported yet.'
-
-    def _from_data(self, data):
-        buffer = ByteBuffer(data[5:])
+    MIN_LENGTH = 8
 
-        # record key bytes
-        self._common_record_key(buffer.pop_slice(3))
+    # record key bytes
+    owner_id = _uint(5)
+    owner_lun = _bits(6, 0x3)
+    number = _uint(7)
 
+    def __str__(self):
+        return 'Not supported yet.'
@@ -26,7 +26,7 @@ from .msgs import create_request_by_name
 from .msgs import constants
 from .event import EVENT_ASSERTION, EVENT_DEASSERTION
 
-from .helper import clear_repository_helper
+from .helper import clear_repository_helper, run_steps, Done
 from .state import State
 
 
@@ -48,44 +48,67 @@ class Sel(object):
         clear_repository_helper(self.get_sel_reservation_id,
                 self._clear_sel, retry)
 
-    def sel_entries(self):
-        """Generator which returns all SEL entries."""
+    def _get_sel_entry(self, reservation_id, record_id):
+        """Returns the next record id and the data of a SEL entry."""
+        return run_steps(sel_entry_steps(reservation_id, record_id),
+                self.send_message)
+
+    def _prefetch_sel_entries(self, reservation_id, record_id, count):
+        """Reads `count` SEL entries with consecutive record ids as batch.
+
+        Returns a dictionary of the successfully read entries with the
+        record id as key and a tuple of the next record id and the data as
+        value.
+        """
+        reqs = []
+        for n in range(count):
+            req = create_request_by_name('GetSelEntry')
+            req.reservation_id = reservation_id
+            req.record_id = (record_id + n) & 0xffff
+            req.offset = 0
+            req.length = 0xff
+            reqs.append(req)
+
+        entries = {}
+        for (req, rsp) in zip(reqs, self.send_message_batch(reqs)):
+            if (rsp.completion_code == constants.CC_OK
+                    and len(rsp.record_data) >= 16):
+                entries[req.record_id] = (rsp.next_record_id,
+                        ByteBuffer(rsp.record_data))
+        return entries
+
+    def sel_entries(self, prefetch=16):
+        """Generator which returns all SEL entries.
+
+        If the interface can send batches of requests, the entries are
+        prefetched speculatively, assuming consecutive record ids. The
+        entries are still returned in the order given by the next record id
+        of each entry. An entry which was not prefetched is read on its own.
+        """
         rsp = self.send_message_with_name('GetSelInfo')
         if rsp.entries == 0:
             return
         reservation_id = self.get_sel_reservation_id()
-        next_record_id = 0
-        while True:
-            req = create_request_by_name('GetSelEntry')
-            req.reservation_id = reservation_id
-            req.record_id = next_record_id
-            req.offset = 0
-            self.max_req_len = 0xff # read entire record
-
-            record_data = ByteBuffer()
-            while True:
-                req.length = self.max_req_len
-                if (self.max_req_len != 0xff
-                        and (req.offset + req.length) > 16):
-                    req.length = 16 - req.offset
-
-                rsp = self.send_message(req)
-                if rsp.completion_code == constants.CC_CANT_RET_NUM_REQ_BYTES:
-                    if self.max_req_len  == 0xff:
-                        self.max_req_len = 16
-                    else:
-                        self.max_req_len -= 1
-                    continue
-                else:
-                    check_completion_code(rsp.completion_code)
-
-                record_data.extend(rsp.record_data)
-                req.offset = len(record_data)
 
-                if len(record_data) >= 16:
-                    break
+        if not hasattr(self.interface, 'send_and_receive_batch'):
+            prefetch = 0
 
-            next_record_id = rsp.next_record_id
+        prefetched = {}
+        next_record_id = 0
+        while True:
+            if prefetch > 1 and next_record_id not in prefetched:
+                prefetched = self._prefetch_sel_entries(reservation_id,
+                        next_record_id, prefetch)
+                if next_record_id not in prefetched:
+                    # the record ids are not consecutive, stop guessing
+                    prefetch = 0
+
+            if next_record_id in prefetched:
+                (next_record_id, record_data) = \
+                        prefetched.pop(next_record_id)
+            else:
+                (next_record_id, record_data) = \
+                        self._get_sel_entry(reservation_id, next_record_id)
 
             yield SelEntry(record_data)
             if next_record_id == 0xffff:
@@ -95,6 +118,45 @@ class Sel(object):
         '''Returns all SEL entries as a list.'''
         return list(self.sel_entries())
 
+def sel_entry_steps(reservation_id, record_id):
+    """Request generator which reads a SEL entry, see `helper.run_steps`.
+
+    The result is the tuple of next record id and entry data. The entire
+    entry is requested at once, if the target rejects this it is read in
+    smaller chunks.
+    """
+    req = create_request_by_name('GetSelEntry')
+    req.reservation_id = reservation_id
+    req.record_id = record_id
+    req.offset = 0
+    max_req_len = 0xff # read entire record
+
+    record_data = ByteBuffer()
+    while True:
+        req.length = max_req_len
+        if max_req_len != 0xff and (req.offset + req.length) > 16:
+            req.length = 16 - req.offset
+
+        rsp = yield req
+        if rsp.completion_code == constants.CC_CANT_RET_NUM_REQ_BYTES:
+            if max_req_len == 0xff:
+                max_req_len = 16
+            else:
+                max_req_len -= 1
+                if max_req_len <= 0:
+                    raise RetryError()
+            continue
+        check_completion_code(rsp.completion_code)
+
+        record_data.extend(rsp.record_data)
+        req.offset = len(record_data)
+
+        if len(record_data) >= 16:
+            break
+
+    yield Done((rsp.next_record_id, record_data))
+
+
 class SelInfo(State):
 
     def _from_response(self, rsp):
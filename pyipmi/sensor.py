@@ -16,18 +16,20 @@
 
 from __future__ import absolute_import
 
-# from builtins import object
+from builtins import object
 
 # import math
 # from . import errors
 # import array
-# import time
+import time
 # from pyipmi.errors import DecodingError, CompletionCodeError, RetryError
+from .errors import CompletionCodeError
 from .utils import check_completion_code # ByteBuffer
 from .msgs import create_request_by_name
-# from .msgs import constants
+from .msgs import constants
 
-from .helper import get_sdr_data_helper, get_sdr_chunk_helper
+from .helper import get_sdr_data_helper, get_sdr_chunk_helper, DEVICE_SDR
+from .helper import walk_sdr_helper, sdr_read_requests, sdr_read_results
 
 from . import sdr
 
@@ -102,6 +104,108 @@ SENSOR_TYPE_OEM_KONTRON_POWER_DENIED = 0xcd
 SENSOR_TYPE_OEM_KONTRON_RESET = 0xcf
 
 
+def sensor_reading_from_response(rsp):
+    """Returns the raw reading and the assertion states of a Get Sensor
+    Reading response.
+    """
+    reading = rsp.sensor_reading
+    if rsp.config.initial_update_in_progress:
+        reading = None
+
+    states = None
+    if rsp.states1 is not None:
+        states = rsp.states1
+        if rsp.states2 is not None:
+            states |= (rsp.states2 << 8)
+    return (reading, states)
+
+
+def is_readable_sensor(record):
+    """True if the sensor of the record can be read, i.e. it is a full or
+    compact sensor record.
+    """
+    return record.type in (sdr.SDR_TYPE_FULL_SENSOR_RECORD,
+            sdr.SDR_TYPE_COMPACT_SENSOR_RECORD)
+
+
+def sensor_reading_requests(sdrs):
+    """Returns a Get Sensor Reading request for each sensor record."""
+    reqs = []
+    for s in sdrs:
+        req = create_request_by_name('GetSensorReading')
+        req.sensor_number = s.number
+        req.lun = s.owner_lun
+        reqs.append(req)
+    return reqs
+
+
+class SensorSnapshot(object):
+    """The readings of a set of sensors, which were read in one sweep.
+
+    The readings are kept in lists, which have the same order as
+    `records`. `raw` and `states` are None if the sensor could not be
+    read or its initial update is still in progress. `values` are the
+    converted readings of full sensor records and None for the other
+    records or if the reading can not be converted. `errors` is the
+    completion code of each failed reading, otherwise None. A sensor which
+    did not respond at all is reported with `CC_TIMEOUT`, which is also
+    the case for a response of None.
+
+    `timestamp` is the start of the sweep and `duration` the time in
+    seconds it took.
+    """
+
+    def __init__(self, records, rsps, timestamp, duration):
+        self.records = records
+        self.timestamp = timestamp
+        self.duration = duration
+        self.raw = []
+        self.values = []
+        self.states = []
+        self.errors = []
+        self._index = {}
+
+        for (index, (s, rsp)) in enumerate(zip(records, rsps)):
+            self._index[(s.owner_lun, s.number)] = index
+            (raw, states, value, error) = (None, None, None, None)
+            if rsp is None:
+                error = constants.CC_TIMEOUT
+            else:
+                try:
+                    check_completion_code(rsp.completion_code)
+                    (raw, states) = sensor_reading_from_response(rsp)
+                except CompletionCodeError as e:
+                    error = e.cc
+            if raw is not None and \
+                    s.type == sdr.SDR_TYPE_FULL_SENSOR_RECORD:
+                try:
+                    value = s.convert_sensor_raw_to_value(raw)
+                except (ValueError, ZeroDivisionError, OverflowError):
+                    pass
+            self.raw.append(raw)
+            self.states.append(states)
+            self.values.append(value)
+            self.errors.append(error)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(zip(self.records, self.raw, self.values, self.states,
+                self.errors))
+
+    def index(self, sensor_number, lun=0):
+        """Returns the index of a sensor in the lists, or None."""
+        return self._index.get((lun, sensor_number))
+
+    def value(self, sensor_number, lun=0):
+        """Returns the converted reading of a sensor."""
+        index = self.index(sensor_number, lun)
+        if index is None:
+            return None
+        return self.values[index]
+
+
 class Sensor(object):
     def reserve_device_sdr_repository(self):
         rsp = self.send_message_with_name('ReserveDeviceSdrRepository')
@@ -119,6 +223,10 @@ class Sensor(object):
 
         return (rsp.next_record_id, rsp.record_data)
 
+    def _get_device_sdr_chunks(self, reservation_id, reads):
+        reqs = sdr_read_requests('GetDeviceSdr', reservation_id, reads)
+        return sdr_read_results(self.send_message_batch(reqs))
+
     def get_device_sdr(self, record_id, reservation_id=None):
         """Collects all data from the sensor device to get the SDR
         specified by record id.
@@ -127,24 +235,44 @@ class Sensor(object):
         `reservation_id=None` can be set. if None the reservation ID will
         be determined.
         """
-        (next_id, record_data) = get_sdr_data_helper(self.reserve_device_sdr_repository,
-                self._get_device_sdr_chunk, record_id, reservation_id)
+        (next_id, record_data) = get_sdr_data_helper(
+                self.reserve_device_sdr_repository,
+                self._get_device_sdr_chunk, record_id, reservation_id,
+                self._sdr_read_size(DEVICE_SDR))
 
         return sdr.SdrCommon.from_data(record_data, next_id)
 
     def device_sdr_entries(self):
         """A generator that returns the SDR list. Starting with ID=0x0000 and
         end when ID=0xffff is returned.
-        """
-        reservation_id = self.reserve_device_sdr_repository()
-        record_id = 0
 
-        while True:
-            s = self.get_device_sdr(record_id, reservation_id)
+        If `sdr_cache` is set, the records are taken from the cache as long
+        as the device SDRs have not changed. Otherwise the cached records
+        are updated with `sdr.SdrRepository.sync`.
+        """
+        if self.sdr_cache is not None:
+            entries = self.sdr_cache.device_entries(self,
+                    self._device_sdr_entries,
+                    self._sdr_read_size(DEVICE_SDR),
+                    self._sync_device_sdr_records)
+        else:
+            entries = self._device_sdr_entries()
+
+        for s in entries:
             yield s
-            if s.next_id == 0xffff:
-                break
-            record_id = s.next_id
+
+    def _device_sdr_entries(self):
+        for (next_id, record_data) in walk_sdr_helper(
+                self.reserve_device_sdr_repository,
+                self._get_device_sdr_chunks,
+                read_size=self._sdr_read_size(DEVICE_SDR)):
+            yield sdr.SdrCommon.from_data(record_data, next_id)
+
+    def _sync_device_sdr_records(self, records):
+        repository = sdr.SdrRepository(records)
+        repository.sync(self.reserve_device_sdr_repository,
+                self._get_device_sdr_chunks, self._sdr_read_size(DEVICE_SDR))
+        return list(repository)
 
     def get_device_sdr_list(self, reservation_id=None):
         """Returns the complete SDR list.
@@ -168,17 +296,54 @@ class Sensor(object):
         rsp = self.send_message_with_name('GetSensorReading',
                                           sensor_number=sensor_number,
                                           lun=lun)
+        return sensor_reading_from_response(rsp)
+
+    def get_sensor_readings(self, sensor_numbers, lun=0):
+        """Returns the sensor readings at the assertion states for all given
+        sensor numbers. The requests are sent as batch if the interface
+        supports it.
 
-        reading = rsp.sensor_reading
-        if rsp.config.initial_update_in_progress:
-            reading = None
+        `sensor_numbers` list of sensor numbers
 
-        states = None
-        if rsp.states1 is not None:
-            states = rsp.states1
-            if rsp.states2 is not None:
-                states |= (rsp.states2 << 8)
-        return (reading, states)
+        Returns a list with a tuple of `raw reading` and `assertion states`
+        for each sensor. If the reading of a sensor failed, the
+        `CompletionCodeError` is returned instead of the tuple.
+        """
+        reqs = []
+        for sensor_number in sensor_numbers:
+            req = create_request_by_name('GetSensorReading')
+            req.sensor_number = sensor_number
+            req.lun = lun
+            reqs.append(req)
+
+        readings = []
+        for rsp in self.send_message_batch(reqs):
+            try:
+                check_completion_code(rsp.completion_code)
+                readings.append(sensor_reading_from_response(rsp))
+            except CompletionCodeError as e:
+                readings.append(e)
+        return readings
+
+    def read_all_sensors(self, sdrs=None):
+        """Reads all sensors in one sweep and returns a `SensorSnapshot`.
+
+        `sdrs` are the sensor records to read. By default, the records of
+        `device_sdr_entries` are used, which are taken from `sdr_cache`
+        if it is set. Only full and compact sensor records are read. The
+        requests are sent with `send_message_batch`. A sensor which does
+        not respond does not abort the sweep, it is reported with
+        `CC_TIMEOUT` in the errors of the snapshot.
+        """
+        if sdrs is None:
+            sdrs = self.device_sdr_entries()
+        sdrs = [s for s in sdrs if is_readable_sensor(s)]
+
+        timestamp = time.time()
+        rsps = self.send_message_batch(sensor_reading_requests(sdrs),
+                skip_timeouts=True)
+        return SensorSnapshot(sdrs, rsps, timestamp,
+                time.time() - timestamp)
 
     def set_sensor_thresholds(self, sensor_number, lun=0, unr=None, ucr=None,
                 unc=None, lnc=None, lcr=None, lnr=None):
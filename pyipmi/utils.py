@@ -17,6 +17,7 @@
 from builtins import range
 import sys
 import codecs
+import struct
 from array import array
 from .msgs import constants
 from .errors import DecodingError, CompletionCodeError
@@ -44,6 +45,13 @@ def bytes2(dat, enc):
     return dat
 
 
+def array_tobytes(a):
+    # python 3.9 removed array.tostring()
+    if hasattr(a, 'tobytes'):
+        return a.tobytes()
+    return a.tostring()
+
+
 def check_completion_code(cc):
     if cc != constants.CC_OK:
         raise CompletionCodeError(cc)
@@ -55,62 +63,154 @@ def chunks(d, n):
 
 
 class ByteBuffer:
-    def __init__(self, data=None):
+    """A byte buffer which is written at the end and read from the front.
 
-        if data is not None:
-            self.array = array('B', py3enc_unic_bytes_fix(data))
+    The read bytes are not removed from the buffer, a read offset is
+    advanced instead. Buffers returned by `pop_slice` and buffers created
+    from `bytes` share the memory with their source. They are copied only
+    when data is appended to them.
+    """
+
+    def __init__(self, data=None):
+        if data is None:
+            self._data = array('B')
+        elif isinstance(data, memoryview):
+            self._data = data
+        else:
+            data = py3enc_unic_bytes_fix(data)
+            if isinstance(data, bytes) and int(sys.version[0]) > 2:
+                # bytes are immutable, no need to copy them
+                self._data = memoryview(data)
+            else:
+                self._data = array('B', data)
+        self._offset = 0
+
+    def _writable(self):
+        """Returns the backing array of the buffer, the unread bytes are
+        copied if they are shared with another buffer.
+        """
+        if not isinstance(self._data, array):
+            self._data = array('B', self._tobytes())
+            self._offset = 0
+        return self._data
+
+    def _extend(self, data):
+        try:
+            self._writable().extend(data)
+        except BufferError:
+            # a slice of this buffer is still in use
+            self._data = array('B', self._tobytes())
+            self._offset = 0
+            self._data.extend(data)
+
+    def _tobytes(self, start=0, end=None):
+        start += self._offset
+        if end is None:
+            end = len(self._data)
         else:
-            self.array = array('B')
+            end = min(self._offset + end, len(self._data))
+        if isinstance(self._data, array):
+            return array_tobytes(self._data[start:end])
+        return self._data[start:end].tobytes()
 
     def push_unsigned_int(self, value, length):
-        for i in range(length):
-            self.array.append((value >> (8*i) & 0xff))
+        self._extend(array('B', [(value >> (8*i)) & 0xff
+                for i in range(length)]))
 
     def pop_unsigned_int(self, length):
-        value = 0
-        for i in range(length):
-            try:
-                value |= self.array.pop(0) << (8*i)
-            except IndexError:
-                raise DecodingError('Data too short for message')
+        if len(self) < length:
+            raise DecodingError('Data too short for message')
+
+        fmt = _UNSIGNED_INT_FORMATS.get(length)
+        if fmt is not None:
+            value = fmt.unpack_from(self._data, self._offset)[0]
+        else:
+            value = 0
+            for (i, b) in enumerate(bytearray(self._tobytes(0, length))):
+                value |= b << (8*i)
+        self._offset += length
         return value
 
     def push_string(self, value):
-        self.array.fromstring(value)
+        self._extend(array('B', py3enc_unic_bytes_fix(value)))
 
     def pop_string(self, length):
-        s = self.array[0:length]
-        del self.array[0:length]
-        return py3dec_unic_bytes_fix(s.tostring())
+        s = self._tobytes(0, length)
+        self._offset += len(s)
+        return py3dec_unic_bytes_fix(s)
 
     def pop_slice(self, length):
-        if len(self.array) < length:
+        if len(self) < length:
             raise DecodingError('Data too short for message')
 
-        c = ByteBuffer(self.array[0:length])
-        self.__delslice__(0, length)
+        end = self._offset + length
+        if _HAS_ARRAY_VIEWS:
+            c = ByteBuffer(memoryview(self._data)[self._offset:end])
+        else:
+            c = ByteBuffer(self._tobytes(0, length))
+        self._offset = end
         return c
 
     def tostring(self):
-        return py3dec_unic_bytes_fix(self.array.tostring())
+        return py3dec_unic_bytes_fix(self._tobytes())
+
+    def tobytes(self):
+        return self._tobytes()
 
     def extend(self, data):
-        self.array.extend(data)
+        self._extend(data)
 
     def append_array(self, a):
-        self.array.extend(a)
+        self._extend(a)
+
+    @property
+    def array(self):
+        """A copy of the unread bytes as `array`."""
+        return array('B', self._tobytes())
 
     def __getslice__(self, a, b):
-        return self.array[a:b]
+        return self[a:b]
 
     def __delslice__(self, a, b):
-        del self.array[a:b]
+        del self[a:b]
 
     def __len__(self):
-        return len(self.array)
+        return len(self._data) - self._offset
 
     def __getitem__(self, idx):
-        return self.array[idx]
+        if isinstance(idx, slice):
+            return self.array[idx]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('ByteBuffer index out of range')
+        return _UNSIGNED_INT_FORMATS[1].unpack_from(self._data,
+                self._offset + idx)[0]
+
+    def __delitem__(self, idx):
+        if isinstance(idx, slice) and idx.start in (None, 0) \
+                and idx.step in (None, 1):
+            # deleting from the front only advances the read offset
+            stop = len(self) if idx.stop is None else idx.stop
+            if stop < 0:
+                stop += len(self)
+            self._offset += max(0, min(stop, len(self)))
+            return
+        data = self.array
+        del data[idx]
+        self._data = data
+        self._offset = 0
+
+
+# python 2 arrays do not support memoryview
+_HAS_ARRAY_VIEWS = int(sys.version[0]) > 2
+
+_UNSIGNED_INT_FORMATS = {
+    1: struct.Struct('<B'),
+    2: struct.Struct('<H'),
+    4: struct.Struct('<I'),
+    8: struct.Struct('<Q'),
+}
 
 
 bcd_map = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', ' ', '-', '.' ]
@@ -133,7 +233,8 @@ def bcd_decode(input, errors='strict'):
 
 
 def bcd_search(name):
-    if name != 'bcd+':
+    # newer python versions strip the '+' from the name
+    if name not in ('bcd+', 'bcd'):
         return None
     return codecs.CodecInfo(
             name = 'bcd+',
@@ -62,4 +62,8 @@ setup(name = name,
             'markdown',
             'future',
         ],
+        extras_require={
+            'rmcpplus': ['pycryptodome'],
+            'numpy': ['numpy'],
+        },
 )
@@ -5,7 +5,7 @@ from array import array
 
 import nose
 from mock import MagicMock
-from nose.tools import eq_, raises
+from nose.tools import eq_, ok_, raises
 
 from pyipmi.errors import TimeoutError
 from pyipmi.interfaces import Ipmitool
@@ -109,3 +109,196 @@ class TestIpmitool:
         data = interface.send_and_receive_raw(target, 0, 0x6, '\x01')
 
         mock.assert_called_once_with('ipmitool -I serial-terminal -D /dev/tty2:115200 -t 0x20 -l 0 raw 0x06 0x01')
+
+
+FAKE_IPMITOOL = r'''
+import sys
+import time
+
+with open(sys.argv[0] + '.log', 'a') as f:
+    f.write(' '.join(sys.argv[1:]) + '\n')
+
+RESPONSES = {
+    'raw 0x06 0x01': ' 10 80 01 02 51 bd 98 3a 00 a8 06 00 03\n'
+                     ' 00 00\n',
+    'raw 0x06 0x55': 'Unable to send RAW command (channel=0x0 netfn=0x6 '
+                     'lun=0x0 cmd=0x55 rsp=0xc1): Invalid command\n',
+    'raw 0x06 0x99': 'Unable to send RAW command (channel=0x0 netfn=0x6 '
+                     'lun=0x0 cmd=0x99)\n',
+}
+
+if '-H' in sys.argv and sys.argv[sys.argv.index('-H') + 1] == 'dead':
+    sys.stderr.write('Error: Unable to establish IPMI v2 / RMCP+ session\n')
+    sys.exit(1)
+
+STUCK = '-H' in sys.argv and sys.argv[sys.argv.index('-H') + 1] == 'stuck'
+
+def run(line):
+    if line == 'raw 0x06 0x77':
+        # a hung session
+        time.sleep(60)
+    elif line.startswith('echo '):
+        sys.stdout.write(line[5:] + '\n')
+    elif line.startswith('raw 0x06 0x55') or line.startswith('raw 0x06 0x99'):
+        sys.stderr.write(RESPONSES[line])
+        sys.stderr.flush()
+    else:
+        sys.stdout.write(RESPONSES.get(line, ''))
+
+if sys.argv[-2] == 'exec':
+    # stdout is not flushed, errors on stderr come first
+    for line in open(sys.argv[-1]):
+        run(line.strip())
+    sys.exit(0)
+
+while True:
+    sys.stdout.write('ipmitool> ')
+    sys.stdout.flush()
+    line = sys.stdin.readline()
+    if not line or line.strip() == 'exit':
+        if STUCK:
+            # does not end the session
+            time.sleep(60)
+        break
+    run(line.strip())
+    sys.stdout.flush()
+'''
+
+
+def _fake_ipmitool_interface(host='10.0.1.1', persistent=True):
+    import sys
+    import tempfile
+    path = tempfile.mktemp(suffix='_ipmitool.py')
+    with open(path, 'w') as f:
+        f.write(FAKE_IPMITOOL)
+
+    interface = Ipmitool(interface_type='lanplus', persistent=persistent)
+    interface.IPMITOOL_PATH = '%s %s' % (sys.executable, path)
+    session = Session()
+    session.interface = interface
+    session.set_session_type_rmcp(host)
+    session.set_auth_type_user('admin', 'secret')
+    session.establish()
+    return (interface, session, path + '.log')
+
+
+def test_persistent_shell_reuses_process():
+    (interface, session, log) = _fake_ipmitool_interface()
+
+    for _ in range(3):
+        data = interface.send_and_receive_raw(Target(0x20), 0, 0x6, b'\x01')
+        eq_(data, b'\x00\x10\x80\x01\x02\x51\xbd\x98\x3a\x00\xa8\x06\x00\x03'
+                b'\x00\x00')
+    eq_(len(interface._shells), 1)
+
+    # another target needs another process
+    interface.send_and_receive_raw(Target(0x72), 0, 0x6, b'\x01')
+    eq_(len(interface._shells), 2)
+
+    session.close()
+    eq_(len(interface._shells), 0)
+
+    with open(log) as f:
+        lines = f.read().splitlines()
+    eq_(lines, [
+        '-I lanplus -H 10.0.1.1 -p 623 -U admin -P secret -t 0x20 -l 0 shell',
+        '-I lanplus -H 10.0.1.1 -p 623 -U admin -P secret -t 0x72 -l 0 shell',
+    ])
+
+
+def test_persistent_shell_completion_code():
+    (interface, session, log) = _fake_ipmitool_interface()
+    data = interface.send_and_receive_raw(Target(0x20), 0, 0x6, b'\x55')
+    eq_(data, b'\xc1')
+    # the process is still usable
+    data = interface.send_and_receive_raw(Target(0x20), 0, 0x6, b'\x01')
+    eq_(data[0:1], b'\x00')
+    session.close()
+
+
+@raises(TimeoutError)
+def test_persistent_shell_timeout():
+    (interface, session, log) = _fake_ipmitool_interface()
+    try:
+        interface.send_and_receive_raw(Target(0x20), 0, 0x6, b'\x99')
+    finally:
+        session.close()
+
+
+@raises(TimeoutError)
+def test_persistent_shell_hung():
+    (interface, session, log) = _fake_ipmitool_interface()
+    interface.timeout = 0.5
+    try:
+        interface.send_and_receive_raw(Target(0x20), 0, 0x6, b'\x77')
+    finally:
+        eq_(len(interface._shells), 0)
+        session.close()
+
+
+@raises(RuntimeError)
+def test_persistent_shell_terminated():
+    (interface, session, log) = _fake_ipmitool_interface(host='dead')
+    try:
+        interface.send_and_receive_raw(Target(0x20), 0, 0x6, b'\x01')
+    finally:
+        eq_(len(interface._shells), 0)
+        session.close()
+
+
+def test_persistent_shell_stuck_on_exit():
+    import time
+    (interface, session, log) = _fake_ipmitool_interface(host='stuck')
+    interface.timeout = 0.5
+    interface.send_and_receive_raw(Target(0x20), 0, 0x6, b'\x01')
+    child = list(interface._shells.values())[0]
+
+    start = time.time()
+    session.close()
+    ok_(time.time() - start < 5)
+    ok_(child.returncode is not None)
+    eq_(len(interface._shells), 0)
+
+
+BATCH = [
+    (Target(0x20), 0, 0x6, b'\x01'),
+    (Target(0x20), 0, 0x6, b'\x55'),
+    (Target(0x20), 0, 0x6, b'\x22'),
+    (Target(0x72), 0, 0x6, b'\x55'),
+    (Target(0x20), 0, 0x6, b'\x01'),
+]
+
+DEVICE_ID = (b'\x00\x10\x80\x01\x02\x51\xbd\x98\x3a\x00\xa8\x06\x00\x03'
+        b'\x00\x00')
+
+
+def test_send_and_receive_raw_batch_exec():
+    (interface, session, log) = _fake_ipmitool_interface(persistent=False)
+    rsps = interface.send_and_receive_raw_batch(BATCH)
+    eq_(rsps, [DEVICE_ID, b'\xc1', b'\x00', b'\xc1', DEVICE_ID])
+
+    # one process per target
+    with open(log) as f:
+        lines = f.read().splitlines()
+    eq_(len(lines), 2)
+    ok_(' -t 0x20 -l 0 exec ' in lines[0])
+    ok_(' -t 0x72 -l 0 exec ' in lines[1])
+
+
+def test_send_and_receive_raw_batch_persistent():
+    (interface, session, log) = _fake_ipmitool_interface()
+    rsps = interface.send_and_receive_raw_batch(BATCH)
+    eq_(rsps, [DEVICE_ID, b'\xc1', b'\x00', b'\xc1', DEVICE_ID])
+    eq_(len(interface._shells), 2)
+    session.close()
+
+
+def test_send_and_receive_batch():
+    from pyipmi.msgs.bmc import GetDeviceIdReq
+    (interface, session, log) = _fake_ipmitool_interface(persistent=False)
+    reqs = [GetDeviceIdReq(), GetDeviceIdReq()]
+    for req in reqs:
+        req.target = Target(0x20)
+    rsps = interface.send_and_receive_batch(reqs)
+    eq_([rsp.completion_code for rsp in rsps], [0, 0])
+    eq_(rsps[1].device_id, 0x10)
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import hashlib
+import socket
+import struct
+import threading
+
+from mock import MagicMock
+from nose.tools import eq_, ok_, raises
+
+from pyipmi import Session, Target, create_connection
+from pyipmi.errors import TimeoutError, CompletionCodeError
+from pyipmi.interfaces import create_interface
+from pyipmi.msgs import create_request_by_name
+from pyipmi.interfaces.rmcp import Rmcp, IpmiMsg, RmcpMsg, AsfMsg, \
+        AUTH_TYPE_MD5, AUTH_TYPE_NONE
+
+
+def _checksum(data):
+    return -sum(bytearray(data)) % 256
+
+
+class FakeBmc(threading.Thread):
+    """A minimal IPMI v1.5 LAN responder running on localhost."""
+
+    SESSION_ID = 0x11223344
+    TEMP_SESSION_ID = 0xaabbccdd
+    CHALLENGE = b'0123456789abcdef'
+
+    def __init__(self, password=b'secret', drop=0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.password = password.ljust(16, b'\x00')
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(5)
+        self.port = self.sock.getsockname()[1]
+        self.requests = []
+        self.activated = False
+        self.closed = False
+        self.drop = drop
+        # number of responses which are held back and then sent in
+        # reverse order
+        self.hold = 1
+        self.held = []
+
+    def _auth_code(self, session_id, seq, data):
+        return hashlib.md5(self.password + struct.pack('<I', session_id)
+                + data + struct.pack('<I', seq) + self.password).digest()
+
+    def _respond(self, addr, auth_type, session_id, req, cc, data=b''):
+        rsp = bytearray([req[3], ((req[1] & 0xfc) + 4) | (req[4] & 3), 0,
+                req[0], (req[4] & 0xfc) | (req[1] & 3), req[5], cc])
+        rsp[2] = _checksum(rsp[0:2])
+        rsp += data
+        rsp.append(_checksum(rsp[3:]))
+        rsp = bytes(rsp)
+        hdr = struct.pack('<BII', auth_type, 0, session_id)
+        if auth_type != 0:
+            hdr += self._auth_code(session_id, 0, rsp)
+        pdu = b'\x06\x00\xff\x07' + hdr + struct.pack('B', len(rsp)) + rsp
+        self.held.append(pdu)
+        if len(self.held) >= self.hold:
+            for pdu in reversed(self.held):
+                self.sock.sendto(pdu, addr)
+            self.held = []
+
+    def handle(self, pdu, addr):
+        if pdu[3:4] == b'\x06':
+            # ASF presence ping
+            tag = bytearray(pdu)[9]
+            pong = struct.pack('!IBBBB', 4542, 0x40, tag, 0, 0)
+            self.sock.sendto(b'\x06\x00\xff\x06' + pong, addr)
+            return
+
+        (auth_type, seq, session_id) = struct.unpack('<BII', pdu[4:13])
+        offset = 13
+        auth_code = None
+        if auth_type != 0:
+            auth_code = pdu[offset:offset+16]
+            offset += 16
+        length = bytearray(pdu)[offset]
+        msg = pdu[offset+1:offset+1+length]
+        req = bytearray(msg)
+        netfn = req[1] >> 2
+        cmd = req[5]
+        data = bytes(req[6:-1])
+
+        if auth_type == AUTH_TYPE_MD5:
+            assert auth_code == self._auth_code(session_id, seq, msg)
+
+        self.requests.append((netfn, cmd, seq, session_id, data))
+
+        if self.drop > 0:
+            self.drop -= 1
+            return
+
+        if (netfn, cmd) == (6, 0x38):
+            self._respond(addr, 0, 0, req, 0,
+                    b'\x01\x17\x04\x00\x00\x00\x00\x00')
+        elif (netfn, cmd) == (6, 0x39):
+            self._respond(addr, 0, 0, req, 0,
+                    struct.pack('<I', self.TEMP_SESSION_ID) + self.CHALLENGE)
+        elif (netfn, cmd) == (6, 0x3a):
+            assert session_id == self.TEMP_SESSION_ID
+            assert data[2:18] == self.CHALLENGE
+            self.activated = True
+            self._respond(addr, auth_type, self.TEMP_SESSION_ID, req, 0,
+                    b'\x02' + struct.pack('<II', self.SESSION_ID, 0x100)
+                    + b'\x04')
+        elif (netfn, cmd) == (6, 0x3b):
+            self._respond(addr, auth_type, self.SESSION_ID, req, 0,
+                    data[0:1])
+        elif (netfn, cmd) == (6, 0x3c):
+            self.closed = True
+            self._respond(addr, auth_type, self.SESSION_ID, req, 0)
+        elif (netfn, cmd) == (6, 0x01):
+            self._respond(addr, auth_type, self.SESSION_ID, req, 0,
+                    b'\x0c\x89\x00\x00\x02\x3d\x98\x3a\x00\xbe\x14')
+        else:
+            self._respond(addr, auth_type, self.SESSION_ID, req, 0xc1)
+
+    def run(self):
+        while not self.closed:
+            try:
+                (pdu, addr) = self.sock.recvfrom(1024)
+            except socket.timeout:
+                break
+            self.handle(pdu, addr)
+        self.sock.close()
+
+
+def _establish(bmc, **kwargs):
+    interface = Rmcp(timeout=0.5, **kwargs)
+    session = Session()
+    session.interface = interface
+    session.set_session_type_rmcp('127.0.0.1', port=bmc.port)
+    session.set_auth_type_user('admin', 'secret')
+    session.establish()
+    return (interface, session)
+
+
+def test_create_interface():
+    interface = create_interface('rmcp')
+    ok_(isinstance(interface, Rmcp))
+
+
+def test_rmcpmsg_pack_unpack():
+    pdu = RmcpMsg(0x07).pack(b'\x01\x02')
+    eq_(pdu, b'\x06\x00\xff\x07\x01\x02')
+    m = RmcpMsg()
+    eq_(m.unpack(pdu), b'\x01\x02')
+    eq_(m.class_of_msg, 0x07)
+
+
+def test_asfmsg_pack():
+    eq_(AsfMsg(0x80, 3).pack(), b'\x00\x00\x11\xbe\x80\x03\x00\x00')
+
+
+def test_ipmimsg_pack_no_auth():
+    m = IpmiMsg()
+    eq_(m.pack(b'\x20\x18'), b'\x00' * 9 + b'\x02\x20\x18')
+
+
+def test_ipmimsg_pack_unpack_md5():
+    m = IpmiMsg(AUTH_TYPE_MD5, 'secret')
+    m.session_id = 0x1234
+    m.sequence_number = 5
+    pdu = m.pack(b'\x20\x18')
+    eq_(len(pdu), 9 + 16 + 1 + 2)
+    n = IpmiMsg()
+    eq_(n.unpack(pdu), b'\x20\x18')
+    eq_(n.session_id, 0x1234)
+    eq_(n.sequence_number, 5)
+    eq_(n.auth_type, AUTH_TYPE_MD5)
+
+
+def test_establish_session_and_send_raw():
+    bmc = FakeBmc()
+    bmc.start()
+    (interface, session) = _establish(bmc)
+    ok_(bmc.activated)
+
+    data = interface.send_and_receive_raw(Target(0x20), 0, 0x6, b'\x01')
+    eq_(data, b'\x00\x0c\x89\x00\x00\x02\x3d\x98\x3a\x00\xbe\x14')
+    data = interface.send_and_receive_raw(Target(0x20), 0, 0x6, b'\x01')
+    eq_(data, b'\x00\x0c\x89\x00\x00\x02\x3d\x98\x3a\x00\xbe\x14')
+
+    session.close()
+    bmc.join()
+    ok_(bmc.closed)
+
+    # only one handshake for all requests
+    eq_([r[1] for r in bmc.requests],
+            [0x38, 0x39, 0x3a, 0x3b, 0x01, 0x01, 0x3c])
+    # session sequence numbers start at the initial inbound sequence
+    eq_([r[2] for r in bmc.requests[3:]], [0x100, 0x101, 0x102, 0x103])
+    eq_(set(r[3] for r in bmc.requests[3:]), set([FakeBmc.SESSION_ID]))
+
+
+def test_send_raw_completion_code():
+    bmc = FakeBmc()
+    bmc.start()
+    (interface, session) = _establish(bmc)
+    data = interface.send_and_receive_raw(Target(0x20), 0, 0x6, b'\x55')
+    eq_(data, b'\xc1')
+    session.close()
+    bmc.join()
+
+
+def test_send_raw_retry_after_timeout():
+    bmc = FakeBmc()
+    bmc.start()
+    (interface, session) = _establish(bmc)
+    bmc.drop = 1
+    data = interface.send_and_receive_raw(Target(0x20), 0, 0x6, b'\x01')
+    eq_(data[0:1], b'\x00')
+    session.close()
+    bmc.join()
+
+
+def test_close_session_completion_code():
+    interface = create_interface('rmcp')
+    interface._session_active = True
+    interface._ipmi_msg.session_id = FakeBmc.SESSION_ID
+    interface._sock = sock = MagicMock()
+    interface._send_and_receive_msg = MagicMock(
+            side_effect=CompletionCodeError(0x87))
+
+    interface.close_session(Session())
+    ok_(not interface._session_active)
+    ok_(interface._sock is None)
+    sock.close.assert_called_once_with()
+
+
+def test_rmcp_ping():
+    bmc = FakeBmc()
+    bmc.start()
+    (interface, session) = _establish(bmc)
+    session.rmcp_ping()
+    ok_(interface.is_ipmc_accessible(None))
+    session.close()
+    bmc.join()
+
+
+@raises(TimeoutError)
+def test_establish_session_timeout():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    interface = Rmcp(timeout=0.1, max_retries=1)
+    session = Session()
+    session.interface = interface
+    session.set_session_type_rmcp('127.0.0.1', port=sock.getsockname()[1])
+    try:
+        session.establish()
+    finally:
+        sock.close()
+
+
+@raises(RuntimeError)
+def test_bridging_not_supported():
+    bmc = FakeBmc()
+    bmc.start()
+    (interface, session) = _establish(bmc)
+    try:
+        interface.send_and_receive_raw(Target(0x82), 0, 0x6, b'\x01')
+    finally:
+        session.close()
+        bmc.join()
+
+
+def test_send_batch_pipelined():
+    bmc = FakeBmc()
+    bmc.start()
+    (interface, session) = _establish(bmc, window=4)
+    # the BMC answers only after four requests, in reverse order
+    bmc.hold = 4
+    rsps = interface.send_and_receive_raw_batch(
+            [(Target(0x20), 0, 0x6, b'\x01')] * 4
+            + [(Target(0x20), 0, 0x6, b'\x55')] * 4)
+    eq_(rsps[0:4], [b'\x00\x0c\x89\x00\x00\x02\x3d\x98\x3a\x00\xbe\x14'] * 4)
+    eq_(rsps[4:8], [b'\xc1'] * 4)
+    bmc.hold = 1
+    session.close()
+    bmc.join()
+    eq_(len(bmc.requests), 4 + 8 + 1)
+    eq_(interface.get_window(Target(0x20)), 4)
+
+
+def test_send_batch_messages():
+    bmc = FakeBmc()
+    bmc.start()
+    (interface, session) = _establish(bmc, window=2)
+    reqs = [create_request_by_name('GetDeviceId'),
+            create_request_by_name('GetSelftestResults')]
+    for req in reqs:
+        req.target = Target(0x20)
+    rsps = interface.send_and_receive_batch(reqs)
+    eq_(rsps[0].device_id, 0x0c)
+    eq_(rsps[1].completion_code, 0xc1)
+    session.close()
+    bmc.join()
+
+
+def test_send_batch_skip_timeouts():
+    bmc = FakeBmc()
+    bmc.start()
+    (interface, session) = _establish(bmc, max_retries=2)
+    # the first request is never answered
+    bmc.drop = 2
+    rsps = interface.send_and_receive_raw_batch(
+            [(Target(0x20), 0, 0x6, b'\x55'), (Target(0x20), 0, 0x6, b'\x01')],
+            skip_timeouts=True)
+    eq_(rsps[0], None)
+    eq_(rsps[1], b'\x00\x0c\x89\x00\x00\x02\x3d\x98\x3a\x00\xbe\x14')
+    session.close()
+    bmc.join()
+
+
+def test_send_batch_window_fallback():
+    bmc = FakeBmc()
+    bmc.start()
+    (interface, session) = _establish(bmc, window=4)
+    bmc.drop = 1
+    rsps = interface.send_and_receive_raw_batch(
+            [(Target(0x20), 0, 0x6, b'\x01')] * 4)
+    eq_(len(set(rsps)), 1)
+    eq_(interface.get_window(Target(0x20)), 1)
+    session.close()
+    bmc.join()
+
+
+@raises(RuntimeError)
+def test_window_too_big():
+    Rmcp(window=33)
+
+
+def test_get_device_id_via_connection():
+    bmc = FakeBmc()
+    bmc.start()
+    (interface, session) = _establish(bmc)
+    ipmi = create_connection(interface)
+    ipmi.target = Target(0x20)
+    rsp = ipmi.send_message_with_name('GetDeviceId')
+    eq_(rsp.device_id, 0x0c)
+    eq_(rsp.manufacturer_id, 15000)
+    session.close()
+    bmc.join()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import hashlib
+import hmac
+import os
+import socket
+import struct
+import threading
+
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_, ok_, raises
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    AES = None
+
+from pyipmi import Session, Target, create_connection
+from pyipmi.interfaces import create_interface
+from pyipmi.interfaces.rmcpplus import RmcpPlus, RmcpPlusMsg, CipherSuite
+
+
+def _checksum(data):
+    return -sum(bytearray(data)) % 256
+
+
+class FakeBmc(threading.Thread):
+    """A minimal IPMI v2.0 RMCP+ responder running on localhost."""
+
+    SESSION_ID = 0x55667788
+    GUID = b'G' * 16
+    RC = b'R' * 16
+
+    # (rakp hash, integrity hash, integrity length, icv length, aes)
+    SUITES = {
+        2: (hashlib.sha1, hashlib.sha1, 12, 12, False),
+        3: (hashlib.sha1, hashlib.sha1, 12, 12, True),
+        17: (hashlib.sha256, hashlib.sha256, 16, 16, True),
+    }
+
+    def __init__(self, cipher_suite=3, password=b'secret', drop=0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        (self.rakp_hash, self.integrity_hash, self.integrity_length,
+                self.icv_length, self.aes) = self.SUITES[cipher_suite]
+        self.kuid = password.ljust(20, b'\x00')
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(5)
+        self.port = self.sock.getsockname()[1]
+        self.handshakes = []
+        self.requests = []
+        self.closed = False
+        self.drop = drop
+        self.k1 = None
+        self.k2 = None
+
+    def _hmac(self, key, data):
+        return hmac.new(key, data, self.rakp_hash).digest()
+
+    def _send(self, addr, payload_type, session_id, payload, seq=0):
+        if self.k2 is not None and self.aes:
+            pad = (16 - (len(payload) + 1) % 16) % 16
+            payload += bytes(bytearray(range(1, pad + 1))) \
+                    + struct.pack('B', pad)
+            iv = os.urandom(16)
+            payload = iv + AES.new(self.k2[:16], AES.MODE_CBC,
+                    iv).encrypt(payload)
+            payload_type |= 0x80
+        if self.k1 is not None:
+            payload_type |= 0x40
+        pdu = struct.pack('<BBIIH', 6, payload_type, session_id, seq,
+                len(payload)) + payload
+        if self.k1 is not None:
+            pad = (4 - (len(pdu) + 2) % 4) % 4
+            pdu += b'\xff' * pad + struct.pack('BB', pad, 7)
+            pdu += hmac.new(self.k1, pdu, self.integrity_hash).digest()[
+                    :self.integrity_length]
+        self.sock.sendto(b'\x06\x00\xff\x07' + pdu, addr)
+
+    def _respond(self, addr, req, cc, data=b''):
+        rsp = bytearray([req[3], ((req[1] & 0xfc) + 4) | (req[4] & 3), 0,
+                req[0], (req[4] & 0xfc) | (req[1] & 3), req[5], cc])
+        rsp[2] = _checksum(rsp[0:2])
+        rsp += data
+        rsp.append(_checksum(rsp[3:]))
+        self._send(addr, 0, self.console_session_id, bytes(rsp))
+
+    def handle_handshake(self, addr, payload_type, payload):
+        tag = payload[0:1]
+        self.handshakes.append(payload_type)
+        if payload_type == 0x10:
+            self.console_session_id = struct.unpack('<I', payload[4:8])[0]
+            self._send(addr, 0x11, 0, tag + b'\x00\x04\x00'
+                    + payload[4:8] + struct.pack('<I', self.SESSION_ID)
+                    + payload[8:32])
+        elif payload_type == 0x12:
+            assert struct.unpack('<I', payload[4:8])[0] == self.SESSION_ID
+            self.rm = payload[8:24]
+            ulen = bytearray(payload)[27]
+            self.user = payload[24:25] + payload[27:28] + payload[28:28+ulen]
+            auth_code = self._hmac(self.kuid,
+                    struct.pack('<II', self.console_session_id,
+                    self.SESSION_ID) + self.rm + self.RC + self.GUID
+                    + self.user)
+            self._send(addr, 0x13, 0, tag + b'\x00\x00\x00'
+                    + struct.pack('<I', self.console_session_id) + self.RC
+                    + self.GUID + auth_code)
+        elif payload_type == 0x14:
+            expected = self._hmac(self.kuid, self.RC
+                    + struct.pack('<I', self.console_session_id) + self.user)
+            if payload[8:] != expected:
+                self._send(addr, 0x15, 0, tag + b'\x0f\x00\x00'
+                        + struct.pack('<I', self.console_session_id))
+                return
+            sik = self._hmac(self.kuid, self.rm + self.RC + self.user)
+            icv = self._hmac(sik, self.rm + struct.pack('<I', self.SESSION_ID)
+                    + self.GUID)[:self.icv_length]
+            self._send(addr, 0x15, 0, tag + b'\x00\x00\x00'
+                    + struct.pack('<I', self.console_session_id) + icv)
+            self.k1 = self._hmac(sik, b'\x01' * 20)
+            self.k2 = self._hmac(sik, b'\x02' * 20)
+
+    def handle(self, pdu, addr):
+        (auth_type, payload_type, session_id, seq, length) = \
+                struct.unpack('<BBIIH', pdu[4:16])
+        assert auth_type == 6
+        payload = pdu[16:16+length]
+
+        if payload_type & 0x3f != 0:
+            self.handle_handshake(addr, payload_type, payload)
+            return
+
+        assert session_id == self.SESSION_ID
+        assert payload_type & 0x40
+        auth_code = pdu[-self.integrity_length:]
+        assert auth_code == hmac.new(self.k1, pdu[4:-self.integrity_length],
+                self.integrity_hash).digest()[:self.integrity_length]
+        if self.aes:
+            assert payload_type & 0x80
+            plain = AES.new(self.k2[:16], AES.MODE_CBC,
+                    payload[:16]).decrypt(payload[16:])
+            payload = plain[:-1 - bytearray(plain)[-1]]
+
+        req = bytearray(payload)
+        netfn = req[1] >> 2
+        cmd = req[5]
+        self.requests.append((netfn, cmd, seq, bytes(req[6:-1])))
+
+        if self.drop > 0:
+            self.drop -= 1
+            return
+
+        if (netfn, cmd) == (6, 0x3b):
+            self._respond(addr, req, 0, bytes(req[6:7]))
+        elif (netfn, cmd) == (6, 0x3c):
+            self.closed = True
+            self._respond(addr, req, 0)
+        elif (netfn, cmd) == (6, 0x01):
+            self._respond(addr, req, 0,
+                    b'\x0c\x89\x00\x00\x02\x3d\x98\x3a\x00\xbe\x14')
+        else:
+            self._respond(addr, req, 0xc1)
+
+    def run(self):
+        while not self.closed:
+            try:
+                (pdu, addr) = self.sock.recvfrom(1024)
+            except socket.timeout:
+                break
+            self.handle(pdu, addr)
+        self.sock.close()
+
+
+def _require_aes():
+    if AES is None:
+        raise SkipTest('pycryptodome not installed')
+
+
+def _establish(bmc, password='secret', **kwargs):
+    interface = RmcpPlus(timeout=0.5, **kwargs)
+    session = Session()
+    session.interface = interface
+    session.set_session_type_rmcp('127.0.0.1', port=bmc.port)
+    session.set_auth_type_user('admin', password)
+    session.establish()
+    return (interface, session)
+
+
+def test_create_interface():
+    interface = create_interface('rmcpplus', cipher_suite=2)
+    ok_(isinstance(interface, RmcpPlus))
+
+
+@raises(RuntimeError)
+def test_unsupported_cipher_suite():
+    RmcpPlus(cipher_suite=0)
+
+
+def test_rmcpplusmsg_pack_unpack_outside_session():
+    pdu = RmcpPlusMsg().pack(b'\x01\x02', 0x10)
+    eq_(pdu, b'\x06\x10' + b'\x00' * 8 + b'\x02\x00\x01\x02')
+    m = RmcpPlusMsg()
+    eq_(m.unpack(pdu), b'\x01\x02')
+    eq_(m.payload_type, 0x10)
+    ok_(not m.authenticated)
+
+
+def test_rmcpplusmsg_pack_unpack_authenticated():
+    suite = CipherSuite(2)
+    m = RmcpPlusMsg(suite, b'\x01' * 20, b'\x02' * 20)
+    m.session_id = 0x1234
+    m.sequence_number = 7
+    pdu = m.pack(b'\x20\x18\xc8')
+    # header, payload, pad, pad length, next header, authcode
+    eq_(len(pdu), 12 + 3 + 3 + 2 + 12)
+    eq_((len(pdu) - 12) % 4, 0)
+    n = RmcpPlusMsg(suite, b'\x01' * 20, b'\x02' * 20)
+    eq_(n.unpack(pdu), b'\x20\x18\xc8')
+    eq_(n.session_id, 0x1234)
+    eq_(n.sequence_number, 7)
+    ok_(n.authenticated)
+
+
+def test_rmcpplusmsg_pack_unpack_encrypted():
+    _require_aes()
+    suite = CipherSuite(17)
+    m = RmcpPlusMsg(suite, b'\x01' * 32, b'\x02' * 32)
+    pdu = m.pack(b'\x20\x18\xc8')
+    ok_(b'\x20\x18\xc8' not in pdu)
+    n = RmcpPlusMsg(suite, b'\x01' * 32, b'\x02' * 32)
+    eq_(n.unpack(pdu), b'\x20\x18\xc8')
+    ok_(n.encrypted)
+
+
+def _check_session(cipher_suite):
+    bmc = FakeBmc(cipher_suite)
+    bmc.start()
+    (interface, session) = _establish(bmc, cipher_suite=cipher_suite)
+
+    for _ in range(3):
+        data = interface.send_and_receive_raw(Target(0x20), 0, 0x6, b'\x01')
+        eq_(data, b'\x00\x0c\x89\x00\x00\x02\x3d\x98\x3a\x00\xbe\x14')
+
+    session.close()
+    bmc.join()
+    ok_(bmc.closed)
+
+    # the RAKP handshake is done only once for all requests
+    eq_(bmc.handshakes, [0x10, 0x12, 0x14])
+    eq_([r[1] for r in bmc.requests], [0x3b, 0x01, 0x01, 0x01, 0x3c])
+    eq_([r[2] for r in bmc.requests], [1, 2, 3, 4, 5])
+
+
+def test_session_cipher_suite_2():
+    _check_session(2)
+
+
+def test_session_cipher_suite_3():
+    _require_aes()
+    _check_session(3)
+
+
+def test_session_cipher_suite_17():
+    _require_aes()
+    _check_session(17)
+
+
+@raises(RuntimeError)
+def test_wrong_password():
+    bmc = FakeBmc(2)
+    bmc.start()
+    try:
+        _establish(bmc, password='wrong', cipher_suite=2)
+    finally:
+        bmc.closed = True
+        bmc.join()
+
+
+def test_send_raw_retry_after_timeout():
+    bmc = FakeBmc(2)
+    bmc.start()
+    (interface, session) = _establish(bmc, cipher_suite=2)
+    bmc.drop = 1
+    data = interface.send_and_receive_raw(Target(0x20), 0, 0x6, b'\x01')
+    eq_(data[0:1], b'\x00')
+    session.close()
+    bmc.join()
+
+
+def test_get_device_id_via_connection():
+    bmc = FakeBmc(2)
+    bmc.start()
+    (interface, session) = _establish(bmc, cipher_suite=2)
+    ipmi = create_connection(interface)
+    ipmi.target = Target(0x20)
+    rsp = ipmi.send_message_with_name('GetDeviceId')
+    eq_(rsp.device_id, 0x0c)
+    session.close()
+    bmc.join()
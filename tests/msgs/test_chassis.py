@@ -14,7 +14,7 @@ def test_getchassisstatus_encode_valid_req():
     data = encode_message(m)
     eq_(m.__netfn__, 0)
     eq_(m.__cmdid__, 1)
-    eq_(data, '')
+    eq_(data, b'')
 
 def test_getchassisstatus_decode_valid_rsp():
     m = pyipmi.msgs.chassis.GetChassisStatusRsp()
@@ -50,4 +50,4 @@ def test_chassiscontrol_encode_valid_req():
     data = encode_message(m)
     eq_(m.__netfn__, 0)
     eq_(m.__cmdid__, 2)
-    eq_(data, '\x01')
+    eq_(data, b'\x01')
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import random
+
+from array import array
+
+from nose.tools import eq_, ok_, raises
+
+import pyipmi.msgs.sdr
+import pyipmi.msgs.sensor
+
+from pyipmi.errors import DecodingError
+from pyipmi.msgs.codec import MessageCodec, _STEP_STRUCT
+from pyipmi.msgs.message import Bitfield
+from pyipmi.msgs.registry import DEFAULT_REGISTRY
+
+
+def _state(msg):
+    state = {}
+    for field in msg.__fields__:
+        value = getattr(msg, field.name, None)
+        if isinstance(value, Bitfield.BitWrapper):
+            value = value._value
+        elif isinstance(value, array):
+            value = value.tolist()
+        state[field.name] = value
+    return state
+
+
+def _outcome(fn):
+    try:
+        return fn()
+    except Exception as e:
+        return type(e)
+
+
+def _message_classes():
+    classes = set(cls for (key, cls) in DEFAULT_REGISTRY.registry.items()
+            if isinstance(key, str) and hasattr(cls, '__fields__'))
+    return sorted(classes, key=lambda cls: cls.__name__)
+
+
+def test_compiled_on_registration():
+    ok_(isinstance(pyipmi.msgs.sensor.GetSensorReadingRsp.__codec__,
+            MessageCodec))
+    codec = pyipmi.msgs.sdr.GetSdrReq.__codec__
+    eq_([kind for (kind, _) in codec.steps], [_STEP_STRUCT])
+    eq_(codec.fields, [])
+
+
+def test_same_as_generic_code():
+    rnd = random.Random(0)
+    for cls in _message_classes():
+        eq_(_outcome(cls()._encode), _outcome(cls()._encode_fields))
+        for _ in range(20):
+            data = bytes(bytearray(rnd.choice([0, rnd.randint(0, 255)])
+                    for _ in range(rnd.randint(0, 24))))
+            compiled = cls()
+            generic = cls()
+            outcome = _outcome(lambda: compiled._decode(data))
+            eq_(outcome, _outcome(lambda: generic._decode_fields(data)))
+            if outcome is None:
+                eq_(_state(compiled), _state(generic))
+
+
+def test_decode_optional_fields():
+    m = pyipmi.msgs.sensor.GetSensorReadingRsp()
+    m._decode(b'\x00\x11\x22')
+    eq_(m.sensor_reading, 0x11)
+    eq_(m.config.event_message_disabled, 0)
+    eq_(m.states1, None)
+    eq_(m.states2, None)
+
+    m._decode(b'\x00\x11\x22\x33\x44')
+    eq_(m.states1, 0x33)
+    eq_(m.states2, 0x44)
+    eq_(m._encode(), b'\x00\x11\x22\x33\x44')
+
+
+def test_decode_stops_at_completion_code():
+    m = pyipmi.msgs.sdr.GetSdrRsp()
+    m._decode(b'\xca')
+    eq_(m.completion_code, 0xca)
+
+
+def test_decode_remaining_bytes():
+    m = pyipmi.msgs.sdr.GetSdrRsp()
+    m._decode(b'\x00\x02\x01\xaa\xbb')
+    eq_(m.next_record_id, 0x0102)
+    eq_(m.record_data, array('B', [0xaa, 0xbb]))
+
+
+@raises(DecodingError)
+def test_decode_too_short():
+    m = pyipmi.msgs.sdr.GetSdrRsp()
+    m._decode(b'\x00\x02')
+
+
+@raises(DecodingError)
+def test_decode_extra_bytes():
+    m = pyipmi.msgs.sdr.GetSdrReq()
+    m._decode(b'\x00\x00\x00\x00\x00\x00\x00')
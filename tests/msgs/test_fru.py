@@ -31,7 +31,7 @@ def test_writefrudatareq_encode_valid_req():
     m.offset = 0x302
     m.data = array('B', b'\x04\x05')
     data = encode_message(m)
-    eq_(data, '\x01\x02\x03\x04\x05')
+    eq_(data, b'\x01\x02\x03\x04\x05')
 
 def test_writefrudatareq_decode_valid_req_wo_data():
     m = pyipmi.msgs.fru.WriteFruDataReq()
@@ -46,7 +46,7 @@ def test_writefrudatareq_encode_valid_req_wo_data():
     m.offset = 0x302
     m.data = array('B')
     data = encode_message(m)
-    eq_(data, '\x01\x02\x03')
+    eq_(data, b'\x01\x02\x03')
 
 @raises(DecodingError)
 def test_writefrudatareq_decode_invalid_req():
@@ -76,7 +76,7 @@ def test_readfrudatareq_encode_valid_req():
     m.offset = 0x302
     m.count = 4
     data = encode_message(m)
-    eq_(data, '\x01\x02\x03\x04')
+    eq_(data, b'\x01\x02\x03\x04')
 
 def test_readfrudatarsp_decode_valid_rsp():
     m = pyipmi.msgs.fru.ReadFruDataRsp()
@@ -101,7 +101,7 @@ def test_readfrudatarsp_encode_valid_rsp():
     m.count = 5
     m.data = array('B', b'\x01\x02\x03\x04\x05')
     data = encode_message(m)
-    eq_(data, '\x00\x05\x01\x02\x03\x04\x05')
+    eq_(data, b'\x00\x05\x01\x02\x03\x04\x05')
 
 @raises(EncodingError)
 def test_readfrudatarsp_encode_invalid_rsp():
@@ -15,7 +15,7 @@ def test_uploadfirmwareblockreq_encode():
     m.number = 1
     m.data = [0, 1, 2, 3]
     data = encode_message(m)
-    eq_(data, '\x00\x01\x00\x01\x02\x03')
+    eq_(data, b'\x00\x01\x00\x01\x02\x03')
 
 def test_activatefirmwarereq_decode_valid_req():
     m = pyipmi.msgs.hpm.ActivateFirmwareReq()
@@ -28,7 +28,7 @@ def test_activatefirmwarereq_encode_valid_req():
     m.picmg_identifier = 0
     m.rollback_override_policy = 0x1
     data = encode_message(m)
-    eq_(data, '\x00\x01')
+    eq_(data, b'\x00\x01')
 
 def test_activatefirmwarereq_decode_valid_req_wo_optional():
     m = pyipmi.msgs.hpm.ActivateFirmwareReq()
@@ -41,4 +41,4 @@ def test_activatefirmwarereq_encode_valid_req_wo_optional():
     m.picmg_identifier = 0
     m.rollback_override_policy = None
     data = encode_message(m)
-    eq_(data, '\x00')
+    eq_(data, b'\x00')
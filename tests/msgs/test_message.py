@@ -5,6 +5,7 @@ from nose.tools import eq_, raises
 
 from array import array
 from pyipmi.utils import ByteBuffer
+from pyipmi.msgs import create_request_by_name, encode_message
 from pyipmi.msgs.message import Message, UnsignedInt, RemainingBytes, String
 
 class TestMessage(object):
@@ -65,3 +66,12 @@ def test_message():
     eq_(msg.lun, 0)
     eq_(msg.netfn, 1)
     eq_(msg.cmdid, 2)
+
+def test_encode_message_returns_bytes():
+    m = create_request_by_name('GetSdr')
+    m.record_id = 0x0102
+    data = encode_message(m)
+    eq_(type(data), bytes)
+    eq_(data, b'\x00\x00\x02\x01\x00\x00')
+
+    eq_(encode_message(create_request_by_name('GetDeviceId')), b'')
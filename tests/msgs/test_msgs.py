@@ -133,7 +133,7 @@ def test_setbmcglobalenables_encode_all_disabled_req():
     m.enables.event_message_buffer_full_interrupt = 0
     m.enables.receive_message_queue_interrupt = 0
     data = encode_message(m)
-    eq_(data, '\x00')
+    eq_(data, b'\x00')
 
 def test_setbmcglobalenables_encode_enable_oem_2_req():
     m = pyipmi.msgs.bmc.SetBmcGlobalEnablesReq()
@@ -145,7 +145,7 @@ def test_setbmcglobalenables_encode_enable_oem_2_req():
     m.enables.event_message_buffer_full_interrupt = 0
     m.enables.receive_message_queue_interrupt = 0
     data = encode_message(m)
-    eq_(data, '\x80')
+    eq_(data, b'\x80')
 
 def test_setbmcglobalenables_encode_enable_oem_1_req():
     m = pyipmi.msgs.bmc.SetBmcGlobalEnablesReq()
@@ -157,7 +157,7 @@ def test_setbmcglobalenables_encode_enable_oem_1_req():
     m.enables.event_message_buffer_full_interrupt = 0
     m.enables.receive_message_queue_interrupt = 0
     data = encode_message(m)
-    eq_(data, '\x40')
+    eq_(data, b'\x40')
 
 def test_setbmcglobalenables_encode_enable_oem_0_req():
     m = pyipmi.msgs.bmc.SetBmcGlobalEnablesReq()
@@ -169,7 +169,7 @@ def test_setbmcglobalenables_encode_enable_oem_0_req():
     m.enables.event_message_buffer_full_interrupt = 0
     m.enables.receive_message_queue_interrupt = 0
     data = encode_message(m)
-    eq_(data, '\x20')
+    eq_(data, b'\x20')
 
 def test_setbmcglobalenables_encode_enable_receive_message_queue_interrupt_req():
     m = pyipmi.msgs.bmc.SetBmcGlobalEnablesReq()
@@ -181,7 +181,7 @@ def test_setbmcglobalenables_encode_enable_receive_message_queue_interrupt_req()
     m.enables.event_message_buffer_full_interrupt = 0
     m.enables.receive_message_queue_interrupt = 1
     data = encode_message(m)
-    eq_(data, '\x01')
+    eq_(data, b'\x01')
 
 def test_getbmcglobalenables_decode_all_disabled_rsp():
     m = pyipmi.msgs.bmc.GetBmcGlobalEnablesRsp()
@@ -228,7 +228,7 @@ def test_clearmessageflags_encode_clear_none_req():
     m.clear.event_message_buffer = 0
     m.clear.receive_message_queue = 0
     data = encode_message(m)
-    eq_(data, '\x00')
+    eq_(data, b'\x00')
 
 def test_clearmessageflags_encode_clear_oem_2_req():
     m = pyipmi.msgs.bmc.ClearMessageFlagsReq()
@@ -239,7 +239,7 @@ def test_clearmessageflags_encode_clear_oem_2_req():
     m.clear.event_message_buffer = 0
     m.clear.receive_message_queue = 0
     data = encode_message(m)
-    eq_(data, '\x80')
+    eq_(data, b'\x80')
 
 def test_clearmessageflags_encode_clear_oem_0_req():
     m = pyipmi.msgs.bmc.ClearMessageFlagsReq()
@@ -250,7 +250,7 @@ def test_clearmessageflags_encode_clear_oem_0_req():
     m.clear.event_message_buffer = 0
     m.clear.receive_message_queue = 0
     data = encode_message(m)
-    eq_(data, '\x20')
+    eq_(data, b'\x20')
 
 def test_clearmessageflags_encode_clear_receive_message_queue_req():
     m = pyipmi.msgs.bmc.ClearMessageFlagsReq()
@@ -261,7 +261,7 @@ def test_clearmessageflags_encode_clear_receive_message_queue_req():
     m.clear.event_message_buffer = 0
     m.clear.receive_message_queue = 1
     data = encode_message(m)
-    eq_(data, '\x01')
+    eq_(data, b'\x01')
 
 def test_getmessageflags_decode_not_flag_set_rsp():
     m = pyipmi.msgs.bmc.GetMessageFlagsRsp()
@@ -301,21 +301,21 @@ def test_enablemessagechannelreceive_encode_all_off_req():
     m.channel.number = 0
     m.channel.state = 0
     data = encode_message(m)
-    eq_(data, '\x00\x00')
+    eq_(data, b'\x00\x00')
 
 def test_enablemessagechannelreceive_encode_channel1_enable_req():
     m = pyipmi.msgs.bmc.EnableMessageChannelReceiveReq()
     m.channel.number = 1
     m.channel.state = 1
     data = encode_message(m)
-    eq_(data, '\x01\x01')
+    eq_(data, b'\x01\x01')
 
 def test_enablemessagechannelreceive_encode_channel2_enable_req():
     m = pyipmi.msgs.bmc.EnableMessageChannelReceiveReq()
     m.channel.number = 2
     m.channel.state = 1
     data = encode_message(m)
-    eq_(data, '\x02\x01')
+    eq_(data, b'\x02\x01')
 
 def test_enablemessagechannelreceive_decode_channel1_enabled_rsp():
     m = pyipmi.msgs.bmc.EnableMessageChannelReceiveRsp()
@@ -355,7 +355,7 @@ def test_masterwriteread_encode_req_all_zero_read():
     m.bus_id.slave_address = 0
     m.read_count = 0
     data = encode_message(m)
-    eq_(data,'\x00\x00\x00')
+    eq_(data, b'\x00\x00\x00')
 
 def test_masterwriteread_encode_req_for_read():
     m = pyipmi.msgs.bmc.MasterWriteReadReq()
@@ -365,7 +365,7 @@ def test_masterwriteread_encode_req_for_read():
     m.bus_id.slave_address = 0x3a
     m.read_count = 5
     data = encode_message(m)
-    eq_(data,'\x45\x74\x05')
+    eq_(data, b'\x45\x74\x05')
 
 def test_masterwriteread_encode_req_for_write():
     m = pyipmi.msgs.bmc.MasterWriteReadReq()
@@ -377,7 +377,7 @@ def test_masterwriteread_encode_req_for_write():
 #    m.data = '\x01\x23\x45'
     m.data = [1, 0x23, 0x45]
     data = encode_message(m)
-    eq_(data,'\x00\x00\x00\x01\x23\x45')
+    eq_(data, b'\x00\x00\x00\x01\x23\x45')
 
 def test_masterwriteread_decode_rsp():
     m = pyipmi.msgs.bmc.MasterWriteReadRsp()
@@ -390,14 +390,14 @@ def test_seteventreceiver_encode_lun0_req():
     m.event_receiver.ipmb_i2c_slave_address = 0x10
     m.event_receiver.lun = 0
     data = encode_message(m)
-    eq_(data, '\x20\x00')
+    eq_(data, b'\x20\x00')
 
 def test_seteventreceiver_encode_lun3_req():
     m = pyipmi.msgs.event.SetEventReceiverReq()
     m.event_receiver.ipmb_i2c_slave_address = 0x10
     m.event_receiver.lun = 3
     data = encode_message(m)
-    eq_(data, '\x20\x03')
+    eq_(data, b'\x20\x03')
 
 def test_geteventreceiver_decode_lun0_rsp():
     m = pyipmi.msgs.event.GetEventReceiverRsp()
@@ -412,3 +412,44 @@ def test_geteventreceiver_decode_lun3_rsp():
     eq_(m.completion_code, 0x00)
     eq_(m.event_receiver.ipmb_i2c_slave_address, 0x10)
     eq_(m.event_receiver.lun, 3)
+
+def test_getchannelauthenticationcapabilities_encode_req():
+    m = pyipmi.msgs.bmc.GetChannelAuthenticationCapabilitiesReq()
+    m.privilege_level.requested = 4
+    data = encode_message(m)
+    eq_(data, b'\x0e\x04')
+
+def test_getchannelauthenticationcapabilities_decode_rsp():
+    m = pyipmi.msgs.bmc.GetChannelAuthenticationCapabilitiesRsp()
+    decode_message(m, '\x00\x01\x17\x14\x00\x00\x00\x00\x00')
+    eq_(m.completion_code, 0)
+    eq_(m.channel_number, 1)
+    eq_(m.support.none, 1)
+    eq_(m.support.md2, 1)
+    eq_(m.support.md5, 1)
+    eq_(m.support.straight, 1)
+    eq_(m.support.ipmi_2_0, 0)
+    eq_(m.status.user_level, 0)
+    eq_(m.status.per_message, 1)
+
+def test_getsessionchallenge_decode_rsp():
+    m = pyipmi.msgs.bmc.GetSessionChallengeRsp()
+    decode_message(m, '\x00\x44\x33\x22\x11' + 'abcdefghijklmnop')
+    eq_(m.completion_code, 0)
+    eq_(m.temporary_session_id, 0x11223344)
+    eq_(m.challenge_string, array('B', b'abcdefghijklmnop'))
+
+def test_activatesession_decode_rsp():
+    m = pyipmi.msgs.bmc.ActivateSessionRsp()
+    decode_message(m, '\x00\x02\x44\x33\x22\x11\x01\x00\x00\x00\x04')
+    eq_(m.completion_code, 0)
+    eq_(m.authentication.type, 2)
+    eq_(m.session_id, 0x11223344)
+    eq_(m.initial_inbound_sequence_number, 1)
+    eq_(m.privilege_level.maximum_allowed, 4)
+
+def test_closesession_encode_req():
+    m = pyipmi.msgs.bmc.CloseSessionReq()
+    m.session_id = 0x11223344
+    data = encode_message(m)
+    eq_(data, b'\x44\x33\x22\x11')
@@ -68,7 +68,7 @@ def test_clear_activation_lock_req():
     m.mask.activation_locked = 1
     m.set.activation_locked = 0
     data = encode_message(m)
-    eq_(data, '\x00\x01\x01\x00')
+    eq_(data, b'\x00\x01\x01\x00')
 
 def test_set_activation_lock_req():
     m = pyipmi.msgs.picmg.SetFruActivationPolicyReq()
@@ -76,7 +76,7 @@ def test_set_activation_lock_req():
     m.mask.activation_locked = 1
     m.set.activation_locked = 1
     data = encode_message(m)
-    eq_(data, '\x00\x01\x01\x01')
+    eq_(data, b'\x00\x01\x01\x01')
 
 def test_clear_deactivation_lock_req():
     m = pyipmi.msgs.picmg.SetFruActivationPolicyReq()
@@ -84,7 +84,7 @@ def test_clear_deactivation_lock_req():
     m.mask.deactivation_locked = 1
     m.set.deactivation_locked = 0
     data = encode_message(m)
-    eq_(data, '\x00\x01\x02\x00')
+    eq_(data, b'\x00\x01\x02\x00')
 
 def test_set_deactivation_lock_req():
     m = pyipmi.msgs.picmg.SetFruActivationPolicyReq()
@@ -92,7 +92,7 @@ def test_set_deactivation_lock_req():
     m.mask.deactivation_locked = 1
     m.set.deactivation_locked = 1
     data = encode_message(m)
-    eq_(data, '\x00\x01\x02\x02')
+    eq_(data, b'\x00\x01\x02\x02')
 
 def test_decode_rsp_local_control_state():
     m = pyipmi.msgs.picmg.GetFruLedStateRsp()
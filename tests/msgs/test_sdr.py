@@ -13,7 +13,7 @@ from pyipmi.msgs import decode_message
 def test_getsdrrepositoryinfo_encode_req():
     m = pyipmi.msgs.sdr.GetSdrRepositoryInfoReq()
     data = encode_message(m)
-    eq_(data, '')
+    eq_(data, b'')
 
 def test_getsdrrepositoryinfo_decode_rsp():
     m = pyipmi.msgs.sdr.GetSdrRepositoryInfoRsp()
@@ -34,7 +34,7 @@ def test_getsdrrepositoryinfo_decode_rsp():
 def test_getsdrrepositoryallocationinfo_encode_req():
     m = pyipmi.msgs.sdr.GetSdrRepositoryAllocationInfoReq()
     data = encode_message(m)
-    eq_(data, '')
+    eq_(data, b'')
 
 def test_getsdrrepositoryallocationinfo_decode_rsp():
     m = pyipmi.msgs.sdr.GetSdrRepositoryAllocationInfoRsp()
@@ -49,7 +49,7 @@ def test_getsdrrepositoryallocationinfo_decode_rsp():
 def test_reservesdrrepository_encode_req():
     m = pyipmi.msgs.sdr.ReserveSdrRepositoryReq()
     data = encode_message(m)
-    eq_(data, '')
+    eq_(data, b'')
 
 def test_reservesdrrepository_decode_rsp():
     m = pyipmi.msgs.sdr.ReserveSdrRepositoryRsp()
@@ -64,7 +64,7 @@ def test_getsdr_encode_req():
     m.offset = 0xaa
     m.bytes_to_read = 0x55
     data = encode_message(m)
-    eq_(data, '\x22\x11\x44\x33\xaa\x55')
+    eq_(data, b'\x22\x11\x44\x33\xaa\x55')
 
 def test_getsdr_decode_rsp():
     m = pyipmi.msgs.sdr.GetSdrRsp()
@@ -77,7 +77,7 @@ def test_addsdr_encode_req():
     m = pyipmi.msgs.sdr.AddSdrReq()
     m.record_data = array('B', [0x55, 0x44])
     data = encode_message(m)
-    eq_(data, '\x55\x44')
+    eq_(data, b'\x55\x44')
 
 def test_addsdr_decode_rsp():
     m = pyipmi.msgs.sdr.AddSdrRsp()
@@ -93,7 +93,7 @@ def test_partialaddsdr_encode_req():
     m.status.in_progress = 0xaa
     m.record_data = array('B', [0x55, 0x44])
     data = encode_message(m)
-    eq_(data, '\x11\x22\x33\x44\xaa\x0a\x55\x44')
+    eq_(data, b'\x11\x22\x33\x44\xaa\x0a\x55\x44')
 
 def test_partialaddsdr_decode_rsp():
     m = pyipmi.msgs.sdr.PartialAddSdrRsp()
@@ -106,7 +106,7 @@ def test_deletesdr_encode_req():
     m.reservation_id = 0x2211
     m.record_id = 0x4433
     data = encode_message(m)
-    eq_(data, '\x11\x22\x33\x44')
+    eq_(data, b'\x11\x22\x33\x44')
 
 def test_deletesdr_decode_rsp():
     m = pyipmi.msgs.sdr.DeleteSdrRsp()
@@ -119,7 +119,7 @@ def test_clearsdrrepository_encode_req():
     m.reservation_id = 0x2211
     m.cmd = 1
     data = encode_message(m)
-    eq_(data, '\x11"CLR\x01')
+    eq_(data, b'\x11"CLR\x01')
 
 def test_clearsdrrepository_decode_rsp():
     m = pyipmi.msgs.sdr.ClearSdrRepositoryRsp()
@@ -34,4 +34,4 @@ def test_getselentry_encode_valid_rsp():
     m.next_record_id = 0x0102
     m.record_data = array('B', b'\x01\x02\x03\x04')
     data = encode_message(m)
-    eq_(data, '\x00\x02\x01\x01\x02\x03\x04')
+    eq_(data, b'\x00\x02\x01\x01\x02\x03\x04')
@@ -13,7 +13,7 @@ from pyipmi.msgs import decode_message
 def test_getdevicesdrinfo_encode_req():
     m = pyipmi.msgs.sensor.GetDeviceSdrInfoReq()
     data = encode_message(m)
-    eq_(data, '')
+    eq_(data, b'')
 
 def test_getdevicesdrinfo_encode_rsp():
     m = pyipmi.msgs.sensor.GetDeviceSdrInfoRsp()
@@ -45,7 +45,7 @@ def test_getdevicesdr_encode_req():
     m.offset = 0x89
     m.bytes_to_read = 0xab
     data = encode_message(m)
-    eq_(data, '\x23\x01\x67\x45\x89\xab')
+    eq_(data, b'\x23\x01\x67\x45\x89\xab')
 
 def test_getdevicesdr_decode_rsp():
     m = pyipmi.msgs.sensor.GetDeviceSdrRsp()
@@ -60,13 +60,13 @@ def test_setsensorhysteresis_encode_req():
     m.positive_going_hysteresis = 0xaa
     m.negative_going_hysteresis = 0xbb
     data = encode_message(m)
-    eq_(data, '\xab\xff\xaa\xbb')
+    eq_(data, b'\xab\xff\xaa\xbb')
 
 def test_getsensorhysteresis_encode_req():
     m = pyipmi.msgs.sensor.GetSensorHysteresisReq()
     m.sensor_number = 0xab
     data = encode_message(m)
-    eq_(data, '\xab\xff')
+    eq_(data, b'\xab\xff')
 
 def test_getsensorhysteresis_decode_rsp():
     m = pyipmi.msgs.sensor.GetSensorHysteresisRsp()
@@ -81,7 +81,7 @@ def test_setsensorthresholds_encode_req_set_unr():
     m.set_mask.unr = 1
     m.threshold.unr = 0xaa
     data = encode_message(m)
-    eq_(data, '\x55\x20\x00\x00\x00\x00\x00\xaa')
+    eq_(data, b'\x55\x20\x00\x00\x00\x00\x00\xaa')
 
 def test_setsensorthresholds_encode_req_set_ucr():
     m = pyipmi.msgs.sensor.SetSensorThresholdsReq()
@@ -89,7 +89,7 @@ def test_setsensorthresholds_encode_req_set_ucr():
     m.set_mask.ucr = 1
     m.threshold.ucr = 0xaa
     data = encode_message(m)
-    eq_(data, '\x55\x10\x00\x00\x00\x00\xaa\x00')
+    eq_(data, b'\x55\x10\x00\x00\x00\x00\xaa\x00')
 
 def test_setsensorthresholds_encode_req_set_unc():
     m = pyipmi.msgs.sensor.SetSensorThresholdsReq()
@@ -97,7 +97,7 @@ def test_setsensorthresholds_encode_req_set_unc():
     m.set_mask.unc = 1
     m.threshold.unc = 0xaa
     data = encode_message(m)
-    eq_(data, '\x55\x08\x00\x00\x00\xaa\x00\x00')
+    eq_(data, b'\x55\x08\x00\x00\x00\xaa\x00\x00')
 
 def test_setsensorthresholds_encode_req_set_lnr():
     m = pyipmi.msgs.sensor.SetSensorThresholdsReq()
@@ -105,7 +105,7 @@ def test_setsensorthresholds_encode_req_set_lnr():
     m.set_mask.lnr = 1
     m.threshold.lnr = 0xaa
     data = encode_message(m)
-    eq_(data, '\x55\x04\x00\x00\xaa\x00\x00\x00')
+    eq_(data, b'\x55\x04\x00\x00\xaa\x00\x00\x00')
 
 def test_setsensorthresholds_encode_req_set_lcr():
     m = pyipmi.msgs.sensor.SetSensorThresholdsReq()
@@ -113,7 +113,7 @@ def test_setsensorthresholds_encode_req_set_lcr():
     m.set_mask.lcr = 1
     m.threshold.lcr = 0xaa
     data = encode_message(m)
-    eq_(data, '\x55\x02\x00\xaa\x00\x00\x00\x00')
+    eq_(data, b'\x55\x02\x00\xaa\x00\x00\x00\x00')
 
 def test_setsensorthresholds_encode_req_set_lnc():
     m = pyipmi.msgs.sensor.SetSensorThresholdsReq()
@@ -121,7 +121,7 @@ def test_setsensorthresholds_encode_req_set_lnc():
     m.set_mask.lnc = 1
     m.threshold.lnc = 0xaa
     data = encode_message(m)
-    eq_(data, '\x55\x01\xaa\x00\x00\x00\x00\x00')
+    eq_(data, b'\x55\x01\xaa\x00\x00\x00\x00\x00')
 
 def test_setsensoreventenable_encode_req():
     m = pyipmi.msgs.sensor.SetSensorEventEnableReq()
@@ -130,7 +130,7 @@ def test_setsensoreventenable_encode_req():
     m.enable.event_message = 0
     m.enable.sensor_scanning = 0
     data = encode_message(m)
-    eq_(data, '\xab\x00')
+    eq_(data, b'\xab\x00')
 
 def test_setsensoreventenable_encode_cfg_req():
     m = pyipmi.msgs.sensor.SetSensorEventEnableReq()
@@ -139,7 +139,7 @@ def test_setsensoreventenable_encode_cfg_req():
     m.enable.event_message = 0
     m.enable.sensor_scanning = 0
     data = encode_message(m)
-    eq_(data, '\xab\x20')
+    eq_(data, b'\xab\x20')
 
 def test_setsensoreventenable_encode_scanning_enabled_req():
     m = pyipmi.msgs.sensor.SetSensorEventEnableReq()
@@ -148,7 +148,7 @@ def test_setsensoreventenable_encode_scanning_enabled_req():
     m.enable.event_message = 0
     m.enable.sensor_scanning = 1
     data = encode_message(m)
-    eq_(data, '\xab\x40')
+    eq_(data, b'\xab\x40')
 
 def test_setsensoreventenable_encode_event_enabled_req():
     m = pyipmi.msgs.sensor.SetSensorEventEnableReq()
@@ -157,7 +157,7 @@ def test_setsensoreventenable_encode_event_enabled_req():
     m.enable.event_message = 1
     m.enable.sensor_scanning = 0
     data = encode_message(m)
-    eq_(data, '\xab\x80')
+    eq_(data, b'\xab\x80')
 
 def test_setsensoreventenable_encode_byte3_req():
     m = pyipmi.msgs.sensor.SetSensorEventEnableReq()
@@ -167,7 +167,7 @@ def test_setsensoreventenable_encode_byte3_req():
     m.enable.sensor_scanning = 0
     m.byte3 = 0xaa
     data = encode_message(m)
-    eq_(data, '\xab\x00\xaa')
+    eq_(data, b'\xab\x00\xaa')
 
 def test_setsensoreventenable_encode_byte34_req():
     m = pyipmi.msgs.sensor.SetSensorEventEnableReq()
@@ -178,13 +178,13 @@ def test_setsensoreventenable_encode_byte34_req():
     m.byte3 = 0xaa
     m.byte4 = 0xbb
     data = encode_message(m)
-    eq_(data, '\xab\x00\xaa\xbb')
+    eq_(data, b'\xab\x00\xaa\xbb')
 
 def test_getsensoreventenable_encode_req():
     m = pyipmi.msgs.sensor.GetSensorEventEnableReq()
     m.sensor_number = 0xab
     data = encode_message(m)
-    eq_(data, '\xab')
+    eq_(data, b'\xab')
 
 def test_getsensoreventenable_decode_event_enabled_rsp():
     m = pyipmi.msgs.sensor.GetSensorEventEnableRsp()
@@ -229,7 +229,7 @@ def test_rearmsensorevents_encode_req():
     m = pyipmi.msgs.sensor.RearmSensorEventsReq()
     m.sensor_number = 0xab
     data = encode_message(m)
-    eq_(data, '\xab\x00\x00\x00\x00\x00')
+    eq_(data, b'\xab\x00\x00\x00\x00\x00')
 
 def test_rearmsensorevents_decode_rsp():
     m = pyipmi.msgs.sensor.RearmSensorEventsRsp()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import sys
+
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_, ok_, raises
+
+from pyipmi import Target
+from pyipmi.errors import CompletionCodeError
+from pyipmi.msgs import create_request_by_name
+
+if sys.version_info < (3, 5):
+    raise SkipTest('asyncio front-end needs python 3.5')
+
+import asyncio
+
+from pyipmi import aio
+from tests.interfaces import test_rmcp, test_rmcpplus
+
+
+def _run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def _connect(bmc, name, **kwargs):
+    interface = aio.create_interface(name, timeout=0.5, **kwargs)
+    ipmi = aio.create_connection(interface)
+    ipmi.target = Target(0x20)
+    ipmi.session.set_session_type_rmcp('127.0.0.1', port=bmc.port)
+    ipmi.session.set_auth_type_user('admin', 'secret')
+    await ipmi.session.establish()
+    return ipmi
+
+
+@raises(RuntimeError)
+def test_create_interface_not_supported():
+    aio.create_interface('ipmitool')
+
+
+@raises(RuntimeError)
+def test_create_interface_window_too_big():
+    aio.create_interface('rmcp', window=33)
+
+
+def test_rmcp_concurrent_requests():
+    bmc = test_rmcp.FakeBmc()
+    bmc.start()
+
+    async def run():
+        ipmi = await _connect(bmc, 'rmcp', window=4)
+        rsps = await asyncio.gather(
+                *[ipmi.send_message_with_name('GetDeviceId')
+                    for _ in range(10)])
+        await ipmi.session.close()
+        return rsps
+
+    rsps = _run(run())
+    bmc.join()
+    ok_(bmc.closed)
+
+    eq_(len(rsps), 10)
+    eq_(set(rsp.device_id for rsp in rsps), set([0x0c]))
+    # only one handshake for all requests
+    eq_([r[1] for r in bmc.requests], [0x38, 0x39, 0x3a, 0x3b]
+            + [0x01] * 10 + [0x3c])
+
+
+def test_rmcp_completion_code_error():
+    bmc = test_rmcp.FakeBmc()
+    bmc.start()
+
+    async def run():
+        ipmi = await _connect(bmc, 'rmcp')
+        try:
+            await ipmi.get_sensor_reading(1)
+        finally:
+            await ipmi.session.close()
+
+    try:
+        _run(run())
+    except CompletionCodeError as e:
+        eq_(e.cc, 0xc1)
+    else:
+        ok_(False)
+    bmc.join()
+
+
+def test_rmcp_send_message_returns_completion_code():
+    bmc = test_rmcp.FakeBmc()
+    bmc.start()
+
+    async def run():
+        ipmi = await _connect(bmc, 'rmcp')
+        req = create_request_by_name('GetSensorReading')
+        req.sensor_number = 1
+        rsp = await ipmi.send_message(req)
+        await ipmi.session.close()
+        return rsp
+
+    rsp = _run(run())
+    bmc.join()
+    eq_(rsp.completion_code, 0xc1)
+
+
+def test_rmcpplus_concurrent_raw_command():
+    bmc = test_rmcpplus.FakeBmc(2)
+    bmc.start()
+
+    async def run():
+        ipmi = await _connect(bmc, 'rmcpplus', cipher_suite=2, window=8)
+        data = await asyncio.gather(
+                *[ipmi.raw_command(0, 0x6, b'\x01') for _ in range(16)])
+        await ipmi.session.close()
+        return data
+
+    data = _run(run())
+    bmc.join()
+    ok_(bmc.closed)
+
+    eq_(set(data), set([b'\x00\x0c\x89\x00\x00\x02\x3d\x98\x3a\x00\xbe\x14']))
+    eq_(bmc.handshakes, [0x10, 0x12, 0x14])
+
+
+def test_fleet():
+    bmcs = [test_rmcp.FakeBmc() for _ in range(3)]
+    for bmc in bmcs:
+        bmc.start()
+    hosts = [('127.0.0.1', bmc.port) for bmc in bmcs]
+
+    async def device_id(ipmi):
+        rsp = await ipmi.send_message_with_name('GetDeviceId')
+        return rsp.device_id
+
+    async def run():
+        fleet = aio.AsyncFleet(hosts, 'admin', 'secret', max_concurrency=2,
+                interface_options={'timeout': 0.5})
+        return await fleet.run_all(device_id)
+
+    results = _run(run())
+    for bmc in bmcs:
+        bmc.join()
+
+    eq_([r.result for r in results], [0x0c] * 3)
+    eq_([r.port for r in results], [bmc.port for bmc in bmcs])
+
+
+def test_sdr_cache():
+    from pyipmi.cache import SdrCache
+    from tests.test_cache import FakeSdrBmc, compact_sensor_record
+
+    bmc = FakeSdrBmc({1: compact_sensor_record(1, 0x10, 'Temp CPU')})
+
+    async def send_message(req, retry=3):
+        return bmc.send_message(req)
+
+    async def run():
+        ipmi = aio.AsyncIpmi()
+        ipmi.target = Target(0x20)
+        ipmi.send_message = send_message
+        ipmi.sdr_cache = SdrCache()
+        first = await ipmi.get_repository_sdr_list()
+        second = await ipmi.get_repository_sdr_list()
+        return (first, second)
+
+    (first, second) = _run(run())
+    eq_(bmc.requests['ReserveSdrRepository'], 1)
+    eq_([s.device_id_string for s in second], ['Temp CPU'])
+    eq_(list(second[0].data), list(first[0].data))
+
+
+def test_read_fru_data():
+    from tests.test_fru import FakeFru
+
+    bmc = FakeFru(range(40))
+
+    async def send_message(req, retry=3):
+        return bmc.send_message(req)
+
+    async def run():
+        ipmi = aio.AsyncIpmi()
+        ipmi.send_message = send_message
+        return await ipmi.read_fru_data()
+
+    eq_(bytearray(_run(run())), bytearray(range(40)))
+    eq_(bmc.counts, [32, 30, 28, 26, 24, 22, 20, 18, 16, 16, 8])
+
+
+def test_sensor_poller():
+    from tests.test_poller import FakeClock, _sensor, _send_batch
+
+    async def send_message_batch(reqs, retry=3, skip_timeouts=False):
+        return _send_batch(reqs)
+
+    clock = FakeClock()
+    snapshots = []
+
+    async def callback(target, snapshot):
+        snapshots.append((target, snapshot.raw))
+
+    async def run():
+        poller = aio.AsyncSensorPoller(callback, jitter=0, clock=clock)
+        for target in ('a', 'b'):
+            ipmi = aio.AsyncIpmi()
+            ipmi.send_message_batch = send_message_batch
+            poller.add_target(target, ipmi)
+            poller.add_sensor(target, _sensor(1), 5)
+        poller.add_sensor('b', _sensor(2), 10)
+        clock.now = 10
+        await poller.run_pending()
+
+    _run(run())
+    eq_(sorted(snapshots), [('a', [2]), ('b', [2, 3])])
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import collections
+import os
+import shutil
+import tempfile
+
+from nose.tools import eq_, ok_
+
+from pyipmi import interfaces, create_connection, Target
+from pyipmi.cache import SdrCache
+from pyipmi.msgs import create_response_by_name
+from pyipmi.sdr import SdrCompactSensorRecord
+
+
+def compact_sensor_record(record_id, number, name):
+    data = [record_id & 0xff, record_id >> 8, 0x51, 0x02, 27 + len(name),
+            0x20, 0x00, number, 0x03, 0x01]
+    data += [0] * 21
+    data += [0xc0 | len(name)] + [ord(c) for c in name]
+    return data
+
+
+class FakeSdrBmc(object):
+    """Serves an SDR repository and device SDRs to `Ipmi.send_message`."""
+
+    def __init__(self, records):
+        self.records = records
+        self.most_recent_addition = 0x1000
+        # largest number of bytes returned by one Get SDR request
+        self.max_read = None
+        self.requests = collections.Counter()
+
+    def _record(self, record_id):
+        ids = sorted(self.records)
+        if record_id == 0:
+            record_id = ids[0]
+        index = ids.index(record_id)
+        next_id = 0xffff if index + 1 == len(ids) else ids[index + 1]
+        return (self.records[record_id], next_id)
+
+    def send_message(self, req, retry=3):
+        name = type(req).__name__[:-3]
+        self.requests[name] += 1
+        rsp = create_response_by_name(name)
+        rsp.completion_code = 0
+        if name == 'GetDeviceId':
+            rsp.manufacturer_id = 0x3a98
+            rsp.product_id = 0x1234
+        elif name == 'GetSdrRepositoryInfo':
+            rsp.record_count = len(self.records)
+            rsp.most_recent_addition = self.most_recent_addition
+            rsp.most_recent_erase = 0
+        elif name == 'GetDeviceSdrInfo':
+            rsp.number_of_sensors = len(self.records)
+            rsp.sensor_population_change = self.most_recent_addition
+        elif name in ('GetSdr', 'GetDeviceSdr'):
+            (data, next_id) = self._record(req.record_id)
+            data = data[req.offset:req.offset + req.bytes_to_read]
+            if self.max_read is not None and len(data) > self.max_read:
+                rsp.completion_code = 0xca
+                return rsp
+            rsp.next_record_id = next_id
+            rsp.record_data = data
+        return rsp
+
+
+def _connect(bmc):
+    ipmi = create_connection(interfaces.create_interface('mock'))
+    ipmi.target = Target(0x20)
+    ipmi.send_message = bmc.send_message
+    return ipmi
+
+
+def _records():
+    return {
+        1: compact_sensor_record(1, 0x10, 'Temp CPU'),
+        2: compact_sensor_record(2, 0x11, 'Temp Board'),
+    }
+
+
+def test_repository_entries_are_cached():
+    bmc = FakeSdrBmc(_records())
+    ipmi = _connect(bmc)
+    ipmi.sdr_cache = SdrCache()
+
+    first = list(ipmi.sdr_repository_entries())
+    get_sdr_count = bmc.requests['GetSdr']
+    ok_(get_sdr_count > 0)
+
+    second = list(ipmi.sdr_repository_entries())
+    eq_(bmc.requests['GetSdr'], get_sdr_count)
+    eq_(bmc.requests['GetSdrRepositoryInfo'], 2)
+
+    eq_([type(s) for s in second], [SdrCompactSensorRecord] * 2)
+    eq_([s.device_id_string for s in second], ['Temp CPU', 'Temp Board'])
+    eq_([s.next_id for s in second], [s.next_id for s in first])
+    eq_([list(s.data) for s in second], [list(s.data) for s in first])
+
+
+def test_changed_repository_is_read_again():
+    bmc = FakeSdrBmc(_records())
+    ipmi = _connect(bmc)
+    ipmi.sdr_cache = SdrCache()
+
+    list(ipmi.sdr_repository_entries())
+    get_sdr_count = bmc.requests['GetSdr']
+
+    bmc.records[3] = compact_sensor_record(3, 0x12, 'Fan 1')
+    bmc.most_recent_addition += 1
+    sdrs = list(ipmi.sdr_repository_entries())
+    ok_(bmc.requests['GetSdr'] > get_sdr_count)
+    eq_(len(sdrs), 3)
+
+
+def test_changed_records_are_synced():
+    bmc = FakeSdrBmc(_records())
+    ipmi = _connect(bmc)
+    ipmi.sdr_cache = SdrCache()
+
+    list(ipmi.device_sdr_entries())
+    bmc.records[3] = compact_sensor_record(3, 0x12, 'Fan 1')
+    bmc.most_recent_addition += 1
+    bmc.requests.clear()
+    sdrs = list(ipmi.device_sdr_entries())
+    # three headers and the new record
+    eq_(bmc.requests['GetDeviceSdr'], 4)
+    eq_([s.number for s in sdrs], [0x10, 0x11, 0x12])
+
+    bmc.requests.clear()
+    list(ipmi.device_sdr_entries())
+    eq_(bmc.requests['GetDeviceSdr'], 0)
+
+
+def test_incomplete_read_is_not_stored():
+    bmc = FakeSdrBmc(_records())
+    ipmi = _connect(bmc)
+    ipmi.sdr_cache = SdrCache()
+
+    next(ipmi.sdr_repository_entries())
+    get_sdr_count = bmc.requests['GetSdr']
+    list(ipmi.sdr_repository_entries())
+    ok_(bmc.requests['GetSdr'] > get_sdr_count)
+
+
+def test_device_entries_persistent_cache():
+    directory = tempfile.mkdtemp()
+    try:
+        bmc = FakeSdrBmc(_records())
+        ipmi = _connect(bmc)
+        ipmi.sdr_cache = SdrCache(directory)
+        list(ipmi.device_sdr_entries())
+        eq_(len(os.listdir(directory)), 1)
+
+        # a new connection with a new cache object
+        bmc = FakeSdrBmc(_records())
+        ipmi = _connect(bmc)
+        ipmi.sdr_cache = SdrCache(directory)
+        sdrs = list(ipmi.device_sdr_entries())
+        eq_(bmc.requests['GetDeviceSdr'], 0)
+        eq_(bmc.requests['GetDeviceSdrInfo'], 1)
+        eq_([s.number for s in sdrs], [0x10, 0x11])
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_key():
+    rsp = create_response_by_name('GetDeviceId')
+    rsp.manufacturer_id = 0x3a98
+    rsp.product_id = 0x1234
+    rsp.firmware_revision.major = 1
+    rsp.firmware_revision.minor = 0x23
+    eq_(SdrCache.key(rsp, 'repository', 0x20),
+            'repository-003a98-1234-00-0-1.23-20')
+
+    eq_(SdrCache.key(rsp, 'repository', 0x20, 'fe80::1', 623),
+            'repository-003a98-1234-00-0-1.23-fe80__1-623-20')
+
+
+def test_hosts_of_same_model_are_cached_separately():
+    cache = SdrCache()
+    # same model and repository stamp, but other records
+    bmcs = [FakeSdrBmc(_records()), FakeSdrBmc({
+        1: compact_sensor_record(1, 0x20, 'Temp PSU'),
+        2: compact_sensor_record(2, 0x21, 'Fan PSU'),
+    })]
+    for (i, bmc) in enumerate(bmcs):
+        ipmi = _connect(bmc)
+        ipmi.session.set_session_type_rmcp('10.0.0.%d' % (i + 1))
+        ipmi.sdr_cache = cache
+        list(ipmi.sdr_repository_entries())
+
+    for (i, bmc) in enumerate(bmcs):
+        bmc.requests.clear()
+        ipmi = _connect(bmc)
+        ipmi.session.set_session_type_rmcp('10.0.0.%d' % (i + 1))
+        ipmi.sdr_cache = cache
+        sdrs = list(ipmi.sdr_repository_entries())
+        eq_(bmc.requests['GetSdr'], 0)
+        eq_([list(s.data) for s in sdrs],
+                [bmc.records[record_id] for record_id in sorted(bmc.records)])
+
+
+def test_read_size_is_stored():
+    bmc = FakeSdrBmc(_records())
+    bmc.max_read = 16
+    cache = SdrCache()
+
+    ipmi = _connect(bmc)
+    ipmi.sdr_cache = cache
+    list(ipmi.sdr_repository_entries())
+    first_requests = bmc.requests['GetSdr']
+
+    # a new connection after the repository has changed
+    bmc.most_recent_addition += 1
+    bmc.requests.clear()
+    ipmi = _connect(bmc)
+    ipmi.sdr_cache = cache
+    sdrs = list(ipmi.sdr_repository_entries())
+    ok_(bmc.requests['GetSdr'] < first_requests)
+    eq_([s.device_id_string for s in sdrs], ['Temp CPU', 'Temp Board'])
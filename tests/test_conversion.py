@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import math
+
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_, ok_, raises
+
+from pyipmi.errors import DecodingError
+from pyipmi.sdr import SdrFullSensorRecord, L_CUBERT
+
+try:
+    import numpy
+except ImportError:
+    raise SkipTest('vectorized conversion needs numpy')
+
+from pyipmi.conversion import convert_raw_to_values, convert_sensor_readings
+
+
+def _full_sensor(m, b, k1, k2, fmt, linearization):
+    sdr = SdrFullSensorRecord(None)
+    sdr.m = m
+    sdr.b = b
+    sdr.k1 = k1
+    sdr.k2 = k2
+    sdr.analog_data_format = fmt
+    sdr.linearization = linearization
+    return sdr
+
+
+def _scalar(sdr, raw):
+    try:
+        return sdr.convert_sensor_raw_to_value(raw)
+    except (ValueError, ZeroDivisionError, OverflowError):
+        return float('nan')
+
+
+def test_same_as_scalar_conversion():
+    sdrs = [_full_sensor(m, -3, 1, -2, fmt, linearization)
+            for linearization in range(L_CUBERT + 1)
+            for fmt in range(3)
+            for m in (1, 7, -2)]
+    raw = numpy.tile(numpy.arange(256), (len(sdrs), 1)).T
+
+    values = convert_sensor_readings(raw, sdrs)
+    eq_(values.shape, (256, len(sdrs)))
+    for (i, sdr) in enumerate(sdrs):
+        for r in range(256):
+            expected = _scalar(sdr, r)
+            value = values[r, i]
+            if math.isnan(expected):
+                ok_(math.isnan(value))
+            else:
+                ok_(abs(value - expected) <= 1e-9 * max(1, abs(expected)),
+                        (sdr.linearization, sdr.analog_data_format, r))
+
+
+def test_convert_raw_to_values_scalars():
+    values = convert_raw_to_values([0x10, 0xff], m=2, b=1, k1=0, k2=0,
+            linearization=0,
+            analog_data_format=SdrFullSensorRecord.DATA_FMT_2S_COMPLEMENT)
+    eq_(values.tolist(), [33.0, -1.0])
+
+
+@raises(DecodingError)
+def test_unknown_linearization():
+    convert_raw_to_values([1], 1, 0, 0, 0, 12)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import socket
+import sys
+import threading
+import time
+
+from nose.tools import eq_, ok_, raises
+
+from pyipmi.errors import TimeoutError
+from pyipmi.fleet import Fleet
+
+from tests.interfaces.test_rmcp import FakeBmc
+
+
+def _device_id(ipmi):
+    return ipmi.send_message_with_name('GetDeviceId').device_id
+
+
+def _start_bmcs(count):
+    bmcs = [FakeBmc() for _ in range(count)]
+    for bmc in bmcs:
+        bmc.start()
+    return bmcs
+
+
+def _join_bmcs(bmcs):
+    for bmc in bmcs:
+        bmc.join()
+
+
+@raises(RuntimeError)
+def test_invalid_limits():
+    Fleet(['10.0.0.1'], max_workers=0)
+
+
+def test_run_threads():
+    bmcs = _start_bmcs(3)
+    hosts = [('127.0.0.1', bmc.port) for bmc in bmcs]
+    fleet = Fleet(hosts, 'admin', 'secret', max_workers=2,
+            interface_options={'timeout': 0.5})
+
+    results = list(fleet.run(_device_id))
+    _join_bmcs(bmcs)
+
+    eq_(sorted(r.index for r in results), [0, 1, 2])
+    for result in results:
+        eq_(result.error, None)
+        eq_(result.result, 0x0c)
+        eq_((result.host, result.port), hosts[result.index])
+    for bmc in bmcs:
+        ok_(bmc.closed)
+
+
+def test_run_all_reports_errors():
+    bmcs = _start_bmcs(1)
+    hosts = [('127.0.0.1', bmcs[0].port)]
+    fleet = Fleet(hosts, 'admin', 'secret',
+            interface_options={'timeout': 0.5})
+
+    results = fleet.run_all(lambda ipmi: ipmi.get_sensor_reading(1))
+    _join_bmcs(bmcs)
+
+    eq_(len(results), 1)
+    eq_(results[0].result, None)
+    eq_(results[0].error.cc, 0xc1)
+
+
+def test_deadline():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    fleet = Fleet([('127.0.0.1', sock.getsockname()[1])], deadline=0.2,
+            interface_options={'timeout': 1.0})
+    try:
+        results = list(fleet.run(_device_id))
+    finally:
+        sock.close()
+
+    eq_(len(results), 1)
+    ok_(isinstance(results[0].error, TimeoutError))
+    ok_(results[0].duration < 1.0)
+
+
+def test_run_processes():
+    if sys.platform.startswith('win'):
+        return
+    bmcs = _start_bmcs(2)
+    hosts = [('127.0.0.1', bmc.port) for bmc in bmcs]
+    fleet = Fleet(hosts, 'admin', 'secret', use_processes=True,
+            interface_options={'timeout': 0.5})
+
+    results = fleet.run_all(_device_id)
+    _join_bmcs(bmcs)
+
+    eq_([r.result for r in results], [0x0c, 0x0c])
+
+
+def test_expired_host_keeps_its_slot():
+    import pyipmi.fleet
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+
+    def slow_call(options, host, port, fn, args, kwargs):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.3)
+        with lock:
+            active[0] -= 1
+        return (None, None)
+
+    original = pyipmi.fleet._call
+    pyipmi.fleet._call = slow_call
+    try:
+        fleet = Fleet(['10.0.0.1', '10.0.0.1'], deadline=0.1)
+        results = list(fleet.run(_device_id))
+    finally:
+        pyipmi.fleet._call = original
+
+    eq_(len(results), 2)
+    for result in results:
+        ok_(isinstance(result.error, TimeoutError))
+    eq_(peak[0], 1)
+
+
+def test_host_blocked_by_expired_host():
+    import pyipmi.fleet
+    release = threading.Event()
+
+    def hanging_call(options, host, port, fn, args, kwargs):
+        release.wait()
+        return (None, None)
+
+    original = pyipmi.fleet._call
+    pyipmi.fleet._call = hanging_call
+    try:
+        fleet = Fleet(['10.0.0.1', '10.0.0.1'], max_per_host=1,
+                deadline=0.1)
+        start = time.time()
+        results = list(fleet.run(_device_id))
+        ok_(time.time() - start < 5)
+    finally:
+        pyipmi.fleet._call = original
+        release.set()
+
+    eq_(sorted(result.index for result in results), [0, 1])
+    for result in results:
+        ok_(isinstance(result.error, TimeoutError))
+
+
+def test_run_processes_unpicklable():
+    if sys.platform.startswith('win'):
+        return
+    fleet = Fleet(['10.0.0.1'], use_processes=True)
+
+    results = fleet.run_all(lambda ipmi: None)
+
+    eq_(len(results), 1)
+    ok_(results[0].error is not None)
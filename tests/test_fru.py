@@ -20,3 +20,54 @@ def test_frudata_object():
 
 def test_inventorycommonheader_object():
     InventoryCommonHeader((0, 1, 2, 3, 4, 5, 6, 235))
+
+def test_frupicmgpowermodulecapabilityrecord_object():
+    data = b'\xc0\x02\x07\x59\xde\x5a\x31\x00\x27\x00\xf4\x01'
+    record = FruDataMultiRecord.create_from_record_id(data)
+    eq_(type(record), FruPicmgPowerModuleCapabilityRecord)
+    eq_(record.manufacturer_id, 0x315a)
+    eq_(record.picmg_record_type_id, 0x27)
+    eq_(record.maximum_current_output, 50.0)
+
+
+class FakeFru(object):
+    """Serves FRU data to `Ipmi.send_message`, at most `max_count` bytes
+    per read.
+    """
+
+    def __init__(self, data, max_count=16):
+        self.data = bytearray(data)
+        self.max_count = max_count
+        self.counts = []
+
+    def send_message(self, req, retry=3):
+        from pyipmi.msgs import fru
+        if isinstance(req, fru.GetFruInventoryAreaInfoReq):
+            rsp = fru.GetFruInventoryAreaInfoRsp()
+            rsp.completion_code = 0
+            rsp.area_size = len(self.data)
+            return rsp
+
+        self.counts.append(req.count)
+        rsp = fru.ReadFruDataRsp()
+        if req.count > self.max_count:
+            rsp.completion_code = 0xca
+            return rsp
+        rsp.completion_code = 0
+        rsp.count = req.count
+        rsp.data = self.data[req.offset:req.offset + req.count]
+        return rsp
+
+
+def test_read_fru_data():
+    from pyipmi import interfaces, create_connection
+
+    bmc = FakeFru(range(40))
+    ipmi = create_connection(interfaces.create_interface('mock'))
+    ipmi.send_message = bmc.send_message
+
+    eq_(bytearray(ipmi.read_fru_data()), bytearray(range(40)))
+    # the chunks are made smaller until the target accepts them
+    eq_(bmc.counts, [32, 30, 28, 26, 24, 22, 20, 18, 16, 16, 8])
+    eq_(bytearray(ipmi.read_fru_data(offset=4, count=3)),
+            bytearray([4, 5, 6]))
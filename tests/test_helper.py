@@ -2,7 +2,7 @@
 #-*- coding: utf-8 -*-
 
 from mock import MagicMock, call
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 
 from pyipmi.helper import *
 
@@ -26,3 +26,177 @@ def test_clear_repository_helper():
     ]
     clear_fn.assert_has_calls(clear_calls)
     eq_(clear_fn.call_count, 3)
+
+def _record(record_id, length):
+    return [record_id & 0xff, record_id >> 8, 0x51, 0x01, length - 5] + \
+            list(range(length - 5))
+
+def _get_fn(records, max_read, calls,
+        cc=constants.CC_CANT_RET_NUM_REQ_BYTES):
+    def get_fn(reservation_id, record_id, offset, length):
+        calls.append((record_id, offset, length))
+        data = records[record_id][offset:offset + length]
+        if len(data) > max_read:
+            raise CompletionCodeError(cc)
+        return (0xffff, data)
+    return get_fn
+
+def test_get_sdr_data_helper_entire_record():
+    records = {1: _record(1, 40)}
+    calls = []
+    (next_id, data) = get_sdr_data_helper(None,
+            _get_fn(records, 0xff, calls), 1, 0x1234)
+    eq_(next_id, 0xffff)
+    eq_(list(data.array), records[1])
+    eq_(calls, [(1, 0, 0xff)])
+
+def test_get_sdr_data_helper_learns_read_size():
+    records = {1: _record(1, 60), 2: _record(2, 60)}
+    read_size = SdrReadSize()
+    calls = []
+    get_fn = _get_fn(records, 24, calls)
+
+    (next_id, data) = get_sdr_data_helper(None, get_fn, 1, 0x1234,
+            read_size)
+    eq_(list(data.array), records[1])
+    eq_(read_size.entire_record, False)
+    ok_(20 <= read_size.accepted_size <= 24)
+
+    del calls[:]
+    (next_id, data) = get_sdr_data_helper(None, get_fn, 2, 0x1234,
+            read_size)
+    eq_(list(data.array), records[2])
+    # no entire record read and the search has converged
+    eq_(calls[0], (2, 0, 5))
+    ok_(len(calls) <= 5)
+    eq_(read_size.accepted_size, 24)
+    eq_(read_size.size, 24)
+
+def _check_read_size_error(cc):
+    records = {1: _record(1, 40), 2: _record(2, 30)}
+    calls = []
+    (next_id, data) = get_sdr_data_helper(None,
+            _get_fn(records, 24, calls, cc), 1, 0x1234)
+    eq_(list(data.array), records[1])
+    eq_(calls[:2], [(1, 0, 0xff), (1, 0, 5)])
+
+    batches = []
+    walk = walk_sdr_helper(MagicMock(return_value=0x1234),
+            _get_batch_fn(records, 24, batches, cc))
+    result = [(next_id, list(data.array)) for (next_id, data) in walk]
+    eq_(result, [(2, records[1]), (0xffff, records[2])])
+    eq_(batches[0][1], [(0, 0, 0xff)])
+
+def test_get_sdr_data_helper_entire_record_invalid_length():
+    _check_read_size_error(constants.CC_REQ_DATA_INV_LENGTH)
+
+def test_get_sdr_data_helper_entire_record_out_of_range():
+    _check_read_size_error(constants.CC_PARAM_OUT_OF_RANGE)
+
+def test_get_sdr_data_helper_entire_record_invalid_data_field():
+    _check_read_size_error(constants.CC_INV_DATA_FIELD_IN_REQ)
+
+def test_get_sdr_data_helper_other_errors():
+    def get_fn(reservation_id, record_id, offset, length):
+        raise CompletionCodeError(constants.CC_INV_CMD)
+
+    try:
+        get_sdr_data_helper(None, get_fn, 1, 0x1234)
+    except CompletionCodeError as e:
+        eq_(e.cc, constants.CC_INV_CMD)
+    else:
+        ok_(False)
+
+def test_sdr_read_size_bisect():
+    read_size = SdrReadSize()
+    read_size.accepted(20)
+    eq_(read_size.size, 40)
+    read_size.rejected(40)
+    eq_(read_size.size, 30)
+    read_size.accepted(30)
+    eq_(read_size.size, 35)
+    read_size.rejected(35)
+    eq_(read_size.size, 32)
+    eq_(SdrReadSize(read_size.state()).state(), read_size.state())
+
+def _get_batch_fn(records, max_read, batches,
+        cc=constants.CC_CANT_RET_NUM_REQ_BYTES):
+    ids = sorted(records)
+    def get_batch_fn(reservation_id, reads):
+        batches.append((reservation_id, reads))
+        results = []
+        for (record_id, offset, length) in reads:
+            if record_id == 0:
+                record_id = ids[0]
+            index = ids.index(record_id)
+            next_id = ids[index + 1] if index + 1 < len(ids) else 0xffff
+            data = records[record_id][offset:offset + length]
+            if len(data) > max_read:
+                results.append(CompletionCodeError(cc))
+            else:
+                results.append((next_id, data))
+        return results
+    return get_batch_fn
+
+def test_walk_sdr_helper_pipelines_reads():
+    records = {1: _record(1, 40), 2: _record(2, 30), 3: _record(3, 5)}
+    # 20 bytes are accepted, 21 rejected
+    read_size = SdrReadSize([20, 20, 21, False])
+    batches = []
+    reserve_fn = MagicMock(return_value=0x1234)
+
+    walk = walk_sdr_helper(reserve_fn, _get_batch_fn(records, 20, batches),
+            read_size=read_size)
+    result = [(next_id, list(data.array)) for (next_id, data) in walk]
+
+    eq_(result, [(2, records[1]), (3, records[2]), (0xffff, records[3])])
+    eq_(reserve_fn.call_count, 1)
+    eq_([reads for (_, reads) in batches], [
+        [(0, 0, 5)],
+        # remaining chunks of record 1 and the header of record 2
+        [(1, 5, 20), (1, 25, 15), (2, 0, 5)],
+        [(2, 5, 20), (2, 25, 5), (3, 0, 5)],
+    ])
+
+def test_walk_sdr_helper_reservation_canceled():
+    records = {1: _record(1, 40), 2: _record(2, 30)}
+    batches = []
+    get_batch_fn = _get_batch_fn(records, 0xff, batches)
+
+    def cancel_once(reservation_id, reads):
+        results = get_batch_fn(reservation_id, reads)
+        if len(batches) == 1:
+            results[0] = CompletionCodeError(constants.CC_RES_CANCELED)
+        return results
+
+    reserve_fn = MagicMock(side_effect=[0x1234, 0x1235])
+    result = [(next_id, list(data.array)) for (next_id, data) in
+            walk_sdr_helper(reserve_fn, cancel_once)]
+
+    eq_(result, [(2, records[1]), (0xffff, records[2])])
+    eq_(reserve_fn.call_count, 2)
+    eq_(batches, [
+        (0x1234, [(0, 0, 0xff)]),
+        (0x1235, [(0, 0, 0xff)]),
+        (0x1235, [(2, 0, 0xff)]),
+    ])
+
+def test_walk_sdr_helper_retries_affected_chunks():
+    records = {1: _record(1, 60)}
+    read_size = SdrReadSize([20, 20, 21, False])
+    batches = []
+    get_batch_fn = _get_batch_fn(records, 20, batches)
+
+    def cancel_second_chunk(reservation_id, reads):
+        results = get_batch_fn(reservation_id, reads)
+        if len(batches) == 2:
+            results[1] = CompletionCodeError(constants.CC_RES_CANCELED)
+        return results
+
+    reserve_fn = MagicMock(side_effect=[0x1234, 0x1235])
+    result = [list(data.array) for (_, data) in walk_sdr_helper(reserve_fn,
+            cancel_second_chunk, read_size=read_size)]
+
+    eq_(result, [records[1]])
+    eq_(batches[1], (0x1234, [(1, 5, 20), (1, 25, 20), (1, 45, 15)]))
+    eq_(batches[2:], [(0x1235, [(1, 25, 20)])])
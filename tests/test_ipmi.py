@@ -75,3 +75,31 @@ def test_ipmi_send_message_with_name_and_kwargs():
     ok_(isinstance(req, GetSensorReadingReq))
     eq_(req.sensor_number, 5)
     eq_(req.lun, 2)
+
+def test_ipmi_send_message_batch_without_batch_support():
+    interface = interfaces.create_interface('mock')
+    mock = MagicMock()
+    mock.return_value = GetDeviceIdRsp()
+    interface.send_and_receive = mock
+    ipmi = create_connection(interface)
+    ipmi.target = None
+    rsps = ipmi.send_message_batch([GetDeviceIdReq(), GetDeviceIdReq()])
+    eq_(len(rsps), 2)
+    eq_(mock.call_count, 2)
+
+def test_ipmi_send_message_batch_retry_busy():
+    ok = GetDeviceIdRsp()
+    ok.completion_code = 0
+    busy = GetDeviceIdRsp()
+    busy.completion_code = CC_NODE_BUSY
+
+    interface = interfaces.create_interface('mock')
+    interface.send_and_receive_batch = MagicMock(return_value=[ok, busy, ok])
+    interface.send_and_receive = MagicMock(return_value=ok)
+    ipmi = create_connection(interface)
+    ipmi.target = None
+    reqs = [GetDeviceIdReq(), GetDeviceIdReq(), GetDeviceIdReq()]
+    rsps = ipmi.send_message_batch(reqs)
+    eq_([rsp.completion_code for rsp in rsps], [0, 0, 0])
+    eq_(interface.send_and_receive_batch.call_count, 1)
+    interface.send_and_receive.assert_called_once_with(reqs[1])
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import threading
+
+from mock import MagicMock
+from nose.tools import eq_, ok_, raises
+
+from pyipmi.msgs.sensor import GetSensorReadingRsp
+from pyipmi.poller import *
+from pyipmi.sensor import SensorSnapshot
+from pyipmi.sdr import SdrCommon
+from tests.test_cache import compact_sensor_record
+
+
+class FakeClock(object):
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _sensor(number, sensor_type=0x01):
+    data = compact_sensor_record(number, number, 'Sensor %d' % number)
+    data[12] = sensor_type
+    return SdrCommon.from_data(data)
+
+
+def _rsp(reading):
+    rsp = GetSensorReadingRsp()
+    rsp.completion_code = 0
+    rsp.sensor_reading = reading
+    rsp.config.initial_update_in_progress = 0
+    return rsp
+
+
+def _send_batch(reqs, skip_timeouts=False):
+    return [_rsp(req.sensor_number + 1) for req in reqs]
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(2, burst=4, clock=clock)
+    eq_(bucket.reserve(4), 0)
+    eq_(bucket.reserve(1), 0.5)
+    eq_(bucket.reserve(1), 1.0)
+    clock.now = 2.0
+    eq_(bucket.reserve(2), 0)
+
+
+@raises(RuntimeError)
+def test_token_bucket_invalid_rate():
+    TokenBucket(0)
+
+
+def test_schedule_coalesces_sensors():
+    schedule = PollSchedule(jitter=0)
+    (temp, voltage, fan) = (_sensor(1), _sensor(2), _sensor(3))
+    schedule.add('a', temp, 5, now=0)
+    schedule.add('a', voltage, 30, now=0)
+    schedule.add('b', fan, 30, now=0)
+
+    eq_(schedule.next_time(), 5)
+    eq_(schedule.due(4.9), [])
+    eq_(schedule.due(5), [('a', [temp])])
+    eq_(schedule.next_time(), 10)
+
+    # missed periods are skipped
+    eq_(schedule.due(31), [('a', [temp, voltage]), ('b', [fan])])
+    eq_(schedule.next_time(), 35)
+
+    schedule.remove('a', temp)
+    eq_(schedule.next_time(), 60)
+    eq_(schedule.targets(), ['a', 'b'])
+
+
+def test_schedule_jitter():
+    rnd = MagicMock()
+    rnd.random.side_effect = [0.1, 0.6]
+    schedule = PollSchedule(jitter=10, rnd=rnd)
+    schedule.add('a', _sensor(1), 30, now=0)
+    schedule.add('b', _sensor(1), 30, now=0)
+    eq_(schedule.due(0.5), [])
+    eq_([target for (target, _) in schedule.due(1.5)], ['a'])
+    eq_([target for (target, _) in schedule.due(6.5)], ['b'])
+
+
+def test_sensor_poller_run_pending():
+    clock = FakeClock()
+    snapshots = []
+    poller = SensorPoller(lambda target, snapshot:
+            snapshots.append((target, snapshot)), rate=1000, burst=2,
+            jitter=0, clock=clock)
+    ipmi = MagicMock()
+    ipmi.send_message_batch.side_effect = _send_batch
+    poller.add_target('a', ipmi)
+    eq_(poller.add_sensors('a', [_sensor(1), _sensor(2, 0x02),
+            _sensor(3, 0x04)], intervals={0x01: 5, 0x02: 30}), 2)
+    poller.add_sensor('a', _sensor(4), 30)
+
+    clock.now = 5
+    poller.run_pending()
+    eq_(len(snapshots), 1)
+    eq_(snapshots[0][1].raw, [2])
+
+    clock.now = 30
+    poller.run_pending()
+    (target, snapshot) = snapshots[1]
+    eq_(target, 'a')
+    eq_(snapshot.raw, [2, 3, 5])
+    # at most two requests at once
+    eq_([len(args[0]) for (args, _) in
+            ipmi.send_message_batch.call_args_list], [1, 2, 1])
+
+
+def test_sensor_poller_error():
+    errors = []
+    poller = SensorPoller(MagicMock(), jitter=0,
+            error_callback=lambda target, e: errors.append((target, e)))
+    ipmi = MagicMock()
+    error = IOError('unreachable')
+    ipmi.send_message_batch.side_effect = error
+    poller.add_target('a', ipmi)
+    poller.add_sensor('a', _sensor(1), 5)
+    poller.run_pending(poller.schedule.next_time())
+    eq_(errors, [('a', error)])
+    eq_(poller.callback.call_count, 0)
+
+
+def test_sensor_poller_threads():
+    done = threading.Event()
+    snapshots = []
+
+    def callback(target, snapshot):
+        snapshots.append(target)
+        if len(snapshots) >= 3:
+            done.set()
+
+    poller = SensorPoller(callback, jitter=0, max_workers=2)
+    for target in ('a', 'b'):
+        ipmi = MagicMock()
+        ipmi.send_message_batch.side_effect = _send_batch
+        poller.add_target(target, ipmi)
+        poller.add_sensor(target, _sensor(1), 0.02)
+    poller.start()
+    try:
+        ok_(done.wait(5))
+    finally:
+        poller.stop()
+    eq_(set(snapshots), set(['a', 'b']))
+
+
+def test_sensor_poller_restart():
+    done = threading.Event()
+    poller = SensorPoller(lambda target, snapshot: done.set(), jitter=0)
+    ipmi = MagicMock()
+    ipmi.send_message_batch.side_effect = _send_batch
+    poller.add_target('a', ipmi)
+    poller.add_sensor('a', _sensor(1), 0.02)
+    # e.g. left over by a job which was dropped by the last stop
+    poller._busy.add('a')
+    poller.start()
+    try:
+        ok_(done.wait(5))
+    finally:
+        poller.stop()
+
+
+def test_sensor_poller_stop_aborts_poll():
+    sent = threading.Event()
+
+    def send_batch(reqs, skip_timeouts=False):
+        sent.set()
+        return _send_batch(reqs)
+
+    callback = MagicMock()
+    poller = SensorPoller(callback, rate=0.5, burst=1, jitter=0)
+    ipmi = MagicMock()
+    ipmi.send_message_batch.side_effect = send_batch
+    poller.add_target('a', ipmi)
+    poller.add_sensors('a', [_sensor(1), _sensor(2)], default=0.01)
+    poller.start()
+    ok_(sent.wait(5))
+    poller.stop()
+
+    # the second request waits for the rate limit and is not sent
+    eq_(ipmi.send_message_batch.call_count, 1)
+    eq_(callback.call_count, 0)
+    eq_(poller._busy, set())
+
+
+def test_sensor_poller_removed_target():
+    callback = MagicMock()
+    error_callback = MagicMock()
+    poller = SensorPoller(callback, jitter=0, error_callback=error_callback)
+    ipmi = MagicMock()
+    poller.add_target('a', ipmi)
+    poller.add_sensor('a', _sensor(1), 5)
+    jobs = poller._due(poller.schedule.next_time())
+    eq_([target for (target, _) in jobs], ['a'])
+
+    # the target is removed while its job is queued
+    poller.remove_target('a')
+    for job in jobs:
+        poller._poll(*job)
+    eq_(ipmi.send_message_batch.call_count, 0)
+    eq_(callback.call_count, 0)
+    eq_(error_callback.call_count, 0)
+    eq_(poller._busy, set())
+    eq_(poller.schedule.next_time(), None)
+
+
+def _threshold_sensor(number):
+    data = [number, 0x00, 0x51, 0x01, 48, 0x20, 0x00, number, 0x03, 0x01]
+    data += [0] * 38 + [0xc4] + [ord(c) for c in 'Temp']
+    data[12] = 0x01
+    data[13] = 0x01
+    # unc, ucr and lnc are readable
+    data[18] = 0x19
+    data[24] = 1
+    (data[37], data[38], data[41]) = (90, 80, 10)
+    # positive and negative going hysteresis
+    (data[42], data[43]) = (2, 3)
+    return SdrCommon.from_data(data)
+
+
+def _snapshot(records, readings):
+    rsps = []
+    for (raw, states) in readings:
+        rsp = _rsp(raw)
+        if raw is None:
+            rsp.completion_code = 0xcb
+        rsp.states1 = states
+        rsps.append(rsp)
+    return SensorSnapshot(records, rsps, 0, 0)
+
+
+def test_delta_filter():
+    published = []
+    delta = SensorDeltaFilter(published.extend, deadband=2)
+    (temp, fan) = (_threshold_sensor(1), _sensor(2))
+    delta.set_deadband('a', fan, 0)
+
+    def update(readings):
+        del published[:]
+        delta('a', _snapshot([temp, fan], readings))
+        return [(c.record.number, c.reasons) for c in published]
+
+    eq_(update([(50, 0), (1, 0x01)]),
+            [(1, (CHANGE_INITIAL,)), (2, (CHANGE_INITIAL,))])
+    eq_(len(delta), 2)
+
+    eq_(update([(52, 0), (1, 0x01)]), [])
+    # the deadband applies to the last passed reading
+    eq_(update([(53, 0), (2, 0x01)]), [(1, (CHANGE_VALUE,)),
+            (2, (CHANGE_VALUE,))])
+    eq_(delta.last('a', temp), (53, 0))
+    eq_(update([(53, 0), (2, 0x03)]), [(2, (CHANGE_STATES,))])
+    eq_(update([(None, None), (2, 0x03)]),
+            [(1, (CHANGE_ERROR, CHANGE_VALUE, CHANGE_STATES))])
+    eq_(published[0].error, 0xcb)
+    eq_(update([(53, 0), (2, 0x03)]),
+            [(1, (CHANGE_ERROR, CHANGE_VALUE, CHANGE_STATES))])
+    eq_(delta.last('a', fan), (2, 0x03))
+
+
+def test_delta_filter_thresholds():
+    published = []
+    delta = SensorDeltaFilter(published.extend, deadband=100)
+    temp = _threshold_sensor(1)
+
+    def zones(raws):
+        result = []
+        for raw in raws:
+            del published[:]
+            delta('a', _snapshot([temp], [(raw, 0)]))
+            result.append([(c.zone, c.reasons) for c in published])
+        return result
+
+    eq_(zones([50, 80, 77, 76, 91, 87, 86, 5, 11, 12, 13]), [
+        [(ZONE_NORMAL, (CHANGE_INITIAL,))],
+        [(ZONE_UPPER_NON_CRITICAL, (CHANGE_THRESHOLD,))],
+        # the negative going hysteresis of the upper thresholds
+        [],
+        [(ZONE_NORMAL, (CHANGE_THRESHOLD,))],
+        [(ZONE_UPPER_CRITICAL, (CHANGE_THRESHOLD,))],
+        [],
+        [(ZONE_UPPER_NON_CRITICAL, (CHANGE_THRESHOLD,))],
+        [(ZONE_LOWER_NON_CRITICAL, (CHANGE_THRESHOLD,))],
+        # the positive going hysteresis of the lower thresholds
+        [],
+        [],
+        [(ZONE_NORMAL, (CHANGE_THRESHOLD,))],
+    ])
+
+
+def test_delta_filter_threads():
+    delta = SensorDeltaFilter(MagicMock())
+    records = [_sensor(n) for n in range(1, 21)]
+
+    def update(target):
+        for n in range(len(records)):
+            delta(target, _snapshot(records[:n + 1],
+                    [(n, 0)] * (n + 1)))
+
+    threads = [threading.Thread(target=update, args=(t,))
+            for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    eq_(len(delta), 8 * len(records))
+    for t in range(8):
+        for record in records:
+            eq_(delta.last(t, record), (len(records) - 1, 0))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+from nose.tools import eq_, ok_, raises
+
+from pyipmi.errors import TimeoutError
+from pyipmi.pool import ConnectionPool
+
+from tests.interfaces.test_rmcp import FakeBmc
+
+
+def _pool(**kwargs):
+    return ConnectionPool(interface_options={'timeout': 0.5}, **kwargs)
+
+
+def _activations(bmc):
+    return len([r for r in bmc.requests if r[1] == 0x3a])
+
+
+def test_reuse_session():
+    bmc = FakeBmc()
+    bmc.start()
+    pool = _pool()
+
+    with pool.connection('127.0.0.1', bmc.port, 'admin', 'secret') as ipmi:
+        ipmi.send_message_with_name('GetDeviceId')
+    with pool.connection('127.0.0.1', bmc.port, 'admin', 'secret') as ipmi2:
+        ipmi2.send_message_with_name('GetDeviceId')
+
+    ok_(ipmi is ipmi2)
+    eq_(_activations(bmc), 1)
+    eq_(pool.sessions('127.0.0.1', bmc.port), 1)
+
+    pool.close()
+    bmc.join()
+    ok_(bmc.closed)
+    eq_(pool.sessions('127.0.0.1', bmc.port), 0)
+
+
+@raises(TimeoutError)
+def test_max_per_bmc():
+    bmc = FakeBmc()
+    bmc.start()
+    pool = _pool(max_per_bmc=1, acquire_timeout=0.1)
+    ipmi = pool.acquire('127.0.0.1', bmc.port, 'admin', 'secret')
+    try:
+        pool.acquire('127.0.0.1', bmc.port, 'admin', 'secret')
+    finally:
+        pool.release(ipmi)
+        pool.close()
+        bmc.join()
+
+
+@raises(TimeoutError)
+def test_max_per_bmc_counts_all_users():
+    bmc = FakeBmc()
+    bmc.start()
+    pool = _pool(max_per_bmc=1, acquire_timeout=0.1)
+    ipmi = pool.acquire('127.0.0.1', bmc.port, 'admin', 'secret')
+    try:
+        pool.acquire('127.0.0.1', bmc.port, 'operator', 'secret')
+    finally:
+        eq_(pool.sessions('127.0.0.1', bmc.port), 1)
+        pool.release(ipmi)
+        pool.close()
+        bmc.join()
+
+
+def test_keepalive():
+    bmc = FakeBmc()
+    bmc.start()
+    pool = _pool(keepalive_interval=0)
+    ipmi = pool.acquire('127.0.0.1', bmc.port, 'admin', 'secret')
+    pool.release(ipmi)
+    ipmi = pool.acquire('127.0.0.1', bmc.port, 'admin', 'secret')
+    pool.release(ipmi)
+    pool.close()
+    bmc.join()
+
+    eq_([r[1] for r in bmc.requests][4:], [0x01, 0x3c])
+
+
+def test_release_broken():
+    bmc = FakeBmc()
+    bmc.start()
+    pool = _pool()
+    ipmi = pool.acquire('127.0.0.1', bmc.port, 'admin', 'secret')
+    pool.release(ipmi, broken=True)
+    bmc.join()
+    ok_(bmc.closed)
+    eq_(pool.sessions('127.0.0.1', bmc.port), 0)
+
+
+def test_evict_least_recently_used():
+    bmcs = [FakeBmc(), FakeBmc()]
+    for bmc in bmcs:
+        bmc.start()
+    pool = _pool(max_idle=1)
+
+    conns = [pool.acquire('127.0.0.1', bmc.port, 'admin', 'secret')
+            for bmc in bmcs]
+    for ipmi in conns:
+        pool.release(ipmi)
+
+    bmcs[0].join()
+    ok_(bmcs[0].closed)
+    ok_(not bmcs[1].closed)
+
+    pool.close()
+    bmcs[1].join()
+    ok_(bmcs[1].closed)
+
+
+def test_password_is_checked():
+    from mock import MagicMock
+    from pyipmi.pool import _PooledConnection, _secret
+
+    pool = _pool(max_per_bmc=1)
+    connected = []
+
+    def connect(key, password):
+        connected.append(password)
+        return _PooledConnection(key, MagicMock(), _secret(password))
+    pool._connect = connect
+
+    ipmi = pool.acquire('10.0.0.1', 623, 'admin', 'secret')
+    pool.release(ipmi)
+    # another password does not get the idle session, it is replaced
+    ipmi2 = pool.acquire('10.0.0.1', 623, 'admin', 'wrong')
+    ok_(ipmi2 is not ipmi)
+    ipmi.session.close.assert_called_once_with()
+    eq_(pool.sessions('10.0.0.1', 623), 1)
+    pool.release(ipmi2)
+
+    ipmi3 = pool.acquire('10.0.0.1', 623, 'admin', 'wrong')
+    ok_(ipmi3 is ipmi2)
+    pool.release(ipmi3)
+    eq_(connected, ['secret', 'wrong'])
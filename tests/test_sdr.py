@@ -1,9 +1,17 @@
 #!/usr/bin/env python
 #-*- coding: utf-8 -*-
 
-from nose.tools import eq_, raises
+import os
+import shutil
+import tempfile
 
+from mock import MagicMock, patch
+from nose.tools import eq_, ok_, raises
+
+from pyipmi import interfaces, create_connection
+from pyipmi.msgs import create_response_by_name
 from pyipmi.sdr import *
+from tests.test_cache import FakeSdrBmc, compact_sensor_record, _connect
 
 @raises(DecodingError)
 def test_sdrcommon_invalid_data_length():
@@ -107,3 +115,414 @@ def test_sdrfrudevicelocator():
 def test_sdrmanagementcontollerdevicelocator():
     data = (0, 0, 0, 0, 0)
     sdr = SdrManagementContollerDeviceLocator(data)
+
+def _compact_sensor(record_id, number, name, sensor_type=0x01, entity=0x03):
+    data = compact_sensor_record(record_id, number, name)
+    data[8] = entity
+    data[12] = sensor_type
+    return SdrCompactSensorRecord(data)
+
+def test_sdrrepository_lookups():
+    sdrs = SdrRepository([
+        _compact_sensor(1, 0x10, 'Temp CPU'),
+        _compact_sensor(2, 0x11, 'Temp Board', entity=0x07),
+        _compact_sensor(3, 0x12, 'Fan 1', sensor_type=0x04),
+    ])
+
+    eq_(len(sdrs), 3)
+    ok_(2 in sdrs)
+    eq_(sdrs.get(2).number, 0x11)
+    eq_(sdrs.find_sensor(0x20, 0, 0x12).device_id_string, 'Fan 1')
+    eq_(sdrs.find_sensor(0x20, 1, 0x12), None)
+    eq_([s.id for s in sdrs.find_by_entity(0x03, 0x01)], [1, 3])
+    eq_([s.id for s in sdrs.find_by_sensor_type(0x01)], [1, 2])
+    eq_([s.id for s in sdrs.find_by_name('Temp Board')], [2])
+    eq_([s.id for s in sdrs.records_of_type(
+            SDR_TYPE_COMPACT_SENSOR_RECORD)], [1, 2, 3])
+    eq_(list(sdrs.records_of_type(SDR_TYPE_FULL_SENSOR_RECORD)), [])
+
+def test_sdrrepository_remove():
+    sdrs = SdrRepository([
+        _compact_sensor(1, 0x10, 'Temp CPU'),
+        _compact_sensor(2, 0x10, 'Temp CPU'),
+    ])
+    eq_(sdrs.remove(1).id, 1)
+    eq_(sdrs.remove(1), None)
+    eq_(sdrs.find_sensor(0x20, 0, 0x10).id, 2)
+    eq_([s.id for s in sdrs.find_by_name('Temp CPU')], [2])
+    sdrs.remove(2)
+    eq_(sdrs.find_sensor(0x20, 0, 0x10), None)
+    eq_(sdrs.find_by_sensor_type(0x01), [])
+    eq_(list(sdrs), [])
+
+def test_sdr_repository_is_updated():
+    ipmi = create_connection(interfaces.create_interface('mock'))
+    ipmi.sdr_repository = SdrRepository([_compact_sensor(1, 0x10, 'Temp')])
+
+    rsp = create_response_by_name('PartialAddSdr')
+    rsp.completion_code = 0
+    rsp.record_id = 0x0005
+    ipmi.send_message = MagicMock(return_value=rsp)
+
+    data = compact_sensor_record(0, 0x11, 'Fan 1')
+    ipmi.partial_add_sdr(0x1234, 0, 0, 0, data[:20])
+    eq_(len(ipmi.sdr_repository), 1)
+    ipmi.partial_add_sdr(0x1234, 0x0005, 20, 1, data[20:])
+    eq_(ipmi.sdr_repository.find_sensor(0x20, 0, 0x11).id, 0x0005)
+
+    rsp = create_response_by_name('DeleteSdr')
+    rsp.completion_code = 0
+    rsp.record_id = 1
+    ipmi.send_message_with_name = MagicMock(return_value=rsp)
+    ipmi.reserve_device_sdr_repository = MagicMock(return_value=0x1234)
+    ipmi.delete_sdr(1)
+    eq_([s.id for s in ipmi.sdr_repository], [0x0005])
+
+def test_sync_sdr_repository():
+    bmc = FakeSdrBmc({
+        1: compact_sensor_record(1, 0x10, 'Temp CPU'),
+        2: compact_sensor_record(2, 0x11, 'Temp Board'),
+        3: compact_sensor_record(3, 0x12, 'Fan 1'),
+    })
+    ipmi = _connect(bmc)
+    sdrs = ipmi.get_sdr_repository()
+    first = sdrs.get(1)
+
+    del bmc.records[2]
+    bmc.records[3] = compact_sensor_record(3, 0x12, 'Fan 1 Speed')
+    bmc.records[5] = compact_sensor_record(5, 0x13, 'Fan 2')
+    bmc.requests.clear()
+    eq_(ipmi.sync_sdr_repository(), ([3, 5], [2]))
+    # three headers and the two changed records
+    eq_(bmc.requests['GetSdr'], 5)
+
+    ok_(sdrs.get(1) is first)
+    eq_([s.id for s in sdrs], [1, 3, 5])
+    eq_([s.next_id for s in sdrs], [3, 5, 0xffff])
+    eq_(sdrs.find_sensor(0x20, 0, 0x12).device_id_string, 'Fan 1 Speed')
+    eq_(sdrs.find_sensor(0x20, 0, 0x11), None)
+
+    # same header, other data
+    bmc.records[1] = compact_sensor_record(1, 0x10, 'Temp CPX')
+    eq_(ipmi.sync_sdr_repository(), ([], []))
+    eq_(ipmi.sync_sdr_repository(verify=True), ([1], []))
+    eq_(sdrs.get(1).device_id_string, 'Temp CPX')
+
+def test_sdrrepository_sync_reservation_canceled():
+    records = {
+        1: compact_sensor_record(1, 0x10, 'Temp CPU'),
+        2: compact_sensor_record(2, 0x11, 'Temp Board'),
+    }
+    sdrs = SdrRepository([SdrCommon.from_data(records[1], 2)])
+    batches = []
+
+    def get_batch_fn(reservation_id, reads):
+        batches.append((reservation_id, reads))
+        if len(batches) == 1:
+            return [CompletionCodeError(constants.CC_RES_CANCELED)]
+        results = []
+        for (record_id, offset, length) in reads:
+            record_id = record_id or 1
+            results.append((2 if record_id == 1 else 0xffff,
+                    records[record_id][offset:offset + length]))
+        return results
+
+    reserve_fn = MagicMock(side_effect=[0x1234, 0x1235])
+    eq_(sdrs.sync(reserve_fn, get_batch_fn), ([2], []))
+    eq_(reserve_fn.call_count, 2)
+    # the new reservation is kept for all following reads
+    eq_([reservation_id for (reservation_id, _) in batches],
+            [0x1234] + [0x1235] * (len(batches) - 1))
+    # only the header of the unchanged record is read
+    ok_(all(length == 5 for (_, reads) in batches
+            for (record_id, _, length) in reads if record_id in (0, 1)))
+    eq_(sdrs.get(2).device_id_string, 'Temp Board')
+
+def _association(record_id, container, contained, flags=0x00):
+    data = [record_id & 0xff, record_id >> 8, 0x51, 0x08, 11]
+    data += list(container) + [flags]
+    for entity in contained:
+        data += list(entity)
+    data += [0] * (16 - len(data))
+    return SdrCommon.from_data(data)
+
+def _entity_sensor(record_id, number, entity):
+    data = compact_sensor_record(record_id, number, 'Sensor %d' % number)
+    (data[8], data[9]) = entity
+    return SdrCompactSensorRecord(data)
+
+def test_sdrentityassociationrecord():
+    sdr = _association(1, (0x07, 1), [(0x09, 1), (0x09, 3)])
+    ok_(isinstance(sdr, SdrEntityAssociationRecord))
+    eq_(sdr.container_entity_id, 0x07)
+    eq_(sdr.container_entity_instance, 1)
+    eq_(sdr.contained_entities_range, 0)
+    eq_(sdr.contained_entities, [(0x09, 1), (0x09, 3)])
+
+    sdr = _association(1, (0x07, 1),
+            [(0x09, 1), (0x09, 3), (0x1d, 1), (0x1d, 2)], flags=0xc0)
+    eq_(sdr.linked, 1)
+    eq_(sdr.contained_entities,
+            [(0x09, 1), (0x09, 2), (0x09, 3), (0x1d, 1), (0x1d, 2)])
+
+def test_sdrdevicerelativeentityassociationrecord():
+    data = [0x02, 0x00, 0x51, 0x09, 27, 0x07, 0x61, 0x40, 0x20, 0x80,
+            0x40, 0x20, 0x03, 0x61, 0x40, 0x20, 0x03, 0x62]
+    data += [0] * (32 - len(data))
+    sdr = SdrCommon.from_data(data)
+    ok_(isinstance(sdr, SdrDeviceRelativeEntityAssociationRecord))
+    eq_(sdr.container_entity_id, 0x07)
+    eq_(sdr.container_entity_instance, 0x61)
+    eq_(sdr.container_device_address, 0x20)
+    eq_(sdr.container_device_channel, 2)
+    eq_(sdr.contained_entities_range, 1)
+    eq_(sdr.contained_entities, [(0x03, 0x61), (0x03, 0x62)])
+
+def test_entity_hierarchy():
+    records = [
+        _association(1, (0x07, 1), [(0x09, 1), (0x09, 3)]),
+        _association(2, (0x09, 3), [(0x03, 1), (0x03, 2)]),
+        _entity_sensor(3, 0x10, (0x03, 1)),
+        _entity_sensor(4, 0x11, (0x03, 2)),
+        _entity_sensor(5, 0x12, (0x09, 3)),
+        _entity_sensor(6, 0x13, (0x09, 1)),
+        _entity_sensor(7, 0x14, (0x07, 1)),
+    ]
+    tree = EntityHierarchy(records)
+    eq_(tree.roots(), [(0x07, 1)])
+    eq_(tree.children(0x09, 3), [(0x03, 1), (0x03, 2)])
+    eq_(tree.parents(0x03, 2), [(0x09, 3)])
+    eq_(tree.descendants(0x07, 1), [(0x09, 1), (0x09, 3), (0x03, 1),
+            (0x03, 2)])
+    eq_([s.number for s in tree.sensors(0x09, 3)], [0x12, 0x10, 0x11])
+    eq_([s.number for s in tree.sensors(0x07, 1)],
+            [0x14, 0x13, 0x12, 0x10, 0x11])
+    eq_(tree.sensors(0x0a, 1), [])
+
+def test_entity_hierarchy_shared():
+    EntityHierarchy.clear_shared()
+    sdrs = SdrRepository([
+        _association(1, (0x07, 1), [(0x03, 1)]),
+        _entity_sensor(2, 0x10, (0x03, 1)),
+    ])
+    other = SdrRepository(list(sdrs))
+    tree = sdrs.entity_hierarchy()
+    ok_(other.entity_hierarchy() is tree)
+
+    sdrs.add(_entity_sensor(3, 0x11, (0x07, 1)))
+    tree = sdrs.entity_hierarchy()
+    ok_(other.entity_hierarchy() is not tree)
+    eq_([s.number for s in tree.sensors(0x07, 1)], [0x11, 0x10])
+
+def _full_sensor(m=1, b=0, k1=0, k2=0, fmt=0, linearization=L_LINEAR):
+    sdr = SdrFullSensorRecord(None)
+    sdr.m = m
+    sdr.b = b
+    sdr.k1 = k1
+    sdr.k2 = k2
+    sdr.analog_data_format = fmt
+    sdr.linearization = linearization
+    return sdr
+
+def test_sdrfullsensorrecord_conversion_table():
+    for linearization in range(L_CUBERT + 1):
+        sdr = _full_sensor(m=3, b=-2, k1=1, k2=-2, fmt=2,
+                linearization=linearization)
+        for raw in range(256):
+            try:
+                expected = sdr._convert(raw)
+            except (ValueError, ZeroDivisionError, OverflowError) as e:
+                expected = type(e)
+            try:
+                value = sdr.convert_sensor_raw_to_value(raw)
+            except (ValueError, ZeroDivisionError, OverflowError) as e:
+                value = type(e)
+            eq_(value, expected)
+
+def test_sdrfullsensorrecord_convert_value_to_raw():
+    sdr = _full_sensor(m=2, b=5, k1=1, k2=-1)
+    eq_(sdr.convert_sensor_raw_to_value(10), 7.0)
+    eq_(sdr.convert_sensor_value_to_raw(7.0), 10)
+    eq_(sdr.convert_sensor_value_to_raw(7.08), 10)
+    eq_(sdr.convert_sensor_value_to_raw(7.12), 11)
+
+    # two's complement
+    sdr = _full_sensor(fmt=SdrFullSensorRecord.DATA_FMT_2S_COMPLEMENT)
+    eq_(sdr.convert_sensor_value_to_raw(-1), 0xff)
+    eq_(sdr.convert_sensor_value_to_raw(-128), 0x80)
+
+    # non-linear
+    sdr = _full_sensor(linearization=L_SQR)
+    eq_(sdr.convert_sensor_value_to_raw(100), 10)
+    eq_(sdr.convert_sensor_value_to_raw(102), 10)
+    eq_(sdr.convert_sensor_value_to_raw(120), 11)
+
+def test_sdrfullsensorrecord_conversion_table_shared():
+    sdr = _full_sensor(m=2, b=5, k1=1, k2=-1)
+    other = _full_sensor(m=2, b=5, k1=1, k2=-1)
+    ok_(sdr._conversion_table() is other._conversion_table())
+    ok_(sdr._reverse_conversion_table() is
+            other._reverse_conversion_table())
+
+    # assigning a conversion field drops the table of the record
+    other.m = 3
+    eq_(other.convert_sensor_raw_to_value(10), 8.0)
+    eq_(sdr.convert_sensor_raw_to_value(10), 7.0)
+    eq_(other.convert_sensor_value_to_raw(8.0), 10)
+
+@raises(ValueError)
+def test_sdrfullsensorrecord_convert_value_to_raw_out_of_range():
+    sdr = _full_sensor()
+    sdr.convert_sensor_value_to_raw(256)
+
+def test_sdrfullsensorrecord_decoding():
+    data = [0x05, 0x00, 0x51, 0x01, 0x33,
+            0x20, 0x01, 0x30, 0x07, 0x01, 0x7f, 0x68, 0x01, 0x01,
+            0x95, 0x0a, 0x95, 0x0a, 0x3f, 0x3f, 0x80, 0x01, 0x00,
+            0x00, 0x02, 0x40, 0xfe, 0xc0, 0x30, 0xe1, 0x05,
+            0x32, 0x64, 0x00, 0xff, 0x80,
+            0x5a, 0x55, 0x50, 0x00, 0x05, 0x0a, 0x02, 0x01,
+            0x00, 0x00, 0x00, 0xc4] + [ord(c) for c in 'Temp']
+    sdr = SdrCommon.from_data(data, 0x0006)
+
+    eq_(type(sdr), SdrFullSensorRecord)
+    ok_(not hasattr(sdr, '__dict__'))
+    eq_((sdr.id, sdr.next_id, sdr.length), (5, 6, 0x33))
+    eq_((sdr.owner_id, sdr.owner_lun, sdr.number), (0x20, 1, 0x30))
+    eq_((sdr.entity_id, sdr.entity_instance), (7, 1))
+    eq_(sdr.initialization, ['scanning', 'events', 'thresholds',
+            'hysteresis', 'type',
+            'default_event_generation', 'default_scanning'])
+    eq_(sdr.capabilities, ['auto_rearm', 'hysteresis_read_and_setable',
+            'threshold_read_and_setable'])
+    eq_(sdr.assertion_mask, 0x0a95)
+    eq_(sdr.analog_data_format, SdrFullSensorRecord.DATA_FMT_2S_COMPLEMENT)
+    eq_((sdr.m, sdr.tolerance), (258, 0))
+    eq_((sdr.b, sdr.accuracy, sdr.accuracy_exp), (-2, 768, 0))
+    eq_((sdr.k1, sdr.k2), (1, -2))
+    eq_(sdr.analog_characteristic, ['nominal_reading', 'normal_min'])
+    eq_(sdr.threshold, {'unr': 0x5a, 'ucr': 0x55, 'unc': 0x50,
+            'lnr': 0x00, 'lcr': 0x05, 'lnc': 0x0a})
+    eq_(sdr.hysteresis, {'positive_going': 2, 'negative_going': 1})
+    eq_(sdr.device_id_string, 'Temp')
+
+    sdr.m = 1
+    eq_(sdr.m, 1)
+    eq_(sdr.b, -2)
+
+def test_sdr_dump():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'sdr.bin')
+        bmc = FakeSdrBmc({
+            1: compact_sensor_record(1, 0x10, 'Temp CPU'),
+            4: compact_sensor_record(4, 0x11, 'Temp Board'),
+        })
+        eq_(_connect(bmc).dump_sdr_repository(path), 2)
+        eq_(os.path.getsize(path), len(bmc.records[1]) + len(bmc.records[4]))
+
+        with SdrDumpFile(path) as dump:
+            eq_(len(dump), 2)
+            eq_(list(dump.record_data(1)), bmc.records[4])
+            sdrs = list(dump)
+            eq_(dump[-1].device_id_string, 'Temp Board')
+        eq_([s.id for s in sdrs], [1, 4])
+        eq_([s.next_id for s in sdrs], [4, 0xffff])
+        eq_([s.device_id_string for s in sdrs], ['Temp CPU', 'Temp Board'])
+
+        with open(path, 'wb') as f:
+            pass
+        with SdrDumpFile(path) as dump:
+            eq_(list(dump), [])
+    finally:
+        shutil.rmtree(directory)
+
+@raises(DecodingError)
+def test_sdr_dump_truncated():
+    (fd, path) = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(bytes(bytearray(compact_sensor_record(1, 1, 'Fan')[:-1])))
+        SdrDumpFile(path)
+    finally:
+        os.remove(path)
+
+class FakeSdrWriter(object):
+    """Accepts Partial Add SDR requests with up to `max_data` bytes."""
+
+    def __init__(self, max_data):
+        self.max_data = max_data
+        self.records = {}
+        self.reservation_id = 0
+        self.next_record_id = 1
+        self.partial = None
+        self.cancel_at = None
+        self.requests = []
+
+    def send_message(self, req, retry=3):
+        name = type(req).__name__[:-3]
+        rsp = create_response_by_name(name)
+        rsp.completion_code = 0
+        if name == 'ReserveSdrRepository':
+            self.reservation_id += 1
+            self.partial = None
+            rsp.reservation_id = self.reservation_id
+        elif name == 'ClearSdrRepository':
+            self.records.clear()
+            rsp.status.erase_in_progress = 1
+        elif name == 'PartialAddSdr':
+            self.requests.append((req.record_id, req.offset,
+                    len(req.record_data)))
+            if len(self.requests) == self.cancel_at:
+                self.reservation_id += 1
+            if req.reservation_id != self.reservation_id:
+                rsp.completion_code = 0xc5
+            elif len(req.record_data) > self.max_data:
+                rsp.completion_code = 0xc7
+            else:
+                if req.offset == 0:
+                    self.partial = (self.next_record_id, [])
+                    self.next_record_id += 1
+                (record_id, data) = self.partial
+                data.extend(req.record_data)
+                rsp.record_id = record_id
+                if req.status.in_progress == 1:
+                    self.records[record_id] = data
+        return rsp
+
+@patch('pyipmi.helper.time.sleep')
+def test_load_sdr_repository(sleep):
+    writer = FakeSdrWriter(max_data=24)
+    ipmi = create_connection(interfaces.create_interface('mock'))
+    ipmi.send_message = writer.send_message
+    ipmi.sdr_repository = SdrRepository()
+    records = [compact_sensor_record(0, n, 'Sensor %d' % n)
+            for n in range(3)]
+
+    result = ipmi.load_sdr_repository(records)
+
+    eq_([writer.records[i] for i in (1, 2, 3)], records)
+    eq_(result.records, 3)
+    eq_(result.bytes, sum(len(r) for r in records))
+    eq_(result.requests, len(writer.requests))
+    # the entire record is rejected once, then the chunk size is learned
+    eq_(writer.requests[:3], [(0, 0, 40), (0, 0, 20), (1, 20, 20)])
+    ok_(20 < max(length for (_, _, length) in writer.requests[-4:]) <= 24)
+    eq_(len(ipmi.sdr_repository), 3)
+    eq_(ipmi.sdr_repository.find_sensor(0x20, 0, 2).id, 3)
+
+@patch('pyipmi.helper.time.sleep')
+def test_load_sdr_repository_reservation_canceled(sleep):
+    writer = FakeSdrWriter(max_data=0xff)
+    writer.cancel_at = 2
+    ipmi = create_connection(interfaces.create_interface('mock'))
+    ipmi.send_message = writer.send_message
+    records = [compact_sensor_record(0, n, 'Sensor %d' % n)
+            for n in range(2)]
+
+    ipmi.load_sdr_repository(records)
+
+    eq_(sorted(writer.records.values()), sorted(records))
+    # only the record during which the reservation was canceled is sent
+    # again
+    eq_(writer.requests, [(0, 0, 40), (0, 0, 40), (0, 0, 40)])
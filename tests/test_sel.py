@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+from array import array
+
+from nose.tools import eq_
+
+import pyipmi.msgs.sel
+from pyipmi import interfaces, create_connection
+
+
+def _sel_record(record_id):
+    return array('B', [record_id & 0xff, record_id >> 8, 0x02, 0, 0, 0, 0,
+            0x20, 0, 0x04, 0x01, 0x30, 0x01, 0x00, 0x00, 0x00])
+
+
+class SelInterface(object):
+    """Answers SEL requests from a table of records."""
+
+    def __init__(self, record_ids, batch=True):
+        self.records = {}
+        for (n, record_id) in enumerate(record_ids):
+            if n + 1 < len(record_ids):
+                next_id = record_ids[n + 1]
+            else:
+                next_id = 0xffff
+            self.records[record_id] = (next_id, _sel_record(record_id))
+        # record id 0 is the first record
+        self.records[0] = self.records[record_ids[0]]
+        self.single = []
+        self.batches = []
+        if batch:
+            self.send_and_receive_batch = self._send_and_receive_batch
+
+    def _rsp(self, req):
+        if isinstance(req, pyipmi.msgs.sel.GetSelInfoReq):
+            rsp = pyipmi.msgs.sel.GetSelInfoRsp()
+            rsp.entries = len(self.records) - 1
+        elif isinstance(req, pyipmi.msgs.sel.ReserveSelReq):
+            rsp = pyipmi.msgs.sel.ReserveSelRsp()
+            rsp.reservation_id = 0x1234
+        else:
+            rsp = pyipmi.msgs.sel.GetSelEntryRsp()
+            if req.record_id not in self.records:
+                rsp.completion_code = 0xcb
+                return rsp
+            (rsp.next_record_id, rsp.record_data) = self.records[req.record_id]
+        rsp.completion_code = 0
+        return rsp
+
+    def send_and_receive(self, req):
+        if isinstance(req, pyipmi.msgs.sel.GetSelEntryReq):
+            self.single.append(req.record_id)
+        return self._rsp(req)
+
+    def _send_and_receive_batch(self, reqs, skip_timeouts=False):
+        self.batches.append([req.record_id for req in reqs])
+        return [self._rsp(req) for req in reqs]
+
+
+def _sel_entries(interface, **kwargs):
+    ipmi = create_connection(interface)
+    ipmi.target = None
+    return [e.record_id for e in ipmi.sel_entries(**kwargs)]
+
+
+def test_sel_entries_without_batch():
+    interface = SelInterface([1, 2, 3], batch=False)
+    eq_(_sel_entries(interface), [1, 2, 3])
+    eq_(interface.single, [0, 2, 3])
+
+
+def test_sel_entries_prefetch_consecutive():
+    interface = SelInterface(list(range(1, 21)))
+    eq_(_sel_entries(interface, prefetch=8), list(range(1, 21)))
+    eq_(interface.single, [])
+    eq_(len(interface.batches), 3)
+
+
+def test_sel_entries_prefetch_not_consecutive():
+    interface = SelInterface([1, 2, 3, 100, 200])
+    eq_(_sel_entries(interface, prefetch=8), [1, 2, 3, 100, 200])
+    # a new batch is started after each gap
+    eq_(interface.batches, [list(range(0, 8)), list(range(100, 108)),
+            list(range(200, 208))])
+    eq_(interface.single, [])
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 #-*- coding: utf-8 -*-
 
-from nose.tools import eq_, raises
+from nose.tools import eq_, ok_, raises
 from mock import MagicMock, call
 
 from pyipmi.sensor import *
@@ -58,3 +58,102 @@ def test_set_sensor_thresholds():
     eq_(req.threshold.lcr, 0)
     eq_(req.set_mask.lnr, 0)
     eq_(req.threshold.lnr, 0)
+
+def test_get_sensor_readings():
+    from pyipmi.errors import CompletionCodeError
+    from pyipmi.msgs.sensor import GetSensorReadingRsp
+
+    rsps = []
+    for (cc, reading) in ((0, 0x12), (0xcb, None), (0, 0x34)):
+        rsp = GetSensorReadingRsp()
+        rsp.completion_code = cc
+        if reading is not None:
+            rsp.sensor_reading = reading
+            rsp.config.initial_update_in_progress = 0
+            rsp.states1 = None
+        rsps.append(rsp)
+
+    mock_send_batch = MagicMock()
+    mock_send_batch.return_value = rsps
+
+    interface = interfaces.create_interface('mock')
+    ipmi = create_connection(interface)
+    ipmi.send_message_batch = mock_send_batch
+
+    readings = ipmi.get_sensor_readings([1, 2, 3])
+    args, kwargs = mock_send_batch.call_args
+    eq_([req.sensor_number for req in args[0]], [1, 2, 3])
+    eq_(readings[0], (0x12, None))
+    eq_(readings[1].cc, 0xcb)
+    eq_(readings[2], (0x34, None))
+
+def test_read_all_sensors():
+    from pyipmi.msgs.sensor import GetSensorReadingRsp
+    from pyipmi.sdr import SdrCommon
+    from tests.test_cache import compact_sensor_record
+
+    full = [0x01, 0x00, 0x51, 0x01, 48, 0x20, 0x01, 0x20, 0x03, 0x01]
+    full += [0] * 38 + [0xc4] + [ord(c) for c in 'Temp']
+    full[24] = 2
+    sdrs = [SdrCommon.from_data(full),
+            SdrCommon.from_data(compact_sensor_record(2, 0x21, 'Fan')),
+            SdrCommon.from_data(compact_sensor_record(3, 0x22, 'PSU'))]
+
+    rsps = []
+    for (cc, reading, states) in ((0, 0x12, 0x01), (0, 0x34, 0x02),
+            (0xcb, None, None)):
+        rsp = GetSensorReadingRsp()
+        rsp.completion_code = cc
+        if reading is not None:
+            rsp.sensor_reading = reading
+            rsp.config.initial_update_in_progress = 0
+            rsp.states1 = states
+        rsps.append(rsp)
+
+    interface = interfaces.create_interface('mock')
+    ipmi = create_connection(interface)
+    ipmi.send_message_batch = MagicMock(return_value=rsps)
+
+    snapshot = ipmi.read_all_sensors(sdrs)
+    args, kwargs = ipmi.send_message_batch.call_args
+    eq_([(req.sensor_number, req.lun) for req in args[0]],
+            [(0x20, 1), (0x21, 0), (0x22, 0)])
+
+    eq_(len(snapshot), 3)
+    eq_(snapshot.raw, [0x12, 0x34, None])
+    eq_(snapshot.values, [0x24, None, None])
+    eq_(snapshot.states, [0x01, 0x02, None])
+    eq_(snapshot.errors, [None, None, 0xcb])
+    eq_(snapshot.value(0x20, lun=1), 0x24)
+    eq_(snapshot.index(0x22), 2)
+    eq_(snapshot.value(0x23), None)
+    eq_(list(snapshot)[1], (sdrs[1], 0x34, None, 0x02, None))
+    ok_(snapshot.duration >= 0)
+
+def test_read_all_sensors_timeout():
+    from pyipmi.errors import TimeoutError
+    from pyipmi.msgs.sensor import GetSensorReadingRsp
+    from pyipmi.sdr import SdrCommon
+    from tests.test_cache import compact_sensor_record
+
+    sdrs = [SdrCommon.from_data(compact_sensor_record(1, 0x21, 'Fan')),
+            SdrCommon.from_data(compact_sensor_record(2, 0x22, 'PSU'))]
+
+    def send_and_receive(req):
+        if req.sensor_number == 0x21:
+            raise TimeoutError()
+        rsp = GetSensorReadingRsp()
+        rsp.completion_code = 0
+        rsp.sensor_reading = 0x34
+        rsp.config.initial_update_in_progress = 0
+        rsp.states1 = 0x02
+        return rsp
+
+    interface = interfaces.create_interface('mock')
+    interface.send_and_receive = send_and_receive
+    ipmi = create_connection(interface)
+    ipmi.target = None
+
+    snapshot = ipmi.read_all_sensors(sdrs)
+    eq_(snapshot.raw, [None, 0x34])
+    eq_(snapshot.errors, [0xc3, None])
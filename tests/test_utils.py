@@ -97,6 +97,38 @@ def test_bytebuffer_pop_slice_error():
     b = ByteBuffer(b'\x30\x31\x32\x33')
     c = b.pop_slice(5)
 
+def test_bytebuffer_pop_after_pop_slice():
+    b = ByteBuffer((1, 2, 3, 4, 5, 6))
+    c = b.pop_slice(2)
+    eq_(c.pop_unsigned_int(2), 0x0201)
+    eq_(b.pop_unsigned_int(3), 0x050403)
+    eq_(len(b), 1)
+    eq_(b[0], 6)
+    eq_(b[-1], 6)
+    eq_(b.array, array('B', [6]))
+
+def test_bytebuffer_extend_with_slice_in_use():
+    b = ByteBuffer((1, 2, 3))
+    c = b.pop_slice(1)
+    b.push_unsigned_int(4, 1)
+    c.push_unsigned_int(5, 1)
+    eq_(b.array, array('B', [2, 3, 4]))
+    eq_(c.array, array('B', [1, 5]))
+
+def test_bytebuffer_from_bytes():
+    b = ByteBuffer(b'\x01\x02\x03')
+    eq_(b.pop_unsigned_int(1), 1)
+    b.push_unsigned_int(4, 1)
+    eq_(b.array, array('B', [2, 3, 4]))
+
+def test_bytebuffer_del_slice():
+    b = ByteBuffer((1, 2, 3, 4))
+    b.pop_unsigned_int(1)
+    del b[0:2]
+    eq_(b.array, array('B', [4]))
+    del b[:]
+    eq_(len(b), 0)
+
 def test_chunks():
     d = [0,1,2,3,4,5,6,7,8,9]
     r = list()